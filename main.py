@@ -1,19 +1,20 @@
 import streamlit as st
 import os
 from base64 import b64encode
-from pages_custom.quotation_page import quotation_app
-from pages_custom.invoice_page import invoice_app
-from pages_custom.receipt_page import receipt_app
-from pages_custom.dashboard_new import dashboard_new_app
-from pages_custom.customers_page import customers_app
-from pages_custom.products_page import products_app
-from pages_custom.reports_page import reports_app
-from pages_custom.settings_page import settings_app
-from utils.auth import validate_pin, can_access_page, is_admin
-from utils.logger import log_event
+# Pages (and pandas/docx/PIL/altair behind them) load on first navigation
+# through utils/page_registry.py, so the PIN screen renders without them
+from utils.settings import get_setting
+from utils import profiler
+from utils import http_side
+from utils import page_registry
+from utils import session_memory
 import re
+import time
 from pathlib import Path
 
+_run_started = time.perf_counter()
+profiler.begin_run()
+
 # ===========================
 # THEME ENGINE (Light/Dark Toggle)
 # ===========================
@@ -117,27 +118,328 @@ dark_css = """
 </style>
 """
 
+# App-wide layout CSS (theme independent)
+APP_BASE_CSS = """
+<style>
+:root { 
+    --brand-blue:#0a84ff; /* kept for nav highlights */
+    --accent:#0a84ff; --accent-light:#5ac8fa; 
+    --ink:#1d1d1f; --sub:#6e6e73; 
+    --glass:rgba(255,255,255,.95); --glass-border:rgba(0,0,0,.06);
+    --text-primary:#1d1d1f;
+}
+[data-testid="stAppViewContainer"] {
+    background: linear-gradient(180deg,#fafafa 0%,#f0f0f5 100%);
+    font-family: "SF Pro Display", -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif;
+    color: var(--text-primary);
+}
+[data-testid="stHeader"] { background-color: transparent; }
+
+.hero-card{
+    background: linear-gradient(135deg, rgba(255,255,255,.95) 0%, rgba(248,248,252,.92) 100%);
+    border: 1px solid var(--glass-border);
+    border-radius: 24px;
+    padding: 28px 32px;
+    box-shadow: 0 2px 8px rgba(0,0,0,.04), 0 12px 32px rgba(0,0,0,.08);
+    backdrop-filter: blur(20px);
+    margin-bottom: 18px;
+    overflow: visible;
+    position: relative;
+}
+
+/* New header layout: left (page title) | center (nav buttons) | right (logo) */
+.header-container{
+    display: flex;
+    align-items: center;
+    justify-content: space-between;
+    gap: 24px;
+    margin-bottom: 12px;
+    min-height: 80px;
+}
+
+.page-title-section{
+    flex: 0 0 auto;
+    min-width: 200px;
+}
+
+.page-title{
+    font-size: 28px;
+    font-weight: 700;
+    color: var(--text-primary);
+    margin: 0;
+    line-height: 1.2;
+}
+
+.page-subtitle{
+    font-size: 14px;
+    color: #6e6e73;
+    margin: 4px 0 0 0;
+}
+
+.nav-buttons-section{
+    flex: 1;
+    display: flex;
+    justify-content: center;
+    gap: 12px;
+}
+
+.logo-section{
+    flex: 0 0 auto;
+    display: flex;
+    align-items: center;
+    justify-content: flex-end;
+    min-width: 200px;
+    position: absolute;
+    right: -30px;
+    top: 50%;
+    transform: translateY(-50%);
+}
+
+.logo-badge{
+    width: 350px;
+    height: auto;
+    max-height: none;
+}
+
+/* Compact vertical rhythm */
+[data-testid="block-container"]{ padding-top: 4px !important; }
+div[data-testid="element-container"]{ margin-bottom: 6px !important; }
+[data-testid="stButton"]{ margin-bottom: 0 !important; }
+
+/* Global compact buttons (match Invoice page sizing) */
+[data-testid="stButton"] > button{
+    background: linear-gradient(145deg,#ffffff 0%,#f9f9fb 100%) !important;
+    border: 1px solid rgba(0,0,0,.08) !important;
+    border-radius: 12px !important;
+    padding: 8px 16px !important;
+    font-size: 13px !important;
+    font-weight: 600 !important;
+    color: var(--ink) !important;
+    box-shadow: 0 2px 6px rgba(0,0,0,.05) !important;
+    transition: all .18s ease !important;
+    white-space: nowrap !important;
+}
+[data-testid="stButton"] > button:hover{
+    transform: translateY(-2px) !important;
+    box-shadow: 0 6px 14px rgba(0,0,0,.12) !important;
+}
+
+/* Uniform compact sizing for top nav buttons (4 cards) */
+button[key^="nav_"]{
+    min-height: 44px !important;
+    height: 44px !important;
+    padding: 6px 14px !important;
+    display: flex !important;
+    align-items: center !important;
+    justify-content: center !important;
+    border-radius: 12px !important;
+    white-space: nowrap !important;
+    font-size: 13px !important;
+    line-height: 1 !important;
+}
+/* Sidebar items consistent height as well */
+button[key^="sidenav_"]{
+    min-height: 44px !important;
+    height: 44px !important;
+    display: flex !important;
+    align-items: center !important;
+    justify-content: center !important;
+    border-radius: 12px !important;
+    font-size: 0.93rem !important;
+}
+
+/* Global form controls to match Invoice  pages */
+/* جميع الحقول تعتمد فقط على متغيرات الثيم */
+[data-testid="stTextInput"] input,
+[data-testid="stNumberInput"] input,
+[data-testid="stSelectbox"] select{
+    background: var(--bg-input) !important;
+    border: 1px solid var(--border) !important;
+    color: var(--text) !important;
+    border-radius: 12px !important;
+    padding: 10px 14px !important;
+    font-size: 14px !important;
+    box-shadow: 0 2px 6px rgba(0,0,0,.04) !important;
+    height: 40px !important;
+    outline: none !important;
+    transition: border-color .12s ease, box-shadow .12s ease !important;
+}
+[data-testid="stTextInput"] input:focus,
+[data-testid="stNumberInput"] input:focus,
+[data-testid="stSelectbox"] select:focus {
+    border-color: var(--accent) !important;
+    box-shadow: 0 0 0 3px rgba(10,132,255,.12) !important;
+}
+[data-testid="stTextInput"] input::placeholder,
+[data-testid="stNumberInput"] input::placeholder{
+    color: #9ca3af !important;
+    opacity: 1 !important;
+}
+.stSelectbox div[data-baseweb="select"],
+.stSelectbox div[role="combobox"],
+.stSelectbox div[role="listbox"],
+.stSelectbox [role="option"]{
+    background: var(--bg-input) !important;
+    color: var(--text-primary) !important;
+}
+.stSelectbox div[data-baseweb="select"] > div,
+.stSelectbox div[role="combobox"] > div{
+    background: var(--bg-input) !important;
+}
+.stSelectbox div[data-baseweb="select"]:focus-within,
+.stSelectbox div[role="combobox"]:focus-within{
+    background: var(--bg-input) !important;
+}
+.stSelectbox svg{ color: var(--text-soft) !important; }
+/* أزرار + و - تعتمد فقط على متغيرات الثيم */
+[data-testid="stNumberInput"] button {
+    background: var(--bg-card) !important;
+    border: 1px solid var(--border) !important;
+    color: var(--text) !important;
+    border-radius: 8px !important;
+    transition: background .15s;
+}
+[data-testid="stNumberInput"] button:hover {
+    background: var(--bg-input) !important;
+}
+.stSelectbox [role="option"][aria-selected="true"]{
+    background:#f3f4f6 !important;
+    color: var(--text-primary) !important;
+}
+
+/* Common utility classes from Invoice theme */
+.section-title{ font-size:20px; font-weight:700; margin:18px 0 10px; color:var(--ink); }
+.added-product-row{
+    background:#ffffff; padding:10px 14px; border:1px solid rgba(0,0,0,.08);
+    border-radius:12px; margin-bottom:6px; box-shadow:0 2px 6px rgba(0,0,0,.05);
+}
+.product-header{
+    display:flex; gap:1rem; padding:8px 0 12px;
+    border-bottom:1px solid rgba(0,0,0,.08); background:transparent;
+    font-size:11px; font-weight:600; letter-spacing:.06em; text-transform:uppercase; color:#86868b;
+    margin-bottom:10px; align-items:center;
+}
+.product-header span{text-align:center;}
+.product-header span:nth-child(1){flex:4.5; text-align:left;}
+.product-header span:nth-child(2){flex:0.7;}
+.product-header span:nth-child(3){flex:1;}
+.product-header span:nth-child(4){flex:1;}
+.product-header span:nth-child(5){flex:0.7;}
+.product-header span:nth-child(6){flex:0.7;}
+</style>
+"""
+
+# Base color mapping using variables (colors only; no sizes changed)
+THEME_VARS_CSS = """
+<style>
+[data-testid="stAppViewContainer"] { background: var(--bg-primary) !important; color: var(--text) !important; }
+[data-testid="stHeader"] { color: var(--text) !important; }
+[data-testid="stSidebar"] { background: var(--bg-sidebar) !important; color: var(--text) !important; }
+
+.page-subtitle { color: var(--text-soft) !important; }
+.hero-card { background: var(--bg-card) !important; border: 1px solid var(--border-soft) !important; color: var(--text) !important; }
+
+/* Generic buttons (neutral). Keep geometry elsewhere; colors from variables */
+[data-testid=stButton] > button { background: var(--bg-card) !important; color: var(--text) !important; border: 1px solid var(--border) !important; }
+[data-testid=stButton] > button:hover { background: var(--button-hover) !important; color: #ffffff !important; }
+
+/* Nav buttons (default neutral, active accent) */
+button[key^="nav_"] { background: var(--bg-card) !important; color: var(--text) !important; border: 1px solid var(--border) !important; }
+button[key^="nav_"]:hover { background: var(--button-hover) !important; color: #ffffff !important; }
+
+/* Sidebar buttons (default neutral, active accent set below) */
+button[key^="sidenav_"] { background: var(--bg-card) !important; color: var(--text) !important; border: 1px solid var(--border) !important; }
+button[key^="sidenav_"]:hover { background: var(--button-hover) !important; color: #ffffff !important; }
+
+/* Inputs */
+[data-testid="stTextInput"] input,
+[data-testid="stNumberInput"] input,
+[data-testid="stSelectbox"] select,
+textarea, input, select {
+    background: var(--bg-input) !important; color: var(--text) !important; border: 1px solid var(--border) !important;
+}
+[data-testid="stTextInput"] input::placeholder,
+[data-testid="stNumberInput"] input::placeholder { color: var(--text-soft) !important; }
+
+/* Streamlit Selectbox (BaseWeb) — ensure dropdown and control use variables */
+.stSelectbox div[data-baseweb="select"],
+.stSelectbox div[role="combobox"] {
+    background: var(--bg-input) !important;
+    color: var(--text) !important;
+    border: 1px solid var(--border) !important;
+}
+.stSelectbox div[data-baseweb="select"]:focus-within,
+.stSelectbox div[role="combobox"]:focus-within {
+    border-color: var(--accent) !important;
+}
+.stSelectbox svg { color: var(--text) !important; }
+.stSelectbox [role="listbox"],
+.stSelectbox [role="option"],
+[data-baseweb="menu"],
+[data-baseweb="popover"] [role="listbox"] {
+    background: var(--bg-card) !important;
+    color: var(--text) !important;
+    border: 1px solid var(--border) !important;
+}
+.stSelectbox [role="option"][aria-selected="true"],
+.stSelectbox [role="option"]:hover {
+    background: var(--button-hover) !important;
+    color: #ffffff !important;
+}
+.stSelectbox [aria-placeholder="true"],
+.stSelectbox [data-baseweb="select"] [class*="placeholder"],
+.stSelectbox [role="combobox"] [class*="placeholder"] {
+    color: var(--text-soft) !important;
+}
+
+/* Horizontal rule under subheaders or sections */
+[data-testid="stMarkdownContainer"] hr, hr { border: none !important; border-top: 1px solid var(--border-soft) !important; }
+
+/* Tables */
+[data-testid="stTable"] table { background: var(--bg-card) !important; color: var(--text) !important; }
+[data-testid="stTable"] th { color: var(--text-soft) !important; border-bottom: 1px solid var(--border) !important; }
+[data-testid="stTable"] td { color: var(--text) !important; border-bottom: 1px solid var(--border-soft) !important; }
+
+/* Utility */
+.section-title { color: var(--text) !important; }
+.added-product-row { background: var(--bg-card) !important; border: 1px solid var(--border-soft) !important; color: var(--text) !important; }
+.product-header { border-bottom: 1px solid var(--border-soft) !important; color: var(--text-soft) !important; }
+</style>
+"""
+
+
+@st.cache_resource
+def _app_css(theme):
+    """Combine base, theme and color-mapping CSS once per theme."""
+    # Theme goes AFTER app base CSS so theme wins in cascade
+    theme_css = light_css if theme == "light" else dark_css
+    return "\n".join([APP_BASE_CSS, theme_css, THEME_VARS_CSS])
+
+
 def inject_theme():
-    """Inject the currently selected theme CSS."""
-    if st.session_state.ui_theme == "light":
-        st.markdown(light_css, unsafe_allow_html=True)
-    else:
-        st.markdown(dark_css, unsafe_allow_html=True)
+    """Inject the app stylesheet for the currently selected theme."""
+    st.markdown(_app_css(st.session_state.ui_theme), unsafe_allow_html=True)
+
 
 
 st.set_page_config(page_title="Newton Smart Home OS", layout="wide")
 
 
-def template_health_check():
+@st.cache_resource
+def _scan_templates():
     """Scan `templates/` for missing expected templates and simple Jinja issues.
 
     Detects:
     - Missing expected template files
     - Unbalanced '{{' vs '}}' occurrences
     - '{{ ... }}' print blocks that contain a '%' character (likely accidental)
+
+    Cached per process: templates only change on deploy, so the regex scan
+    does not need to repeat on every rerun.
     """
     tpl_dir = Path(__file__).resolve().parents[0] / 'templates'
     expected = [
+        'base_A4.html',
         'newton_invoice_A4.html',
         'newton_quotation_A4.html',
         'newton_receipt_A4.html',
@@ -150,7 +452,7 @@ def template_health_check():
             if not (tpl_dir / name).exists():
                 issues.append(f"Missing template: {name}")
 
-        for p in sorted(tpl_dir.glob('*.html')):
+        for p in sorted(tpl_dir.glob('*.html')) + sorted(tpl_dir.glob('partials/*.html')):
             try:
                 txt = p.read_text(encoding='utf-8')
             except Exception as e:
@@ -170,6 +472,12 @@ def template_health_check():
         print("TEMPLATE HEALTH CHECK FOUND ISSUES:")
         for it in issues:
             print(" - ", it)
+    return issues
+
+
+def template_health_check():
+    """Warn in the UI when the (cached) template scan found problems."""
+    if _scan_templates():
         try:
             # Show warnings in the Streamlit UI so users see issues early
             st.warning("Template health check found issues. Open console for details.")
@@ -180,6 +488,28 @@ def template_health_check():
 # Run template health check early so problems are visible on startup
 template_health_check()
 
+
+@st.cache_resource
+def _init_instrumentation():
+    """Apply the saved profiling switch and start the metrics endpoint once per process."""
+    if get_setting("profiling_enabled", False):
+        profiler.set_enabled(True)
+    if profiler.is_enabled():
+        http_side.ensure_server()
+    return True
+
+
+_init_instrumentation()
+
+
+@st.cache_resource
+def _init_warmup():
+    """Start the background warm-up (caches, templates, PDF engines) once per process."""
+    from utils import warmup
+    warmup.start()
+    return True
+
+
 # ===========================
 # PIN LOGIN SYSTEM
 # ===========================
@@ -220,6 +550,8 @@ if not st.session_state.authenticated:
             st.rerun()
         
         if st.button("Login", use_container_width=True):
+            from utils.auth import validate_pin
+            from utils.logger import log_event
             user_data = validate_pin(pin_input)
             if user_data:
                 st.session_state.authenticated = True
@@ -233,311 +565,20 @@ if not st.session_state.authenticated:
         
         st.markdown("<div style='text-align:center; margin-top:40px; color:var(--text-soft); font-size:12px;'>Default PINs: Admin=1234, Staff=5678, Viewer=9999</div>", unsafe_allow_html=True)
     
+    # Warm up while the user types their PIN; the screen above is already rendered
+    _init_warmup()
     st.stop()
 
 # User is authenticated - continue with app
+from utils.auth import can_access_page
+from utils.logger import log_event
 
-# Load logo as data URI
-
-
+# No-op unless this session skipped the PIN screen
+_init_warmup()
 
-st.markdown(
-    """
-    <style>
-    :root { 
-        --brand-blue:#0a84ff; /* kept for nav highlights */
-        --accent:#0a84ff; --accent-light:#5ac8fa; 
-        --ink:#1d1d1f; --sub:#6e6e73; 
-        --glass:rgba(255,255,255,.95); --glass-border:rgba(0,0,0,.06);
-        --text-primary:#1d1d1f;
-    }
-    [data-testid="stAppViewContainer"] {
-        background: linear-gradient(180deg,#fafafa 0%,#f0f0f5 100%);
-        font-family: "SF Pro Display", -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif;
-        color: var(--text-primary);
-    }
-    [data-testid="stHeader"] { background-color: transparent; }
-
-    .hero-card{
-        background: linear-gradient(135deg, rgba(255,255,255,.95) 0%, rgba(248,248,252,.92) 100%);
-        border: 1px solid var(--glass-border);
-        border-radius: 24px;
-        padding: 28px 32px;
-        box-shadow: 0 2px 8px rgba(0,0,0,.04), 0 12px 32px rgba(0,0,0,.08);
-        backdrop-filter: blur(20px);
-        margin-bottom: 18px;
-        overflow: visible;
-        position: relative;
-    }
-
-    /* New header layout: left (page title) | center (nav buttons) | right (logo) */
-    .header-container{
-        display: flex;
-        align-items: center;
-        justify-content: space-between;
-        gap: 24px;
-        margin-bottom: 12px;
-        min-height: 80px;
-    }
-    
-    .page-title-section{
-        flex: 0 0 auto;
-        min-width: 200px;
-    }
-    
-    .page-title{
-        font-size: 28px;
-        font-weight: 700;
-        color: var(--text-primary);
-        margin: 0;
-        line-height: 1.2;
-    }
-    
-    .page-subtitle{
-        font-size: 14px;
-        color: #6e6e73;
-        margin: 4px 0 0 0;
-    }
-    
-    .nav-buttons-section{
-        flex: 1;
-        display: flex;
-        justify-content: center;
-        gap: 12px;
-    }
-    
-    .logo-section{
-        flex: 0 0 auto;
-        display: flex;
-        align-items: center;
-        justify-content: flex-end;
-        min-width: 200px;
-        position: absolute;
-        right: -30px;
-        top: 50%;
-        transform: translateY(-50%);
-    }
-    
-    .logo-badge{
-        width: 350px;
-        height: auto;
-        max-height: none;
-    }
-
-    /* Compact vertical rhythm */
-    [data-testid="block-container"]{ padding-top: 4px !important; }
-    div[data-testid="element-container"]{ margin-bottom: 6px !important; }
-    [data-testid="stButton"]{ margin-bottom: 0 !important; }
-
-    /* Global compact buttons (match Invoice page sizing) */
-    [data-testid="stButton"] > button{
-        background: linear-gradient(145deg,#ffffff 0%,#f9f9fb 100%) !important;
-        border: 1px solid rgba(0,0,0,.08) !important;
-        border-radius: 12px !important;
-        padding: 8px 16px !important;
-        font-size: 13px !important;
-        font-weight: 600 !important;
-        color: var(--ink) !important;
-        box-shadow: 0 2px 6px rgba(0,0,0,.05) !important;
-        transition: all .18s ease !important;
-        white-space: nowrap !important;
-    }
-    [data-testid="stButton"] > button:hover{
-        transform: translateY(-2px) !important;
-        box-shadow: 0 6px 14px rgba(0,0,0,.12) !important;
-    }
-
-    /* Uniform compact sizing for top nav buttons (4 cards) */
-    button[key^="nav_"]{
-        min-height: 44px !important;
-        height: 44px !important;
-        padding: 6px 14px !important;
-        display: flex !important;
-        align-items: center !important;
-        justify-content: center !important;
-        border-radius: 12px !important;
-        white-space: nowrap !important;
-        font-size: 13px !important;
-        line-height: 1 !important;
-    }
-    /* Sidebar items consistent height as well */
-    button[key^="sidenav_"]{
-        min-height: 44px !important;
-        height: 44px !important;
-        display: flex !important;
-        align-items: center !important;
-        justify-content: center !important;
-        border-radius: 12px !important;
-        font-size: 0.93rem !important;
-    }
-
-    /* Global form controls to match Invoice  pages */
-    /* جميع الحقول تعتمد فقط على متغيرات الثيم */
-    [data-testid="stTextInput"] input,
-    [data-testid="stNumberInput"] input,
-    [data-testid="stSelectbox"] select{
-        background: var(--bg-input) !important;
-        border: 1px solid var(--border) !important;
-        color: var(--text) !important;
-        border-radius: 12px !important;
-        padding: 10px 14px !important;
-        font-size: 14px !important;
-        box-shadow: 0 2px 6px rgba(0,0,0,.04) !important;
-        height: 40px !important;
-        outline: none !important;
-        transition: border-color .12s ease, box-shadow .12s ease !important;
-    }
-    [data-testid="stTextInput"] input:focus,
-    [data-testid="stNumberInput"] input:focus,
-    [data-testid="stSelectbox"] select:focus {
-        border-color: var(--accent) !important;
-        box-shadow: 0 0 0 3px rgba(10,132,255,.12) !important;
-    }
-    [data-testid="stTextInput"] input::placeholder,
-    [data-testid="stNumberInput"] input::placeholder{
-        color: #9ca3af !important;
-        opacity: 1 !important;
-    }
-    .stSelectbox div[data-baseweb="select"],
-    .stSelectbox div[role="combobox"],
-    .stSelectbox div[role="listbox"],
-    .stSelectbox [role="option"]{
-        background: var(--bg-input) !important;
-        color: var(--text-primary) !important;
-    }
-    .stSelectbox div[data-baseweb="select"] > div,
-    .stSelectbox div[role="combobox"] > div{
-        background: var(--bg-input) !important;
-    }
-    .stSelectbox div[data-baseweb="select"]:focus-within,
-    .stSelectbox div[role="combobox"]:focus-within{
-        background: var(--bg-input) !important;
-    }
-    .stSelectbox svg{ color: var(--text-soft) !important; }
-    /* أزرار + و - تعتمد فقط على متغيرات الثيم */
-    [data-testid="stNumberInput"] button {
-        background: var(--bg-card) !important;
-        border: 1px solid var(--border) !important;
-        color: var(--text) !important;
-        border-radius: 8px !important;
-        transition: background .15s;
-    }
-    [data-testid="stNumberInput"] button:hover {
-        background: var(--bg-input) !important;
-    }
-    .stSelectbox [role="option"][aria-selected="true"]{
-        background:#f3f4f6 !important;
-        color: var(--text-primary) !important;
-    }
-
-    /* Common utility classes from Invoice theme */
-    .section-title{ font-size:20px; font-weight:700; margin:18px 0 10px; color:var(--ink); }
-    .added-product-row{
-        background:#ffffff; padding:10px 14px; border:1px solid rgba(0,0,0,.08);
-        border-radius:12px; margin-bottom:6px; box-shadow:0 2px 6px rgba(0,0,0,.05);
-    }
-    .product-header{
-        display:flex; gap:1rem; padding:8px 0 12px;
-        border-bottom:1px solid rgba(0,0,0,.08); background:transparent;
-        font-size:11px; font-weight:600; letter-spacing:.06em; text-transform:uppercase; color:#86868b;
-        margin-bottom:10px; align-items:center;
-    }
-    .product-header span{text-align:center;}
-    .product-header span:nth-child(1){flex:4.5; text-align:left;}
-    .product-header span:nth-child(2){flex:0.7;}
-    .product-header span:nth-child(3){flex:1;}
-    .product-header span:nth-child(4){flex:1;}
-    .product-header span:nth-child(5){flex:0.7;}
-    .product-header span:nth-child(6){flex:0.7;}
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
-
-# Inject the selected theme AFTER app base CSS so theme wins in cascade
+# Inject app CSS (base layout + selected theme + color mapping) as one element
 inject_theme()
 
-# Base color mapping using variables (colors only; no sizes changed)
-st.markdown(
-    """
-    <style>
-    [data-testid="stAppViewContainer"] { background: var(--bg-primary) !important; color: var(--text) !important; }
-    [data-testid="stHeader"] { color: var(--text) !important; }
-    [data-testid="stSidebar"] { background: var(--bg-sidebar) !important; color: var(--text) !important; }
-
-    .page-subtitle { color: var(--text-soft) !important; }
-    .hero-card { background: var(--bg-card) !important; border: 1px solid var(--border-soft) !important; color: var(--text) !important; }
-
-    /* Generic buttons (neutral). Keep geometry elsewhere; colors from variables */
-    [data-testid=stButton] > button { background: var(--bg-card) !important; color: var(--text) !important; border: 1px solid var(--border) !important; }
-    [data-testid=stButton] > button:hover { background: var(--button-hover) !important; color: #ffffff !important; }
-
-    /* Nav buttons (default neutral, active accent) */
-    button[key^="nav_"] { background: var(--bg-card) !important; color: var(--text) !important; border: 1px solid var(--border) !important; }
-    button[key^="nav_"]:hover { background: var(--button-hover) !important; color: #ffffff !important; }
-
-    /* Sidebar buttons (default neutral, active accent set below) */
-    button[key^="sidenav_"] { background: var(--bg-card) !important; color: var(--text) !important; border: 1px solid var(--border) !important; }
-    button[key^="sidenav_"]:hover { background: var(--button-hover) !important; color: #ffffff !important; }
-
-    /* Inputs */
-    [data-testid="stTextInput"] input,
-    [data-testid="stNumberInput"] input,
-    [data-testid="stSelectbox"] select,
-    textarea, input, select {
-        background: var(--bg-input) !important; color: var(--text) !important; border: 1px solid var(--border) !important;
-    }
-    [data-testid="stTextInput"] input::placeholder,
-    [data-testid="stNumberInput"] input::placeholder { color: var(--text-soft) !important; }
-
-    /* Streamlit Selectbox (BaseWeb) — ensure dropdown and control use variables */
-    .stSelectbox div[data-baseweb="select"],
-    .stSelectbox div[role="combobox"] {
-        background: var(--bg-input) !important;
-        color: var(--text) !important;
-        border: 1px solid var(--border) !important;
-    }
-    .stSelectbox div[data-baseweb="select"]:focus-within,
-    .stSelectbox div[role="combobox"]:focus-within {
-        border-color: var(--accent) !important;
-    }
-    .stSelectbox svg { color: var(--text) !important; }
-    .stSelectbox [role="listbox"],
-    .stSelectbox [role="option"],
-    [data-baseweb="menu"],
-    [data-baseweb="popover"] [role="listbox"] {
-        background: var(--bg-card) !important;
-        color: var(--text) !important;
-        border: 1px solid var(--border) !important;
-    }
-    .stSelectbox [role="option"][aria-selected="true"],
-    .stSelectbox [role="option"]:hover {
-        background: var(--button-hover) !important;
-        color: #ffffff !important;
-    }
-    .stSelectbox [aria-placeholder="true"],
-    .stSelectbox [data-baseweb="select"] [class*="placeholder"],
-    .stSelectbox [role="combobox"] [class*="placeholder"] {
-        color: var(--text-soft) !important;
-    }
-
-    /* Horizontal rule under subheaders or sections */
-    [data-testid="stMarkdownContainer"] hr, hr { border: none !important; border-top: 1px solid var(--border-soft) !important; }
-
-    /* Tables */
-    [data-testid="stTable"] table { background: var(--bg-card) !important; color: var(--text) !important; }
-    [data-testid="stTable"] th { color: var(--text-soft) !important; border-bottom: 1px solid var(--border) !important; }
-    [data-testid="stTable"] td { color: var(--text) !important; border-bottom: 1px solid var(--border-soft) !important; }
-
-    /* Utility */
-    .section-title { color: var(--text) !important; }
-    .added-product-row { background: var(--bg-card) !important; border: 1px solid var(--border-soft) !important; color: var(--text) !important; }
-    .product-header { border-bottom: 1px solid var(--border-soft) !important; color: var(--text-soft) !important; }
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
-
 if "active_page" not in st.session_state:
     st.session_state.active_page = "dashboard"
 
@@ -568,7 +609,8 @@ ICON_MAP = {
     "light": "☀️",
 }
 
-# Load logo as data URI
+# Load logo as data URI (read and encoded once per process)
+@st.cache_resource
 def _load_logo_datauri():
     candidates = ["data/newton_logo.png", "data/newton_logo.svg", "data/logo.png", "data/logo.svg"]
     base = os.path.dirname(__file__)
@@ -584,332 +626,6 @@ def _load_logo_datauri():
             return f"data:{mime};base64,{data}"
     return None
 
-st.markdown(
-    """
-    <style>
-    :root { 
-        --brand-blue:#0a84ff; /* kept for nav highlights */
-        --accent:#0a84ff; --accent-light:#5ac8fa; 
-        --ink:#1d1d1f; --sub:#6e6e73; 
-        --glass:rgba(255,255,255,.95); --glass-border:rgba(0,0,0,.06);
-        --text-primary:#1d1d1f;
-    }
-    [data-testid="stAppViewContainer"] {
-        background: linear-gradient(180deg,#fafafa 0%,#f0f0f5 100%);
-        font-family: "SF Pro Display", -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif;
-        color: var(--text-primary);
-    }
-    [data-testid="stHeader"] { background-color: transparent; }
-
-    .hero-card{
-        background: linear-gradient(135deg, rgba(255,255,255,.95) 0%, rgba(248,248,252,.92) 100%);
-        border: 1px solid var(--glass-border);
-        border-radius: 24px;
-        padding: 28px 32px;
-        box-shadow: 0 2px 8px rgba(0,0,0,.04), 0 12px 32px rgba(0,0,0,.08);
-        backdrop-filter: blur(20px);
-        margin-bottom: 18px;
-        overflow: visible;
-        position: relative;
-    }
-
-    /* New header layout: left (page title) | center (nav buttons) | right (logo) */
-    .header-container{
-        display: flex;
-        align-items: center;
-        justify-content: space-between;
-        gap: 24px;
-        margin-bottom: 12px;
-        min-height: 80px;
-    }
-    
-    .page-title-section{
-        flex: 0 0 auto;
-        min-width: 200px;
-    }
-    
-    .page-title{
-        font-size: 28px;
-        font-weight: 700;
-        color: var(--text-primary);
-        margin: 0;
-        line-height: 1.2;
-    }
-    
-    .page-subtitle{
-        font-size: 14px;
-        color: #6e6e73;
-        margin: 4px 0 0 0;
-    }
-    
-    .nav-buttons-section{
-        flex: 1;
-        display: flex;
-        justify-content: center;
-        gap: 12px;
-    }
-    
-    .logo-section{
-        flex: 0 0 auto;
-        display: flex;
-        align-items: center;
-        justify-content: flex-end;
-        min-width: 200px;
-        position: absolute;
-        right: -30px;
-        top: 50%;
-        transform: translateY(-50%);
-    }
-    
-    .logo-badge{
-        width: 350px;
-        height: auto;
-        max-height: none;
-    }
-
-    /* Compact vertical rhythm */
-    [data-testid="block-container"]{ padding-top: 4px !important; }
-    div[data-testid="element-container"]{ margin-bottom: 6px !important; }
-    [data-testid="stButton"]{ margin-bottom: 0 !important; }
-
-    /* Global compact buttons (match Invoice page sizing) */
-    [data-testid="stButton"] > button{
-        background: linear-gradient(145deg,#ffffff 0%,#f9f9fb 100%) !important;
-        border: 1px solid rgba(0,0,0,.08) !important;
-        border-radius: 12px !important;
-        padding: 8px 16px !important;
-        font-size: 13px !important;
-        font-weight: 600 !important;
-        color: var(--ink) !important;
-        box-shadow: 0 2px 6px rgba(0,0,0,.05) !important;
-        transition: all .18s ease !important;
-        white-space: nowrap !important;
-    }
-    [data-testid="stButton"] > button:hover{
-        transform: translateY(-2px) !important;
-        box-shadow: 0 6px 14px rgba(0,0,0,.12) !important;
-    }
-
-    /* Uniform compact sizing for top nav buttons (4 cards) */
-    button[key^="nav_"]{
-        min-height: 44px !important;
-        height: 44px !important;
-        padding: 6px 14px !important;
-        display: flex !important;
-        align-items: center !important;
-        justify-content: center !important;
-        border-radius: 12px !important;
-        white-space: nowrap !important;
-        font-size: 13px !important;
-        line-height: 1 !important;
-    }
-    /* Sidebar items consistent height as well */
-    button[key^="sidenav_"]{
-        min-height: 44px !important;
-        height: 44px !important;
-        display: flex !important;
-        align-items: center !important;
-        justify-content: center !important;
-        border-radius: 12px !important;
-        font-size: 0.93rem !important;
-    }
-
-    /* Global form controls to match Invoice  pages */
-    /* جميع الحقول تعتمد فقط على متغيرات الثيم */
-    [data-testid="stTextInput"] input,
-    [data-testid="stNumberInput"] input,
-    [data-testid="stSelectbox"] select{
-        background: var(--bg-input) !important;
-        border: 1px solid var(--border) !important;
-        color: var(--text) !important;
-        border-radius: 12px !important;
-        padding: 10px 14px !important;
-        font-size: 14px !important;
-        box-shadow: 0 2px 6px rgba(0,0,0,.04) !important;
-        height: 40px !important;
-        outline: none !important;
-        transition: border-color .12s ease, box-shadow .12s ease !important;
-    }
-    [data-testid="stTextInput"] input:focus,
-    [data-testid="stNumberInput"] input:focus,
-    [data-testid="stSelectbox"] select:focus {
-        border-color: var(--accent) !important;
-        box-shadow: 0 0 0 3px rgba(10,132,255,.12) !important;
-    }
-    [data-testid="stTextInput"] input::placeholder,
-    [data-testid="stNumberInput"] input::placeholder{
-        color: #9ca3af !important;
-        opacity: 1 !important;
-    }
-    .stSelectbox div[data-baseweb="select"],
-    .stSelectbox div[role="combobox"],
-    .stSelectbox div[role="listbox"],
-    .stSelectbox [role="option"]{
-        background: var(--bg-input) !important;
-        color: var(--text-primary) !important;
-    }
-    .stSelectbox div[data-baseweb="select"] > div,
-    .stSelectbox div[role="combobox"] > div{
-        background: var(--bg-input) !important;
-    }
-    .stSelectbox div[data-baseweb="select"]:focus-within,
-    .stSelectbox div[role="combobox"]:focus-within{
-        background: var(--bg-input) !important;
-    }
-    .stSelectbox svg{ color: var(--text-soft) !important; }
-    /* أزرار + و - تعتمد فقط على متغيرات الثيم */
-    [data-testid="stNumberInput"] button {
-        background: var(--bg-card) !important;
-        border: 1px solid var(--border) !important;
-        color: var(--text) !important;
-        border-radius: 8px !important;
-        transition: background .15s;
-    }
-    [data-testid="stNumberInput"] button:hover {
-        background: var(--bg-input) !important;
-    }
-    .stSelectbox [role="option"][aria-selected="true"]{
-        background:#f3f4f6 !important;
-        color: var(--text-primary) !important;
-    }
-
-    /* Common utility classes from Invoice theme */
-    .section-title{ font-size:20px; font-weight:700; margin:18px 0 10px; color:var(--ink); }
-    .added-product-row{
-        background:#ffffff; padding:10px 14px; border:1px solid rgba(0,0,0,.08);
-        border-radius:12px; margin-bottom:6px; box-shadow:0 2px 6px rgba(0,0,0,.05);
-    }
-    .product-header{
-        display:flex; gap:1rem; padding:8px 0 12px;
-        border-bottom:1px solid rgba(0,0,0,.08); background:transparent;
-        font-size:11px; font-weight:600; letter-spacing:.06em; text-transform:uppercase; color:#86868b;
-        margin-bottom:10px; align-items:center;
-    }
-    .product-header span{text-align:center;}
-    .product-header span:nth-child(1){flex:4.5; text-align:left;}
-    .product-header span:nth-child(2){flex:0.7;}
-    .product-header span:nth-child(3){flex:1;}
-    .product-header span:nth-child(4){flex:1;}
-    .product-header span:nth-child(5){flex:0.7;}
-    .product-header span:nth-child(6){flex:0.7;}
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
-
-# Inject the selected theme AFTER app base CSS so theme wins in cascade
-inject_theme()
-
-# Base color mapping using variables (colors only; no sizes changed)
-st.markdown(
-    """
-    <style>
-    [data-testid="stAppViewContainer"] { background: var(--bg-primary) !important; color: var(--text) !important; }
-    [data-testid="stHeader"] { color: var(--text) !important; }
-    [data-testid="stSidebar"] { background: var(--bg-sidebar) !important; color: var(--text) !important; }
-
-    .page-subtitle { color: var(--text-soft) !important; }
-    .hero-card { background: var(--bg-card) !important; border: 1px solid var(--border-soft) !important; color: var(--text) !important; }
-
-    /* Generic buttons (neutral). Keep geometry elsewhere; colors from variables */
-    [data-testid=stButton] > button { background: var(--bg-card) !important; color: var(--text) !important; border: 1px solid var(--border) !important; }
-    [data-testid=stButton] > button:hover { background: var(--button-hover) !important; color: #ffffff !important; }
-
-    /* Nav buttons (default neutral, active accent) */
-    button[key^="nav_"] { background: var(--bg-card) !important; color: var(--text) !important; border: 1px solid var(--border) !important; }
-    button[key^="nav_"]:hover { background: var(--button-hover) !important; color: #ffffff !important; }
-
-    /* Sidebar buttons (default neutral, active accent set below) */
-    button[key^="sidenav_"] { background: var(--bg-card) !important; color: var(--text) !important; border: 1px solid var(--border) !important; }
-    button[key^="sidenav_"]:hover { background: var(--button-hover) !important; color: #ffffff !important; }
-
-    /* Inputs */
-    [data-testid="stTextInput"] input,
-    [data-testid="stNumberInput"] input,
-    [data-testid="stSelectbox"] select,
-    textarea, input, select {
-        background: var(--bg-input) !important; color: var(--text) !important; border: 1px solid var(--border) !important;
-    }
-    [data-testid="stTextInput"] input::placeholder,
-    [data-testid="stNumberInput"] input::placeholder { color: var(--text-soft) !important; }
-
-    /* Streamlit Selectbox (BaseWeb) — ensure dropdown and control use variables */
-    .stSelectbox div[data-baseweb="select"],
-    .stSelectbox div[role="combobox"] {
-        background: var(--bg-input) !important;
-        color: var(--text) !important;
-        border: 1px solid var(--border) !important;
-    }
-    .stSelectbox div[data-baseweb="select"]:focus-within,
-    .stSelectbox div[role="combobox"]:focus-within {
-        border-color: var(--accent) !important;
-    }
-    .stSelectbox svg { color: var(--text) !important; }
-    .stSelectbox [role="listbox"],
-    .stSelectbox [role="option"],
-    [data-baseweb="menu"],
-    [data-baseweb="popover"] [role="listbox"] {
-        background: var(--bg-card) !important;
-        color: var(--text) !important;
-        border: 1px solid var(--border) !important;
-    }
-    .stSelectbox [role="option"][aria-selected="true"],
-    .stSelectbox [role="option"]:hover {
-        background: var(--button-hover) !important;
-        color: #ffffff !important;
-    }
-    .stSelectbox [aria-placeholder="true"],
-    .stSelectbox [data-baseweb="select"] [class*="placeholder"],
-    .stSelectbox [role="combobox"] [class*="placeholder"] {
-        color: var(--text-soft) !important;
-    }
-
-    /* Horizontal rule under subheaders or sections */
-    [data-testid="stMarkdownContainer"] hr, hr { border: none !important; border-top: 1px solid var(--border-soft) !important; }
-
-    /* Tables */
-    [data-testid="stTable"] table { background: var(--bg-card) !important; color: var(--text) !important; }
-    [data-testid="stTable"] th { color: var(--text-soft) !important; border-bottom: 1px solid var(--border) !important; }
-    [data-testid="stTable"] td { color: var(--text) !important; border-bottom: 1px solid var(--border-soft) !important; }
-
-    /* Utility */
-    .section-title { color: var(--text) !important; }
-    .added-product-row { background: var(--bg-card) !important; border: 1px solid var(--border-soft) !important; color: var(--text) !important; }
-    .product-header { border-bottom: 1px solid var(--border-soft) !important; color: var(--text-soft) !important; }
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
-
-if "active_page" not in st.session_state:
-    st.session_state.active_page = "dashboard"
-
-# Page titles mapping
-PAGE_TITLES = {
-    "dashboard": ("Newton Dashboard", "Monitor live analytics"),
-    "quotation": ("Newton Quotation", "Draft elegant proposals"),
-    "invoice": ("Newton Invoice", "Bill with confidence"),
-    "receipt": ("Newton Receipt", "Acknowledge payments"),
-    "customers": ("Customers", "Manage client accounts"),
-    "products": ("Products", "Manage catalog"),
-    "reports": ("Reports", "Business insights"),
-    "settings": ("Settings", "Configure application"),
-}
-
-# Single source of truth for emojis used across nav buttons
-ICON_MAP = {
-    "dashboard": "📊",
-    "quotation": "📝",
-    "invoice": "💳",
-    "receipt": "🧾",
-    "customers": "👥",
-    "products": "📦",
-    "reports": "📈",
-    "settings": "⚙️",
-    "logout": "🚪",
-    "dark": "🌙",
-    "light": "☀️",
-}
 
 # Load logo
 _logo_uri = _load_logo_datauri()
@@ -955,8 +671,13 @@ with st.sidebar:
         log_event(user_name, "System", "logout", f"User logged out")
         st.session_state.authenticated = False
         st.session_state.user = None
+        st.session_state._logged_page = None
         st.rerun()
     
+    _last_ms = st.session_state.get("last_run_ms")
+    if _last_ms is not None:
+        st.caption(f"Last full rerun: {_last_ms:.0f} ms")
+
     st.markdown("---")
     
     # Theme toggle
@@ -1035,24 +756,21 @@ if not can_access_page(user, current_page):
     st.markdown("Please contact an administrator if you need access to this page.")
     st.stop()
 
-# Log successful page access
-log_event(user.get("name", "Unknown"), current_page, "access_granted", f"Opened {current_page} page")
-
-if st.session_state.active_page == "dashboard":
-    dashboard_new_app()
-elif st.session_state.active_page == "quotation":
-    quotation_app()
-elif st.session_state.active_page == "invoice":
-    invoice_app()
-elif st.session_state.active_page == "receipt":
-    receipt_app()
-elif st.session_state.active_page == "customers":
-    customers_app()
-elif st.session_state.active_page == "products":
-    products_app()
-elif st.session_state.active_page == "reports":
-    reports_app()
-elif st.session_state.active_page == "settings":
-    settings_app()
-elif st.session_state.active_page == "settings":
-    settings_app()
+# Log successful page access once per visit, not on every widget rerun
+if st.session_state.get("_logged_page") != current_page:
+    log_event(user.get("name", "Unknown"), current_page, "access_granted", f"Opened {current_page} page")
+    st.session_state._logged_page = current_page
+
+page_app = page_registry.load_page(current_page)
+if page_app is not None:
+    with profiler.span(f"page.{current_page}"):
+        page_app()
+
+# Per-session memory figures for Settings > Performance (re-measured at most every few seconds)
+session_memory.track(st.session_state, user.get("name", ""))
+
+# Full-script rerun time; fragment reruns record their own in `fragment_ms`
+st.session_state.last_run_ms = (time.perf_counter() - _run_started) * 1000
+if profiler.is_enabled():
+    profiler.record("app.rerun", st.session_state.last_run_ms)
+st.session_state.last_run_profile = profiler.end_run()
@@ -2,6 +2,7 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
+from utils import storage
 try:
     from utils import db as _db
 except Exception:
@@ -97,12 +98,12 @@ def _metric(title, value, subtitle=None):
 def dashboard_new_app():
     _apply_dashboard_theme()
     _app_icon_grid()
-    # ربط البيانات مع Excel
-    def _load_or_empty(path, columns):
+    # ربط البيانات مع التخزين المحلي
+    def _load_or_empty(table, columns):
         df = None
         if _db is not None:
             try:
-                if path.endswith("records.xlsx"):
+                if table == "records":
                     rows = _db.db_query(
                         "SELECT base_id, date, type, number, amount, client_name, phone, location, note FROM records ORDER BY date"
                     )
@@ -115,7 +116,7 @@ def dashboard_new_app():
                             df["type"] = df["type"].astype(str).str.lower()
                         if "amount" in df.columns:
                             df["amount"] = pd.to_numeric(df["amount"], errors="coerce").fillna(0.0)
-                elif path.endswith("customers.xlsx"):
+                elif table == "customers":
                     rows = _db.db_query(
                         "SELECT name, phone, email, address FROM customers ORDER BY id"
                     )
@@ -127,7 +128,7 @@ def dashboard_new_app():
                 df = None
         if df is None:
             try:
-                df = pd.read_excel(path)
+                df = storage.read_table(table)
                 df.columns = [c.strip().lower() for c in df.columns]
             except Exception:
                 df = pd.DataFrame(columns=columns)
@@ -137,11 +138,11 @@ def dashboard_new_app():
         return df[columns]
 
     records = _load_or_empty(
-        "data/records.xlsx",
+        "records",
         ["base_id", "date", "type", "number", "amount", "client_name", "phone", "location", "note"],
     )
     customers = _load_or_empty(
-        "data/customers.xlsx",
+        "customers",
         ["client_name", "phone", "location", "last_activity", "status"],
     )
 
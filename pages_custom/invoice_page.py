@@ -1,12 +1,15 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-import os
-from docx import Document
 from io import BytesIO
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.shared import Pt
-from utils.quotation_utils import render_quotation_html
+from utils.quotation_utils import render_document_html
+from utils.settings import load_settings
+from utils.line_items import LineItem, catalog_image, ensure_table
+from utils.fragments import fragment, rerun_fragment, session_memo
+from utils.profiler import timed
+from utils import storage, docx_templates
+from utils.records import load_records, save_record
+from utils.customers import upsert_customer
 try:
     from utils import db as _db
 except Exception:
@@ -20,6 +23,27 @@ def proper_case(text):
         return text.title().strip()
     except:
         return text
+
+
+# ======================================================
+#      EXPORT WORD
+# ======================================================
+@timed("invoice.generate_word")
+def generate_word_invoice(template, data):
+    doc = docx_templates.load(template)
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                for k, v in data.items():
+                    if k in cell.text:
+                        safe_v = "" if v is None else str(v)
+                        cell.text = cell.text.replace(k, safe_v)
+    buf = BytesIO()
+    doc.save(buf)
+    buf.seek(0)
+    return buf
+
+
 def invoice_app():
     # Phone formatter (same logic as quotation)
     def format_phone_input(raw_input):
@@ -75,7 +99,7 @@ def invoice_app():
         # (Header hero removed by request)
 
     # ---------------- LOAD DATA ----------------
-    # Load product catalog (DB-first, fallback to Excel)
+    # Load product catalog (DB-first, fallback to local storage)
     catalog = None
     if _db is not None:
         try:
@@ -86,181 +110,11 @@ def invoice_app():
             catalog = None
     if catalog is None:
         try:
-            catalog = pd.read_excel("data/products.xlsx")
-        except Exception:
-            st.error("❌ Cannot load products.xlsx")
-            return
-
-    # simple records list for quotations to pick from
-    def load_records():
-        # Try DB first then Excel
-        if _db is not None:
-            try:
-                rows = _db.db_query('SELECT base_id, date, type, number, amount, client_name, phone, location, note FROM records ORDER BY date')
-                if rows:
-                    df = pd.DataFrame(rows)
-                    df.columns = [c.strip().lower() for c in df.columns]
-                    return df
-            except Exception:
-                pass
-        try:
-            df = pd.read_excel("data/records.xlsx")
-            df.columns = [c.strip().lower() for c in df.columns]
-            return df
-        except:
-            return pd.DataFrame(columns=[
-                "base_id","date","type","number","amount","client_name","phone","location","note"
-            ])
-
-            for r in raw_items:
-                # Safely parse quantity from common keys
-                qty = 0.0
-                for k in ('Qty', 'qty', 'Quantity'):
-                    try:
-                        if k in r and r.get(k) is not None and str(r.get(k)).strip() != '':
-                            qty = float(r.get(k))
-                            break
-                    except Exception:
-                        continue
-        if {"type", "number"}.issubset(df.columns):
-            df = df.drop_duplicates(subset=["type", "number"], keep="last")
-        df.to_excel("data/records.xlsx", index=False)
-
-    # ---- Customers helpers (auto add/update) ----
-    def ensure_customers_file():
-        os.makedirs("data", exist_ok=True)
-        path = "data/customers.xlsx"
-        if not os.path.exists(path):
-            cols = [
-                "client_name","phone","location","email","status",
-                "notes","tags","next_follow_up","assigned_to","last_activity"
-            ]
-            pd.DataFrame(columns=cols).to_excel(path, index=False)
-
-    def load_customers():
-        # Try DB then Excel
-        if _db is not None:
-            try:
-                rows = _db.db_query('SELECT id, name, phone, email, address FROM customers ORDER BY id')
-                if rows:
-                    df = pd.DataFrame(rows)
-                    df = df.rename(columns={'name':'client_name','address':'location'})
-                    df.columns = [c.strip().lower() for c in df.columns]
-                    return df
-            except Exception:
-                pass
-        ensure_customers_file()
-        try:
-            df = pd.read_excel("data/customers.xlsx")
-            df.columns = [c.strip().lower() for c in df.columns]
-            return df
+            catalog = storage.read_table("products")
         except Exception:
-            return pd.DataFrame(columns=[
-                "client_name","phone","location","email","status",
-                "notes","tags","next_follow_up","assigned_to","last_activity"
-            ])
-
-    def save_customers(df: pd.DataFrame):
-        os.makedirs("data", exist_ok=True)
-        if _db is not None:
-            try:
-                for _, row in df.iterrows():
-                    name = str(row.get('client_name') or '')
-                    phone = row.get('phone')
-                    email = row.get('email')
-                    address = row.get('location')
-                    try:
-                        existing = _db.db_query('SELECT id FROM customers WHERE name = %s AND phone = %s', (name, phone))
-                    except Exception:
-                        existing = []
-                    if existing:
-                        try:
-                            _db.db_execute('UPDATE customers SET email = %s, address = %s WHERE id = %s', (email, address, existing[0].get('id')))
-                        except Exception:
-                            pass
-                    else:
-                        try:
-                            _db.db_execute('INSERT INTO customers(name, phone, email, address) VALUES (%s,%s,%s,%s)', (name, phone, email, address))
-                        except Exception:
-                            pass
-                df.to_excel("data/customers.xlsx", index=False)
-                return
-            except Exception:
-                pass
-        df.to_excel("data/customers.xlsx", index=False)
-
-    def _norm_phone(x: str):
-        digits = ''.join(filter(str.isdigit, str(x)))
-        if digits.startswith('971') and len(digits) >= 12 and digits[3] == '5':
-            return '0' + digits[3:12]
-        if len(digits) == 9 and digits.startswith('5'):
-            return '0' + digits
-        if len(digits) == 10 and digits.startswith('05'):
-            return digits
-        return digits[-10:]
-
-    def upsert_customer_from_invoice(name: str, phone: str, location: str):
-        if not str(name).strip():
+            st.error("❌ Cannot load product catalog")
             return
-        # Try DB upsert first, fallback to Excel
-        if _db is not None:
-            try:
-                existing = []
-                try:
-                    existing = _db.db_query('SELECT id FROM customers WHERE name = %s OR phone = %s', (proper_case(name), phone))
-                except Exception:
-                    existing = []
-                if existing:
-                    try:
-                        _db.db_execute('UPDATE customers SET phone = %s, address = %s WHERE id = %s', (phone, proper_case(location), existing[0].get('id')))
-                    except Exception:
-                        pass
-                else:
-                    try:
-                        _db.db_execute('INSERT INTO customers(name, phone, email, address) VALUES (%s,%s,%s,%s)', (proper_case(name), phone, '', proper_case(location)))
-                    except Exception:
-                        pass
-                return
-            except Exception:
-                pass
 
-        cdf = load_customers()
-        key = str(name).strip().lower()
-        idx = None
-        if not cdf.empty and "client_name" in cdf.columns:
-            m = cdf["client_name"].astype(str).str.strip().str.lower() == key
-            if m.any():
-                idx = m[m].index[0]
-            elif phone:
-                cdf_phone = cdf.get("phone", pd.Series([], dtype=str)).apply(_norm_phone)
-                target = _norm_phone(phone)
-                pm = cdf_phone == target
-                if pm.any():
-                    idx = pm[pm].index[0]
-        if idx is None:
-            new_row = {
-                "client_name": proper_case(name),
-                "phone": phone,
-                "location": proper_case(location),
-                "email": "",
-                "status": "Active",
-                "notes": "",
-                "tags": "",
-                "next_follow_up": "",
-                "assigned_to": "",
-                "last_activity": datetime.today().strftime('%Y-%m-%d'),
-            }
-            cdf = pd.concat([cdf, pd.DataFrame([new_row])], ignore_index=True)
-        else:
-            cdf.loc[idx, "client_name"] = proper_case(name)
-            if phone:
-                cdf.loc[idx, "phone"] = phone
-            if location:
-                cdf.loc[idx, "location"] = proper_case(location)
-            if not str(cdf.loc[idx, "status"]).strip():
-                cdf.loc[idx, "status"] = "Active"
-            cdf.loc[idx, "last_activity"] = datetime.today().strftime('%Y-%m-%d')
-        save_customers(cdf)
     records = load_records()
     quotes_df = records[records["type"] == "q"].copy()
 
@@ -385,333 +239,295 @@ def invoice_app():
         st.write("")  # keep grid aligned
 
     # ---------- ITEMS (same logic/visuals as Quotation) ----------
-    if "invoice_table" not in st.session_state:
-        st.session_state.invoice_table = pd.DataFrame(columns=[
-            "Item No","Product / Device","Description","Qty","Unit Price (AED)","Line Total (AED)","Warranty (Years)"
-        ])
+    items = ensure_table(st.session_state, "invoice_table")
 
-    st.markdown("---")
-    st.markdown("<div class='section-title'>Add Product</div>", unsafe_allow_html=True)
+    # Items, totals and export rerun as one fragment so line edits skip the
+    # catalog/records reload at the top of the page.
+    @fragment
+    def _line_items_section():
+        st.markdown("---")
+        st.markdown("<div class='section-title'>Add Product</div>", unsafe_allow_html=True)
 
-    st.markdown("""
-    <div class="product-header">
-      <span>Product / Device</span>
-      <span>Qty</span>
-      <span>Unit Price</span>
-      <span>Line Total</span>
-      <span>Warranty</span>
-      <span>Action</span>
-    </div>
-    """, unsafe_allow_html=True)
+        st.markdown("""
+        <div class="product-header">
+          <span>Product / Device</span>
+          <span>Qty</span>
+          <span>Unit Price</span>
+          <span>Line Total</span>
+          <span>Warranty</span>
+          <span>Action</span>
+        </div>
+        """, unsafe_allow_html=True)
 
-    df = st.session_state.invoice_table.copy()
-    if not df.empty:
-        for i, row in df.iterrows():
+        for i, item in enumerate(items):
             cols = st.columns([4.5, 0.7, 1, 1, 0.7, 0.7])
             with cols[0]:
-                st.markdown(f"<div class='added-product-row'><b>✓ {row['Product / Device']}</b></div>", unsafe_allow_html=True)
+                st.markdown(f"<div class='added-product-row'><b>✓ {item.device}</b></div>", unsafe_allow_html=True)
             with cols[1]:
-                st.markdown(f"<div class='added-product-row'><span class='product-value'>{int(row['Qty'])}</span></div>", unsafe_allow_html=True)
+                st.markdown(f"<div class='added-product-row'><span class='product-value'>{int(item.qty)}</span></div>", unsafe_allow_html=True)
             with cols[2]:
-                st.markdown(f"<div class='added-product-row'><span class='product-value'>{row['Unit Price (AED)']:.2f}</span></div>", unsafe_allow_html=True)
+                st.markdown(f"<div class='added-product-row'><span class='product-value'>{item.unit_price:.2f}</span></div>", unsafe_allow_html=True)
             with cols[3]:
                 st.markdown(
-                    f"<div class='added-product-row'><span class='product-value'>AED {row['Line Total (AED)']:.2f}</span></div>",
+                    f"<div class='added-product-row'><span class='product-value'>AED {item.line_total:.2f}</span></div>",
                     unsafe_allow_html=True
                 )
             with cols[4]:
-                st.markdown(f"<div class='added-product-row'><span class='product-value'>{int(row['Warranty (Years)'])} yr</span></div>", unsafe_allow_html=True)
+                st.markdown(f"<div class='added-product-row'><span class='product-value'>{int(item.warranty)} yr</span></div>", unsafe_allow_html=True)
             with cols[5]:
                 if st.button("❌", key=f"delete_{i}"):
-                    st.session_state.invoice_table = st.session_state.invoice_table.drop(i).reset_index(drop=True)
-                    st.session_state.invoice_table["Item No"] = range(1, len(st.session_state.invoice_table)+1)
-                    st.rerun()
+                    items.remove(i)
+                    rerun_fragment()
+
+        e = st.columns([4.5, 0.7, 1, 1, 0.7, 0.7])
+        with e[0]:
+            product = st.selectbox("Product", catalog["Device"], key="add_prod", label_visibility="collapsed")
+            row = catalog[catalog["Device"] == product].iloc[0]
+            desc = row["Description"]
+        # Sync defaults when product changes
+        if st.session_state.get("last_prod_inv") != product:
+            if "price_inv" not in st.session_state:
+                st.session_state["price_inv"] = float(row["UnitPrice"])
+            else:
+                st.session_state["price_inv"] = float(row["UnitPrice"])
+            if "war_inv" not in st.session_state:
+                st.session_state["war_inv"] = int(row["Warranty"])
+            else:
+                st.session_state["war_inv"] = int(row["Warranty"])
+            if "qty_inv" not in st.session_state:
+                st.session_state["qty_inv"] = 1
+            else:
+                st.session_state["qty_inv"] = 1
+            st.session_state["last_prod_inv"] = product
 
-    e = st.columns([4.5, 0.7, 1, 1, 0.7, 0.7])
-    with e[0]:
-        product = st.selectbox("Product", catalog["Device"], key="add_prod", label_visibility="collapsed")
-        row = catalog[catalog["Device"] == product].iloc[0]
-        desc = row["Description"]
-    # Sync defaults when product changes
-    if st.session_state.get("last_prod_inv") != product:
+        # Ensure keys exist (do not pass value= to widget)
+        if "qty_inv" not in st.session_state:
+            st.session_state["qty_inv"] = 1
         if "price_inv" not in st.session_state:
             st.session_state["price_inv"] = float(row["UnitPrice"])
-        else:
-            st.session_state["price_inv"] = float(row["UnitPrice"])
         if "war_inv" not in st.session_state:
             st.session_state["war_inv"] = int(row["Warranty"])
-        else:
-            st.session_state["war_inv"] = int(row["Warranty"])
-        if "qty_inv" not in st.session_state:
-            st.session_state["qty_inv"] = 1
-        else:
-            st.session_state["qty_inv"] = 1
-        st.session_state["last_prod_inv"] = product
-
-    # Ensure keys exist (do not pass value= to widget)
-    if "qty_inv" not in st.session_state:
-        st.session_state["qty_inv"] = 1
-    if "price_inv" not in st.session_state:
-        st.session_state["price_inv"] = float(row["UnitPrice"])
-    if "war_inv" not in st.session_state:
-        st.session_state["war_inv"] = int(row["Warranty"])
-
-    with e[1]:
-        qty = st.number_input("Qty", min_value=1, step=1, label_visibility="collapsed", key="qty_inv")
-    with e[2]:
-        price = st.number_input("Unit Price (AED)", step=10.0, label_visibility="collapsed", key="price_inv")
-    line_total = qty * price
-    with e[3]:
-        st.markdown(
-            f"<div class='added-product-row'><span class='product-value'>AED {line_total:.2f}</span></div>",
-            unsafe_allow_html=True
-        )
-    with e[4]:
-        warranty = st.number_input("Warranty (Years)", min_value=0, value=st.session_state.get("war_inv", int(row["Warranty"])), step=1, label_visibility="collapsed", key="war_inv")
-    with e[5]:
-        if st.button("✅", key="add_inv_btn"):
-            # Attempt to attach image info from catalog
-            image_val = None
-            try:
-                if 'ImagePath' in catalog.columns and not pd.isna(row.get('ImagePath')):
-                    image_val = str(row.get('ImagePath'))
-                elif 'ImageBase64' in catalog.columns and not pd.isna(row.get('ImageBase64')):
-                    image_val = str(row.get('ImageBase64'))
-            except Exception:
-                image_val = None
-
-            new_item = {
-                "Item No": len(st.session_state.invoice_table) + 1,
-                "Product / Device": product,
-                "Description": desc,
-                "Qty": qty,
-                "Unit Price (AED)": price,
-                "Line Total (AED)": line_total,
-                "Warranty (Years)": warranty,
-                "ImagePath": row.get('ImagePath') if 'ImagePath' in row.index else None,
-                "ImageBase64": row.get('ImageBase64') if 'ImageBase64' in row.index else None,
-                "image": image_val,
-            }
-            st.session_state.invoice_table = pd.concat([st.session_state.invoice_table, pd.DataFrame([new_item])], ignore_index=True)
-            st.rerun()
 
-    # ---------- SUMMARY ----------
-    st.markdown("---")
+        with e[1]:
+            qty = st.number_input("Qty", min_value=1, step=1, label_visibility="collapsed", key="qty_inv")
+        with e[2]:
+            price = st.number_input("Unit Price (AED)", step=10.0, label_visibility="collapsed", key="price_inv")
+        line_total = qty * price
+        with e[3]:
+            st.markdown(
+                f"<div class='added-product-row'><span class='product-value'>AED {line_total:.2f}</span></div>",
+                unsafe_allow_html=True
+            )
+        with e[4]:
+            warranty = st.number_input("Warranty (Years)", min_value=0, value=st.session_state.get("war_inv", int(row["Warranty"])), step=1, label_visibility="collapsed", key="war_inv")
+        with e[5]:
+            if st.button("✅", key="add_inv_btn"):
+                items.add(LineItem(
+                    device=product,
+                    description=desc,
+                    qty=qty,
+                    unit_price=price,
+                    warranty=warranty,
+                    # only a path / content hash; the image itself stays in the shared cache
+                    **catalog_image(row),
+                ))
+                rerun_fragment()
+
+        # ---------- SUMMARY ----------
+        st.markdown("---")
     
-    # Two columns: Summary Table (left) | Installation & Discount (right)
-    col_left, col_right = st.columns([1, 1])
+        # Two columns: Summary Table (left) | Installation & Discount (right)
+        col_left, col_right = st.columns([1, 1])
     
-    with col_left:
-        st.markdown("<div class='section-title'>Project Costs</div>", unsafe_allow_html=True)
+        with col_left:
+            st.markdown("<div class='section-title'>Project Costs</div>", unsafe_allow_html=True)
         
-        # Professional summary table (like receipt)
-        product_total = st.session_state.invoice_table["Line Total (AED)"].sum()
+            # Professional summary table (like receipt)
+            product_total = items.subtotal
         
-        # Calculate installation/discount (needs to be defined before display)
-        installation_cost = st.session_state.get("install_cost_inv_value", 0.0)
-        discount_value = st.session_state.get("disc_value_inv_value", 0.0)
-        discount_percent = st.session_state.get("disc_percent_inv_value", 0.0)
+            # Calculate installation/discount (needs to be defined before display)
+            installation_cost = st.session_state.get("install_cost_inv_value", 0.0)
+            discount_value = st.session_state.get("disc_value_inv_value", 0.0)
+            discount_percent = st.session_state.get("disc_percent_inv_value", 0.0)
         
-        percent_value = (product_total + installation_cost) * (discount_percent / 100)
-        total_discount = percent_value + discount_value
-        grand_total = (product_total + installation_cost) - total_discount
+            percent_value = (product_total + installation_cost) * (discount_percent / 100)
+            total_discount = percent_value + discount_value
+            grand_total = (product_total + installation_cost) - total_discount
         
-        st.markdown("""
-        <div style='background:var(--bg-card);border:1px solid var(--border);border-radius:12px;padding:16px;'>
-            <div style='display:flex;justify-content:space-between;padding:10px 0;border-bottom:1px solid var(--border-soft);'>
-                <span style='font-weight:600;color:var(--text-soft);'>Price (AED)</span>
-                <span style='font-weight:700;color:var(--text);'>{:,.2f} AED</span>
-            </div>
-            <div style='display:flex;justify-content:space-between;padding:10px 0;border-bottom:1px solid var(--border-soft);'>
-                <span style='font-weight:600;color:var(--text-soft);'>Installation & Operation Devices</span>
-                <span style='font-weight:700;color:var(--text);'>{:,.2f} AED</span>
-            </div>
-            <div style='display:flex;justify-content:space-between;padding:10px 0;border-bottom:1px solid var(--border-soft);'>
-                <span style='font-weight:600;color:var(--text-soft);'>Discount</span>
-                <span style='font-weight:700;color:var(--text);'>-{:,.2f} AED</span>
-            </div>
-            <div style='display:flex;justify-content:space-between;padding:15px 0;background:var(--bg-input);margin-top:8px;border-radius:8px;padding-left:12px;padding-right:12px;'>
-                <span style='font-weight:700;font-size:16px;color:var(--text);'>TOTAL AMOUNT</span>
-                <span style='font-weight:700;font-size:18px;color:var(--text);'>{:,.2f} AED</span>
+            st.markdown("""
+            <div style='background:var(--bg-card);border:1px solid var(--border);border-radius:12px;padding:16px;'>
+                <div style='display:flex;justify-content:space-between;padding:10px 0;border-bottom:1px solid var(--border-soft);'>
+                    <span style='font-weight:600;color:var(--text-soft);'>Price (AED)</span>
+                    <span style='font-weight:700;color:var(--text);'>{:,.2f} AED</span>
+                </div>
+                <div style='display:flex;justify-content:space-between;padding:10px 0;border-bottom:1px solid var(--border-soft);'>
+                    <span style='font-weight:600;color:var(--text-soft);'>Installation & Operation Devices</span>
+                    <span style='font-weight:700;color:var(--text);'>{:,.2f} AED</span>
+                </div>
+                <div style='display:flex;justify-content:space-between;padding:10px 0;border-bottom:1px solid var(--border-soft);'>
+                    <span style='font-weight:600;color:var(--text-soft);'>Discount</span>
+                    <span style='font-weight:700;color:var(--text);'>-{:,.2f} AED</span>
+                </div>
+                <div style='display:flex;justify-content:space-between;padding:15px 0;background:var(--bg-input);margin-top:8px;border-radius:8px;padding-left:12px;padding-right:12px;'>
+                    <span style='font-weight:700;font-size:16px;color:var(--text);'>TOTAL AMOUNT</span>
+                    <span style='font-weight:700;font-size:18px;color:var(--text);'>{:,.2f} AED</span>
+                </div>
             </div>
-        </div>
-        """.format(product_total, installation_cost, total_discount, grand_total), unsafe_allow_html=True)
+            """.format(product_total, installation_cost, total_discount, grand_total), unsafe_allow_html=True)
     
-    with col_right:
-        st.markdown("<div class='section-title'>Installation & Discount</div>", unsafe_allow_html=True)
+        with col_right:
+            st.markdown("<div class='section-title'>Installation & Discount</div>", unsafe_allow_html=True)
         
-        # Installation Cost
-        installation_cost = st.number_input("Installation & Operation Devices (AED)", min_value=0.0, step=50.0, key="install_cost_inv")
-        st.session_state["install_cost_inv_value"] = installation_cost
+            # Installation Cost
+            installation_cost = st.number_input("Installation & Operation Devices (AED)", min_value=0.0, step=50.0, key="install_cost_inv")
+            st.session_state["install_cost_inv_value"] = installation_cost
         
-        # Discount section
-        st.markdown("<div style='margin-top:12px;'></div>", unsafe_allow_html=True)
-        cD1, cD2 = st.columns(2)
-        with cD1:
-            discount_value = st.number_input("Discount Value (AED)", min_value=0.0, key="disc_value_inv")
-            st.session_state["disc_value_inv_value"] = discount_value
-        with cD2:
-            discount_percent = st.number_input("Discount %", min_value=0.0, max_value=100.0, key="disc_percent_inv")
-            st.session_state["disc_percent_inv_value"] = discount_percent
-
-    # ======================================================
-    #      SAVE + EXPORT WORD
-    # ======================================================
-    def generate_word_invoice(template, data):
-        doc = Document(template)
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for k, v in data.items():
-                        if k in cell.text:
-                            safe_v = "" if v is None else str(v)
-                            cell.text = cell.text.replace(k, safe_v)
-        buf = BytesIO()
-        doc.save(buf)
-        buf.seek(0)
-        return buf
-
-    st.markdown("---")
-    st.markdown('<div class="section-title">Export Invoice</div>', unsafe_allow_html=True)
-
-    # Recalculate for download (same logic as UI summary)
-    formatted_phone = format_phone_input(phone_raw) or phone_raw
-    product_total = st.session_state.invoice_table["Line Total (AED)"].sum()
-    installation_cost = st.session_state.get("install_cost_inv_value", 0.0)
-    discount_value = st.session_state.get("disc_value_inv_value", 0.0)
-    discount_percent = st.session_state.get("disc_percent_inv_value", 0.0)
-    percent_value = (product_total + installation_cost) * (discount_percent / 100)
-    total_discount = percent_value + discount_value
-    grand_total = (product_total + installation_cost) - total_discount
-
-    data = {
-        "{{client_name}}": client_name,
-        "{{invoice_no}}": invoice_no,
-        "{{client_location}}": client_location,
-        "{{client_phone}}": formatted_phone,
-        "{{total_products}}": f"{product_total:,.2f}",
-        "{{installation}}": f"{installation_cost:,.2f}",
-        "{{discount_value}}": f"{discount_value:,.2f}",
-        "{{discount_percent}}": f"{discount_percent:,.0f}",
-        "{{grand_total}}": f"{grand_total:,.2f}",
-    }
-
-    try:
-        word_file = generate_word_invoice("data/invoice_template.docx", data)
+            # Discount section
+            st.markdown("<div style='margin-top:12px;'></div>", unsafe_allow_html=True)
+            cD1, cD2 = st.columns(2)
+            with cD1:
+                discount_value = st.number_input("Discount Value (AED)", min_value=0.0, key="disc_value_inv")
+                st.session_state["disc_value_inv_value"] = discount_value
+            with cD2:
+                discount_percent = st.number_input("Discount %", min_value=0.0, max_value=100.0, key="disc_percent_inv")
+                st.session_state["disc_percent_inv_value"] = discount_percent
+
+        st.markdown("---")
+        st.markdown('<div class="section-title">Export Invoice</div>', unsafe_allow_html=True)
+
+        # Recalculate for download (same logic as UI summary)
+        formatted_phone = format_phone_input(phone_raw) or phone_raw
+        product_total = items.subtotal
+        installation_cost = st.session_state.get("install_cost_inv_value", 0.0)
+        discount_value = st.session_state.get("disc_value_inv_value", 0.0)
+        discount_percent = st.session_state.get("disc_percent_inv_value", 0.0)
+        percent_value = (product_total + installation_cost) * (discount_percent / 100)
+        total_discount = percent_value + discount_value
+        grand_total = (product_total + installation_cost) - total_discount
 
-        clicked = st.download_button(
-            label="Download Invoice (Word)",
-            data=word_file,
-            file_name=f"Invoice_{invoice_no}.docx"
-        )
+        data = {
+            "{{client_name}}": client_name,
+            "{{invoice_no}}": invoice_no,
+            "{{client_location}}": client_location,
+            "{{client_phone}}": formatted_phone,
+            "{{total_products}}": f"{product_total:,.2f}",
+            "{{installation}}": f"{installation_cost:,.2f}",
+            "{{discount_value}}": f"{discount_value:,.2f}",
+            "{{discount_percent}}": f"{discount_percent:,.0f}",
+            "{{grand_total}}": f"{grand_total:,.2f}",
+        }
+
+        # Exports are rebuilt only when the items or filled fields change
+        export_key = (items.revision, tuple(data.items()))
 
-        # Also provide HTML download using the A4 invoice template
         try:
-            # Prepare normalized items for the renderer
-            raw_items = st.session_state.invoice_table.to_dict('records') if 'invoice_table' in st.session_state else []
-            norm_items = []
-            for r in raw_items:
-                try:
-                    qty_val = r.get('Qty')
-                    if qty_val is None or qty_val == '':
+            word_file = session_memo("invoice_word", export_key, lambda: generate_word_invoice("data/invoice_template.docx", data).getvalue())
+
+            clicked = st.download_button(
+                label="Download Invoice (Word)",
+                data=word_file,
+                file_name=f"Invoice_{invoice_no}.docx"
+            )
+
+            # Also provide HTML download using the A4 invoice template
+            def _build_invoice_html():
+                # Prepare normalized items for the renderer
+                raw_items = items.to_records()
+                norm_items = []
+                for r in raw_items:
+                    try:
+                        qty_val = r.get('Qty')
+                        if qty_val is None or qty_val == '':
+                            qty = 0.0
+                        else:
+                            qty = float(qty_val)
+                    except Exception:
                         qty = 0.0
-                    else:
-                        qty = float(qty_val)
-                except Exception:
-                    qty = 0.0
-                try:
-                    unit_price = float(r.get('Unit Price (AED)') or r.get('Unit Price') or r.get('unit_price') or 0)
-                except Exception:
-                    unit_price = 0.0
-                try:
-                    total = float(r.get('Line Total (AED)') or r.get('total') or qty * unit_price)
-                except Exception:
-                    total = qty * unit_price
-                item = {
-                    'description': r.get('Description') or r.get('Product / Device') or r.get('Product') or r.get('Device') or '',
-                    'qty': qty,
-                    'unit_price': unit_price,
-                    'total': total,
-                    'warranty': r.get('Warranty (Years)') or r.get('Warranty') or r.get('war_inv') or '',
-                    'ImagePath': r.get('ImagePath') if 'ImagePath' in r else None,
-                    'ImageBase64': r.get('ImageBase64') if 'ImageBase64' in r else None,
-                    'image': r.get('image') if 'image' in r else (r.get('ImagePath') if 'ImagePath' in r else (r.get('ImageBase64') if 'ImageBase64' in r else None)),
-                }
-                norm_items.append(item)
-
-            html_invoice = render_quotation_html({
-                'company_name': load_settings().get('company_name', 'Newton Smart Home'),
-                'quotation_number': invoice_no,
-                'quotation_date': datetime.today().strftime('%Y-%m-%d'),
-                'client_name': client_name,
-                'client_address': client_location,
-                'items': norm_items,
-                'subtotal': product_total,
-                'Installation': installation_cost,
-                'total_amount': grand_total,
-                'bank_name': load_settings().get('bank_name', ''),
-                'bank_account': load_settings().get('bank_account', ''),
-                'bank_iban': load_settings().get('bank_iban', ''),
-                'sig_name': load_settings().get('default_prepared_by', ''),
-                'sig_role': load_settings().get('default_approved_by', ''),
-            }, template_name='newton_invoice_A4.html')
-            st.download_button('Download Invoice (HTML)', html_invoice, file_name=f"Invoice_{invoice_no}.html", mime='text/html')
-        except Exception as e:
-            st.error(f"Unable to prepare invoice HTML: {e}")
-
-        if clicked:
-            # Determine base_id linkage
-            base_id = None
-            if mode == "From Quotation":
-                try:
-                    q_row = records[records["number"] == st.session_state.get("q_select_inline")].iloc[0]
-                    base_id = q_row.get("base_id", None)
-                except Exception:
-                    base_id = None
-            if not base_id:
-                # Generate a new base id for standalone invoices
-                today_id = datetime.today().strftime('%Y%m%d')
-                same_day = records[records["base_id"].astype(str).str.contains(today_id, na=False)] if not records.empty else pd.DataFrame()
-                seq = len(same_day) + 1
-                base_id = f"{today_id}-{str(seq).zfill(3)}"
+                    try:
+                        unit_price = float(r.get('Unit Price (AED)') or r.get('Unit Price') or r.get('unit_price') or 0)
+                    except Exception:
+                        unit_price = 0.0
+                    try:
+                        total = float(r.get('Line Total (AED)') or r.get('total') or qty * unit_price)
+                    except Exception:
+                        total = qty * unit_price
+                    item = {
+                        'description': r.get('Description') or r.get('Product / Device') or r.get('Product') or r.get('Device') or '',
+                        'qty': qty,
+                        'unit_price': unit_price,
+                        'total': total,
+                        'warranty': r.get('Warranty (Years)') or r.get('Warranty') or r.get('war_inv') or '',
+                        'ImagePath': r.get('ImagePath'),
+                        'image': r.get('image'),
+                    }
+                    norm_items.append(item)
+
+                return render_document_html("invoice", {
+                    'company_name': load_settings().get('company_name', 'Newton Smart Home'),
+                    'quotation_number': invoice_no,
+                    'quotation_date': datetime.today().strftime('%Y-%m-%d'),
+                    'client_name': client_name,
+                    'client_address': client_location,
+                    'items': norm_items,
+                    'subtotal': product_total,
+                    'Installation': installation_cost,
+                    'total_amount': grand_total,
+                    'bank_name': load_settings().get('bank_name', ''),
+                    'bank_account': load_settings().get('bank_account', ''),
+                    'bank_iban': load_settings().get('bank_iban', ''),
+                    'sig_name': load_settings().get('default_prepared_by', ''),
+                    'sig_role': load_settings().get('default_approved_by', ''),
+                })
 
             try:
-                save_record({
-                    "base_id": base_id,
-                    "date": datetime.today().strftime('%Y-%m-%d'),
-                    "type": "i",
-                    "number": invoice_no,
-                    "amount": grand_total,
-                    "client_name": client_name,
-                    "phone": phone_raw,
-                    "location": client_location,
-                    "note": st.session_state.get("q_select_inline") or ""
-                })
-                # Auto-add/update the customer so future quotations/invoices link to same record
-                upsert_customer_from_invoice(client_name, phone_raw, client_location)
-                st.success(f"✅ Saved to records as base {base_id}")
+                html_invoice = session_memo("invoice_html", export_key, _build_invoice_html)
+                st.download_button('Download Invoice (HTML)', html_invoice, file_name=f"Invoice_{invoice_no}.html", mime='text/html')
             except Exception as e:
-                st.warning(f"⚠️ Downloaded, but failed to save record: {e}")
-    except Exception as e:
-        st.error(f"❌ Unable to generate Word file: {e}")
+                st.error(f"Unable to prepare invoice HTML: {e}")
+
+            if clicked:
+                # `records` is from the last full run; re-read it so base ids are not reused
+                latest = load_records()
+                # Determine base_id linkage
+                base_id = None
+                if mode == "From Quotation":
+                    try:
+                        q_row = latest[latest["number"] == st.session_state.get("q_select_inline")].iloc[0]
+                        base_id = q_row.get("base_id", None)
+                    except Exception:
+                        base_id = None
+                if not base_id:
+                    # Generate a new base id for standalone invoices
+                    today_id = datetime.today().strftime('%Y%m%d')
+                    same_day = latest[latest["base_id"].astype(str).str.contains(today_id, na=False)] if not latest.empty else pd.DataFrame()
+                    seq = len(same_day) + 1
+                    base_id = f"{today_id}-{str(seq).zfill(3)}"
 
-def load_settings():
-    try:
-        df = pd.read_excel("data/settings.xlsx")
-        settings = dict(zip(df["key"], df["value"]))
-        return settings
-    except Exception:
-        return {}
-
-    def save_record(record: dict):
-        os.makedirs("data", exist_ok=True)
-        path = "data/records.xlsx"
-        try:
-            df = pd.read_excel(path)
-            df.columns = [c.strip().lower() for c in df.columns]
-        except Exception:
-            df = pd.DataFrame(columns=[
-                "base_id","date","type","number","amount","client_name","phone","location","note"
-            ])
-        df = pd.concat([df, pd.DataFrame([record])], ignore_index=True)
-        df.to_excel(path, index=False)
+                try:
+                    save_record({
+                        "base_id": base_id,
+                        "date": datetime.today().strftime('%Y-%m-%d'),
+                        "type": "i",
+                        "number": invoice_no,
+                        "amount": grand_total,
+                        "client_name": client_name,
+                        "phone": phone_raw,
+                        "location": client_location,
+                        "note": st.session_state.get("q_select_inline") or ""
+                    })
+                    # Auto-add/update the customer so future quotations/invoices link to same record
+                    upsert_customer(client_name, phone_raw, client_location, status="Active")
+                except Exception as e:
+                    st.warning(f"⚠️ Downloaded, but failed to save record: {e}")
+                else:
+                    # Full rerun: the invoice number above is only recomputed by the whole page
+                    st.session_state["_inv_saved"] = base_id
+                    st.rerun()
+        except Exception as e:
+            st.error(f"❌ Unable to generate Word file: {e}")
+
+    saved_base = st.session_state.pop("_inv_saved", None)
+    if saved_base:
+        st.success(f"✅ Saved to records as base {saved_base}")
+
+    _line_items_section()
@@ -1,36 +1,30 @@
-import os
 import base64
 from io import BytesIO
 from datetime import datetime
 from pathlib import Path
 from string import Template
+from typing import TYPE_CHECKING
 
 import pandas as pd
 import streamlit as st
-from PIL import Image
-from docx import Document
-from docx.shared import Pt, Cm
-from docx.enum.text import WD_ALIGN_PARAGRAPH
 
 from utils.settings import load_settings
-try:
-    from utils import db as _db
-except Exception:
-    _db = None
+from utils import storage, file_lock, docx_templates
+from utils import products as catalog
+from utils.products import ConflictError
+from utils import product_import, suppliers
+from utils.fragments import session_memo
+from utils.profiler import timed
+
+if TYPE_CHECKING:
+    from docx.document import Document
 
 
 # ==========================================
 # DATA SETUP
 # ==========================================
-def ensure_product_file() -> Path:
-    os.makedirs("data", exist_ok=True)
-    products_path = Path("data/products.xlsx")
-    if not products_path.exists():
-        df = pd.DataFrame(
-            columns=["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]
-        )
-        df.to_excel(products_path, index=False)
-    return products_path
+def ensure_product_file():
+    storage.ensure_table("products")
 
 
 def proper_case(text):
@@ -42,106 +36,11 @@ def proper_case(text):
         return str(text)
 
 
+@timed("products.load_products")
 def load_products() -> pd.DataFrame:
+    """Catalog with each product's `id` and `version` (see utils/products.py)."""
     ensure_product_file()
-    # Prefer DB source if available
-    if _db is not None:
-        try:
-            rows = _db.db_query(
-                'SELECT id, device as "Device", description as "Description", unit_price as "UnitPrice", warranty as "Warranty", image_base64 as "ImageBase64", image_path as "ImagePath" FROM products ORDER BY id'
-            )
-            if rows:
-                import pandas as _pd
-
-                df = _pd.DataFrame(rows)
-                for col in ["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]:
-                    if col not in df.columns:
-                        df[col] = None
-                return df[["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]]
-        except Exception:
-            # Fall back to Excel
-            pass
-
-    try:
-        df = pd.read_excel("data/products.xlsx")
-        for col in ["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]:
-            if col not in df.columns:
-                df[col] = None
-        return df[["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]]
-    except Exception:
-        return pd.DataFrame(
-            columns=["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]
-        )
-
-
-def save_products(df: pd.DataFrame):
-    os.makedirs("data", exist_ok=True)
-    for col in ["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]:
-        if col not in df.columns:
-            df[col] = None
-    df = df[["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"]]
-    if _db is not None:
-        try:
-            existing_rows = []
-            try:
-                existing_rows = _db.db_query("SELECT id, device FROM products")
-            except Exception:
-                existing_rows = []
-            existing_map = {}
-            for item in existing_rows or []:
-                name_val = (item.get("device") or "").strip()
-                if name_val:
-                    existing_map[name_val.lower()] = item.get("id")
-            seen_keys = set()
-            for _, row in df.iterrows():
-                device_val = row.get("Device")
-                device_text = str(device_val).strip() if device_val is not None else ""
-                if not device_text:
-                    continue
-                key = device_text.lower()
-                seen_keys.add(key)
-                desc_val = row.get("Description")
-                unit_val = row.get("UnitPrice")
-                try:
-                    unit_num = float(unit_val)
-                except Exception:
-                    unit_num = None
-                warranty_val = row.get("Warranty")
-                img_b64 = row.get("ImageBase64")
-                if pd.isna(img_b64):
-                    img_b64 = None
-                img_path = row.get("ImagePath") if "ImagePath" in row else None
-                if pd.isna(img_path):
-                    img_path = None
-                if key in existing_map and existing_map.get(key) is not None:
-                    try:
-                        _db.db_execute(
-                            "UPDATE products SET description = %s, unit_price = %s, warranty = %s, image_base64 = %s, image_path = %s WHERE id = %s",
-                            (desc_val, unit_num, warranty_val, img_b64, img_path, existing_map.get(key)),
-                        )
-                    except Exception:
-                        pass
-                else:
-                    inserted_row = None
-                    try:
-                        inserted_row = _db.db_execute(
-                            "INSERT INTO products(device, description, unit_price, warranty, image_base64, image_path) VALUES (%s,%s,%s,%s,%s,%s) RETURNING id",
-                            (device_text, desc_val, unit_num, warranty_val, img_b64, img_path),
-                            returning=True,
-                        )
-                    except Exception:
-                        inserted_row = None
-                    if inserted_row and inserted_row.get("id"):
-                        existing_map[key] = inserted_row.get("id")
-            for key, pid in list(existing_map.items()):
-                if key and key not in seen_keys and pid is not None:
-                    try:
-                        _db.db_execute("DELETE FROM products WHERE id = %s", (pid,))
-                    except Exception:
-                        pass
-        except Exception:
-            pass
-    df.to_excel("data/products.xlsx", index=False)
+    return catalog.load_products()
 
 
 # ==========================================
@@ -153,6 +52,8 @@ def image_to_base64(uploaded_file, target_size=None, mode="contain"):
     Uses contain mode by default to fit inside the box without cropping or upscaling.
     Flattens to a white background and saves as JPEG to avoid clipping and keep size small.
     """
+    from PIL import Image
+
     try:
         raw = Image.open(uploaded_file)
 
@@ -221,8 +122,9 @@ def save_original_image(uploaded_file, device_name: str) -> str:
     Save the uploaded image as PNG (full quality) for use in Word exports.
     Returns the saved path, or None on failure.
     """
+    from PIL import Image
+
     try:
-        os.makedirs("data/product_images", exist_ok=True)
         safe_name = "".join(c for c in device_name if c.isalnum() or c in (" ", "_", "-")).strip() or "product"
         file_name = f"{safe_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
         out_path = Path("data/product_images") / file_name
@@ -231,13 +133,18 @@ def save_original_image(uploaded_file, device_name: str) -> str:
             img = img.convert("RGBA")
         else:
             img = img.convert("RGB")
-        img.save(out_path, format="PNG", optimize=True)
+        buf = BytesIO()
+        img.save(buf, format="PNG", optimize=True)
+        file_lock.atomic_write(str(out_path), buf.getvalue())
         return str(out_path)
     except Exception:
         return None
 
 
-def insert_product_card(doc: Document, row: pd.Series, width_cm: float, height_cm: float, card_index: int):
+def insert_product_card(doc: "Document", row: pd.Series, width_cm: float, height_cm: float, card_index: int):
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.shared import Cm, Pt
+
     table = doc.add_table(rows=2, cols=2)
     table.style = "Table Grid"
 
@@ -278,8 +185,9 @@ def insert_product_card(doc: Document, row: pd.Series, width_cm: float, height_c
         doc.add_page_break()
 
 
+@timed("products.build_word_cards")
 def build_word_cards_document(products_df: pd.DataFrame) -> BytesIO:
-    doc = Document("data/catalog_template.docx")
+    doc = docx_templates.load("data/catalog_template.docx")
     width_cm = float(load_settings().get("quote_product_image_width_cm", 3.49))
     height_cm = float(load_settings().get("quote_product_image_height_cm", 1.5))
 
@@ -289,7 +197,7 @@ def build_word_cards_document(products_df: pd.DataFrame) -> BytesIO:
     return save_docx_to_buffer(doc)
 
 
-def save_docx_to_buffer(doc: Document) -> BytesIO:
+def save_docx_to_buffer(doc: "Document") -> BytesIO:
     buf = BytesIO()
     doc.save(buf)
     buf.seek(0)
@@ -308,6 +216,87 @@ def base64_to_image_html(base64_str, width=None, height=None):
     )
 
 
+# ==========================================
+# SUPPLIER COSTS
+# ==========================================
+def render_cost_margin(df: pd.DataFrame, fdf: pd.DataFrame):
+    """Cheapest supplier cost and margin for the listed products, one vectorized join for the whole catalog."""
+    source = df.attrs.get("source", "local")
+    prices = suppliers.load_supplier_products(source)
+    supplier_df = suppliers.load_suppliers(source)
+    costs = suppliers.catalog_costs(df, prices, supplier_df)
+
+    with_cost = costs["Cost"].notna()
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Products with a cost", f"{int(with_cost.sum()):,} / {len(df):,}")
+    m2.metric("Average margin", f"{costs['Margin %'].mean():.1f}%" if with_cost.any() else "-")
+    m3.metric("Below cost", int((costs["Margin"] < 0).sum()))
+
+    if with_cost.any():
+        view = fdf[["Device", "UnitPrice"]].join(costs.loc[fdf.index])
+        st.dataframe(
+            view, use_container_width=True, hide_index=True,
+            column_config={
+                "UnitPrice": st.column_config.NumberColumn("Price", format="%.2f"),
+                "Cost": st.column_config.NumberColumn(format="%.2f"),
+                "Margin": st.column_config.NumberColumn(format="%.2f"),
+                "Margin %": st.column_config.NumberColumn(format="%.1f%%"),
+            },
+        )
+    else:
+        st.info("No supplier costs yet. Upload a supplier price list below.")
+
+    with st.expander("Supplier price lists", expanded=False):
+        done = st.session_state.pop("_supplier_import_done", None)
+        if done:
+            st.success(
+                f"Price list imported: {done['rows']:,} SKUs ({done['mapped']:,} mapped to products, "
+                f"{done['unmapped']:,} unmapped) in {done['seconds']:.2f}s ({done['rows_per_second']:,.0f} rows/s)."
+            )
+            if done["skipped"]:
+                st.caption(f"{done['skipped']} row(s) without a SKU or cost were skipped.")
+
+        names = dict(zip(supplier_df["supplier_id"].astype(str), supplier_df["supplier_name"].astype(str)))
+        choice = st.selectbox(
+            "Supplier", list(names) + ["__new__"],
+            format_func=lambda sid: "+ New supplier" if sid == "__new__" else f"{names[sid]} ({sid})",
+            key="supplier_pick",
+        )
+        new_name = st.text_input("Supplier name", key="supplier_new_name") if choice == "__new__" else ""
+        st.caption("Columns: SKU and Cost (required), plus Device or product_id to map new SKUs to products.")
+        up = st.file_uploader("Upload supplier price list", type=["xlsx"], key="supplier_price_list")
+        if up is not None and st.button("Import price list"):
+            try:
+                supplier_id = suppliers.add_supplier(new_name, source=source) if choice == "__new__" else choice
+                status = st.empty()
+                result = suppliers.import_price_list(
+                    up, supplier_id, df, progress=lambda n: status.caption(f"Importing... {n:,} SKUs")
+                )
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                st.session_state["_supplier_import_done"] = result
+                st.rerun()
+
+        unmapped = prices[prices["product_id"].isna() & (prices["supplier_id"].astype(str) == choice)]
+        if len(unmapped):
+            st.markdown(f"**Unmapped SKUs** ({len(unmapped):,})")
+            u1, u2, u3 = st.columns([2, 3, 1])
+            with u1:
+                sku = st.selectbox("SKU", unmapped["supplier_sku"].astype(str).tolist(), key="supplier_map_sku")
+            with u2:
+                pid = st.selectbox(
+                    "Product", df["id"].astype(int).tolist(),
+                    format_func=dict(zip(df["id"].astype(int), df["Device"].astype(str))).get,
+                    key="supplier_map_product",
+                )
+            with u3:
+                st.write("")
+                if st.button("Map", key="supplier_map_btn"):
+                    suppliers.map_sku(choice, sku, pid, source=source)
+                    st.rerun()
+
+
 # ==========================================
 # PAGE
 # ==========================================
@@ -429,16 +418,18 @@ def products_app():
                         if uploaded_image:
                             uploaded_image.seek(0)
                         img_path = save_original_image(uploaded_image, cand) if uploaded_image else None
-                        new_row = {
-                            "Device": cand,
-                            "Description": a_desc,
-                            "UnitPrice": a_price,
-                            "Warranty": a_warranty,
-                            "ImageBase64": img_b64,
-                            "ImagePath": img_path,
-                        }
-                        new_df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-                        save_products(new_df)
+                        try:
+                            catalog.create_product({
+                                "Device": cand,
+                                "Description": a_desc,
+                                "UnitPrice": a_price,
+                                "Warranty": a_warranty,
+                                "ImageBase64": img_b64,
+                                "ImagePath": img_path,
+                            }, source=df.attrs.get("source", "local"))
+                        except Exception as e:
+                            st.error(f"Could not add the product: {e}")
+                            st.stop()
                         st.success("Product added")
                         st.rerun()
             with ac2:
@@ -587,25 +578,26 @@ def products_app():
                                         img_upload.seek(0)
                                         new_img_path = save_original_image(img_upload, proper_case(edit_device))
 
-                                    df.loc[
-                                        original_idx,
-                                        [
-                                            "Device",
-                                            "Description",
-                                            "UnitPrice",
-                                            "Warranty",
-                                            "ImageBase64",
-                                            "ImagePath",
-                                        ],
-                                    ] = [
-                                        proper_case(edit_device),
-                                        edit_desc,
-                                        edit_price,
-                                        edit_warranty,
-                                        new_img_b64,
-                                        new_img_path,
-                                    ]
-                                    save_products(df)
+                                    edited = {
+                                        "Device": proper_case(edit_device),
+                                        "Description": edit_desc,
+                                        "UnitPrice": edit_price,
+                                        "Warranty": edit_warranty,
+                                        "ImageBase64": new_img_b64,
+                                        "ImagePath": new_img_path,
+                                    }
+                                    # Only the fields that actually changed are written
+                                    changes = storage.changed_fields(row, edited)
+                                    try:
+                                        catalog.update_product(row["id"], row["version"], changes,
+                                                               source=df.attrs.get("source", "local"))
+                                    except ConflictError as e:
+                                        st.session_state.pop("_prod_edit_idx", None)
+                                        st.error(f"{e} Your changes were not saved.")
+                                        st.stop()
+                                    except Exception as e:
+                                        st.error(f"Could not save the product: {e}")
+                                        st.stop()
                                     st.session_state.pop("_prod_edit_idx", None)
                                     st.success("Product updated")
                                     st.rerun()
@@ -655,27 +647,35 @@ def products_app():
                             st.rerun()
                     with c2:
                         if st.button("Delete", key=f"del_{display_idx}"):
-                            st.session_state["_prod_delete_idx"] = int(original_idx)
+                            st.session_state["_prod_delete"] = (int(row["id"]), int(row["version"]), str(row["Device"]),
+                                                                df.attrs.get("source", "local"))
                             st.session_state["_prod_mode"] = "confirm_delete"
                             st.rerun()
 
     # ---------------- CONFIRM DELETE ----------------
     if st.session_state.get("_prod_mode") == "confirm_delete":
-        del_idx = st.session_state.get("_prod_delete_idx")
-        if del_idx is not None and 0 <= del_idx < len(df):
-            st.warning(f"Confirm delete: {df.iloc[del_idx]['Device']}")
+        pending = st.session_state.get("_prod_delete")
+        if pending is not None:
+            del_id, del_version, del_device, del_source = pending
+            st.warning(f"Confirm delete: {del_device}")
             cdel1, cdel2 = st.columns(2)
             with cdel1:
                 if st.button("Yes, Delete"):
-                    new_df = df.drop(df.index[del_idx]).reset_index(drop=True)
-                    save_products(new_df)
-                    st.success("Product deleted")
-                    st.session_state.pop("_prod_delete_idx", None)
+                    st.session_state.pop("_prod_delete", None)
                     st.session_state.pop("_prod_mode", None)
+                    try:
+                        catalog.delete_product(del_id, del_version, source=del_source)
+                    except ConflictError as e:
+                        st.error(f"{e} Nothing was deleted.")
+                        st.stop()
+                    except Exception as e:
+                        st.error(f"Could not delete the product: {e}")
+                        st.stop()
+                    st.success("Product deleted")
                     st.rerun()
             with cdel2:
                 if st.button("Cancel"):
-                    st.session_state.pop("_prod_delete_idx", None)
+                    st.session_state.pop("_prod_delete", None)
                     st.session_state.pop("_prod_mode", None)
                     st.rerun()
 
@@ -691,6 +691,11 @@ def products_app():
             mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
         )
 
+    # ---------------- COST & MARGIN ----------------
+    st.markdown("---")
+    st.markdown("<div class='section-title'>Cost & Margin</div>", unsafe_allow_html=True)
+    render_cost_margin(df, fdf)
+
     # ---------------- IMPORT / EXPORT ----------------
     st.markdown("---")
     st.markdown("<div class='section-title'>Import / Export</div>", unsafe_allow_html=True)
@@ -706,30 +711,53 @@ def products_app():
         file_name=f"products_export_{datetime.today().strftime('%Y%m%d')}.xlsx",
     )
 
+    done = st.session_state.pop("_prod_import_done", None)
+    if done:
+        st.success(
+            f"Import applied: {done['added']} added, {done['changed']} changed, {done['removed']} removed "
+            f"in {done['seconds']:.2f}s ({done['rows_per_second']:,.0f} rows/s)."
+        )
+        if done["conflicts"]:
+            st.warning(f"{len(done['conflicts'])} product(s) were changed by someone else meanwhile and were skipped.")
+
     up = st.file_uploader("Upload products.xlsx", type=["xlsx"], accept_multiple_files=False)
     if up is not None:
+        remove_missing = st.checkbox("Remove products that are not in the file", value=True)
+        # Re-plan only when the file, the option or the catalog changes
+        plan_key = (getattr(up, "file_id", None) or (up.name, up.size), remove_missing,
+                    len(df), int(df["version"].sum()) if len(df) else 0)
         try:
-            imp = pd.read_excel(up)
-            for col in ["Device", "Description", "UnitPrice", "Warranty"]:
-                if col not in imp.columns:
-                    st.error(f"Missing column in uploaded file: {col}")
-                    return
-            if "ImageBase64" not in imp.columns:
-                imp["ImageBase64"] = None
-            if "ImagePath" not in imp.columns:
-                imp["ImagePath"] = None
-            st.warning("This will replace all existing products.")
-            ic1, ic2 = st.columns(2)
-            with ic1:
-                if st.button("Confirm Replace"):
-                    imp["Device"] = imp["Device"].apply(proper_case)
-                    save_products(
-                        imp[["Device", "Description", "UnitPrice", "Warranty", "ImageBase64"]]
-                    )
-                    st.success("Products replaced from upload.")
-                    st.rerun()
-            with ic2:
-                if st.button("Cancel Import"):
-                    st.rerun()
+            plan = session_memo("product_import_plan", plan_key,
+                                lambda: product_import.plan_import(up, df, remove_missing=remove_missing))
         except Exception as e:
             st.error(f"Failed to read uploaded file: {e}")
+            return
+        counts = plan.counts()
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Added", counts["added"])
+        m2.metric("Changed", counts["changed"])
+        m3.metric("Removed", counts["removed"])
+        m4.metric("Unchanged", counts["unchanged"])
+        st.caption(
+            f"{plan.rows_read:,} rows read and compared in {plan.seconds:.2f}s. "
+            f"Only these columns are updated: {', '.join(plan.columns)}."
+            + (f" {plan.duplicates} repeated device row(s): the last one is used." if plan.duplicates else "")
+        )
+        if not plan.total:
+            st.info("The catalog already matches this file.")
+            return
+        st.dataframe(plan.preview, use_container_width=True, hide_index=True)
+        if plan.total > len(plan.preview):
+            st.caption(f"Showing the first {len(plan.preview):,} of {plan.total:,} changes.")
+        ic1, ic2 = st.columns(2)
+        with ic1:
+            if st.button(f"Apply {plan.total:,} changes"):
+                bar = st.progress(0.0, text="Importing...")
+                result = product_import.apply_import(
+                    plan, progress=lambda n, total: bar.progress(n / total, text=f"Importing... {n:,}/{total:,}")
+                )
+                st.session_state["_prod_import_done"] = result
+                st.rerun()
+        with ic2:
+            if st.button("Cancel Import"):
+                st.rerun()
@@ -4,14 +4,21 @@ from datetime import datetime
 import os
 from io import BytesIO
 import base64
+import json
 import tempfile
 from streamlit.components.v1 import html as st_html
-from utils.quotation_utils import render_quotation_html, html_to_pdf
+from utils.quotation_utils import render_document_html, document_to_pdf
 from pathlib import Path
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from utils.logger import log_event
 from utils.settings import load_settings
+from utils.line_items import LineItem, catalog_image, ensure_table
+from utils.fragments import fragment, rerun_fragment, peek_memo, session_memo
+from utils.profiler import timed
+from utils import storage, file_lock, downloads, image_cache, docx_templates
+from utils.records import load_records, save_record
+from utils.customers import upsert_customer, find_customer_id
 try:
     from utils import db as _db
 except Exception:
@@ -26,6 +33,119 @@ def proper_case(text):
     except:
         return text
 
+# =========================
+# WORD EXPORT
+# =========================
+def _insert_image_in_cell(cell, b64_str: str, width_cm: float, height_cm: float, img_path: str = None):
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.shared import Cm
+
+    try:
+        bio = None
+        if img_path and os.path.exists(img_path):
+            with open(img_path, "rb") as f:
+                bio = BytesIO(f.read())
+        elif b64_str and not pd.isna(b64_str):
+            img_bytes = base64.b64decode(b64_str)
+            bio = BytesIO(img_bytes)
+        if bio is None:
+            return False
+        # تفريغ محتوى الخلية ثم إدراج الصورة في فقرة محاذاة للوسط
+        cell.text = ""
+        p = cell.paragraphs[0] if cell.paragraphs else cell.add_paragraph("")
+        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        run = p.add_run()
+        run.add_picture(bio, width=Cm(width_cm), height=Cm(height_cm))
+        return True
+    except Exception:
+        return False
+
+
+def _format_cell(cell, font_name, font_size, align):
+    from docx.shared import Pt
+
+    for paragraph in cell.paragraphs:
+        paragraph.alignment = align
+        for run in paragraph.runs:
+            run.font.name = font_name
+            run.font.size = Pt(font_size)
+
+
+@timed("quotation.generate_word")
+def fill_quotation_docx(data: dict, products: list, image_map: dict | None = None,
+                        image_path_map: dict | None = None, width_cm: float = 3.49,
+                        height_cm: float = 1.5, template: str = "data/quotation_template.docx") -> BytesIO:
+    """Fill the Word quotation template with header placeholders and product rows."""
+    image_map = image_map or {}
+    # python-docx loads only when a Word file is actually built
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+    image_path_map = image_path_map or {}
+    doc = docx_templates.load(template)
+
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                old = cell.text
+                new = old
+                for key, val in data.items():
+                    new = new.replace(key, "" if val is None else str(val))
+                if old != new:
+                    cell.text = new
+                    _format_cell(cell, "Times New Roman (Headings CS)", 10, WD_ALIGN_PARAGRAPH.LEFT)
+
+    target_table = None
+    for table in doc.tables:
+        try:
+            if table.cell(0, 0).text.strip().lower() in ["item no", "item no."]:
+                target_table = table
+                break
+        except Exception:
+            continue
+    if not target_table:
+        raise Exception("❌ Product table not found")
+
+    start_row = 1
+    last_index = None
+    for idx, row in enumerate(target_table.rows):
+        if row.cells[0].text.strip().lower() == "last":
+            last_index = idx
+            break
+    if last_index is None:
+        raise Exception("❌ 'last' row missing in Word template")
+
+    for i, product in enumerate(products):
+        row_index = start_row + i
+        if row_index >= last_index:
+            break
+        row = target_table.rows[row_index]
+        row.cells[0].text = str(product.get("Item No", i + 1))
+        # إدراج الصورة في عمود المنتج إن وُجدت، وإلا نكتب الاسم نصياً
+        prod_name = str(product.get("Product / Device", ""))
+        b64_img = image_cache.get_base64(product.get("ImageKey")) or image_map.get(prod_name)
+        img_path = product.get("ImagePath") or image_path_map.get(prod_name)
+        placed = _insert_image_in_cell(row.cells[1], b64_img, width_cm, height_cm, img_path)
+        if not placed:
+            row.cells[1].text = prod_name
+        row.cells[2].text = str(product.get("Description", ""))
+        row.cells[3].text = str(product.get("Qty", ""))
+        row.cells[4].text = f"{float(product.get('Unit Price (AED)', 0)):,.2f}"
+        row.cells[5].text = f"{float(product.get('Line Total (AED)', 0)):,.2f}"
+        row.cells[6].text = str(product.get("Warranty (Years)", ""))
+        for cell in row.cells:
+            _format_cell(cell, "Arial MT", 9, WD_ALIGN_PARAGRAPH.CENTER)
+
+    delete_start = start_row + len(products)
+    for j in range(last_index - 1, delete_start - 1, -1):
+        row = target_table.rows[j]
+        target_table._tbl.remove(row._tr)
+
+    buffer = BytesIO()
+    doc.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
 # Apply the same visual theme used in dashboard_page.py
 def _apply_quotation_theme():
     # Now inherits global Invoice theme from main.py
@@ -102,7 +222,7 @@ def quotation_app():
             catalog = None
     if catalog is None:
         try:
-            catalog = pd.read_excel("data/products.xlsx")
+            catalog = storage.read_table("products")
         except Exception:
             st.error("❌ ERROR: Cannot load product catalog")
             return
@@ -113,198 +233,7 @@ def quotation_app():
             st.error(f"❌ Missing column: {col}")
             return
 
-    # Records helpers (match invoice logic)
-    def load_records():
-        # Try DB first, fallback to Excel
-        if _db is not None:
-            try:
-                rows = _db.db_query('SELECT base_id, date, type, number, amount, client_name, phone, location, note FROM records ORDER BY date')
-                if rows:
-                    df = pd.DataFrame(rows)
-                    df.columns = [c.strip().lower() for c in df.columns]
-                    return df
-            except Exception:
-                pass
-        try:
-            df = pd.read_excel("data/records.xlsx")
-            df.columns = [c.strip().lower() for c in df.columns]
-            return df
-        except:
-            return pd.DataFrame(columns=[
-                "base_id","date","type","number","amount","client_name","phone","location","note"
-            ])
-
-    def save_record(rec: dict):
-        # Try saving to DB, fallback to Excel
-        if _db is not None:
-            try:
-                # Delete existing by type+number then insert
-                if rec.get('type') and rec.get('number'):
-                    try:
-                        _db.db_execute('DELETE FROM records WHERE type = %s AND number = %s', (rec.get('type'), rec.get('number')))
-                    except Exception:
-                        pass
-                _db.db_execute(
-                    'INSERT INTO records(base_id, date, type, number, amount, client_name, phone, location, note) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)',
-                    (rec.get('base_id'), rec.get('date'), rec.get('type'), rec.get('number'), rec.get('amount'), rec.get('client_name'), rec.get('phone'), rec.get('location'), rec.get('note'))
-                )
-                return
-            except Exception:
-                pass
-
-        df = load_records()
-        if not df.empty and {"type", "number"}.issubset(df.columns):
-            df = df[~((df["type"] == rec.get("type")) & (df["number"] == rec.get("number")))]
-        df = pd.concat([df, pd.DataFrame([rec])], ignore_index=True)
-        if {"type", "number"}.issubset(df.columns):
-            df = df.drop_duplicates(subset=["type", "number"], keep="last")
-        df.to_excel("data/records.xlsx", index=False)
-
-    # Customers helpers (auto add from quotation)
-    def ensure_customers_file():
-        os.makedirs("data", exist_ok=True)
-        path = "data/customers.xlsx"
-        if not os.path.exists(path):
-            cols = [
-                "client_name","phone","location","email","status",
-                "notes","tags","next_follow_up","assigned_to","last_activity"
-            ]
-            pd.DataFrame(columns=cols).to_excel(path, index=False)
-
-    def load_customers():
-        # Try DB first then fallback to Excel
-        if _db is not None:
-            try:
-                rows = _db.db_query('SELECT id, name, phone, email, address FROM customers ORDER BY id')
-                if rows:
-                    df = pd.DataFrame(rows)
-                    df = df.rename(columns={'name':'client_name', 'address':'location'})
-                    df.columns = [c.strip().lower() for c in df.columns]
-                    return df
-            except Exception:
-                pass
-        ensure_customers_file()
-        try:
-            df = pd.read_excel("data/customers.xlsx")
-            df.columns = [c.strip().lower() for c in df.columns]
-            return df
-        except:
-            return pd.DataFrame(columns=[
-                "client_name","phone","location","email","status",
-                "notes","tags","next_follow_up","assigned_to","last_activity"
-            ])
-
-    def save_customers(df: pd.DataFrame):
-        os.makedirs("data", exist_ok=True)
-        # Try DB sync (upsert) then write Excel to preserve app-specific fields
-        if _db is not None:
-            try:
-                for _, row in df.iterrows():
-                    name = str(row.get('client_name') or '')
-                    phone = row.get('phone')
-                    email = row.get('email')
-                    address = row.get('location')
-                    try:
-                        existing = _db.db_query('SELECT id FROM customers WHERE name = %s AND phone = %s', (name, phone))
-                    except Exception:
-                        existing = []
-                    if existing:
-                        try:
-                            _db.db_execute('UPDATE customers SET email = %s, address = %s WHERE id = %s', (email, address, existing[0].get('id')))
-                        except Exception:
-                            pass
-                    else:
-                        try:
-                            _db.db_execute('INSERT INTO customers(name, phone, email, address) VALUES (%s,%s,%s,%s)', (name, phone, email, address))
-                        except Exception:
-                            pass
-                df.to_excel("data/customers.xlsx", index=False)
-                return
-            except Exception:
-                pass
-        df.to_excel("data/customers.xlsx", index=False)
-
-    def upsert_customer_from_quotation(name: str, phone: str, location: str):
-        if not str(name).strip():
-            return
-        # Try DB upsert matching DB schema, otherwise fall back to Excel logic
-        if _db is not None:
-            try:
-                # Simple phone/name lookup
-                existing = []
-                try:
-                    existing = _db.db_query('SELECT id FROM customers WHERE name = %s OR phone = %s', (proper_case(name), phone))
-                except Exception:
-                    existing = []
-                if existing:
-                    try:
-                        _db.db_execute('UPDATE customers SET phone = %s, address = %s WHERE id = %s', (phone, proper_case(location), existing[0].get('id')))
-                    except Exception:
-                        pass
-                else:
-                    try:
-                        _db.db_execute('INSERT INTO customers(name, phone, email, address) VALUES (%s,%s,%s,%s)', (proper_case(name), phone, '', proper_case(location)))
-                    except Exception:
-                        pass
-                return
-            except Exception:
-                pass
-
-        # Fallback: original Excel behaviour
-        ensure_customers_file()
-        cdf = load_customers()
-        key = str(name).strip().lower()
-        exists = None
-        if not cdf.empty and "client_name" in cdf.columns:
-            m = cdf["client_name"].astype(str).str.strip().str.lower() == key
-            if m.any():
-                exists = cdf[m].index[0]
-            else:
-                # Try phone-based matching when names differ
-                cdf_phone = cdf.get("phone", pd.Series([], dtype=str)).apply(lambda x: x if pd.isna(x) else str(x))
-                try_phone = phone
-                def norm(x):
-                    digits = ''.join(filter(str.isdigit, str(x)))
-                    if digits.startswith('971') and len(digits) >= 12 and digits[3] == '5':
-                        return '0' + digits[3:12]
-                    if len(digits) == 9 and digits.startswith('5'):
-                        return '0' + digits
-                    if len(digits) == 10 and digits.startswith('05'):
-                        return digits
-                    return digits[-10:]
-                if try_phone:
-                    m2 = cdf_phone.apply(norm) == norm(try_phone)
-                    if m2.any():
-                        exists = cdf[m2].index[0]
-        if exists is None:
-            new_row = {
-                "client_name": proper_case(name),
-                "phone": phone,
-                "location": proper_case(location),
-                "email": "",
-                "status": "New",
-                "notes": "",
-                "tags": "",
-                "next_follow_up": "",
-                "assigned_to": "",
-                "last_activity": datetime.today().strftime('%Y-%m-%d'),
-            }
-            cdf = pd.concat([cdf, pd.DataFrame([new_row])], ignore_index=True)
-        else:
-            # Update phone/location/last_activity for existing
-            cdf.loc[exists, "client_name"] = proper_case(name)
-            cdf.loc[exists, "phone"] = phone or cdf.loc[exists, "phone"]
-            cdf.loc[exists, "location"] = proper_case(location) or cdf.loc[exists, "location"]
-            # Quotation marks engagement start; keep status if set
-            cdf.loc[exists, "status"] = cdf.loc[exists, "status"] or "New"
-            cdf.loc[exists, "last_activity"] = datetime.today().strftime('%Y-%m-%d')
-        save_customers(cdf)
-
-    if "product_table" not in st.session_state:
-        st.session_state.product_table = pd.DataFrame(columns=[
-            "Item No","Product / Device","Description",
-            "Qty","Unit Price (AED)","Line Total (AED)","Warranty (Years)"
-        ])
+    items = ensure_table(st.session_state, "product_table")
 
     # =========================
     # CLIENT DETAILS
@@ -326,238 +255,220 @@ def quotation_app():
 
     with c2:
         today = datetime.today().strftime('%Y%m%d')
-        auto_quote = f"QUO-{today}-{len(st.session_state.product_table)+1:03d}"
+        auto_quote = f"QUO-{today}-{len(items)+1:03d}"
         quote_no = st.text_input("Quotation No", value=auto_quote, key="quo_no")
 
         prepared_by = proper_case(st.text_input("Prepared By", value="Mr Bukhari", key="quo_prepared"))
         approved_by = proper_case(st.text_input("Approved By", value="Mr Mohammed", key="quo_approved"))
 
-    # =========================
-    # PRODUCTS
-    # =========================
-    st.markdown("---")
-    st.markdown('<div class="section-title">Add Product</div>', unsafe_allow_html=True)
-
-    # Header row
-    st.markdown("""
-    <div class="product-header">
-        <span>Product / Device</span>
-        <span>Qty</span>
-        <span>Unit Price</span>
-        <span>Line Total</span>
-        <span>Warranty</span>
-        <span>Action</span>
-    </div>
-    """, unsafe_allow_html=True)
-
-    st.session_state.num_entries = 1
-
-    df = st.session_state.product_table.copy()
-
-    if not df.empty:
-        for idx, (i, row) in enumerate(df.iterrows()):
+    # Items, totals and export rerun together as one fragment so adding or
+    # removing a line doesn't reload the catalog or rebuild the client form.
+    @fragment
+    def _line_items_section():
+        # =========================
+        # PRODUCTS
+        # =========================
+        st.markdown("---")
+        st.markdown('<div class="section-title">Add Product</div>', unsafe_allow_html=True)
+
+        # Header row
+        st.markdown("""
+        <div class="product-header">
+            <span>Product / Device</span>
+            <span>Qty</span>
+            <span>Unit Price</span>
+            <span>Line Total</span>
+            <span>Warranty</span>
+            <span>Action</span>
+        </div>
+        """, unsafe_allow_html=True)
+
+        st.session_state.num_entries = 1
+
+        for i, item in enumerate(items):
             cols = st.columns([4.5,0.7,1,1,0.7,0.7])
 
             with cols[0]:
                 st.markdown(f"""
                     <div class='added-product-row'>
                         <span style="font-weight:bold;color:rgba(10,132,255,.65);">✓</span>
-                        <span style="font-weight:600;color:#1f2937;">{row['Product / Device']}</span>
+                        <span style="font-weight:600;color:#1f2937;">{item.device}</span>
                     </div>
                 """, unsafe_allow_html=True)
 
             with cols[1]:
-                st.markdown(f"<div class='added-product-row'><span class='product-value'>{int(row['Qty'])}</span></div>", unsafe_allow_html=True)
+                st.markdown(f"<div class='added-product-row'><span class='product-value'>{int(item.qty)}</span></div>", unsafe_allow_html=True)
 
             with cols[2]:
-                st.markdown(f"<div class='added-product-row'><span class='product-value'>{row['Unit Price (AED)']:.2f}</span></div>", unsafe_allow_html=True)
+                st.markdown(f"<div class='added-product-row'><span class='product-value'>{item.unit_price:.2f}</span></div>", unsafe_allow_html=True)
 
             with cols[3]:
                 st.markdown(
-                    f"<div class='added-product-row'><span class='product-value'>AED {row['Line Total (AED)']:.2f}</span></div>",
+                    f"<div class='added-product-row'><span class='product-value'>AED {item.line_total:.2f}</span></div>",
                     unsafe_allow_html=True
                 )
 
             with cols[4]:
-                st.markdown(f"<div class='added-product-row'><span class='product-value'>{int(row['Warranty (Years)'])} yr</span></div>", unsafe_allow_html=True)
+                st.markdown(f"<div class='added-product-row'><span class='product-value'>{int(item.warranty)} yr</span></div>", unsafe_allow_html=True)
 
             with cols[5]:
                 if st.button("❌", key=f"del_q_{i}"):
-                    st.session_state.product_table = st.session_state.product_table.drop(i).reset_index(drop=True)
-                    st.session_state.product_table["Item No"] = range(1, len(st.session_state.product_table)+1)
-                    st.rerun()
-
-    for entry_idx in range(st.session_state.num_entries):
-        cols = st.columns([4.5,0.7,1,1,0.7,0.7])
-
-        with cols[0]:
-            product = st.selectbox(
-                "Product",
-                catalog["Device"],
-                key=f"prod_entry_{entry_idx}",
-                label_visibility="collapsed"
-            )
-            row = catalog[catalog["Device"] == product].iloc[0]
-            desc = row["Description"]
-
-        key_qty = f"qty_val_{entry_idx}"
-        key_price = f"price_val_{entry_idx}"
-        key_war = f"war_val_{entry_idx}"
-        if key_qty not in st.session_state:
-            st.session_state[key_qty] = 1
-        if key_price not in st.session_state:
-            st.session_state[key_price] = float(row["UnitPrice"])
-        if key_war not in st.session_state:
-            st.session_state[key_war] = int(row["Warranty"])
-        # Sync price and warranty when product changes
-        last_key = f"last_prod_{entry_idx}"
-        if st.session_state.get(last_key) != product:
-            st.session_state[f"price_val_{entry_idx}"] = float(row["UnitPrice"])
-            st.session_state[f"war_val_{entry_idx}"] = int(row["Warranty"])
-            st.session_state[last_key] = product
-
-        with cols[1]:
-            st.number_input(
-                "Qty",
-                min_value=1,
-                step=1,
-                key=key_qty,
-                label_visibility="collapsed"
-            )
+                    items.remove(i)
+                    rerun_fragment()
 
-        with cols[2]:
-            st.number_input(
-                "Unit Price (AED)",
-                min_value=0.0,
-                step=10.0,
-                key=key_price,
-                label_visibility="collapsed"
-            )
-
-        qty = st.session_state[f"qty_val_{entry_idx}"]
-        price = st.session_state[f"price_val_{entry_idx}"]
-        line_price = qty * price
-
-        with cols[3]:
-            st.markdown(
-                f"<div class='added-product-row'><span class='product-value'>AED {line_price:.2f}</span></div>",
-                unsafe_allow_html=True
-            )
+        for entry_idx in range(st.session_state.num_entries):
+            cols = st.columns([4.5,0.7,1,1,0.7,0.7])
 
-        with cols[4]:
-            st.number_input(
-                "Warranty (Years)",
-                min_value=0,
-                step=1,
-                key=key_war,
-                label_visibility="collapsed"
-            )
+            with cols[0]:
+                product = st.selectbox(
+                    "Product",
+                    catalog["Device"],
+                    key=f"prod_entry_{entry_idx}",
+                    label_visibility="collapsed"
+                )
+                row = catalog[catalog["Device"] == product].iloc[0]
+                desc = row["Description"]
+
+            key_qty = f"qty_val_{entry_idx}"
+            key_price = f"price_val_{entry_idx}"
+            key_war = f"war_val_{entry_idx}"
+            if key_qty not in st.session_state:
+                st.session_state[key_qty] = 1
+            if key_price not in st.session_state:
+                st.session_state[key_price] = float(row["UnitPrice"])
+            if key_war not in st.session_state:
+                st.session_state[key_war] = int(row["Warranty"])
+            # Sync price and warranty when product changes
+            last_key = f"last_prod_{entry_idx}"
+            if st.session_state.get(last_key) != product:
+                st.session_state[f"price_val_{entry_idx}"] = float(row["UnitPrice"])
+                st.session_state[f"war_val_{entry_idx}"] = int(row["Warranty"])
+                st.session_state[last_key] = product
 
-        warranty = st.session_state[f"war_val_{entry_idx}"]
-
-        with cols[5]:
-            if st.button("✅", key=f"add_row_{entry_idx}"):
-                # attempt to attach image info from catalog (ImagePath or ImageBase64)
-                image_val = None
-                try:
-                    if 'ImagePath' in catalog.columns and not pd.isna(row.get('ImagePath')):
-                        image_val = str(row.get('ImagePath'))
-                    elif 'ImageBase64' in catalog.columns and not pd.isna(row.get('ImageBase64')):
-                        image_val = str(row.get('ImageBase64'))
-                except Exception:
-                    image_val = None
-
-                new_row = {
-                    "Item No": len(st.session_state.product_table) + 1,
-                    "Product / Device": product,
-                    "Description": desc,
-                    "Qty": qty,
-                    "Unit Price (AED)": price,
-                    "Line Total (AED)": line_price,
-                    "Warranty (Years)": warranty,
-                    # keep both raw columns for Word export and a normalized `image` for HTML rendering
-                    "ImagePath": row.get('ImagePath') if 'ImagePath' in row.index else None,
-                    "ImageBase64": row.get('ImageBase64') if 'ImageBase64' in row.index else None,
-                    "image": image_val,
-                }
-                st.session_state.product_table = pd.concat(
-                    [st.session_state.product_table, pd.DataFrame([new_row])],
-                    ignore_index=True
+            with cols[1]:
+                st.number_input(
+                    "Qty",
+                    min_value=1,
+                    step=1,
+                    key=key_qty,
+                    label_visibility="collapsed"
                 )
-                st.rerun()
 
-    st.markdown("---")
+            with cols[2]:
+                st.number_input(
+                    "Unit Price (AED)",
+                    min_value=0.0,
+                    step=10.0,
+                    key=key_price,
+                    label_visibility="collapsed"
+                )
 
-    product_total = st.session_state.product_table["Line Total (AED)"].sum() if not st.session_state.product_table.empty else 0
+            qty = st.session_state[f"qty_val_{entry_idx}"]
+            price = st.session_state[f"price_val_{entry_idx}"]
+            line_price = qty * price
 
-    # =========================
-    # SUMMARY (match invoice)
-    # =========================
-    st.markdown("---")
-    col_left, col_right = st.columns([1, 1])
+            with cols[3]:
+                st.markdown(
+                    f"<div class='added-product-row'><span class='product-value'>AED {line_price:.2f}</span></div>",
+                    unsafe_allow_html=True
+                )
 
-    with col_left:
-        st.markdown("<div class='section-title'>Project Costs</div>", unsafe_allow_html=True)
+            with cols[4]:
+                st.number_input(
+                    "Warranty (Years)",
+                    min_value=0,
+                    step=1,
+                    key=key_war,
+                    label_visibility="collapsed"
+                )
 
-        # Pull persisted values (so left card reflects right inputs)
-        installation_cost_val = st.session_state.get("install_cost_quo_value", 0.0)
-        discount_value_val = st.session_state.get("disc_value_quo_value", 0.0)
-        discount_percent_val = st.session_state.get("disc_percent_quo_value", 0.0)
+            warranty = st.session_state[f"war_val_{entry_idx}"]
 
-        percent_value = (product_total + installation_cost_val) * (discount_percent_val / 100)
-        total_discount = percent_value + discount_value_val
-        grand_total = (product_total + installation_cost_val) - total_discount
+            with cols[5]:
+                if st.button("✅", key=f"add_row_{entry_idx}"):
+                    items.add(LineItem(
+                        device=product,
+                        description=desc,
+                        qty=qty,
+                        unit_price=price,
+                        warranty=warranty,
+                        # only a path / content hash; the image itself stays in the shared cache
+                        **catalog_image(row),
+                    ))
+                    rerun_fragment()
+
+        st.markdown("---")
+
+        product_total = items.subtotal
+
+        # =========================
+        # SUMMARY (match invoice)
+        # =========================
+        st.markdown("---")
+        col_left, col_right = st.columns([1, 1])
+
+        with col_left:
+            st.markdown("<div class='section-title'>Project Costs</div>", unsafe_allow_html=True)
+
+            # Pull persisted values (so left card reflects right inputs)
+            installation_cost_val = st.session_state.get("install_cost_quo_value", 0.0)
+            discount_value_val = st.session_state.get("disc_value_quo_value", 0.0)
+            discount_percent_val = st.session_state.get("disc_percent_quo_value", 0.0)
+
+            percent_value = (product_total + installation_cost_val) * (discount_percent_val / 100)
+            total_discount = percent_value + discount_value_val
+            grand_total = (product_total + installation_cost_val) - total_discount
 
-        st.markdown(
-            """
-            <div style='background:#fff;border:1px solid rgba(0,0,0,.08);border-radius:12px;padding:16px;box-shadow:0 2px 6px rgba(0,0,0,.04);'>
-                <div style='display:flex;justify-content:space-between;padding:10px 0;border-bottom:1px solid rgba(0,0,0,.06);'>
-                    <span style='font-weight:600;color:#6e6e73;'>Price (AED)</span>
-                    <span style='font-weight:700;color:#1d1d1f;'>{:,.2f} AED</span>
-                </div>
-                <div style='display:flex;justify-content:space-between;padding:10px 0;border-bottom:1px solid rgba(0,0,0,.06);'>
-                    <span style='font-weight:600;color:#6e6e73;'>Installation & Operation Devices</span>
-                    <span style='font-weight:700;color:#1d1d1f;'>{:,.2f} AED</span>
-                </div>
-                <div style='display:flex;justify-content:space-between;padding:10px 0;border-bottom:1px solid rgba(0,0,0,.06);'>
-                    <span style='font-weight:600;color:#6e6e73;'>Discount</span>
-                    <span style='font-weight:700;color:#1d1d1f;'>-{:,.2f} AED</span>
-                </div>
-                <div style='display:flex;justify-content:space-between;padding:15px 0;background:rgba(0,0,0,.02);margin-top:8px;border-radius:8px;padding-left:12px;padding-right:12px;'>
-                    <span style='font-weight:700;font-size:16px;color:#1d1d1f;'>TOTAL AMOUNT</span>
-                    <span style='font-weight:700;font-size:18px;color:#1d1d1f;'>{:,.2f} AED</span>
+            st.markdown(
+                """
+                <div style='background:#fff;border:1px solid rgba(0,0,0,.08);border-radius:12px;padding:16px;box-shadow:0 2px 6px rgba(0,0,0,.04);'>
+                    <div style='display:flex;justify-content:space-between;padding:10px 0;border-bottom:1px solid rgba(0,0,0,.06);'>
+                        <span style='font-weight:600;color:#6e6e73;'>Price (AED)</span>
+                        <span style='font-weight:700;color:#1d1d1f;'>{:,.2f} AED</span>
+                    </div>
+                    <div style='display:flex;justify-content:space-between;padding:10px 0;border-bottom:1px solid rgba(0,0,0,.06);'>
+                        <span style='font-weight:600;color:#6e6e73;'>Installation & Operation Devices</span>
+                        <span style='font-weight:700;color:#1d1d1f;'>{:,.2f} AED</span>
+                    </div>
+                    <div style='display:flex;justify-content:space-between;padding:10px 0;border-bottom:1px solid rgba(0,0,0,.06);'>
+                        <span style='font-weight:600;color:#6e6e73;'>Discount</span>
+                        <span style='font-weight:700;color:#1d1d1f;'>-{:,.2f} AED</span>
+                    </div>
+                    <div style='display:flex;justify-content:space-between;padding:15px 0;background:rgba(0,0,0,.02);margin-top:8px;border-radius:8px;padding-left:12px;padding-right:12px;'>
+                        <span style='font-weight:700;font-size:16px;color:#1d1d1f;'>TOTAL AMOUNT</span>
+                        <span style='font-weight:700;font-size:18px;color:#1d1d1f;'>{:,.2f} AED</span>
+                    </div>
                 </div>
-            </div>
-            """.format(product_total, installation_cost_val, total_discount, grand_total),
-            unsafe_allow_html=True,
-        )
+                """.format(product_total, installation_cost_val, total_discount, grand_total),
+                unsafe_allow_html=True,
+            )
 
-    with col_right:
-        st.markdown("<div class='section-title'>Installation & Discount</div>", unsafe_allow_html=True)
+        with col_right:
+            st.markdown("<div class='section-title'>Installation & Discount</div>", unsafe_allow_html=True)
 
-        installation_cost = st.number_input(
-            "Installation & Operation Devices (AED)",
-            min_value=0.0,
-            step=50.0,
-            key="install_cost_quo",
-        )
-        st.session_state["install_cost_quo_value"] = installation_cost
+            installation_cost = st.number_input(
+                "Installation & Operation Devices (AED)",
+                min_value=0.0,
+                step=50.0,
+                key="install_cost_quo",
+            )
+            st.session_state["install_cost_quo_value"] = installation_cost
 
-        st.markdown("<div style='margin-top:12px;'></div>", unsafe_allow_html=True)
-        cD1, cD2 = st.columns(2)
-        with cD1:
-            discount_value = st.number_input("Discount Value (AED)", min_value=0.0, key="disc_value_quo")
-            st.session_state["disc_value_quo_value"] = discount_value
-        with cD2:
-            discount_percent = st.number_input("Discount %", min_value=0.0, max_value=100.0, key="disc_percent_quo")
-            st.session_state["disc_percent_quo_value"] = discount_percent
+            st.markdown("<div style='margin-top:12px;'></div>", unsafe_allow_html=True)
+            cD1, cD2 = st.columns(2)
+            with cD1:
+                discount_value = st.number_input("Discount Value (AED)", min_value=0.0, key="disc_value_quo")
+                st.session_state["disc_value_quo_value"] = discount_value
+            with cD2:
+                discount_percent = st.number_input("Discount %", min_value=0.0, max_value=100.0, key="disc_percent_quo")
+                st.session_state["disc_percent_quo_value"] = discount_percent
+
+        _export_section()
 
     # =========================
     # EXPORT HELPERS (on-click only)
     # =========================
     def generate_word_file(data: dict) -> BytesIO:
-        doc = Document("data/quotation_template.docx")
-
         # قراءة أبعاد الصور من الإعدادات (سم)
         _s = load_settings()
         _wcm = float(_s.get("quote_product_image_width_cm", 3.49))
@@ -575,109 +486,20 @@ def quotation_app():
             image_map = {}
             image_path_map = {}
 
-        def insert_image_in_cell(cell, b64_str: str, width_cm: float, height_cm: float, img_path: str = None):
-            try:
-                bio = None
-                if img_path and os.path.exists(img_path):
-                    with open(img_path, "rb") as f:
-                        bio = BytesIO(f.read())
-                elif b64_str and not pd.isna(b64_str):
-                    img_bytes = base64.b64decode(b64_str)
-                    bio = BytesIO(img_bytes)
-                if bio is None:
-                    return False
-                # تفريغ محتوى الخلية ثم إدراج الصورة في فقرة محاذاة للوسط
-                cell.text = ""
-                p = cell.paragraphs[0] if cell.paragraphs else cell.add_paragraph("")
-                p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                run = p.add_run()
-                run.add_picture(bio, width=Cm(width_cm), height=Cm(height_cm))
-                return True
-            except Exception:
-                return False
-
-        def format_cell(cell, font_name, font_size, align):
-            for paragraph in cell.paragraphs:
-                paragraph.alignment = align
-                for run in paragraph.runs:
-                    run.font.name = font_name
-                    run.font.size = Pt(font_size)
-
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    old = cell.text
-                    new = old
-                    for key, val in data.items():
-                        new = new.replace(key, "" if val is None else str(val))
-                    if old != new:
-                        cell.text = new
-                        format_cell(cell, "Times New Roman (Headings CS)", 10, WD_ALIGN_PARAGRAPH.LEFT)
-
         # Insert products from session state
-        products = st.session_state.product_table.to_dict("records") if "product_table" in st.session_state else []
-
-        target_table = None
-        for table in doc.tables:
-            try:
-                if table.cell(0, 0).text.strip().lower() in ["item no", "item no."]:
-                    target_table = table
-                    break
-            except Exception:
-                continue
-        if not target_table:
-            raise Exception("❌ Product table not found")
-
-        start_row = 1
-        last_index = None
-        for idx, row in enumerate(target_table.rows):
-            if row.cells[0].text.strip().lower() == "last":
-                last_index = idx
-                break
-        if last_index is None:
-            raise Exception("❌ 'last' row missing in Word template")
-
-        for i, product in enumerate(products):
-            row_index = start_row + i
-            if row_index >= last_index:
-                break
-            row = target_table.rows[row_index]
-            row.cells[0].text = str(product.get("Item No", i + 1))
-            # إدراج الصورة في عمود المنتج إن وُجدت، وإلا نكتب الاسم نصياً
-            prod_name = str(product.get("Product / Device", ""))
-            b64_img = image_map.get(prod_name)
-            img_path = image_path_map.get(prod_name)
-            placed = insert_image_in_cell(row.cells[1], b64_img, _wcm, _hcm, img_path)
-            if not placed:
-                row.cells[1].text = prod_name
-            row.cells[2].text = str(product.get("Description", ""))
-            row.cells[3].text = str(product.get("Qty", ""))
-            row.cells[4].text = f"{float(product.get('Unit Price (AED)', 0)):,.2f}"
-            row.cells[5].text = f"{float(product.get('Line Total (AED)', 0)):,.2f}"
-            row.cells[6].text = str(product.get("Warranty (Years)", ""))
-            for cell in row.cells:
-                format_cell(cell, "Arial MT", 9, WD_ALIGN_PARAGRAPH.CENTER)
-
-        delete_start = start_row + len(products)
-        for j in range(last_index - 1, delete_start - 1, -1):
-            row = target_table.rows[j]
-            target_table._tbl.remove(row._tr)
-
-        buffer = BytesIO()
-        doc.save(buffer)
-        buffer.seek(0)
-        return buffer
+        return fill_quotation_docx(data, items.to_records(), image_map, image_path_map, _wcm, _hcm)
 
+    @timed("quotation.convert_to_pdf")
     def convert_to_pdf(word_buffer: BytesIO) -> bytes:
         # Deprecated: DOCX->PDF via ConvertAPI removed.
         # Instead render HTML template and convert to PDF directly.
-        products = st.session_state.product_table.to_dict('records') if 'product_table' in st.session_state else []
+        products = items.to_records()
         data = {
             'client_name': st.session_state.get('quo_client_name', ''),
             'client_location': st.session_state.get('quo_loc', ''),
             'quote_no': st.session_state.get('quo_no', ''),
         }
-        html = render_quotation_html({
+        return document_to_pdf("quotation", {
             'company_name': load_settings().get('company_name', 'Newton Smart Home'),
             'quotation_number': data.get('quote_no', ''),
             'quotation_date': datetime.today().strftime('%Y-%m-%d'),
@@ -703,315 +525,308 @@ def quotation_app():
             'bank_company': load_settings().get('company_name', 'Newton Smart Home'),
             'sig_name': load_settings().get('default_prepared_by', ''),
             'sig_role': load_settings().get('default_approved_by', ''),
-        }, template_name="newton_quotation_A4.html")
-        return html_to_pdf(html)
+        })
 
     def _auto_download(data_bytes: bytes, filename: str, mime: str):
-        b64 = base64.b64encode(data_bytes).decode('utf-8')
+        """Start a browser download of bytes served by `utils.downloads` (only the URL goes to the page)."""
+        link = downloads.url(downloads.publish(data_bytes, filename, mime), filename)
         # Visible fallback link (in case browser blocks auto-download)
-        st.markdown(
-            f"If the download doesn't start, click here: [Download {filename}](data:{mime};base64,{b64})",
-            unsafe_allow_html=True,
-        )
-        # Build a compact JS snippet for auto-download. Escape backslashes carefully.
-        js = (
-            "<script>"
-            "(function(){"
-            f"const b64='{b64}';"
-            f"const mime='{mime}';"
-            "const byteChars=atob(b64);"
-            "const byteNumbers=new Array(byteChars.length);"
-            "for(let i=0;i<byteChars.length;i++)byteNumbers[i]=byteChars.charCodeAt(i);"
-            "const byteArray=new Uint8Array(byteNumbers);"
-            "const blob=new Blob([byteArray],{type:mime});"
-            "const url=URL.createObjectURL(blob);"
-            "const a=document.createElement('a');a.href=url;"
-            f"a.download='{filename}';"
-            "document.body.appendChild(a);a.click();"
-            "setTimeout(function(){URL.revokeObjectURL(url);a.remove();},1000);"
-            "})();</script>"
+        st.markdown(f"If the download doesn't start, click here: [Download {filename}]({link})")
+        st_html(
+            "<script>(function(){const a=document.createElement('a');"
+            f"a.href={json.dumps(link)};a.download={json.dumps(filename)};"
+            "document.body.appendChild(a);a.click();a.remove();})();</script>",
+            height=0,
         )
-        st_html(js, height=0)
+
+    def _download_action(label: str, build, filename: str, mime: str, key: str) -> bool:
+        """Download button; True on the run it was clicked.
+
+        Served from the side server when it is available, otherwise through
+        st.download_button (which keeps the bytes in the session's media store).
+        """
+        if downloads.available():
+            if st.button(label, key=key):
+                _auto_download(build(), filename, mime)
+                return True
+            return False
+        return st.download_button(label=label, data=build(), file_name=filename, mime=mime, key=key)
 
     def _save_export_locally(data_bytes: bytes, filename: str) -> str:
-        out_dir = Path('data') / 'exports'
-        out_dir.mkdir(parents=True, exist_ok=True)
-        out_path = out_dir / filename
-        with open(out_path, 'wb') as f:
-            f.write(data_bytes)
+        out_path = Path('data') / 'exports' / filename
+        file_lock.atomic_write(str(out_path), data_bytes)
         return str(out_path)
 
-    st.markdown("---")
-    st.markdown('<div class="section-title">Export Quotation</div>', unsafe_allow_html=True)
+    def _export_section():
+        st.markdown("---")
+        st.markdown('<div class="section-title">Export Quotation</div>', unsafe_allow_html=True)
 
-    # Button colors (blue for Word, red for PDF)
-    st.markdown(
-        """
-        <style>
-        div.stButton>button[k="word_action"]{
-            background:linear-gradient(145deg,#0a84ff 0%,#1b6cff 100%)!important;color:#fff!important;
-            border:1px solid rgba(10,132,255,.35)!important;border-radius:12px!important;
-            padding:8px 16px!important;font-weight:700!important;
-        }
-        div.stButton>button[k="pdf_action"]{
-            background:linear-gradient(145deg,#ff3b30 0%,#d70015 100%)!important;color:#fff!important;
-            border:1px solid rgba(255,59,48,.35)!important;border-radius:12px!important;
-            padding:8px 16px!important;font-weight:700!important;
+        # Button colors (blue for Word, red for PDF)
+        st.markdown(
+            """
+            <style>
+            div.stButton>button[k="word_action"]{
+                background:linear-gradient(145deg,#0a84ff 0%,#1b6cff 100%)!important;color:#fff!important;
+                border:1px solid rgba(10,132,255,.35)!important;border-radius:12px!important;
+                padding:8px 16px!important;font-weight:700!important;
+            }
+            div.stButton>button[k="pdf_action"]{
+                background:linear-gradient(145deg,#ff3b30 0%,#d70015 100%)!important;color:#fff!important;
+                border:1px solid rgba(255,59,48,.35)!important;border-radius:12px!important;
+                padding:8px 16px!important;font-weight:700!important;
+            }
+            </style>
+            """,
+            unsafe_allow_html=True,
+        )
+
+        # Recalculate using the Installation & Discount values (to mirror invoice)
+        product_total = items.subtotal
+        installation_cost_val = st.session_state.get("install_cost_quo_value", 0.0)
+        discount_value_val = st.session_state.get("disc_value_quo_value", 0.0)
+        discount_percent_val = st.session_state.get("disc_percent_quo_value", 0.0)
+        percent_value = (product_total + installation_cost_val) * (discount_percent_val / 100)
+        total_discount = percent_value + discount_value_val
+        grand_total = (product_total + installation_cost_val) - total_discount
+
+        data_to_fill = {
+            "{{client_name}}": client_name,
+            "{{quote_no}}": quote_no,
+            "{{client_location}}": client_location,
+            "{{prepared_by}}": prepared_by,
+            "{{client_phone}}": client_phone or "N/A",
+            "{{approved_by}}": approved_by,
+            "{{client_email}}": "N/A",
+            # Quotation template keys
+            "{{total1}}": f"{product_total:,.2f}",
+            "{{installation_cost}}": f"{installation_cost_val:,.2f}",
+            "{{Price}}": f"{product_total:,.2f}",
+            "{{Total}}": f"{grand_total:,.2f}",
+            # Extra keys (no-op if not present in template)
+            "{{discount_value}}": f"{discount_value_val:,.2f}",
+            "{{discount_percent}}": f"{discount_percent_val:,.0f}",
+            "{{total_discount}}": f"{total_discount:,.2f}",
+            "{{grand_total}}": f"{grand_total:,.2f}",
         }
-        </style>
-        """,
-        unsafe_allow_html=True,
-    )
-
-    # Recalculate using the Installation & Discount values (to mirror invoice)
-    product_total = st.session_state.product_table["Line Total (AED)"].sum() if not st.session_state.product_table.empty else 0.0
-    installation_cost_val = st.session_state.get("install_cost_quo_value", 0.0)
-    discount_value_val = st.session_state.get("disc_value_quo_value", 0.0)
-    discount_percent_val = st.session_state.get("disc_percent_quo_value", 0.0)
-    percent_value = (product_total + installation_cost_val) * (discount_percent_val / 100)
-    total_discount = percent_value + discount_value_val
-    grand_total = (product_total + installation_cost_val) - total_discount
-
-    data_to_fill = {
-        "{{client_name}}": client_name,
-        "{{quote_no}}": quote_no,
-        "{{client_location}}": client_location,
-        "{{prepared_by}}": prepared_by,
-        "{{client_phone}}": client_phone or "N/A",
-        "{{approved_by}}": approved_by,
-        "{{client_email}}": "N/A",
-        # Quotation template keys
-        "{{total1}}": f"{product_total:,.2f}",
-        "{{installation_cost}}": f"{installation_cost_val:,.2f}",
-        "{{Price}}": f"{product_total:,.2f}",
-        "{{Total}}": f"{grand_total:,.2f}",
-        # Extra keys (no-op if not present in template)
-        "{{discount_value}}": f"{discount_value_val:,.2f}",
-        "{{discount_percent}}": f"{discount_percent_val:,.0f}",
-        "{{total_discount}}": f"{total_discount:,.2f}",
-        "{{grand_total}}": f"{grand_total:,.2f}",
-    }
-
-    # Always show the two action buttons side-by-side
-    b1, b2 = st.columns(2)
-
-    # Simple, invoice-style: pre-render a download_button for Word
-    with b1:
-        try:
-            word_ready = generate_word_file(data_to_fill)
-            clicked_word = st.download_button(
-                label="Download Word",
-                data=word_ready.getvalue(),
-                file_name=f"Quotation_{client_name}_{quote_no}.docx",
-                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                key=f"dl_word_{quote_no}"
-            )
-            if clicked_word:
-                # Save record after user downloads (same behavior as invoice)
-                today_id = datetime.today().strftime('%Y%m%d')
-                existing = load_records()
-                if not existing.empty and "base_id" in existing.columns:
-                    same_day = existing[existing.get("base_id", "").astype(str).str.contains(today_id, na=False)]
-                    seq = len(same_day) + 1
-                else:
-                    seq = 1
-                base_id = f"{today_id}-{str(seq).zfill(3)}"
-                save_record({
-                    "base_id": base_id,
-                    "date": datetime.today().strftime('%Y-%m-%d'),
-                    "type": "q",
-                    "number": quote_no,
-                    "amount": grand_total,
-                    "client_name": client_name,
-                    "phone": phone_raw,
-                    "location": client_location,
-                    "note": ""
-                })
-                upsert_customer_from_quotation(client_name, phone_raw, client_location)
-                # Attempt to persist quotation and items to DB (non-intrusive)
-                if _db is not None:
-                    try:
-                        # Ensure customer exists (upsert already attempted above)
-                        cust = None
-                        try:
-                            cust_rows = _db.db_query('SELECT id FROM customers WHERE name = %s AND phone = %s', (proper_case(client_name), phone_raw))
-                            cust = cust_rows[0].get('id') if cust_rows else None
-                        except Exception:
-                            cust = None
 
-                        # Insert quotation and items
-                        try:
-                            qrow = _db.db_execute(
-                                'INSERT INTO quotations(quote_number, customer_id, subtotal, installation_fee, total_amount, status, notes) VALUES (%s,%s,%s,%s,%s,%s,%s) RETURNING id',
-                                (quote_no, cust, product_total, installation_cost_val, grand_total, 'pending', ''),
-                                returning=True,
-                            )
-                            quotation_id = qrow.get('id') if qrow else None
-                        except Exception:
-                            quotation_id = None
-
-                        products = st.session_state.product_table.to_dict('records') if 'product_table' in st.session_state else []
-                        if quotation_id is not None and products:
-                            for p in products:
-                                try:
-                                    prod_name = p.get('Product / Device')
-                                    prod_rows = _db.db_query('SELECT id FROM products WHERE lower(device) = lower(%s) LIMIT 1', (prod_name,))
-                                    prod_id = prod_rows[0].get('id') if prod_rows else None
-                                except Exception:
-                                    prod_id = None
-                                try:
-                                    _db.db_execute(
-                                        'INSERT INTO quotation_items(quotation_id, product_id, description, quantity, unit_price, line_total, warranty) VALUES (%s,%s,%s,%s,%s,%s,%s)',
-                                        (
-                                            quotation_id,
-                                            prod_id,
-                                            p.get('Description'),
-                                            p.get('Qty') or 0,
-                                            p.get('Unit Price (AED)') or 0,
-                                            p.get('Line Total (AED)') or 0,
-                                            str(p.get('Warranty (Years)') or ''),
-                                        ),
-                                    )
-                                except Exception:
-                                    # Don't block on item-level failures
-                                    pass
-                        # Optionally track the export
+        # Exports are rebuilt only when the items or filled fields change
+        export_key = (items.revision, tuple(data_to_fill.items()))
+
+        # Always show the two action buttons side-by-side
+        b1, b2 = st.columns(2)
+
+        # Simple, invoice-style: pre-render a download_button for Word
+        with b1:
+            try:
+                clicked_word = _download_action(
+                    "Download Word",
+                    lambda: session_memo("quotation_word", export_key, lambda: generate_word_file(data_to_fill).getvalue()),
+                    f"Quotation_{client_name}_{quote_no}.docx",
+                    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                    f"dl_word_{quote_no}",
+                )
+                if clicked_word:
+                    # Save record after user downloads (same behavior as invoice)
+                    today_id = datetime.today().strftime('%Y%m%d')
+                    existing = load_records()
+                    if not existing.empty and "base_id" in existing.columns:
+                        same_day = existing[existing.get("base_id", "").astype(str).str.contains(today_id, na=False)]
+                        seq = len(same_day) + 1
+                    else:
+                        seq = 1
+                    base_id = f"{today_id}-{str(seq).zfill(3)}"
+                    save_record({
+                        "base_id": base_id,
+                        "date": datetime.today().strftime('%Y-%m-%d'),
+                        "type": "q",
+                        "number": quote_no,
+                        "amount": grand_total,
+                        "client_name": client_name,
+                        "phone": phone_raw,
+                        "location": client_location,
+                        "note": ""
+                    })
+                    upsert_customer(client_name, phone_raw, client_location, status="New")
+                    # Attempt to persist quotation and items to DB (non-intrusive)
+                    if _db is not None:
                         try:
-                            _db.db_execute('INSERT INTO exports(quotation_id, export_type, file_path, metadata) VALUES (%s,%s,%s,%s)', (quotation_id, 'word', '', None))
+                            # Ensure customer exists (upsert already attempted above)
+                            cust = find_customer_id(client_name, phone_raw)
+
+                            # Insert quotation and items
+                            try:
+                                qrow = _db.db_execute(
+                                    'INSERT INTO quotations(quote_number, customer_id, subtotal, installation_fee, total_amount, status, notes) VALUES (%s,%s,%s,%s,%s,%s,%s) RETURNING id',
+                                    (quote_no, cust, product_total, installation_cost_val, grand_total, 'pending', ''),
+                                    returning=True,
+                                )
+                                quotation_id = qrow.get('id') if qrow else None
+                            except Exception:
+                                quotation_id = None
+
+                            products = items.to_records()
+                            if quotation_id is not None and products:
+                                for p in products:
+                                    try:
+                                        prod_name = p.get('Product / Device')
+                                        prod_rows = _db.db_query('SELECT id FROM products WHERE lower(device) = lower(%s) LIMIT 1', (prod_name,))
+                                        prod_id = prod_rows[0].get('id') if prod_rows else None
+                                    except Exception:
+                                        prod_id = None
+                                    try:
+                                        _db.db_execute(
+                                            'INSERT INTO quotation_items(quotation_id, product_id, description, quantity, unit_price, line_total, warranty) VALUES (%s,%s,%s,%s,%s,%s,%s)',
+                                            (
+                                                quotation_id,
+                                                prod_id,
+                                                p.get('Description'),
+                                                p.get('Qty') or 0,
+                                                p.get('Unit Price (AED)') or 0,
+                                                p.get('Line Total (AED)') or 0,
+                                                str(p.get('Warranty (Years)') or ''),
+                                            ),
+                                        )
+                                    except Exception:
+                                        # Don't block on item-level failures
+                                        pass
+                            # Optionally track the export
+                            try:
+                                _db.db_execute('INSERT INTO exports(quotation_id, export_type, file_path, metadata) VALUES (%s,%s,%s,%s)', (quotation_id, 'word', '', None))
+                            except Exception:
+                                pass
                         except Exception:
+                            # If any DB error occurs, fall back silently to local storage
                             pass
-                    except Exception:
-                        # If any DB error occurs, fall back silently to Excel behaviour
-                        pass
-
-                # Log quotation creation
-                user = st.session_state.get("user", {})
-                log_event(user.get("name", "Unknown"), "Quotation", "quotation_created", 
-                         f"Client: {client_name}, Amount: {grand_total}")
-                st.success(f"✅ Saved quotation to records with base {base_id}")
-        except Exception as e:
-            st.error(f"❌ Unable to prepare Word file: {e}")
 
-    # PDF: keep a click-to-generate then download button for reliability
-    with b2:
-        try:
-            # Pre-generate PDF bytes for single-click download (may take a moment)
-            word_for_pdf = generate_word_file(data_to_fill)
-            pdf_ready = convert_to_pdf(word_for_pdf)
-            clicked_pdf = st.download_button(
-                label="Download PDF",
-                data=pdf_ready,
-                file_name=f"Quotation_{client_name}_{quote_no}.pdf",
-                mime="application/pdf",
-                key=f"dl_pdf_{quote_no}"
-            )
-            if clicked_pdf:
-                today_id = datetime.today().strftime('%Y%m%d')
-                existing = load_records()
-                if not existing.empty and "base_id" in existing.columns:
-                    same_day = existing[existing.get("base_id", "").astype(str).str.contains(today_id, na=False)]
-                    seq = len(same_day) + 1
-                else:
-                    seq = 1
-                base_id = f"{today_id}-{str(seq).zfill(3)}"
-                save_record({
-                    "base_id": base_id,
-                    "date": datetime.today().strftime('%Y-%m-%d'),
-                    "type": "q",
-                    "number": quote_no,
-                    "amount": grand_total,
-                    "client_name": client_name,
-                    "phone": phone_raw,
-                    "location": client_location,
-                    "note": "PDF"
-                })
-                upsert_customer_from_quotation(client_name, phone_raw, client_location)
-                # Attempt DB persistence of quotation and items (non-intrusive)
-                if _db is not None:
-                    try:
-                        cust = None
-                        try:
-                            cust_rows = _db.db_query('SELECT id FROM customers WHERE name = %s AND phone = %s', (proper_case(client_name), phone_raw))
-                            cust = cust_rows[0].get('id') if cust_rows else None
-                        except Exception:
-                            cust = None
+                    # Log quotation creation
+                    user = st.session_state.get("user", {})
+                    log_event(user.get("name", "Unknown"), "Quotation", "quotation_created", 
+                             f"Client: {client_name}, Amount: {grand_total}")
+                    st.success(f"✅ Saved quotation to records with base {base_id}")
+            except Exception as e:
+                st.error(f"❌ Unable to prepare Word file: {e}")
 
-                        qrow = None
+        # PDF: keep a click-to-generate then download button for reliability
+        with b2:
+            try:
+                # PDF conversion is slow, so it only runs on request and is
+                # reused until the quotation changes
+                pdf_ready = peek_memo("quotation_pdf", export_key)
+                if pdf_ready is None and st.button("Prepare PDF", key=f"prep_pdf_{quote_no}"):
+                    with st.spinner("Preparing PDF..."):
+                        pdf_ready = session_memo(
+                            "quotation_pdf", export_key,
+                            lambda: convert_to_pdf(generate_word_file(data_to_fill)),
+                        )
+                clicked_pdf = False
+                if pdf_ready is not None:
+                    clicked_pdf = _download_action(
+                        "Download PDF", lambda: pdf_ready,
+                        f"Quotation_{client_name}_{quote_no}.pdf", "application/pdf", f"dl_pdf_{quote_no}",
+                    )
+                if clicked_pdf:
+                    today_id = datetime.today().strftime('%Y%m%d')
+                    existing = load_records()
+                    if not existing.empty and "base_id" in existing.columns:
+                        same_day = existing[existing.get("base_id", "").astype(str).str.contains(today_id, na=False)]
+                        seq = len(same_day) + 1
+                    else:
+                        seq = 1
+                    base_id = f"{today_id}-{str(seq).zfill(3)}"
+                    save_record({
+                        "base_id": base_id,
+                        "date": datetime.today().strftime('%Y-%m-%d'),
+                        "type": "q",
+                        "number": quote_no,
+                        "amount": grand_total,
+                        "client_name": client_name,
+                        "phone": phone_raw,
+                        "location": client_location,
+                        "note": "PDF"
+                    })
+                    upsert_customer(client_name, phone_raw, client_location, status="New")
+                    # Attempt DB persistence of quotation and items (non-intrusive)
+                    if _db is not None:
                         try:
-                            qrow = _db.db_execute(
-                                'INSERT INTO quotations(quote_number, customer_id, subtotal, installation_fee, total_amount, status, notes) VALUES (%s,%s,%s,%s,%s,%s,%s) RETURNING id',
-                                (quote_no, cust, product_total, installation_cost_val, grand_total, 'pending', ''),
-                                returning=True,
-                            )
-                        except Exception:
+                            cust = find_customer_id(client_name, phone_raw)
+
                             qrow = None
-                        quotation_id = qrow.get('id') if qrow else None
-                        products = st.session_state.product_table.to_dict('records') if 'product_table' in st.session_state else []
-                        if quotation_id is not None and products:
-                            for p in products:
-                                try:
-                                    prod_name = p.get('Product / Device')
-                                    prod_rows = _db.db_query('SELECT id FROM products WHERE lower(device) = lower(%s) LIMIT 1', (prod_name,))
-                                    prod_id = prod_rows[0].get('id') if prod_rows else None
-                                except Exception:
-                                    prod_id = None
-                                try:
-                                    _db.db_execute(
-                                        'INSERT INTO quotation_items(quotation_id, product_id, description, quantity, unit_price, line_total, warranty) VALUES (%s,%s,%s,%s,%s,%s,%s)',
-                                        (
-                                            quotation_id,
-                                            prod_id,
-                                            p.get('Description'),
-                                            p.get('Qty') or 0,
-                                            p.get('Unit Price (AED)') or 0,
-                                            p.get('Line Total (AED)') or 0,
-                                            str(p.get('Warranty (Years)') or ''),
-                                        ),
-                                    )
-                                except Exception:
-                                    pass
-                        try:
-                            _db.db_execute('INSERT INTO exports(quotation_id, export_type, file_path, metadata) VALUES (%s,%s,%s,%s)', (quotation_id, 'pdf', '', None))
+                            try:
+                                qrow = _db.db_execute(
+                                    'INSERT INTO quotations(quote_number, customer_id, subtotal, installation_fee, total_amount, status, notes) VALUES (%s,%s,%s,%s,%s,%s,%s) RETURNING id',
+                                    (quote_no, cust, product_total, installation_cost_val, grand_total, 'pending', ''),
+                                    returning=True,
+                                )
+                            except Exception:
+                                qrow = None
+                            quotation_id = qrow.get('id') if qrow else None
+                            products = items.to_records()
+                            if quotation_id is not None and products:
+                                for p in products:
+                                    try:
+                                        prod_name = p.get('Product / Device')
+                                        prod_rows = _db.db_query('SELECT id FROM products WHERE lower(device) = lower(%s) LIMIT 1', (prod_name,))
+                                        prod_id = prod_rows[0].get('id') if prod_rows else None
+                                    except Exception:
+                                        prod_id = None
+                                    try:
+                                        _db.db_execute(
+                                            'INSERT INTO quotation_items(quotation_id, product_id, description, quantity, unit_price, line_total, warranty) VALUES (%s,%s,%s,%s,%s,%s,%s)',
+                                            (
+                                                quotation_id,
+                                                prod_id,
+                                                p.get('Description'),
+                                                p.get('Qty') or 0,
+                                                p.get('Unit Price (AED)') or 0,
+                                                p.get('Line Total (AED)') or 0,
+                                                str(p.get('Warranty (Years)') or ''),
+                                            ),
+                                        )
+                                    except Exception:
+                                        pass
+                            try:
+                                _db.db_execute('INSERT INTO exports(quotation_id, export_type, file_path, metadata) VALUES (%s,%s,%s,%s)', (quotation_id, 'pdf', '', None))
+                            except Exception:
+                                pass
                         except Exception:
                             pass
-                    except Exception:
-                        pass
 
-                st.success(f"✅ Saved PDF quotation with base {base_id}")
-        except Exception as e:
-            st.error(f"❌ Unable to prepare PDF: {e}")
+                    st.success(f"✅ Saved PDF quotation with base {base_id}")
+            except Exception as e:
+                st.error(f"❌ Unable to prepare PDF: {e}")
 
-    # Provide Download HTML button (separate row)
-    try:
-        html_content = render_quotation_html({
-            'company_name': load_settings().get('company_name', 'Newton Smart Home'),
-            'quotation_number': quote_no,
-            'quotation_date': datetime.today().strftime('%Y-%m-%d'),
-            'valid_until': '',
-            'status': 'Pending Approval',
-            'client_name': client_name,
-            'client_company': '',
-            'client_address': client_location,
-            'client_city': '',
-            'client_trn': '',
-            'project_title': '',
-            'project_location': client_location,
-            'project_scope': '',
-            'project_notes': '',
-            'items': st.session_state.product_table.to_dict('records') if 'product_table' in st.session_state else [],
-            'subtotal': product_total,
-            'Installation': float(st.session_state.get('install_cost_quo_value', 0.0) or 0.0),
-            'vat_amount': 0,
-            'total_amount': grand_total,
-            'bank_name': load_settings().get('bank_name', ''),
-            'bank_account': load_settings().get('bank_account', ''),
-            'bank_iban': load_settings().get('bank_iban', ''),
-            'bank_company': load_settings().get('company_name', 'Newton Smart Home'),
-            'sig_name': load_settings().get('default_prepared_by', ''),
-            'sig_role': load_settings().get('default_approved_by', ''),
-        }, template_name="newton_quotation_A4.html")
-        if st.button('Download HTML'):
-            st.download_button('Download Quotation (HTML)', html_content, file_name=f"Quotation_{client_name}_{quote_no}.html", mime='text/html')
-    except Exception as e:
-        st.error(f"❌ Unable to prepare HTML: {e}")
+        # Provide Download HTML button (separate row)
+        try:
+            html_content = session_memo("quotation_html", export_key, lambda: render_document_html("quotation", {
+                'company_name': load_settings().get('company_name', 'Newton Smart Home'),
+                'quotation_number': quote_no,
+                'quotation_date': datetime.today().strftime('%Y-%m-%d'),
+                'valid_until': '',
+                'status': 'Pending Approval',
+                'client_name': client_name,
+                'client_company': '',
+                'client_address': client_location,
+                'client_city': '',
+                'client_trn': '',
+                'project_title': '',
+                'project_location': client_location,
+                'project_scope': '',
+                'project_notes': '',
+                'items': items.to_records(),
+                'subtotal': product_total,
+                'Installation': float(st.session_state.get('install_cost_quo_value', 0.0) or 0.0),
+                'vat_amount': 0,
+                'total_amount': grand_total,
+                'bank_name': load_settings().get('bank_name', ''),
+                'bank_account': load_settings().get('bank_account', ''),
+                'bank_iban': load_settings().get('bank_iban', ''),
+                'bank_company': load_settings().get('company_name', 'Newton Smart Home'),
+                'sig_name': load_settings().get('default_prepared_by', ''),
+                'sig_role': load_settings().get('default_approved_by', ''),
+            }))
+            _download_action('Download HTML', lambda: html_content.encode('utf-8'),
+                             f"Quotation_{client_name}_{quote_no}.html", 'text/html', f"dl_html_{quote_no}")
+        except Exception as e:
+            st.error(f"❌ Unable to prepare HTML: {e}")
 
+    _line_items_section()
@@ -1,14 +1,33 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
-from utils.quotation_utils import render_quotation_html
+from utils.quotation_utils import render_document_html, document_to_pdf
 from utils.settings import load_settings
-from docx import Document
+from utils.profiler import timed
+from utils import docx_templates
+from utils.fragments import peek_memo, session_memo
+from utils.records import save_record
+from utils.balances import PICKER_LIMIT, open_invoices, receipts_for
 from io import BytesIO
-try:
-    from utils import db as _db
-except Exception:
-    _db = None
+
+
+# =====================================
+# WORD TEMPLATE ONLY (pdfkit removed)
+# =====================================
+@timed("receipt.generate_word")
+def generate_word(template, data_dict):
+    doc = docx_templates.load(template)
+
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                for k, v in data_dict.items():
+                    if k in cell.text:
+                        cell.text = cell.text.replace(k, "" if v is None else str(v))
+
+    buf = BytesIO()
+    doc.save(buf)
+    buf.seek(0)
+    return buf
 
 
 def receipt_app():
@@ -48,82 +67,11 @@ def receipt_app():
         flat = phone_flat10(raw_input)
         return f"{flat} xxxxxxxxxx" if flat else "xxxxxxxxxx"
 
-    # =====================================
-    # HELPERS
-    # =====================================
-    def load_records():
-        if _db is not None:
-            try:
-                rows = _db.db_query('SELECT base_id, date, type, number, amount, client_name, phone, location, note FROM records ORDER BY date')
-                if rows:
-                    df = pd.DataFrame(rows)
-                    df.columns = [c.strip().lower() for c in df.columns]
-                    return df
-            except Exception:
-                pass
-        try:
-            df = pd.read_excel("data/records.xlsx")
-            df.columns = [c.strip().lower() for c in df.columns]
-            return df
-        except:
-            return pd.DataFrame(columns=[
-                "base_id", "date", "type", "number", "amount",
-                "client_name", "phone", "location", "note"
-            ])
-
-    def save_record(rec):
-        # Try DB first then fallback to Excel
-        if _db is not None:
-            try:
-                if rec.get('type') and rec.get('number'):
-                    try:
-                        _db.db_execute('DELETE FROM records WHERE type = %s AND number = %s', (rec.get('type'), rec.get('number')))
-                    except Exception:
-                        pass
-                _db.db_execute('INSERT INTO records(base_id, date, type, number, amount, client_name, phone, location, note) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)',
-                                (rec.get('base_id'), rec.get('date'), rec.get('type'), rec.get('number'), rec.get('amount'), rec.get('client_name'), rec.get('phone'), rec.get('location'), rec.get('note')))
-                return
-            except Exception:
-                pass
-
-        df = load_records()
-        if not df.empty and {"type", "number"}.issubset(df.columns):
-            df = df[~((df["type"] == rec.get("type")) & (df["number"] == rec.get("number")))]
-        df = pd.concat([df, pd.DataFrame([rec])], ignore_index=True)
-        if {"type", "number"}.issubset(df.columns):
-            df = df.drop_duplicates(subset=["type", "number"], keep="last")
-        df.to_excel("data/records.xlsx", index=False)
-
-    # =====================================
-    # WORD TEMPLATE ONLY (pdfkit removed)
-    # =====================================
-    def generate_word(template, data_dict):
-        doc = Document(template)
-
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for k, v in data_dict.items():
-                        if k in cell.text:
-                            cell.text = cell.text.replace(k, "" if v is None else str(v))
-
-        buf = BytesIO()
-        doc.save(buf)
-        buf.seek(0)
-        return buf
-
     # =====================================
     # THEME
     # Inherit global Invoice theme from main.py to keep design consistent
     # (No page-level overrides needed)
 
-    # =====================================
-    # LOAD DATABASE
-    # =====================================
-    records = load_records()
-    invoices_df = records[records["type"] == "i"].copy()
-    invoice_list = invoices_df["number"].astype(str).tolist()
-
     # =====================================
     # RECEIPT UI
     # =====================================
@@ -132,20 +80,27 @@ def receipt_app():
     c1, c2 = st.columns(2)
 
     with c1:
-        # Rich labels for type-to-search
+        # Only invoices with a remaining balance, from the balance index
+        search = st.text_input("Search invoice, client or phone", key="rcpt_invoice_search")
+        invoices_df = open_invoices(search, limit=PICKER_LIMIT + 1)
+        if len(invoices_df) > PICKER_LIMIT:
+            invoices_df = invoices_df.head(PICKER_LIMIT)
+            st.caption(f"Showing the latest {PICKER_LIMIT} open invoices; search to narrow the list.")
         if not invoices_df.empty:
             df = invoices_df.fillna("")
             numbers = df["number"].astype(str).tolist()
-            labels = {}
-            for _, row in df.iterrows():
-                labels[str(row["number"])]= f"{row['number']}  |  {row.get('client_name','')}  |  {phone_label_mask(row.get('phone',''))}"
+            labels = {
+                n: f"{n}  |  {c}  |  {phone_label_mask(p)}  |  {float(r):,.2f} AED due"
+                for n, c, p, r in zip(numbers, df["client_name"], df["phone"], df["remaining"])
+            }
             selected_invoice = st.selectbox(
                 "Select Invoice",
-                options=numbers if numbers else ["No invoices"],
+                options=numbers,
                 key="rcpt_invoice_select",
                 format_func=lambda n: labels.get(n, n),
             )
         else:
+            st.info("No open invoices" + (" match this search." if search else "."))
             selected_invoice = None
 
     with c2:
@@ -154,12 +109,13 @@ def receipt_app():
 
     if selected_invoice:
 
-        inv = records[records["number"] == selected_invoice].iloc[0]
+        inv = invoices_df[invoices_df["number"].astype(str) == selected_invoice].iloc[0]
 
         base_id = inv["base_id"]
+        invoice_total = float(inv["total"] or 0)
 
-        # Count previous receipts for same base ID
-        previous_r = len(records[(records["base_id"] == base_id) & (records["type"] == "r")]) + 1
+        # Next receipt number for the same base ID
+        previous_r = int(inv["receipts"] or 0) + 1
 
         receipt_no = f"R-{today}-{base_id}-{previous_r}"
 
@@ -170,20 +126,20 @@ def receipt_app():
         pretty_phone = format_phone_input(inv.get('phone','')) or inv.get('phone','')
         st.write(f"**Phone:** {pretty_phone}")
         st.write(f"**Location:** {proper_case(inv.get('location',''))}")
-        st.write(f"**Invoice Total:** {float(inv.get('amount',0)):.2f} AED")
+        st.write(f"**Invoice Total:** {invoice_total:.2f} AED")
 
         st.markdown("---")
 
         # Previous payments and summary
-        prev_receipts = records[(records["base_id"] == base_id) & (records["type"] == "r")]
-        previous_paid_total = prev_receipts["amount"].sum() if not prev_receipts.empty else 0.0
+        prev_receipts = receipts_for(base_id)
+        previous_paid_total = float(inv["paid"] or 0)
 
         st.markdown("---")
         col_left, col_right = st.columns([1,1])
 
         with col_right:
             st.markdown("<div class='section-title'>Payment</div>", unsafe_allow_html=True)
-            max_allowed = max(inv["amount"] - previous_paid_total, 0.0)
+            max_allowed = max(invoice_total - previous_paid_total, 0.0)
             payment = st.number_input(
                 "Payment Amount (AED)",
                 min_value=0.0,
@@ -194,7 +150,7 @@ def receipt_app():
                 st.warning("Entered payment exceeds remaining balance; capped.")
                 payment = max_allowed
             total_paid_after = previous_paid_total + payment
-            remaining = inv["amount"] - total_paid_after
+            remaining = invoice_total - total_paid_after
             st.metric("Remaining Balance", f"{remaining:,.2f} AED")
 
         with col_left:
@@ -204,7 +160,7 @@ def receipt_app():
                 <div style='background:#fff;border:1px solid rgba(0,0,0,.08);border-radius:12px;padding:16px;box-shadow:0 2px 6px rgba(0,0,0,.04);'>
                     <div style='display:flex;justify-content:space-between;padding:8px 0;border-bottom:1px solid rgba(0,0,0,.06);'>
                         <span style='font-weight:600;color:#6e6e73;'>Invoice Total</span>
-                        <span style='font-weight:700;color:#1d1d1f;'>{inv['amount']:,.2f} AED</span>
+                        <span style='font-weight:700;color:#1d1d1f;'>{invoice_total:,.2f} AED</span>
                     </div>
                     <div style='display:flex;justify-content:space-between;padding:8px 0;border-bottom:1px solid rgba(0,0,0,.06);'>
                         <span style='font-weight:600;color:#6e6e73;'>Previous Payments</span>
@@ -230,7 +186,7 @@ def receipt_app():
             # History list
             if not prev_receipts.empty:
                 st.markdown("<div style='margin-top:14px;font-weight:600;color:#6e6e73;'>Previous Receipts</div>", unsafe_allow_html=True)
-                for _, r in prev_receipts.sort_values("date", ascending=False).iterrows():
+                for _, r in prev_receipts.iterrows():
                     st.markdown(
                         f"<div style='font-size:13px;padding:4px 0;border-bottom:1px dashed rgba(0,0,0,.08);'>" \
                         f"{r['number']} — {r['amount']:,.2f} AED</div>",
@@ -258,24 +214,49 @@ def receipt_app():
             file_name=f"Receipt_{receipt_no}.docx"
         )
 
-        # Also offer HTML export using the receipt A4 template
+        # Also offer HTML and PDF exports using the receipt A4 template
+        receipt_context = {
+            'company_name': load_settings().get('company_name', 'Newton Smart Home'),
+            'receipt_number': receipt_no,
+            'receipt_date': datetime.today().strftime('%Y-%m-%d'),
+            'client_name': inv.get('client_name',''),
+            'client_phone': (format_phone_input(inv.get('phone','')) or inv.get('phone','')),
+            'client_location': inv.get('location',''),
+            'invoice_total': invoice_total,
+            'amount': payment,
+            'previous_paid': previous_paid_total,
+            'balance': remaining,
+        }
         try:
-            html_receipt = render_quotation_html({
-                'company_name': load_settings().get('company_name', 'Newton Smart Home'),
-                'receipt_number': receipt_no,
-                'receipt_date': datetime.today().strftime('%Y-%m-%d'),
-                'client_name': inv.get('client_name',''),
-                'client_phone': (format_phone_input(inv.get('phone','')) or inv.get('phone','')),
-                'client_location': inv.get('location',''),
-                'amount': payment,
-                'previous_paid': previous_paid_total,
-                'balance': remaining,
-            }, template_name='newton_receipt_A4.html')
+            html_receipt = render_document_html('receipt', receipt_context)
             st.download_button('Download Receipt (HTML)', html_receipt, file_name=f"Receipt_{receipt_no}.html", mime='text/html')
         except Exception as e:
             st.warning(f"Unable to prepare receipt HTML: {e}")
 
-        if clicked:
+        clicked_pdf = False
+        try:
+            # PDF conversion is slow, so it only runs on request and is reused
+            # until the receipt changes
+            pdf_key = (receipt_no, float(payment))
+            pdf_ready = peek_memo("receipt_pdf", pdf_key)
+            if pdf_ready is None and st.button("Prepare PDF", key=f"prep_pdf_{receipt_no}"):
+                with st.spinner("Preparing PDF..."):
+                    pdf_ready = session_memo(
+                        "receipt_pdf", pdf_key,
+                        lambda: document_to_pdf('receipt', receipt_context),
+                    )
+            if pdf_ready is not None:
+                clicked_pdf = st.download_button(
+                    label="Download Receipt (PDF)",
+                    data=pdf_ready,
+                    file_name=f"Receipt_{receipt_no}.pdf",
+                    mime="application/pdf",
+                    key=f"dl_pdf_{receipt_no}"
+                )
+        except Exception as e:
+            st.warning(f"Unable to prepare receipt PDF: {e}")
+
+        if clicked or clicked_pdf:
             try:
                 save_record({
                     "base_id": base_id,
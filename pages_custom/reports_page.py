@@ -1,41 +1,30 @@
-import os
 from io import BytesIO
 from datetime import datetime, date
 from typing import Tuple
 
 import pandas as pd
 import streamlit as st
-import altair as alt
 try:
     from utils import db as _db
 except Exception:
     _db = None
+from utils.fragments import fragment
+from utils import storage
+from utils.profiler import timed
 
 # ==========================================
 # File Ensurers
 # ==========================================
 
 def ensure_report_files():
-    os.makedirs("data", exist_ok=True)
-
-    cust_path = "data/customers.xlsx"
-    rec_path = "data/records.xlsx"
-
-    if not os.path.exists(cust_path):
-        pd.DataFrame(columns=[
-            "client_name","phone","location","email","status",
-            "notes","tags","next_follow_up","assigned_to","last_activity"
-        ]).to_excel(cust_path, index=False)
-
-    if not os.path.exists(rec_path):
-        pd.DataFrame(columns=[
-            "base_id","date","type","number","amount","client_name","phone","location","note"
-        ]).to_excel(rec_path, index=False)
+    storage.ensure_table("customers")
+    storage.ensure_table("records")
 
 # ==========================================
 # Loaders with normalization
 # ==========================================
 
+@timed("reports.load_records")
 def _load_records() -> pd.DataFrame:
     ensure_report_files()
     # Try DB first
@@ -55,7 +44,7 @@ def _load_records() -> pd.DataFrame:
         except Exception:
             pass
     try:
-        df = pd.read_excel("data/records.xlsx")
+        df = storage.read_table("records")
         df.columns = [c.strip().lower() for c in df.columns]
         # Normalize types and dates
         if "date" in df.columns:
@@ -71,6 +60,7 @@ def _load_records() -> pd.DataFrame:
         ])
 
 
+@timed("reports.load_customers")
 def _load_customers() -> pd.DataFrame:
     # Try DB first
     if _db is not None:
@@ -86,7 +76,7 @@ def _load_customers() -> pd.DataFrame:
         except Exception:
             pass
     try:
-        df = pd.read_excel("data/customers.xlsx")
+        df = storage.read_table("customers")
         df.columns = [c.strip().lower() for c in df.columns]
         if "next_follow_up" in df.columns:
             df["next_follow_up"] = pd.to_datetime(df["next_follow_up"], errors="coerce")
@@ -98,6 +88,7 @@ def _load_customers() -> pd.DataFrame:
         ])
 
 
+@timed("reports.load_products")
 def _load_products() -> pd.DataFrame:
     # Try DB first
     if _db is not None:
@@ -108,7 +99,7 @@ def _load_products() -> pd.DataFrame:
         except Exception:
             pass
     try:
-        df = pd.read_excel("data/products.xlsx")
+        df = storage.read_table("products")
         return df
     except Exception:
         return pd.DataFrame()
@@ -207,6 +198,49 @@ def _apply_filters(records: pd.DataFrame) -> Tuple[pd.DataFrame, dict]:
 # ==========================================
 
 
+@timed("reports.project_lifecycle")
+def _project_lifecycle(records: pd.DataFrame) -> pd.DataFrame:
+    """One row per project (base_id) with document status and balances."""
+    # بناء جدول لكل base_id
+    lifecycle = []
+    for base_id, group in records.groupby("base_id"):
+        client = group["client_name"].iloc[0] if "client_name" in group.columns else "—"
+        phone = group["phone"].iloc[0] if "phone" in group.columns else "—"
+        location = group["location"].iloc[0] if "location" in group.columns else "—"
+        q_row = group[group["type"] == "q"]
+        i_row = group[group["type"] == "i"]
+        r_row = group[group["type"] == "r"]
+        status_q = "✅" if not q_row.empty else "❌"
+        status_i = "✅" if not i_row.empty else "❌"
+        status_r = "✅" if not r_row.empty else "❌"
+        amt = i_row["amount"].sum() if not i_row.empty else 0.0
+        paid = r_row["amount"].sum() if not r_row.empty else 0.0
+        remain = amt - paid
+        last_update = group["date"].max() if "date" in group.columns else "—"
+        lifecycle.append({
+            "base_id": base_id,
+            "client": client,
+            "phone": phone,
+            "location": location,
+            "عرض سعر": status_q,
+            "فاتورة": status_i,
+            "إيصال": status_r,
+            "المبلغ": amt,
+            "المدفوع": paid,
+            "الرصيد": remain,
+            "آخر تحديث": last_update,
+        })
+    return pd.DataFrame(lifecycle)
+
+
+@st.cache_data(show_spinner=False)
+def _excel_bytes(df: pd.DataFrame) -> bytes:
+    """Encode a report table as xlsx; cached so reruns skip re-encoding unchanged data."""
+    buf = BytesIO()
+    df.to_excel(buf, index=False)
+    return buf.getvalue()
+
+
 def _metric_card(label: str, value: str):
     st.markdown(
         f"""
@@ -224,6 +258,9 @@ def _metric_card(label: str, value: str):
 # ==========================================
 
 def reports_app():
+    # altair is only needed for the charts below
+    import altair as alt
+
     ensure_report_files()
     records = _load_records()
     customers = _load_customers()
@@ -249,36 +286,7 @@ def reports_app():
     st.markdown("<div class='section-title'>متابعة دورة حياة المشاريع</div>", unsafe_allow_html=True)
     # 2) جدول متابعة المشاريع
     if not records.empty:
-        # بناء جدول لكل base_id
-        lifecycle = []
-        for base_id, group in records.groupby("base_id"):
-            client = group["client_name"].iloc[0] if "client_name" in group.columns else "—"
-            phone = group["phone"].iloc[0] if "phone" in group.columns else "—"
-            location = group["location"].iloc[0] if "location" in group.columns else "—"
-            q_row = group[group["type"] == "q"]
-            i_row = group[group["type"] == "i"]
-            r_row = group[group["type"] == "r"]
-            status_q = "✅" if not q_row.empty else "❌"
-            status_i = "✅" if not i_row.empty else "❌"
-            status_r = "✅" if not r_row.empty else "❌"
-            amt = i_row["amount"].sum() if not i_row.empty else 0.0
-            paid = r_row["amount"].sum() if not r_row.empty else 0.0
-            remain = amt - paid
-            last_update = group["date"].max() if "date" in group.columns else "—"
-            lifecycle.append({
-                "base_id": base_id,
-                "client": client,
-                "phone": phone,
-                "location": location,
-                "عرض سعر": status_q,
-                "فاتورة": status_i,
-                "إيصال": status_r,
-                "المبلغ": amt,
-                "المدفوع": paid,
-                "الرصيد": remain,
-                "آخر تحديث": last_update,
-            })
-        df_life = pd.DataFrame(lifecycle)
+        df_life = _project_lifecycle(records)
         st.dataframe(df_life, use_container_width=True, hide_index=True)
     else:
         st.info("لا توجد مشاريع بعد.")
@@ -298,26 +306,28 @@ def reports_app():
     st.altair_chart(chart, use_container_width=True)
 
     # 3) جدول المستندات الكامل
-    st.markdown("---")
-    st.markdown("<div class='section-title'>Documents</div>", unsafe_allow_html=True)
-    if not records.empty:
-        view = records.copy()
-        cols = [
-            "date","type","number","client_name","phone","location","amount","base_id","note"
-        ]
-        cols = [c for c in cols if c in view.columns]
-        view = view[cols].sort_values(by=["date"], ascending=False)
-        st.dataframe(view, use_container_width=True, hide_index=True)
-
-        buf_xlsx = BytesIO()
-        view.to_excel(buf_xlsx, index=False)
-        buf_xlsx.seek(0)
-        st.download_button("Export Excel", buf_xlsx, file_name="documents_report.xlsx")
+    # Export buttons rerun only this section
+    @fragment
+    def _documents_section():
+        st.markdown("---")
+        st.markdown("<div class='section-title'>Documents</div>", unsafe_allow_html=True)
+        if not records.empty:
+            view = records.copy()
+            cols = [
+                "date","type","number","client_name","phone","location","amount","base_id","note"
+            ]
+            cols = [c for c in cols if c in view.columns]
+            view = view[cols].sort_values(by=["date"], ascending=False)
+            st.dataframe(view, use_container_width=True, hide_index=True)
+
+            st.download_button("Export Excel", _excel_bytes(view), file_name="documents_report.xlsx")
+
+            buf_csv = BytesIO(view.to_csv(index=False).encode("utf-8"))
+            st.download_button("Export CSV", buf_csv, file_name="documents_report.csv")
+        else:
+            st.info("No documents found.")
 
-        buf_csv = BytesIO(view.to_csv(index=False).encode("utf-8"))
-        st.download_button("Export CSV", buf_csv, file_name="documents_report.csv")
-    else:
-        st.info("No documents found.")
+    _documents_section()
 
     # 4) Financial analytics
     st.markdown("---")
@@ -402,24 +412,22 @@ def reports_app():
         st.info("No customers found.")
 
     # 8) Exporting
-    st.markdown("---")
-    st.markdown("<div class='section-title'>Exporting</div>", unsafe_allow_html=True)
-
-    # Full report = جميع المستندات
-    full_buf = BytesIO()
-    records.to_excel(full_buf, index=False)
-    full_buf.seek(0)
-    st.download_button("Download Full Report (Excel)", full_buf, file_name="full_report.xlsx")
-
-    # Summary only
-    summary_df = pd.DataFrame([
-        {"Metric":"Total Quotations","Value": q_count},
-        {"Metric":"Total Invoice Amount","Value": inv_sum},
-        {"Metric":"Total Received Amount","Value": rec_sum},
-        {"Metric":"Outstanding Balance","Value": outstanding},
-        {"Metric":"Total Projects","Value": projects},
-    ])
-    sum_buf = BytesIO()
-    summary_df.to_excel(sum_buf, index=False)
-    sum_buf.seek(0)
-    st.download_button("Download Summary Only (Excel)", sum_buf, file_name="summary_report.xlsx")
\ No newline at end of file
+    @fragment
+    def _export_section():
+        st.markdown("---")
+        st.markdown("<div class='section-title'>Exporting</div>", unsafe_allow_html=True)
+
+        # Full report = جميع المستندات
+        st.download_button("Download Full Report (Excel)", _excel_bytes(records), file_name="full_report.xlsx")
+
+        # Summary only
+        summary_df = pd.DataFrame([
+            {"Metric":"Total Quotations","Value": q_count},
+            {"Metric":"Total Invoice Amount","Value": inv_sum},
+            {"Metric":"Total Received Amount","Value": rec_sum},
+            {"Metric":"Outstanding Balance","Value": outstanding},
+            {"Metric":"Total Projects","Value": projects},
+        ])
+        st.download_button("Download Summary Only (Excel)", _excel_bytes(summary_df), file_name="summary_report.xlsx")
+
+    _export_section()
\ No newline at end of file
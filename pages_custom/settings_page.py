@@ -1,10 +1,11 @@
 """
-Settings Page - Complete Implementation with 5 Sections:
+Settings Page - Complete Implementation with 6 Sections:
 1. User Management
 2. System Configuration  
 3. Template Manager
 4. Backup & Restore
 5. Log Viewer
+6. Performance
 """
 
 import streamlit as st
@@ -20,7 +21,12 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from utils.auth import load_users, save_users, is_admin
 from utils.logger import log_event, load_logs
-from utils.settings import load_settings, save_settings
+from utils.settings import load_settings, save_settings, SETTINGS_PATH
+from utils import profiler
+from utils import storage, file_lock
+from utils.pdf_renderer import get_renderer
+from utils import pdf_engines, pdf_optimize
+from utils import http_side, warmup, image_cache, session_memory
 try:
     from utils import db as _db
 except Exception:
@@ -457,7 +463,7 @@ def _apply_settings_theme():
 
 
 def settings_app():
-    """Main settings page with 5 sections."""
+    """Main settings page with 6 sections."""
     
     # Apply theme
     _apply_settings_theme()
@@ -477,12 +483,13 @@ def settings_app():
         st.warning("⚠️ Most settings require administrator privileges.")
     
     # Create tabs for sections
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
         "Users",
         "Configuration",
         "Templates",
         "Backup & Restore",
-        "Activity Logs"
+        "Activity Logs",
+        "Performance"
     ])
     
     with tab1:
@@ -500,6 +507,9 @@ def settings_app():
     with tab5:
         log_viewer_section(user, user_name)
 
+    with tab6:
+        performance_section(user, user_name)
+
 
 # ========================================================
 # SECTION 1: USER MANAGEMENT
@@ -689,11 +699,7 @@ def system_config_section(user, user_name):
 
     if dbg_col1.button("\u200f\u0641\u062d\u0635 \u0645\u0644\u0641\u0627\u062a \u0627\u0644\u0628\u064a\u0627\u0646\u0627\u062a", key="debug_files"):
         files = [
-            ("products.xlsx", "data/products.xlsx"),
-            ("customers.xlsx", "data/customers.xlsx"),
-            ("records.xlsx", "data/records.xlsx"),
-            ("users.xlsx", "data/users.xlsx"),
-            ("logs.xlsx", "data/logs.xlsx"),
+            ("newton.db", storage.DB_PATH),
             ("settings.json", "data/settings.json")
         ]
         status_rows = []
@@ -704,6 +710,13 @@ def system_config_section(user, user_name):
                 "المسار": path,
                 "الحالة": "موجود" if exists else "مفقود"
             })
+        for table in storage.TABLE_COLUMNS:
+            exists = storage.table_exists(table)
+            status_rows.append({
+                "الملف": table,
+                "المسار": f"{storage.DB_PATH}:{table}",
+                "الحالة": "موجود" if exists else "مفقود"
+            })
         st.dataframe(pd.DataFrame(status_rows))
 
     if dbg_col2.button("\u200f\u0639\u0631\u0636 \u0622\u062e\u0631 \u0627\u0644\u0633\u062c\u0644\u0627\u062a", key="debug_logs"):
@@ -771,9 +784,7 @@ def template_manager_section(user, user_name):
             
             if upload and st.button(f"Replace Template", key=f"btn_{name}", type="primary"):
                 try:
-                    os.makedirs("data", exist_ok=True)
-                    with open(path, "wb") as f:
-                        f.write(upload.read())
+                    file_lock.atomic_write(path, upload.read())
                     log_event(user_name, "Settings", "template_uploaded", f"{name} template: {filename}")
                     st.success(f"✓ {name} template updated successfully")
                     st.rerun()
@@ -804,12 +815,17 @@ def backup_restore_section(user, user_name):
             buf = BytesIO()
             with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
                 files_included = []
-                for fname in ["products.xlsx", "customers.xlsx", "records.xlsx", 
-                             "users.xlsx", "logs.xlsx", "settings.json"]:
-                    path = f"data/{fname}"
-                    if os.path.exists(path):
-                        zf.write(path, fname)
-                        files_included.append(fname)
+                # Tables are exported as xlsx so backups stay readable and restorable
+                for table in storage.TABLE_COLUMNS:
+                    if storage.table_exists(table):
+                        sheet = BytesIO()
+                        storage.read_table(table).to_excel(sheet, index=False)
+                        zf.writestr(f"{table}.xlsx", sheet.getvalue())
+                        files_included.append(f"{table}.xlsx")
+                file_lock.flush(SETTINGS_PATH)
+                if os.path.exists(SETTINGS_PATH):
+                    zf.write(SETTINGS_PATH, "settings.json")
+                    files_included.append("settings.json")
             buf.seek(0)
             ts = datetime.now().strftime("%Y%m%d_%H%M%S")
             log_event(user_name, "Settings", "backup_created", f"Full backup: {len(files_included)} files")
@@ -836,10 +852,19 @@ def backup_restore_section(user, user_name):
         st.markdown('<div class="spacing-sm"></div>', unsafe_allow_html=True)
         if st.button("Restore Data", type="secondary"):
             try:
+                data_dir = os.path.abspath("data")
                 with zipfile.ZipFile(restore, "r") as zf:
-                    os.makedirs("data", exist_ok=True)
-                    file_list = zf.namelist()
-                    zf.extractall("data")
+                    file_list = [n for n in zf.namelist() if not n.endswith("/")]
+                    for fname in file_list:
+                        target = os.path.abspath(os.path.join(data_dir, fname))
+                        if os.path.commonpath([data_dir, target]) != data_dir:
+                            continue
+                        # Atomic replace, and it supersedes any queued settings save
+                        file_lock.atomic_write(target, zf.read(fname))
+                for fname in file_list:
+                    table = os.path.splitext(os.path.basename(fname))[0]
+                    if fname.endswith(".xlsx") and table in storage.TABLE_COLUMNS:
+                        storage.import_xlsx(table, os.path.join("data", fname))
                 log_event(user_name, "Settings", "restore_completed", f"Restored {len(file_list)} files")
                 st.success(f"✓ Data restored successfully ({len(file_list)} files). Please refresh the page.")
             except Exception as e:
@@ -904,3 +929,182 @@ def log_viewer_section(user, user_name):
         csv = filtered.to_csv(index=False)
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         st.download_button("⬇ Download CSV", csv, f"activity_logs_{ts}.csv", "text/csv")
+
+
+# ========================================================
+# SECTION 6: PERFORMANCE
+# ========================================================
+def performance_section(user, user_name):
+    """Rerun timings and hot-path span statistics."""
+
+    st.markdown('<div class="crm-section-title">Performance</div>', unsafe_allow_html=True)
+
+    c1, c2 = st.columns(2)
+    with c1:
+        last_ms = st.session_state.get("last_run_ms")
+        st.markdown('<div class="log-metric"><div class="log-metric-value">{}</div><div class="log-metric-label">Last full rerun (ms)</div></div>'.format(
+            f"{last_ms:.0f}" if last_ms is not None else "—"), unsafe_allow_html=True)
+    with c2:
+        frag = st.session_state.get("fragment_ms", {})
+        st.markdown('<div class="log-metric"><div class="log-metric-value">{}</div><div class="log-metric-label">Timed sections</div></div>'.format(len(frag)), unsafe_allow_html=True)
+    if frag:
+        st.dataframe(
+            pd.DataFrame([{"section": k, "last_ms": round(v, 1)} for k, v in frag.items()]),
+            use_container_width=True, hide_index=True,
+        )
+
+    renderer = get_renderer()
+    if renderer.warm_ms is not None:
+        st.caption(f"PDF renderer warmed up in {renderer.warm_ms:.0f} ms")
+
+    # Session memory (measured by main.py after each full run, see utils/session_memory.py)
+    st.markdown('<div class="spacing-md"></div>', unsafe_allow_html=True)
+    st.markdown('<div class="crm-subsection">Session memory</div>', unsafe_allow_html=True)
+    session_memory.track(st.session_state, user_name, force=True)
+    totals = session_memory.totals()
+    images = image_cache.stats()
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Sessions", totals["sessions"])
+    m2.metric("Session state (KB)", f"{totals['bytes'] / 1024:,.0f}")
+    m3.metric("Cached exports (KB)", f"{totals['memo_bytes'] / 1024:,.0f}",
+              help=f"Budget {totals['budget_bytes'] / 1024 / 1024:,.0f} MB; "
+                   f"{totals['evictions']} entries ({totals['evicted_bytes'] / 1024:,.0f} KB) evicted so far")
+    st.dataframe(
+        pd.DataFrame([
+            {"session": row["session"][:8], "user": row["user"], "KB": round(row["bytes"] / 1024, 1),
+             "largest entries": ", ".join(f"{k} ({v / 1024:,.0f} KB)" for k, v in
+                                          sorted(row["keys"].items(), key=lambda kv: kv[1], reverse=True)[:3])}
+            for row in session_memory.sessions()
+        ] + [{"session": "process", "user": "", "KB": round(images["bytes"] / 1024, 1),
+              "largest entries": f"image cache ({images['images']} images)"}]),
+        use_container_width=True, hide_index=True,
+    )
+    if is_admin(user):
+        settings = load_settings()
+        budget_mb = st.number_input(
+            "Cached exports budget per process (MB)", min_value=1, step=16, key="perf_memo_budget",
+            value=int(settings.get("session_memory_budget_mb", session_memory.DEFAULT_BUDGET_MB)),
+            help="Rendered Word/PDF/HTML kept for reuse across reruns. Beyond this the least recently used are dropped and rebuilt on demand.",
+        )
+        if budget_mb != int(settings.get("session_memory_budget_mb", session_memory.DEFAULT_BUDGET_MB)):
+            settings["session_memory_budget_mb"] = int(budget_mb)
+            save_settings(settings)
+            log_event(user_name, "Settings", "memory_budget_changed", f"Budget: {budget_mb} MB")
+            session_memory.enforce_budget()
+
+    # Process warm-up (started once per server process by main.py)
+    st.markdown('<div class="spacing-md"></div>', unsafe_allow_html=True)
+    st.markdown('<div class="crm-subsection">Warm-up</div>', unsafe_allow_html=True)
+    steps = warmup.status()
+    if not steps:
+        st.caption("Warm-up has not started in this process.")
+    else:
+        failed = [s["step"] for s in steps if s["state"] == "failed"]
+        if not warmup.is_ready():
+            done = sum(s["state"] in ("ok", "failed") for s in steps)
+            st.info(f"Warming up: {done}/{len(steps)} steps done")
+        elif failed:
+            st.warning(f"Warm-up finished with failures: {', '.join(failed)}")
+        else:
+            total = sum(s["ms"] or 0 for s in steps)
+            st.success(f"Ready: warm-up finished in {total:.0f} ms")
+        st.dataframe(
+            pd.DataFrame([
+                {"step": s["step"], "state": s["state"],
+                 "ms": round(s["ms"], 1) if s["ms"] is not None else None, "detail": s["detail"]}
+                for s in steps
+            ]),
+            use_container_width=True, hide_index=True,
+        )
+
+    # PDF engines (detected once per process in the background)
+    st.markdown('<div class="spacing-md"></div>', unsafe_allow_html=True)
+    st.markdown('<div class="crm-subsection">PDF engines</div>', unsafe_allow_html=True)
+    available = pdf_engines.detect_engines()
+    errors = pdf_engines.detection_errors()
+    st.dataframe(
+        pd.DataFrame([
+            {"engine": name, "available": bool(available.get(name)), "note": errors.get(name, "")}
+            for name in pdf_engines.engine_names()
+        ]),
+        use_container_width=True, hide_index=True,
+    )
+    if is_admin(user):
+        settings = load_settings()
+        options = ["auto"] + pdf_engines.engine_names()
+        current = settings.get("pdf_engine", "auto")
+        qualities = list(pdf_optimize.QUALITY_PRESETS)
+        current_quality = settings.get("pdf_quality", pdf_optimize.DEFAULT_QUALITY)
+        e1, e2, e3 = st.columns(3)
+        with e1:
+            engine = st.selectbox("Preferred engine", options,
+                                  index=options.index(current) if current in options else 0, key="perf_pdf_engine")
+        with e2:
+            quality = st.selectbox("PDF size / quality", qualities,
+                                   index=qualities.index(current_quality) if current_quality in qualities else 0,
+                                   key="perf_pdf_quality",
+                                   help="Image resolution in exported PDFs: print 200 dpi, email 150 dpi, screen 96 dpi, original untouched")
+        with e3:
+            allow_remote = st.toggle("Allow remote conversion (ConvertAPI)",
+                                     value=bool(settings.get("pdf_allow_remote", False)), key="perf_pdf_remote")
+        if (engine != current or quality != current_quality
+                or allow_remote != bool(settings.get("pdf_allow_remote", False))):
+            settings["pdf_engine"] = engine
+            settings["pdf_quality"] = quality
+            settings["pdf_allow_remote"] = bool(allow_remote)
+            save_settings(settings)
+            log_event(user_name, "Settings", "pdf_engine_changed",
+                      f"Engine: {engine}, quality: {quality}, remote: {allow_remote}")
+            st.rerun()
+        if not pdf_optimize.is_available():
+            st.caption("pikepdf is not installed; PDFs are exported without size optimization.")
+
+    st.markdown('<div class="spacing-md"></div>', unsafe_allow_html=True)
+    st.markdown('<div class="crm-subsection">Instrumentation</div>', unsafe_allow_html=True)
+
+    if is_admin(user):
+        enabled = st.toggle("Enable profiling", value=profiler.is_enabled(), key="perf_enabled")
+        if enabled != profiler.is_enabled():
+            profiler.set_enabled(enabled)
+            settings = load_settings()
+            settings["profiling_enabled"] = bool(enabled)
+            save_settings(settings)
+            if enabled:
+                http_side.ensure_server()
+            log_event(user_name, "Settings", "profiling_toggled", f"Enabled: {enabled}")
+            st.rerun()
+    elif not profiler.is_enabled():
+        st.info("Profiling is disabled. An administrator can enable it here.")
+
+    if not profiler.is_enabled():
+        return
+
+    # Spans recorded during this session's previous full rerun
+    last_run = st.session_state.get("last_run_profile") or []
+    if last_run:
+        st.markdown('<div class="crm-subsection">Previous rerun</div>', unsafe_allow_html=True)
+        st.dataframe(
+            pd.DataFrame([{"span": name, "ms": round(ms, 2)} for name, ms in last_run]),
+            use_container_width=True, hide_index=True,
+        )
+
+    snap = profiler.snapshot()
+    st.markdown('<div class="crm-subsection">All sessions (p50 / p95)</div>', unsafe_allow_html=True)
+    if snap["spans"]:
+        st.dataframe(pd.DataFrame(snap["spans"]), use_container_width=True, hide_index=True)
+    else:
+        st.caption("No samples yet. Use the app for a while and come back.")
+    if snap["counters"]:
+        st.dataframe(
+            pd.DataFrame([{"counter": k, "value": v} for k, v in snap["counters"].items()]),
+            use_container_width=True, hide_index=True,
+        )
+
+    st.caption(f"Metrics endpoint: {http_side.side_base_url()}/metrics (Prometheus) and /metrics.json")
+    d1, d2 = st.columns(2)
+    with d1:
+        st.download_button("⬇ Download JSON", json.dumps(snap, indent=2), "newton_metrics.json", "application/json")
+    with d2:
+        if is_admin(user) and st.button("Reset statistics", key="perf_reset"):
+            profiler.reset()
+            st.rerun()
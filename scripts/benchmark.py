@@ -0,0 +1,527 @@
+"""Benchmark suite for data loading, aggregation and document rendering.
+
+Generates synthetic records/customers/products/line items, times the same
+loaders, aggregations and exporters the pages use, and compares the results
+against a stored baseline so regressions show up before they reach users.
+
+Usage:
+    python scripts/benchmark.py                      # small scale, compare with baseline
+    python scripts/benchmark.py --scale medium       # 10k-100k records, 1k products, 50-500 items
+    python scripts/benchmark.py --scale large        # adds 1M records / 10k products
+    python scripts/benchmark.py --only render,docx   # run selected groups
+    python scripts/benchmark.py --save-baseline      # store results as the new baseline
+    python scripts/benchmark.py --postgres           # also time loaders against DB_CONNECTION_STRING (read-only)
+
+Groups: excel, storage, sqlite, postgres, aggregate, render, pdf, docx.
+Exit code is 1 when any case is slower than baseline by more than --threshold
+(relative) and by at least --min-delta milliseconds. Every case reports its
+fastest run, and cases under 50 ms are sampled repeatedly, so scheduler jitter
+on short cases is not mistaken for a regression.
+"""
+from pathlib import Path
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+repo_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(repo_root))
+
+import pandas as pd
+
+BASELINE_PATH = repo_root / "benchmarks" / "baseline.json"
+
+SCALES = {
+    "small": {"records": [1_000], "products": [10, 1_000], "line_items": [1, 50]},
+    "medium": {"records": [1_000, 10_000, 100_000], "products": [10, 1_000], "line_items": [1, 50, 500]},
+    "large": {"records": [1_000, 10_000, 100_000, 1_000_000], "products": [10, 1_000, 10_000], "line_items": [1, 50, 500]},
+}
+
+# xlsx writes above this take minutes and say nothing new about parse cost
+EXCEL_MAX_ROWS = 100_000
+# Cases under FAST_MS are sampled up to FAST_SAMPLES times (within FAST_BUDGET_S)
+FAST_MS = 50.0
+FAST_SAMPLES = 30
+FAST_BUDGET_S = 1.0
+# One-shot cold-start cases (cannot be repeated in-process): reported, never flagged
+SINGLE_RUN = set()
+
+LOCATIONS = ["Dubai - Marina", "Abu Dhabi - Yas Island", "Sharjah - Al Majaz", "Ajman - Al Rawda", "RAK - Julph"]
+STATUSES = ["New", "Follow-up", "Active", "Done", "Lost"]
+
+
+# ==========================================
+# Synthetic data
+# ==========================================
+
+def make_customers(n: int, seed: int = 1) -> pd.DataFrame:
+    rnd = random.Random(seed)
+    return pd.DataFrame({
+        "client_name": [f"Client {i:06d}" for i in range(n)],
+        "phone": [f"05{rnd.randint(0, 99_999_999):08d}" for _ in range(n)],
+        "location": [rnd.choice(LOCATIONS) for _ in range(n)],
+        "email": [f"client{i}@example.com" for i in range(n)],
+        "status": [rnd.choice(STATUSES) for _ in range(n)],
+        "notes": [""] * n,
+        "tags": [""] * n,
+        "next_follow_up": [""] * n,
+        "assigned_to": [rnd.choice(["Sales", "Ops", ""]) for _ in range(n)],
+        "last_activity": [date(2024, 1, 1).isoformat()] * n,
+    })
+
+
+def make_records(n: int, customers: pd.DataFrame, seed: int = 2) -> pd.DataFrame:
+    """Quotation/invoice/receipt rows grouped into projects of about three documents."""
+    rnd = random.Random(seed)
+    start = date(2023, 1, 1)
+    names = customers["client_name"].tolist()
+    phones = customers["phone"].tolist()
+    locs = customers["location"].tolist()
+    rows = {k: [] for k in ["base_id", "date", "type", "number", "amount", "client_name", "phone", "location", "note"]}
+    for i in range(n):
+        project = i // 3
+        c = project % len(names)
+        kind = "qir"[i % 3]
+        rows["base_id"].append(f"{(start + timedelta(days=project % 700)).strftime('%Y%m%d')}-{project:06d}")
+        rows["date"].append((start + timedelta(days=(project % 700) + i % 3)).isoformat())
+        rows["type"].append(kind)
+        rows["number"].append(f"{kind.upper()}-{i:07d}")
+        rows["amount"].append(round(rnd.uniform(500, 50_000), 2))
+        rows["client_name"].append(names[c])
+        rows["phone"].append(phones[c])
+        rows["location"].append(locs[c])
+        rows["note"].append("")
+    return pd.DataFrame(rows)
+
+
+def make_products(n: int, seed: int = 3) -> pd.DataFrame:
+    rnd = random.Random(seed)
+    return pd.DataFrame({
+        "Device": [f"Device {i:05d}" for i in range(n)],
+        "Description": [f"Smart device model {i} with extended description text" for i in range(n)],
+        "UnitPrice": [round(rnd.uniform(50, 5_000), 2) for _ in range(n)],
+        "Warranty": [rnd.choice([1, 2, 3]) for _ in range(n)],
+        "ImageBase64": [None] * n,
+        "ImagePath": [None] * n,
+    })
+
+
+def make_line_items(n: int, seed: int = 4) -> list:
+    """Line items in the record shape produced by LineItemTable.to_records()."""
+    from utils.line_items import LineItem, LineItemTable
+    rnd = random.Random(seed)
+    table = LineItemTable()
+    for i in range(n):
+        table.add(LineItem(
+            device=f"Device {i:05d}",
+            description=f"Smart device model {i}",
+            qty=rnd.randint(1, 10),
+            unit_price=round(rnd.uniform(50, 5_000), 2),
+            warranty=rnd.choice([1, 2, 3]),
+        ))
+    return table.to_records()
+
+
+# ==========================================
+# Timing helpers
+# ==========================================
+
+def measure(func, repeat: int) -> float:
+    """
+    Fastest wall time of `func()` over `repeat` runs, in milliseconds.
+
+    The fastest run is the one least disturbed by the scheduler, GC and other
+    processes. Cases under FAST_MS are re-run up to FAST_SAMPLES times (within
+    FAST_BUDGET_S), since a few samples say little about their jitter.
+    """
+    samples = []
+
+    def run():
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+
+    for _ in range(repeat):
+        run()
+    if min(samples) < FAST_MS:
+        deadline = time.perf_counter() + FAST_BUDGET_S
+        while len(samples) < FAST_SAMPLES and time.perf_counter() < deadline:
+            run()
+    return min(samples)
+
+
+@contextmanager
+def working_dir(path: Path):
+    """Loaders use relative `data/...` paths, so run them from a scratch directory."""
+    prev = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(prev)
+
+
+@contextmanager
+def no_database():
+    """Force the file fallback path even if a DB is configured in the environment."""
+    prev = os.environ.pop("DB_CONNECTION_STRING", None)
+    try:
+        yield
+    finally:
+        if prev is not None:
+            os.environ["DB_CONNECTION_STRING"] = prev
+
+
+# ==========================================
+# Benchmark groups
+# ==========================================
+
+def bench_excel(scale: dict, repeat: int, results: dict):
+    """Raw xlsx parse cost: what every loader paid per call before local storage."""
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        for n in scale["records"]:
+            if n > EXCEL_MAX_ROWS:
+                print(f"  excel: skipping records={n} (above {EXCEL_MAX_ROWS} rows)")
+                continue
+            customers = make_customers(max(10, n // 10))
+            make_records(n, customers).to_excel(data_dir / "records.xlsx", index=False)
+            customers.to_excel(data_dir / "customers.xlsx", index=False)
+            results[f"excel.read_records[{n}]"] = measure(lambda: pd.read_excel(data_dir / "records.xlsx"), repeat)
+            results[f"excel.read_customers[{n // 10}]"] = measure(lambda: pd.read_excel(data_dir / "customers.xlsx"), repeat)
+        for n in scale["products"]:
+            make_products(n).to_excel(data_dir / "products.xlsx", index=False)
+            results[f"excel.read_products[{n}]"] = measure(lambda: pd.read_excel(data_dir / "products.xlsx"), repeat)
+
+
+def bench_storage(scale: dict, repeat: int, results: dict):
+    """Page loaders on the local SQLite storage (cold = cache miss, warm = version cache hit)."""
+    from utils import storage, balances, records as records_store, customers as customers_store, products as products_store
+    from utils import product_import, suppliers
+    from pages_custom import customers_page, reports_page, products_page
+
+    def cold(func):
+        def run():
+            with storage._cache_lock:
+                storage._frame_cache.clear()
+            return func()
+        return run
+
+    with tempfile.TemporaryDirectory() as tmp, no_database():
+        (Path(tmp) / "data").mkdir()
+        with working_dir(Path(tmp)):
+            try:
+                for n in scale["records"]:
+                    customers = make_customers(max(10, n // 10))
+                    records = make_records(n, customers)
+                    results[f"storage.write_records[{n}]"] = measure(lambda: storage.write_table("records", records), repeat)
+                    # One document save: upsert of a single row vs rewriting the table above
+                    balances.open_invoices()
+                    numbers = iter(range(10**9))
+                    results[f"storage.save_record[{n}]"] = measure(lambda: records_store.save_record({
+                        "base_id": "20250101-001", "date": "2025-01-01", "type": "q",
+                        "number": f"Q-BENCH-{next(numbers)}", "amount": 100.0, "client_name": "Bench",
+                    }), repeat)
+                    storage.write_table("records", records)
+                    storage.write_table("customers", customers)
+                    phones = iter(range(10**9))
+                    results[f"storage.upsert_customer[{n // 10}]"] = measure(
+                        lambda: customers_store.upsert_customer("Bench Client", f"058{next(phones):07d}", "Dubai"), repeat)
+                    storage.write_table("customers", customers)
+                    results[f"storage.customers.load_records.cold[{n}]"] = measure(cold(customers_page.load_records), repeat)
+                    results[f"storage.customers.load_records[{n}]"] = measure(customers_page.load_records, repeat)
+                    results[f"storage.reports.load_records[{n}]"] = measure(reports_page._load_records, repeat)
+                    results[f"storage.customers.load_customers[{n // 10}]"] = measure(customers_page.load_customers, repeat)
+                    # Customers page edit: changed fields of one row
+                    customer = customers_page.load_customers().iloc[0].to_dict()
+                    notes = iter(range(10**9))
+                    results[f"storage.customers.update_customer[{n // 10}]"] = measure(
+                        lambda: customers_store.update_customer(customer, {"notes": f"note {next(notes)}"}), repeat)
+                    # Receipt page: open-invoice picker and a receipt save against the balance index
+                    balances.open_invoices()
+                    results[f"storage.receipt.open_invoices[{n}]"] = measure(balances.open_invoices, repeat)
+                    base_id = records.loc[records["type"] == "i", "base_id"].iloc[0]
+                    results[f"storage.receipt.save_receipt[{n}]"] = measure(lambda: records_store.save_record({
+                        "base_id": base_id, "date": "2025-01-01", "type": "r",
+                        "number": f"R-BENCH-{next(numbers)}", "amount": 1.0, "client_name": "Bench",
+                    }), repeat)
+                for n in scale["products"]:
+                    storage.write_table("products", make_products(n))
+                    results[f"storage.products.load_products.cold[{n}]"] = measure(cold(products_page.load_products), repeat)
+                    results[f"storage.products.load_products[{n}]"] = measure(products_page.load_products, repeat)
+                    # One-field edit: versioned single-row update vs rewriting the whole catalog
+                    catalog = products_page.load_products()
+                    first = catalog.iloc[0]
+                    versions = iter(range(int(first["version"]), 10**9))
+                    prices = iter(range(10**9))
+                    results[f"storage.products.update_product[{n}]"] = measure(
+                        lambda: products_store.update_product(first["id"], next(versions), {"UnitPrice": next(prices)}), repeat)
+                    # Weekly price list: 10% of prices change, alternating between two sheets
+                    sheets = []
+                    for bump in (1, 0):
+                        sheet = catalog[["Device", "Description", "UnitPrice", "Warranty"]].copy()
+                        sheet.loc[sheet.index[: max(1, n // 10)], "UnitPrice"] += bump
+                        buf = io.BytesIO()
+                        sheet.to_excel(buf, index=False)
+                        sheets.append(buf.getvalue())
+                    turns = iter(range(10**9))
+                    results[f"storage.products.import_price_list[{n}]"] = measure(
+                        lambda: product_import.apply_import(product_import.plan_import(io.BytesIO(sheets[next(turns) % 2]))), repeat)
+                    # Supplier price list covering the catalog, then the page's cost/margin join
+                    catalog = products_page.load_products()
+                    supplier_id = suppliers.add_supplier("Bench Supplier")
+                    price_lists = []
+                    for bump in (1, 0):
+                        sheet = pd.DataFrame({"SKU": [f"SKU-{i:05d}" for i in range(n)], "Device": catalog["Device"],
+                                              "Cost": (catalog["UnitPrice"] * 0.6).round(2) + bump})
+                        buf = io.BytesIO()
+                        sheet.to_excel(buf, index=False)
+                        price_lists.append(buf.getvalue())
+                    results[f"storage.suppliers.import_price_list[{n}]"] = measure(
+                        lambda: suppliers.import_price_list(io.BytesIO(price_lists[next(turns) % 2]), supplier_id, catalog),
+                        repeat)
+                    results[f"storage.suppliers.catalog_costs[{n}]"] = measure(lambda: suppliers.catalog_costs(catalog), repeat)
+                row = {"timestamp": "2025-01-01 00:00:00", "user": "bench", "page": "bench", "action": "bench", "details": ""}
+                results["storage.append_log"] = measure(lambda: storage.append_rows("logs", [row]), repeat)
+            finally:
+                storage.close_connections()
+
+
+def _sqlite_load(conn, sql: str) -> pd.DataFrame:
+    # Same shape as the DB branch of the loaders: list of dict rows -> DataFrame
+    cur = conn.execute(sql)
+    cols = [c[0] for c in cur.description]
+    return pd.DataFrame([dict(zip(cols, r)) for r in cur.fetchall()])
+
+
+def bench_sqlite(scale: dict, repeat: int, results: dict):
+    """Local stand-in for the Postgres path: same queries, rows materialized as dicts."""
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in scale["records"]:
+            conn = sqlite3.connect(Path(tmp) / f"bench_{n}.db")
+            customers = make_customers(max(10, n // 10))
+            make_records(n, customers).to_sql("records", conn, index=False)
+            customers.rename(columns={"client_name": "name", "location": "address"}).to_sql("customers", conn, index_label="id")
+            results[f"sqlite.load_records[{n}]"] = measure(lambda: _sqlite_load(
+                conn, "SELECT base_id, date, type, number, amount, client_name, phone, location, note FROM records ORDER BY date"), repeat)
+            results[f"sqlite.load_customers[{n // 10}]"] = measure(lambda: _sqlite_load(
+                conn, "SELECT id, name, phone, email, address FROM customers ORDER BY id"), repeat)
+            conn.close()
+
+
+def bench_postgres(scale: dict, repeat: int, results: dict):
+    """Read-only timings against the configured database; never writes synthetic data."""
+    from utils import db
+    if not db.get_connection_string():
+        print("  postgres: DB_CONNECTION_STRING not set, skipping")
+        return
+    from pages_custom import customers_page, reports_page, products_page
+    results["postgres.customers.load_records"] = measure(customers_page.load_records, repeat)
+    results["postgres.reports.load_records"] = measure(reports_page._load_records, repeat)
+    results["postgres.customers.load_customers"] = measure(customers_page.load_customers, repeat)
+    results["postgres.products.load_products"] = measure(products_page.load_products, repeat)
+
+
+def bench_aggregate(scale: dict, repeat: int, results: dict):
+    from pages_custom import reports_page
+    from utils import customer_dedup
+    from utils.customers import customer_finances
+    for n in scale["records"]:
+        customers = make_customers(max(10, n // 10))
+        records = make_records(n, customers)
+        records["date"] = pd.to_datetime(records["date"])
+        results[f"aggregate.reports.project_lifecycle[{n}]"] = measure(lambda: reports_page._project_lifecycle(records), repeat)
+        results[f"aggregate.customers.finances[{len(customers)}x{n}]"] = measure(
+            lambda: customer_finances(customers, records), repeat)
+        with_ids = customers.assign(id=range(len(customers)))
+        results[f"aggregate.customers.find_duplicates[{len(customers)}]"] = measure(
+            lambda: customer_dedup.find_duplicates(with_ids), repeat)
+
+
+def _quotation_context(items: list) -> dict:
+    subtotal = sum(float(i.get("Line Total (AED)", 0) or 0) for i in items)
+    return {
+        "company_name": "Newton Smart Home",
+        "quotation_number": "Q-BENCH-0001",
+        "quotation_date": date.today().isoformat(),
+        "client_name": "Benchmark Client",
+        "client_address": "Dubai - Marina",
+        "project_location": "Dubai - Marina",
+        "items": items,
+        "subtotal": subtotal,
+        "Installation": 500.0,
+        "vat_amount": 0,
+        "total_amount": subtotal + 500.0,
+    }
+
+
+def bench_render(scale: dict, repeat: int, results: dict):
+    from utils.quotation_utils import render_document_html
+    for n in scale["line_items"]:
+        ctx = _quotation_context(make_line_items(n))
+        for doc in ["quotation", "invoice"]:
+            results[f"render.{doc}_html[{n}]"] = measure(lambda: render_document_html(doc, ctx), repeat)
+        results[f"render.quotation_html.asset_refs[{n}]"] = measure(
+            lambda: render_document_html("quotation", ctx, inline_assets=False), repeat)
+    receipt = {"receipt_number": "R-20250101-1-1", "client_name": "Client", "amount": 500.0,
+               "previous_paid": 1_000.0, "balance": 2_500.0}
+    results["render.receipt_html"] = measure(lambda: render_document_html("receipt", receipt), repeat)
+
+
+def bench_pdf(scale: dict, repeat: int, results: dict):
+    """Per-document PDF latency for each available local engine (and one-off WeasyPrint calls)."""
+    from utils import pdf_engines
+    from utils.quotation_utils import _document_context, _render, document_to_pdf, render_document_html
+    from utils.assets import url_fetcher
+    from utils.pdf_renderer import A4_STYLESHEET
+    from utils.pdf_optimize import optimize_pdf
+    available = pdf_engines.detect_engines()
+    engines = [e for e in pdf_engines.select_engines("document", preferred="auto")
+               if available.get(e.name) and not e.remote]
+    if not engines:
+        print("  pdf: no local converter available, skipping")
+        return
+    for engine in engines:
+        started = time.perf_counter()
+        engine.warm_up()
+        results[f"pdf.{engine.name}.warm_up"] = (time.perf_counter() - started) * 1000
+        SINGLE_RUN.add(f"pdf.{engine.name}.warm_up")
+    for n in scale["line_items"]:
+        ctx = _document_context("quotation", _quotation_context(make_line_items(n)))
+        html = _render("newton_quotation_A4.html", dict(ctx, external_styles=True), inline_assets=False)
+        for engine in engines:
+            if engine.renders_documents:
+                results[f"pdf.{engine.name}[{n}]"] = measure(lambda: engine.from_document("quotation", ctx), repeat)
+            else:
+                results[f"pdf.{engine.name}[{n}]"] = measure(lambda: engine.from_html(html, [A4_STYLESHEET]), repeat)
+        if available.get("weasyprint"):
+            from weasyprint import HTML
+            inline_html = render_document_html("quotation", ctx, inline_assets=False)
+            # Before: new HTML object per call, fonts and the inline stylesheet resolved every time
+            results[f"pdf.uncached[{n}]"] = measure(lambda: HTML(string=inline_html, url_fetcher=url_fetcher).write_pdf(), repeat)
+        raw = engines[0].from_document("quotation", ctx) if engines[0].renders_documents else engines[0].from_html(html, [A4_STYLESHEET])
+        for quality in ("print", "email"):
+            results[f"pdf.optimize.{quality}[{n}]"] = measure(lambda: optimize_pdf(raw, quality), repeat)
+        results[f"pdf.document_to_pdf[{n}]"] = measure(lambda: document_to_pdf("quotation", ctx), repeat)
+
+
+def bench_docx(scale: dict, repeat: int, results: dict):
+    from pages_custom.quotation_page import fill_quotation_docx
+    from pages_custom.invoice_page import generate_word_invoice
+    from pages_custom.products_page import build_word_cards_document
+    header = {"{{client_name}}": "Benchmark Client", "{{quote_no}}": "Q-BENCH-0001", "{{client_location}}": "Dubai - Marina"}
+    with working_dir(repo_root):
+        for n in scale["line_items"]:
+            items = make_line_items(n)
+            results[f"docx.quotation[{n}]"] = measure(lambda: fill_quotation_docx(header, items), repeat)
+        results["docx.invoice"] = measure(lambda: generate_word_invoice("data/invoice_template.docx", {"{{client_name}}": "Benchmark Client"}), repeat)
+        for n in scale["products"]:
+            if n > 1_000:
+                continue
+            products = make_products(n)
+            results[f"docx.product_cards[{n}]"] = measure(lambda: build_word_cards_document(products), repeat)
+
+
+GROUPS = {
+    "excel": bench_excel,
+    "storage": bench_storage,
+    "sqlite": bench_sqlite,
+    "postgres": bench_postgres,
+    "aggregate": bench_aggregate,
+    "render": bench_render,
+    "pdf": bench_pdf,
+    "docx": bench_docx,
+}
+
+
+# ==========================================
+# Baseline comparison
+# ==========================================
+
+def load_baseline() -> dict:
+    try:
+        return json.loads(BASELINE_PATH.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+
+def save_baseline(scale_name: str, results: dict):
+    BASELINE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    data = load_baseline()
+    data[scale_name] = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results_ms": {k: round(v, 3) for k, v in sorted(results.items())},
+    }
+    BASELINE_PATH.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    print(f"Saved baseline for '{scale_name}' to {BASELINE_PATH}")
+
+
+def compare(scale_name: str, results: dict, threshold: float, min_delta: float) -> int:
+    """Print results against the baseline; a regression is slower by `threshold` and by at least `min_delta` ms."""
+    baseline = load_baseline().get(scale_name, {}).get("results_ms", {})
+    regressions = 0
+    print(f"\n{'case':<55} {'ms':>10} {'baseline':>10} {'change':>8}")
+    for name, ms in sorted(results.items()):
+        base = baseline.get(name)
+        if base:
+            change = (ms - base) / base
+            if name in SINGLE_RUN:
+                flag = "  (single run)"
+            else:
+                flag = "  REGRESSION" if change > threshold and ms - base >= min_delta else ""
+            regressions += 1 if flag == "  REGRESSION" else 0
+            print(f"{name:<55} {ms:>10.2f} {base:>10.2f} {change:>+7.0%}{flag}")
+        else:
+            print(f"{name:<55} {ms:>10.2f} {'-':>10} {'new':>8}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Newton Smart Home benchmark suite")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--only", default="", help="comma separated groups: " + ",".join(GROUPS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument("--min-delta", type=float, default=2.0,
+                        help="slowdowns smaller than this many ms are never flagged")
+    parser.add_argument("--postgres", action="store_true", help="include read-only loaders against the configured DB")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    groups = [g.strip() for g in args.only.split(",") if g.strip()] or [g for g in GROUPS if g != "postgres"]
+    if args.postgres and "postgres" not in groups:
+        groups.append("postgres")
+    unknown = [g for g in groups if g not in GROUPS]
+    if unknown:
+        parser.error(f"unknown groups: {', '.join(unknown)}")
+
+    scale = SCALES[args.scale]
+    results = {}
+    for g in groups:
+        print(f"[{g}]")
+        started = time.perf_counter()
+        GROUPS[g](scale, args.repeat, results)
+        print(f"  done in {time.perf_counter() - started:.1f}s")
+
+    if args.save_baseline:
+        save_baseline(args.scale, results)
+        return 0
+    regressions = compare(args.scale, results, args.threshold, args.min_delta)
+    if regressions:
+        print(f"\n{regressions} case(s) slower than baseline by more than {args.threshold:.0%} "
+              f"and {args.min_delta:g} ms")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,14 @@
 import importlib
-mods = [
-    'pages_custom.receipt_page',
-    'pages_custom.invoice_page',
-    'pages_custom.quotation_page'
-]
-for m in mods:
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from utils.page_registry import PAGES
+
+for page, (m, attr) in PAGES.items():
     try:
-        importlib.import_module(m)
+        getattr(importlib.import_module(m), attr)
         print(m + ' OK')
     except Exception as e:
         print(m + ' ERR ->', e)
@@ -0,0 +1,52 @@
+"""Find and merge duplicate customers, then re-link their documents.
+
+Uses Postgres when DB_CONNECTION_STRING is set, otherwise data/newton.db. Run it
+before creating the unique phone index in sql/ddl.sql, and whenever customers
+were imported or edited in bulk. Without --apply nothing is written.
+
+Usage:
+    python scripts/dedupe_customers.py            # report duplicate clusters (dry run)
+    python scripts/dedupe_customers.py --apply    # merge them and re-link records/quotations
+"""
+from pathlib import Path
+import argparse
+import sys
+
+repo_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(repo_root))
+
+from utils.customer_dedup import dedupe_customers
+
+
+def _label(row: dict) -> str:
+    return f"{row.get('client_name') or '-'} | {row.get('phone') or '-'} | {row.get('location') or '-'}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge duplicate customers")
+    parser.add_argument("--apply", action="store_true", help="write the merges (default: report only)")
+    parser.add_argument("--limit", type=int, default=50, help="clusters to list (default 50)")
+    args = parser.parse_args()
+
+    result = dedupe_customers(apply=args.apply)
+    clusters = result["clusters"]
+    for c in clusters[:args.limit]:
+        print(f"keep #{c['keep']}: {_label(c['merged'])}")
+        for row in c["rows"][1:]:
+            print(f"   merge #{row['id']}: {_label(row)}")
+    if len(clusters) > args.limit:
+        print(f"... {len(clusters) - args.limit} more clusters")
+
+    duplicates = sum(len(c["merge"]) for c in clusters)
+    if args.apply:
+        summary = f"Merged {duplicates} duplicates into {len(clusters)} customers; re-linked {result['records']} records"
+    else:
+        summary = f"Would merge {duplicates} duplicates into {len(clusters)} customers and re-link {result['records']} records"
+    print(f"{summary} ({result['customers']} customers, {result['backend']})")
+    if clusters and not args.apply:
+        print("Dry run - rerun with --apply to write the changes")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
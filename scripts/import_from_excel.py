@@ -1,84 +1,382 @@
-"""Simple importer from data/*.xlsx into Postgres using utils.db helpers.
+"""Bulk import of data/*.xlsx into Postgres: chunked upserts, resumable and optionally parallel.
 
-Usage: python scripts/import_from_excel.py
-Make sure DB connection is set in env DB_CONNECTION_STRING or in Streamlit secrets.
+Every dataset (products, customers, records, users, logs, suppliers and
+supplier price lists) is streamed from its xlsx file in chunks and each chunk
+is upserted on the dataset's natural key in one multi-row statement and one
+transaction:
+
+- products: device name (case-insensitive)
+- customers: normalized phone (`phone_key`), else name for customers without a phone
+- records: (type, number); invoice_balances is refreshed afterwards
+- users: name (case-insensitive)
+- logs: a hash of the row and its occurrence number (identical log lines are kept)
+- suppliers: supplier_id
+- supplier_products: (supplier_id, supplier_sku), with sp_id as the SKU for older sheets
+
+Re-running is therefore idempotent: matching rows are updated only when a
+value differs (blank cells never overwrite stored values), the rest is
+inserted, and rows without a key are skipped. Committed row counts are
+checkpointed in data/.import_checkpoint.json, so an interrupted run resumes
+after the last committed chunk. A dataset whose xlsx changed since (size or
+modification time) is imported from the start.
+
+With --workers, datasets run in parallel on separate connections; the chunks
+of one dataset stay sequential so its checkpoint is always a committed prefix.
+
+Run sql/ddl.sql first. Make sure DB connection is set in env
+DB_CONNECTION_STRING or in Streamlit secrets.
+
+Usage:
+    python scripts/import_from_excel.py                        # every dataset, resuming
+    python scripts/import_from_excel.py --only products,users
+    python scripts/import_from_excel.py --workers 3            # datasets in parallel
+    python scripts/import_from_excel.py --restart --chunk-size 2000
 """
 from pathlib import Path
+import argparse
+import hashlib
+import json
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
 
 repo_root = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(repo_root))
 
 import pandas as pd
-from utils import db
-
-
-def import_products():
-    p = Path('data/products.xlsx')
-    if not p.exists():
-        print('No data/products.xlsx found — skipping products import')
-        return
-    df = pd.read_excel(p)
-    # normalize column names that might be used in this project
-    df = df.rename(columns={
-        'Device': 'device', 'Description': 'description', 'UnitPrice': 'unit_price',
-        'Warranty': 'warranty', 'ImagePath': 'image_path', 'ImageBase64': 'image_base64', 'SKU': 'sku'
-    })
-    conn = None
-    inserted = 0
-    for _, row in df.iterrows():
-        device = str(row.get('device') or '')
-        description = row.get('description')
-        unit_price = row.get('unit_price')
-        try:
-            unit_price = float(str(unit_price).replace('AED','').replace(',','')) if unit_price not in (None, '') else 0.0
-        except Exception:
-            unit_price = 0.0
-        warranty = row.get('warranty')
-        image_path = row.get('image_path')
-        image_base64 = row.get('image_base64')
-        sku = row.get('sku')
-
-        sql = (
-            "INSERT INTO products(device, description, sku, unit_price, warranty, image_path, image_base64)"
-            " VALUES (%s,%s,%s,%s,%s,%s,%s)"
-        )
-        params = (device, description, sku, unit_price, warranty, image_path, image_base64)
-        try:
-            db.db_execute(sql, params)
-            inserted += 1
-        except Exception as e:
-            print('Failed to insert product', device, e)
-    print(f'Inserted {inserted} products')
-
-
-def import_customers():
-    p = Path('data/customers.xlsx')
-    if not p.exists():
-        print('No data/customers.xlsx found — skipping customers import')
-        return
-    df = pd.read_excel(p)
-    df = df.rename(columns={'Name': 'name', 'Phone': 'phone', 'Email': 'email', 'Address': 'address'})
-    inserted = 0
-    for _, row in df.iterrows():
-        name = str(row.get('name') or '')
-        phone = row.get('phone')
-        email = row.get('email')
-        address = row.get('address')
-        sql = "INSERT INTO customers(name, phone, email, address) VALUES (%s,%s,%s,%s)"
-        try:
-            db.db_execute(sql, (name, phone, email, address))
-            inserted += 1
-        except Exception as e:
-            print('Failed to insert customer', name, e)
-    print(f'Inserted {inserted} customers')
+from utils import db, file_lock
+from utils.customers import name_key, phone_key
+from utils.product_import import read_sheet
+
+DATA_DIR = repo_root / "data"
+CHECKPOINT = DATA_DIR / ".import_checkpoint.json"
+CHUNK_SIZE = 1000
+
+
+# ==========================================
+# Cell cleaning
+# ==========================================
+
+def _cell(v) -> Optional[str]:
+    """Text for a text column: None for blanks, 502992932.0 -> "502992932"."""
+    if v is None or (isinstance(v, float) and pd.isna(v)):
+        return None
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    text = str(v).strip()
+    return text or None
+
+
+def _number(v) -> Optional[float]:
+    text = _cell(v)
+    if text is None:
+        return None
+    try:
+        return float(text.upper().replace("AED", "").replace(",", "").strip())
+    except ValueError:
+        return None
+
+
+def _texts(chunk: pd.DataFrame, source: str) -> List[Optional[str]]:
+    return [_cell(v) for v in chunk[source]] if source in chunk.columns else [None] * len(chunk)
+
+
+# ==========================================
+# Datasets
+# ==========================================
+
+@dataclass
+class Dataset:
+    name: str
+    file: str
+    required: List[str]
+    # Postgres column -> SQL type, in VALUES order
+    columns: Dict[str, str]
+    # Chunk (xlsx columns) -> rows of Postgres values; `state` persists across chunks
+    rows: Callable[[pd.DataFrame, dict], List[tuple]]
+    # Match predicate between the table (t) and the incoming rows (v)
+    match: str
+    # Natural key of a prepared row (None: no key, the row is skipped)
+    key: Callable[[tuple], object]
+    # Columns never updated on a match
+    fixed: tuple = ()
+    extra_set: str = ""
+    after: str = ""
+
+
+def _products(chunk: pd.DataFrame, state: dict) -> List[tuple]:
+    devices = [(_cell(v) or "").title() or None for v in chunk["Device"]]
+    prices = [_number(v) for v in chunk["UnitPrice"]] if "UnitPrice" in chunk.columns else [None] * len(chunk)
+    return list(zip(
+        devices, _texts(chunk, "Description"), _texts(chunk, "SKU"), prices, _texts(chunk, "Warranty"),
+        _texts(chunk, "ImagePath"), _texts(chunk, "ImageBase64"),
+    ))
+
+
+def _customers(chunk: pd.DataFrame, state: dict) -> List[tuple]:
+    names = [(_cell(v) or "").title() or None for v in chunk["client_name"]]
+    return list(zip(names, _texts(chunk, "phone"), _texts(chunk, "email"), _texts(chunk, "location")))
+
+
+def _records(chunk: pd.DataFrame, state: dict) -> List[tuple]:
+    amounts = [_number(v) for v in chunk["amount"]] if "amount" in chunk.columns else [None] * len(chunk)
+    return list(zip(
+        _texts(chunk, "base_id"), _texts(chunk, "date"), _texts(chunk, "type"), _texts(chunk, "number"), amounts,
+        _texts(chunk, "client_name"), _texts(chunk, "phone"), _texts(chunk, "location"), _texts(chunk, "note"),
+    ))
+
+
+def _users(chunk: pd.DataFrame, state: dict) -> List[tuple]:
+    # allowed_pages is jsonb; the app reads it back as the comma separated string
+    pages = [json.dumps(v) if v is not None else None for v in _texts(chunk, "allowed_pages")]
+    return list(zip(_texts(chunk, "name"), _texts(chunk, "pin"), _texts(chunk, "role"), pages))
+
+
+def _suppliers(chunk: pd.DataFrame, state: dict) -> List[tuple]:
+    return list(zip(_texts(chunk, "supplier_id"), _texts(chunk, "supplier_name"), _texts(chunk, "warranty"),
+                    _texts(chunk, "notes")))
+
+
+def _supplier_products(chunk: pd.DataFrame, state: dict) -> List[tuple]:
+    # Sheets from before supplier SKUs existed are keyed by sp_id
+    skus = [sku or sp for sku, sp in zip(_texts(chunk, "supplier_sku"), _texts(chunk, "sp_id"))]
+    ids = [int(n) if n is not None else None for n in (_number(v) for v in _texts(chunk, "product_id"))]
+    costs = [_number(v) for v in chunk["cost_price"]] if "cost_price" in chunk.columns else [None] * len(chunk)
+    return list(zip(
+        _texts(chunk, "sp_id"), _texts(chunk, "supplier_id"), skus, ids, costs, _texts(chunk, "warranty"),
+        _texts(chunk, "notes"),
+    ))
+
+
+def _logs(chunk: pd.DataFrame, state: dict) -> List[tuple]:
+    seen = state.setdefault("seen", {})
+    out = []
+    for row in zip(*(_texts(chunk, c) for c in ("timestamp", "user", "page", "action", "details"))):
+        text = "\x1f".join(v or "" for v in row)
+        seen[text] = seen.get(text, 0) + 1
+        out.append(row + (hashlib.sha1(f"{text}\x1f{seen[text]}".encode("utf-8")).hexdigest(),))
+    return out
+
+
+DATASETS = [
+    Dataset(
+        "products", "products.xlsx", ["Device"],
+        {"device": "text", "description": "text", "sku": "text", "unit_price": "numeric", "warranty": "text",
+         "image_path": "text", "image_base64": "text"},
+        _products, "lower(t.device) = lower(v.device)", lambda r: (r[0] or "").lower() or None,
+        extra_set=", version = t.version + 1",
+    ),
+    Dataset(
+        "customers", "customers.xlsx", ["client_name"],
+        {"name": "text", "phone": "text", "email": "text", "address": "text"},
+        _customers,
+        "(CASE WHEN newton_phone_key(v.phone) IS NOT NULL THEN t.phone_key = newton_phone_key(v.phone) "
+        "ELSE t.phone_key IS NULL AND lower(t.name) = lower(v.name) END)",
+        lambda r: ("phone", phone_key(r[1])) if phone_key(r[1]) else ("name", name_key(r[0])) if r[0] else None,
+    ),
+    Dataset(
+        "records", "records.xlsx", ["type", "number"],
+        {"base_id": "text", "date": "text", "type": "text", "number": "text", "amount": "numeric",
+         "client_name": "text", "phone": "text", "location": "text", "note": "text"},
+        _records, "t.type = v.type AND t.number = v.number", lambda r: (r[2], r[3]) if r[2] and r[3] else None,
+        after=(
+            "INSERT INTO invoice_balances(number, base_id, date, client_name, phone, location, total, paid, receipts) "
+            "SELECT DISTINCT ON (i.number) i.number, i.base_id, i.date, i.client_name, i.phone, i.location, "
+            "COALESCE(i.amount, 0), COALESCE(r.paid, 0), COALESCE(r.n, 0) FROM records i "
+            "LEFT JOIN (SELECT base_id, SUM(amount) AS paid, COUNT(*) AS n FROM records WHERE type = 'r' GROUP BY base_id) r "
+            "ON r.base_id = i.base_id WHERE i.type = 'i' AND i.number IS NOT NULL ORDER BY i.number "
+            "ON CONFLICT (number) DO UPDATE SET base_id = EXCLUDED.base_id, date = EXCLUDED.date, "
+            "client_name = EXCLUDED.client_name, phone = EXCLUDED.phone, location = EXCLUDED.location, "
+            "total = EXCLUDED.total, paid = EXCLUDED.paid, receipts = EXCLUDED.receipts"
+        ),
+    ),
+    Dataset(
+        "users", "users.xlsx", ["name", "pin"],
+        {"name": "text", "pin": "text", "role": "text", "allowed_pages": "jsonb"},
+        _users, "lower(t.name) = lower(v.name)", lambda r: (r[0] or "").lower() or None,
+    ),
+    Dataset(
+        "logs", "logs.xlsx", ["timestamp"],
+        {"timestamp": "text", "user": "text", "page": "text", "action": "text", "details": "text", "row_key": "text"},
+        _logs, "t.row_key = v.row_key", lambda r: r[-1],
+        fixed=("timestamp", "user", "page", "action", "details", "row_key"),
+    ),
+    Dataset(
+        "suppliers", "suppliers.xlsx", ["supplier_id"],
+        {"supplier_id": "text", "supplier_name": "text", "warranty": "text", "notes": "text"},
+        _suppliers, "t.supplier_id = v.supplier_id", lambda r: r[0] if r[0] and r[1] else None,
+        fixed=("supplier_id",),
+    ),
+    Dataset(
+        "supplier_products", "supplier_products.xlsx", ["supplier_id"],
+        {"sp_id": "text", "supplier_id": "text", "supplier_sku": "text", "product_id": "bigint",
+         "cost_price": "numeric", "warranty": "text", "notes": "text"},
+        _supplier_products, "t.supplier_id = v.supplier_id AND t.supplier_sku = v.supplier_sku",
+        lambda r: (r[1], r[2]) if r[1] and r[2] else None,
+        fixed=("supplier_id", "supplier_sku"), extra_set=", updated_at = now()",
+    ),
+]
+
+
+def _q(column: str) -> str:
+    return f'"{column}"'
+
+
+def upsert_sql(ds: Dataset) -> str:
+    """
+    One statement per chunk: update matching rows whose values differ, insert the rest.
+
+    Returns one row (updated, inserted). Blank incoming cells keep the stored value.
+    """
+    cols = list(ds.columns)
+    updatable = [c for c in cols if c not in ds.fixed]
+    parts = [f"WITH v({', '.join(_q(c) for c in cols)}) AS (VALUES %s)"]
+    if updatable:
+        new = [f"COALESCE(v.{_q(c)}, t.{_q(c)})" for c in updatable]
+        sets = ", ".join(f"{_q(c)} = {n}" for c, n in zip(updatable, new))
+        changed = f"({', '.join(f't.{_q(c)}' for c in updatable)}) IS DISTINCT FROM ({', '.join(new)})"
+        parts.append(f"upd AS (UPDATE {ds.name} t SET {sets}{ds.extra_set} FROM v WHERE {ds.match} AND {changed} RETURNING 1)")
+    else:
+        parts.append("upd AS (SELECT 1 WHERE false)")
+    parts.append(
+        f"ins AS (INSERT INTO {ds.name} ({', '.join(_q(c) for c in cols)}) "
+        f"SELECT {', '.join(f'v.{_q(c)}' for c in cols)} FROM v "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {ds.name} t WHERE {ds.match}) RETURNING 1)"
+    )
+    return ", ".join(parts) + " SELECT (SELECT count(*) FROM upd) AS updated, (SELECT count(*) FROM ins) AS inserted"
+
+
+def _template(ds: Dataset) -> str:
+    return "(" + ", ".join(f"%s::{t}" for t in ds.columns.values()) + ")"
+
+
+def _dedupe(ds: Dataset, rows: List[tuple]) -> List[tuple]:
+    """Drop rows without a key and repeated keys inside one statement (the last occurrence wins)."""
+    latest = {}
+    for row in rows:
+        key = ds.key(row)
+        if key is not None:
+            latest.pop(key, None)
+            latest[key] = row
+    return list(latest.values())
+
+
+# ==========================================
+# Checkpoint
+# ==========================================
+
+_checkpoint_lock = threading.Lock()
+
+
+def _fingerprint(path: Path) -> dict:
+    st = path.stat()
+    return {"size": st.st_size, "mtime": int(st.st_mtime)}
+
+
+def load_checkpoint(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_progress(path: Path, checkpoint: dict, name: str, entry: dict):
+    with _checkpoint_lock:
+        checkpoint[name] = entry
+        file_lock.atomic_write(str(path), json.dumps(checkpoint, indent=2))
+
+
+# ==========================================
+# Import
+# ==========================================
+
+def import_dataset(ds: Dataset, chunk_size: int, checkpoint: dict, checkpoint_path: Path) -> dict:
+    path = DATA_DIR / ds.file
+    summary = {"dataset": ds.name, "rows": 0, "inserted": 0, "updated": 0, "resumed": 0, "seconds": 0.0, "status": ""}
+    if not path.exists():
+        summary["status"] = f"no data/{ds.file}"
+        return summary
+    fingerprint = _fingerprint(path)
+    entry = checkpoint.get(ds.name) or {}
+    if {k: entry.get(k) for k in fingerprint} != fingerprint:
+        entry = {}
+    if entry.get("done"):
+        summary.update(rows=entry.get("rows", 0), resumed=entry.get("rows", 0), status="up to date")
+        return summary
+
+    skip = int(entry.get("rows", 0))
+    summary["resumed"] = skip
+    sql, template = upsert_sql(ds), _template(ds)
+    state: dict = {}
+    read = 0
+    started = time.perf_counter()
+    for chunk in read_sheet(str(path), chunk_size, required=ds.required, columns=None):
+        rows = ds.rows(chunk, state)
+        start, read = read, read + len(rows)
+        # Rows up to `skip` were committed by an earlier run
+        rows = _dedupe(ds, rows[max(0, skip - start):])
+        if rows:
+            with db.db_transaction() as cur:
+                result = db.execute_values(cur, sql, rows, template=template, page_size=len(rows), fetch=True)
+            summary["inserted"] += sum(int(r["inserted"]) for r in result)
+            summary["updated"] += sum(int(r["updated"]) for r in result)
+        if read > skip:
+            summary["rows"] += read - max(start, skip)
+            save_progress(checkpoint_path, checkpoint, ds.name, dict(fingerprint, rows=read, done=False))
+    if ds.after:
+        db.db_execute(ds.after)
+    summary["seconds"] = time.perf_counter() - started
+    summary["status"] = "resumed" if skip else "imported"
+    save_progress(checkpoint_path, checkpoint, ds.name, dict(fingerprint, rows=read, done=True))
+    return summary
+
+
+def _run(ds: Dataset, args, checkpoint: dict) -> dict:
+    try:
+        return import_dataset(ds, args.chunk_size, checkpoint, args.checkpoint)
+    except Exception as e:
+        first = str(e).splitlines()[0] if str(e) else type(e).__name__
+        return {"dataset": ds.name, "rows": 0, "inserted": 0, "updated": 0, "resumed": 0, "seconds": 0.0,
+                "status": f"failed: {first}"}
 
 
 def main():
-    print('Starting import — ensure DB connection is configured in st.secrets or env DB_CONNECTION_STRING')
-    import_products()
-    import_customers()
+    parser = argparse.ArgumentParser(description="Import data/*.xlsx into Postgres")
+    parser.add_argument("--only", default="", help="comma separated datasets: " + ",".join(d.name for d in DATASETS))
+    parser.add_argument("--workers", type=int, default=1, help="datasets imported in parallel (default 1)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help=f"rows per statement and transaction (default {CHUNK_SIZE})")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and import everything again")
+    parser.add_argument("--checkpoint", type=Path, default=CHECKPOINT, help="checkpoint file (default data/.import_checkpoint.json)")
+    args = parser.parse_args()
+
+    if not db.get_connection_string():
+        print("No database configured: set DB_CONNECTION_STRING or Streamlit secrets")
+        return 1
+    wanted = {n.strip() for n in args.only.split(",") if n.strip()}
+    unknown = wanted - {d.name for d in DATASETS}
+    if unknown:
+        print(f"Unknown datasets: {', '.join(sorted(unknown))}")
+        return 2
+    datasets = [d for d in DATASETS if not wanted or d.name in wanted]
+    checkpoint = {} if args.restart else load_checkpoint(args.checkpoint)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        summaries = list(pool.map(lambda d: _run(d, args, checkpoint), datasets))
+    elapsed = time.perf_counter() - started
+
+    print(f"{'dataset':<12}{'rows':>9}{'inserted':>10}{'updated':>9}{'resumed':>9}{'seconds':>9}{'rows/s':>10}  status")
+    for s in summaries:
+        rate = s["rows"] / s["seconds"] if s["seconds"] > 0 else 0.0
+        print(f"{s['dataset']:<12}{s['rows']:>9}{s['inserted']:>10}{s['updated']:>9}{s['resumed']:>9}"
+              f"{s['seconds']:>9.2f}{rate:>10.0f}  {s['status']}")
+    total = sum(s["rows"] for s in summaries)
+    print(f"{total} rows in {elapsed:.2f}s ({total / elapsed if elapsed > 0 else 0:.0f} rows/s)")
+    return 1 if any(s["status"].startswith("failed") for s in summaries) else 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Measure cold-start time of the app: PIN screen and first visit of each page.
+
+Every sample runs in a fresh Python process (a new Streamlit worker), renders
+main.py once with Streamlit's AppTest harness and reports the wall time plus
+which heavy libraries had been imported by then.
+
+Usage:
+    python scripts/measure_startup.py                     # PIN screen + every page, 3 runs each
+    python scripts/measure_startup.py --pages login       # PIN screen only
+    python scripts/measure_startup.py --pages dashboard,quotation --runs 5
+    python scripts/measure_startup.py --json              # machine-readable output
+"""
+from pathlib import Path
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+repo_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(repo_root))
+
+HEAVY_MODULES = ["pandas", "numpy", "docx", "PIL", "altair", "jinja2", "weasyprint", "reportlab", "pikepdf", "openpyxl"]
+PAGES = ["dashboard", "quotation", "invoice", "receipt", "customers", "products", "reports", "settings"]
+# The PIN screen should be served well under this on a fresh worker
+LOGIN_BUDGET_MS = 1000
+
+
+def _child(target: str) -> dict:
+    """One cold render in this (fresh) process."""
+    import os
+    os.chdir(repo_root)
+    started = time.perf_counter()
+    import streamlit  # noqa: F401
+    from streamlit.testing.v1 import AppTest
+    imported_ms = (time.perf_counter() - started) * 1000
+
+    at = AppTest.from_file(str(repo_root / "main.py"), default_timeout=120)
+    if target != "login":
+        at.session_state["authenticated"] = True
+        at.session_state["user"] = {"name": "Admin", "role": "admin"}
+        at.session_state["active_page"] = target
+    run_started = time.perf_counter()
+    at.run()
+    render_ms = (time.perf_counter() - run_started) * 1000
+    return {
+        "target": target,
+        "streamlit_import_ms": imported_ms,
+        "render_ms": render_ms,
+        "exception": [str(e.value)[:200] for e in at.exception],
+        "heavy": [m for m in HEAVY_MODULES if m in sys.modules],
+    }
+
+
+def _sample(target: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", target],
+        cwd=repo_root, capture_output=True, text=True,
+    )
+    for line in reversed(out.stdout.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    raise RuntimeError(f"{target}: no result\n{out.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Newton Smart Home cold-start times")
+    parser.add_argument("--pages", default="login," + ",".join(PAGES), help="comma-separated: login and/or page ids")
+    parser.add_argument("--runs", type=int, default=3, help="fresh processes per target (median is reported)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_child(args.child)))
+        return 0
+
+    results = []
+    for target in [t.strip() for t in args.pages.split(",") if t.strip()]:
+        samples = [_sample(target) for _ in range(max(1, args.runs))]
+        results.append({
+            "target": target,
+            "render_ms": statistics.median(s["render_ms"] for s in samples),
+            "streamlit_import_ms": statistics.median(s["streamlit_import_ms"] for s in samples),
+            "heavy": samples[-1]["heavy"],
+            "exception": samples[-1]["exception"],
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'target':<12} {'render ms':>10} {'streamlit ms':>13}  heavy modules loaded")
+        for r in results:
+            flag = "  EXCEPTION" if r["exception"] else ""
+            print(f"{r['target']:<12} {r['render_ms']:>10.0f} {r['streamlit_import_ms']:>13.0f}  {', '.join(r['heavy']) or '-'}{flag}")
+
+    login = next((r for r in results if r["target"] == "login"), None)
+    if login is not None and login["render_ms"] > LOGIN_BUDGET_MS:
+        print(f"PIN screen took {login['render_ms']:.0f} ms (budget {LOGIN_BUDGET_MS} ms)")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,35 @@
+"""One-shot migration of legacy data/*.xlsx files into the local SQLite storage.
+
+The app runs this automatically the first time it opens data/newton.db; use the
+script to re-import explicitly (e.g. after editing an xlsx by hand).
+
+Usage:
+    python scripts/migrate_xlsx_to_sqlite.py           # import tables that do not exist yet
+    python scripts/migrate_xlsx_to_sqlite.py --force   # replace tables from the xlsx files
+"""
+from pathlib import Path
+import argparse
+import sys
+
+repo_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(repo_root))
+
+from utils import storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate data/*.xlsx into data/newton.db")
+    parser.add_argument("--force", action="store_true", help="replace tables that already exist")
+    args = parser.parse_args()
+
+    migrated = storage.migrate_from_xlsx(force=args.force)
+    if not migrated:
+        print("Nothing to migrate (tables already present; use --force to re-import)")
+    for name in storage.TABLE_COLUMNS:
+        if storage.table_exists(name):
+            print(f"{name}: {len(storage.read_table(name))} rows")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
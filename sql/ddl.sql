@@ -15,6 +15,8 @@ create table if not exists products (
 );
 create index if not exists idx_products_sku on products(sku);
 create index if not exists idx_products_name on products(lower(device));
+-- optimistic concurrency for row-level edits (utils/products.py bumps it on every update)
+alter table products add column if not exists version integer not null default 1;
 
 -- customers
 create table if not exists customers (
@@ -67,6 +69,19 @@ create table if not exists users (
 );
 create index if not exists idx_users_name on users(lower(name));
 
+-- activity log (utils/logger.py); row_key identifies rows imported by scripts/import_from_excel.py
+create table if not exists logs (
+  id bigint generated always as identity primary key,
+  "timestamp" text,
+  "user" text,
+  page text,
+  action text,
+  details text,
+  row_key text
+);
+create index if not exists idx_logs_timestamp on logs("timestamp");
+create unique index if not exists logs_row_key_key on logs(row_key);
+
 -- exports/documents (track generated files)
 create table if not exists exports (
   id bigint generated always as identity primary key,
@@ -76,3 +91,85 @@ create table if not exists exports (
   metadata jsonb,
   created_at timestamptz default now()
 );
+
+-- document records (quotations, invoices, receipts); one row per (type, number)
+create table if not exists records (
+  base_id text,
+  date text,
+  type text,
+  number text,
+  amount numeric(14,2),
+  client_name text,
+  phone text,
+  location text,
+  note text
+);
+create unique index if not exists records_type_number_key on records(type, number);
+create index if not exists idx_records_base_id on records(base_id);
+
+-- canonical customer phone (same rules as phone_flat10 in the app: 0502992932)
+create or replace function newton_phone_key(phone text) returns text
+language sql immutable as $$
+  select case
+    when d = '' then null
+    when d like '9715%' and length(d) >= 12 then '0' || substr(d, 4, 9)
+    when length(d) = 9 and d like '5%' then '0' || d
+    when length(d) = 10 and d like '05%' then d
+    else right(d, 10)
+  end
+  from (select regexp_replace(coalesce(phone, ''), '\D', '', 'g') as d) s
+$$;
+alter table customers add column if not exists phone_key text generated always as (newton_phone_key(phone)) stored;
+-- fails while duplicate phones exist; merge them first with scripts/dedupe_customers.py
+create unique index if not exists customers_phone_key_key on customers(phone_key);
+create index if not exists idx_customers_name_lower on customers(lower(name));
+
+-- outstanding balance per invoice; kept current on each record save by utils/balances.py
+create table if not exists invoice_balances (
+  number text primary key,
+  base_id text,
+  date text,
+  client_name text,
+  phone text,
+  location text,
+  total numeric(14,2) not null default 0,
+  paid numeric(14,2) not null default 0,
+  remaining numeric(14,2) generated always as (total - paid) stored,
+  receipts integer not null default 0
+);
+create index if not exists idx_invoice_balances_base_id on invoice_balances(base_id);
+create index if not exists idx_invoice_balances_open on invoice_balances(date desc, number desc) where remaining > 0.005;
+create index if not exists idx_records_base_id_type on records(base_id, type);
+-- backfill invoices saved before the table existed
+insert into invoice_balances(number, base_id, date, client_name, phone, location, total, paid, receipts)
+select distinct on (i.number) i.number, i.base_id, i.date, i.client_name, i.phone, i.location,
+       coalesce(i.amount, 0), coalesce(r.paid, 0), coalesce(r.n, 0)
+from records i
+left join (select base_id, sum(amount) as paid, count(*) as n from records where type = 'r' group by base_id) r
+  on r.base_id = i.base_id
+where i.type = 'i' and i.number is not null
+order by i.number
+on conflict (number) do nothing;
+
+-- suppliers and their price lists; supplier SKUs are mapped to products by utils/suppliers.py
+create table if not exists suppliers (
+  supplier_id text primary key,
+  supplier_name text not null,
+  warranty text,
+  notes text,
+  created_at timestamptz default now()
+);
+create table if not exists supplier_products (
+  id bigint generated always as identity primary key,
+  sp_id text,
+  supplier_id text not null,
+  supplier_sku text not null,
+  product_id bigint,
+  cost_price numeric(12,2),
+  warranty text,
+  notes text,
+  updated_at timestamptz default now()
+);
+create unique index if not exists supplier_products_sku_key on supplier_products(supplier_id, supplier_sku);
+-- cheapest cost per product for the catalog cost/margin view
+create index if not exists idx_supplier_products_product on supplier_products(product_id, cost_price) where product_id is not null;
@@ -0,0 +1,95 @@
+"""
+Template Assets for Newton Smart Home Application
+Serves the static images shared by the A4 HTML templates (logo, stamp).
+
+Templates reference assets by logical name with `{{ asset('logo') }}`, which
+renders as a `newton-asset:logo` URL instead of an inline base64 blob. The PDF
+renderer resolves those URLs through `url_fetcher` from an in-memory cache, and
+`inline_assets` swaps in data URIs only for standalone HTML downloads.
+"""
+
+import base64
+import mimetypes
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from utils.profiler import count
+
+ASSETS_DIR = Path(__file__).resolve().parents[1] / "templates" / "assets"
+SCHEME = "newton-asset:"
+
+_ASSET_RE = re.compile(re.escape(SCHEME) + r"([A-Za-z0-9_.-]+)")
+_lock = threading.Lock()
+# name -> (bytes, mime type, data URI); assets only change on deploy
+_cache: Dict[str, Tuple[bytes, str, str]] = {}
+
+
+def _resolve_path(name: str) -> Optional[Path]:
+    if not name or "/" in name or "\\" in name or name.startswith("."):
+        return None
+    direct = ASSETS_DIR / name
+    if direct.is_file():
+        return direct
+    for path in sorted(ASSETS_DIR.glob(f"{name}.*")):
+        if path.is_file():
+            return path
+    return None
+
+
+def _load(name: str) -> Optional[Tuple[bytes, str, str]]:
+    with _lock:
+        hit = _cache.get(name)
+    if hit is not None:
+        count("assets.cache_hit")
+        return hit
+    path = _resolve_path(name)
+    if path is None:
+        return None
+    data = path.read_bytes()
+    mime = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    entry = (data, mime, f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}")
+    with _lock:
+        _cache[name] = entry
+    count("assets.cache_miss")
+    return entry
+
+
+def asset_url(name: str) -> str:
+    """URL used inside templates; resolved at PDF time or by `inline_assets`."""
+    return f"{SCHEME}{name}"
+
+
+def asset_bytes(name: str) -> Optional[bytes]:
+    entry = _load(name)
+    return entry[0] if entry else None
+
+
+def asset_data_uri(name: str) -> str:
+    """Data URI for an asset (empty string if the asset is missing)."""
+    entry = _load(name)
+    return entry[2] if entry else ""
+
+
+def inline_assets(html: str) -> str:
+    """Replace `newton-asset:` references with data URIs so the HTML is self-contained."""
+    if SCHEME not in html:
+        return html
+    return _ASSET_RE.sub(lambda m: asset_data_uri(m.group(1)), html)
+
+
+def url_fetcher(url: str, *args, **kwargs):
+    """WeasyPrint url_fetcher serving `newton-asset:` URLs from memory."""
+    if url.startswith(SCHEME):
+        entry = _load(url[len(SCHEME):])
+        if entry is None:
+            raise ValueError(f"Unknown template asset: {url}")
+        return {"string": entry[0], "mime_type": entry[1], "redirected_url": url}
+    from weasyprint import default_url_fetcher
+    return default_url_fetcher(url, *args, **kwargs)
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
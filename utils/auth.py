@@ -3,9 +3,10 @@ Authentication and User Management Utilities
 Handles PIN-based login, user data, and permissions.
 """
 
-import os
 import pandas as pd
 from typing import Optional, Dict
+from utils.profiler import timed
+from utils import storage
 try:
     from utils import db as _db
 except Exception:
@@ -13,10 +14,8 @@ except Exception:
 
 
 def ensure_users_file():
-    """Create users.xlsx if it doesn't exist with default admin user."""
-    os.makedirs("data", exist_ok=True)
-    path = "data/users.xlsx"
-    if not os.path.exists(path):
+    """Create the local users table with default users if it is missing or empty."""
+    if len(storage.read_table("users")) == 0:
         default_users = pd.DataFrame([
             {
                 "name": "Admin",
@@ -37,12 +36,13 @@ def ensure_users_file():
                 "allowed_pages": "dashboard,reports"
             }
         ])
-        default_users.to_excel(path, index=False)
+        storage.write_table("users", default_users)
 
 
+@timed("auth.load_users")
 def load_users() -> pd.DataFrame:
     """
-    Load users from data/users.xlsx.
+    Load users (Postgres first, then local storage).
     Returns DataFrame with columns: name, pin, role, allowed_pages
     """
     # Try DB first (users table exists in DDL)
@@ -59,10 +59,10 @@ def load_users() -> pd.DataFrame:
     except Exception:
         pass
 
-    # Excel fallback
-    ensure_users_file()
+    # Local storage fallback
     try:
-        df = pd.read_excel("data/users.xlsx")
+        ensure_users_file()
+        df = storage.read_table("users")
         df.columns = [c.strip().lower() for c in df.columns]
         for col in ["name", "pin", "role", "allowed_pages"]:
             if col not in df.columns:
@@ -75,10 +75,10 @@ def load_users() -> pd.DataFrame:
 
 def save_users(df: pd.DataFrame):
     """
-    Save users DataFrame to data/users.xlsx.
+    Save users DataFrame (Postgres upsert plus local storage).
     """
     try:
-        # Try DB upsert for each user row, then write Excel as fallback/persistence
+        # Try DB upsert for each user row, then write local storage as fallback/persistence
         if _db is not None:
             try:
                 for _, row in df.iterrows():
@@ -103,8 +103,7 @@ def save_users(df: pd.DataFrame):
             except Exception:
                 pass
 
-        os.makedirs("data", exist_ok=True)
-        df.to_excel("data/users.xlsx", index=False)
+        storage.write_table("users", df)
     except Exception as e:
         print(f"Error saving users: {e}")
 
@@ -0,0 +1,293 @@
+"""
+Invoice Balances for Newton Smart Home Application
+Outstanding-balance index: one row per invoice with its total, paid amount, remaining balance and receipt count.
+
+Receipts belong to an invoice through its `base_id`. Instead of loading every
+record and summing receipts on each receipt page run, `invoice_balances` is
+kept current when a record is saved (`record_saved`, called by
+utils/records.py) by recomputing the balance of that one project:
+
+- Postgres: `invoice_balances` table from sql/ddl.sql, `remaining` is a
+  generated column with a partial index on open invoices.
+- Local store: an SQLite table of the same name. It remembers the `records`
+  version it reflects and is rebuilt once when records changed another way
+  (bulk import, restore, compaction).
+
+If the Postgres table is missing, balances are computed from the records.
+"""
+
+from typing import Dict, Optional
+
+import pandas as pd
+
+from utils import storage
+from utils.profiler import count, timed
+
+try:
+    from utils import db as _db
+except Exception:
+    _db = None
+
+BALANCE_COLUMNS = ["number", "base_id", "date", "client_name", "phone", "location",
+                   "total", "paid", "remaining", "receipts"]
+# Invoices listed by the receipt picker at once (search narrows the rest)
+PICKER_LIMIT = 200
+# Balances below this are treated as settled (rounding of AED amounts)
+SETTLED = 0.005
+
+# None = not checked yet; False = Postgres table missing (balances computed from records)
+_db_table: Optional[bool] = None
+
+
+def balances_from_records(records: pd.DataFrame) -> pd.DataFrame:
+    """Build the balance rows for every invoice in `records` (full rebuild)."""
+    if records is None or records.empty:
+        return pd.DataFrame(columns=BALANCE_COLUMNS)
+    amounts = pd.to_numeric(records["amount"], errors="coerce").fillna(0.0)
+    is_invoice = records["type"] == "i"
+    invoices = records[is_invoice].assign(amount=amounts[is_invoice]).drop_duplicates("number", keep="last")
+    receipts = records[(records["type"] == "r") & records["base_id"].notna()]
+    paid = amounts[receipts.index].groupby(receipts["base_id"].astype(str)).agg(["sum", "count"])
+
+    out = invoices[["number", "base_id", "date", "client_name", "phone", "location"]].copy()
+    out["number"] = out["number"].astype(str)
+    out["total"] = invoices["amount"].astype(float)
+    base = out["base_id"].where(out["base_id"].notna(), None).astype(object)
+    keys = base.map(lambda b: None if b is None else str(b))
+    out["paid"] = keys.map(paid["sum"]).fillna(0.0).astype(float)
+    out["receipts"] = keys.map(paid["count"]).fillna(0).astype(int)
+    out["remaining"] = (out["total"] - out["paid"]).round(2)
+    return out[BALANCE_COLUMNS].reset_index(drop=True)
+
+
+def _filter_open(df: pd.DataFrame, search: str, limit: int) -> pd.DataFrame:
+    df = df[df["remaining"] > SETTLED]
+    if search:
+        needle = search.strip().lower()
+        text = (df["number"].astype(str) + " " + df["client_name"].astype(str) + " " + df["phone"].astype(str)).str.lower()
+        df = df[text.str.contains(needle, regex=False)]
+    return df.sort_values(["date", "number"], ascending=False).head(limit).reset_index(drop=True)
+
+
+# ==========================================
+# Postgres
+# ==========================================
+
+def _db_ready() -> bool:
+    if _db is None or not _db.get_connection_string():
+        return False
+    return _db_table is not False
+
+
+def _db_missing(e: Exception):
+    global _db_table
+    if _db_table is not False:
+        print(f"invoice_balances: table unavailable, computing from records ({str(e).splitlines()[0] if str(e) else type(e).__name__})")
+    _db_table = False
+
+
+def _refresh_db(rec: Dict):
+    base_id = rec.get("base_id")
+    if rec.get("type") == "i" and rec.get("number"):
+        _db.db_execute(
+            "INSERT INTO invoice_balances(number, base_id, date, client_name, phone, location, total, paid, receipts) "
+            "SELECT %s, %s, %s, %s, %s, %s, %s, COALESCE(SUM(amount), 0), COUNT(*) "
+            "FROM records WHERE type = 'r' AND base_id = %s "
+            "ON CONFLICT (number) DO UPDATE SET base_id = EXCLUDED.base_id, date = EXCLUDED.date, "
+            "client_name = EXCLUDED.client_name, phone = EXCLUDED.phone, location = EXCLUDED.location, "
+            "total = EXCLUDED.total, paid = EXCLUDED.paid, receipts = EXCLUDED.receipts",
+            (str(rec["number"]), base_id, rec.get("date"), rec.get("client_name"), rec.get("phone"),
+             rec.get("location"), float(rec.get("amount") or 0), base_id),
+        )
+    elif rec.get("type") == "r" and base_id:
+        _db.db_execute(
+            "UPDATE invoice_balances b SET paid = s.paid, receipts = s.n "
+            "FROM (SELECT COALESCE(SUM(amount), 0) AS paid, COUNT(*) AS n FROM records "
+            "WHERE type = 'r' AND base_id = %s) s WHERE b.base_id = %s",
+            (base_id, base_id),
+        )
+
+
+def _open_db(search: str, limit: int) -> pd.DataFrame:
+    where = f"remaining > {SETTLED}"
+    params = []
+    if search:
+        where += " AND (number ILIKE %s OR client_name ILIKE %s OR phone ILIKE %s)"
+        params = [f"%{search.strip()}%"] * 3
+    rows = _db.db_query(
+        f"SELECT {', '.join(BALANCE_COLUMNS)} FROM invoice_balances WHERE {where} "
+        "ORDER BY date DESC, number DESC LIMIT %s",
+        tuple(params + [limit]),
+    )
+    df = pd.DataFrame(rows, columns=BALANCE_COLUMNS)
+    for col in ("total", "paid", "remaining"):
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0.0)
+    return df
+
+
+# ==========================================
+# Local store
+# ==========================================
+
+def _prepare_local(conn):
+    storage.ensure_columns("invoice_balances", BALANCE_COLUMNS, conn=conn)
+    storage.ensure_columns("records", storage.TABLE_COLUMNS["records"], conn=conn)
+    conn.execute('CREATE TABLE IF NOT EXISTS _derived_versions (name TEXT PRIMARY KEY, source_version INTEGER NOT NULL)')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_invoice_balances_number ON invoice_balances (number)')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_invoice_balances_base_id ON invoice_balances (base_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_invoice_balances_open ON invoice_balances (date, number) WHERE remaining > 0.005')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_records_base_id_type ON records (base_id, type)')
+
+
+def _synced_version(conn) -> Optional[int]:
+    try:
+        row = conn.execute("SELECT source_version FROM _derived_versions WHERE name = 'invoice_balances'").fetchone()
+    except Exception:
+        return None
+    return int(row[0]) if row else None
+
+
+def _set_synced(conn, version: int):
+    conn.execute(
+        "INSERT INTO _derived_versions(name, source_version) VALUES ('invoice_balances', ?) "
+        "ON CONFLICT(name) DO UPDATE SET source_version = excluded.source_version",
+        (version,),
+    )
+
+
+def _rebuild_local(conn):
+    records = pd.read_sql_query(
+        "SELECT base_id, date, type, number, amount, client_name, phone, location FROM records WHERE type IN ('i', 'r')",
+        conn,
+    )
+    df = balances_from_records(records)
+    conn.execute('DELETE FROM invoice_balances')
+    cols = ", ".join(BALANCE_COLUMNS)
+    conn.executemany(
+        f"INSERT OR REPLACE INTO invoice_balances ({cols}) VALUES ({', '.join('?' for _ in BALANCE_COLUMNS)})",
+        ([storage.to_sql_value(v) for v in row] for row in df.itertuples(index=False, name=None)),
+    )
+    count("balances.rebuilds")
+
+
+def _refresh_local(conn, rec: Dict):
+    base_id = storage.to_sql_value(rec.get("base_id"))
+    paid, n = conn.execute(
+        "SELECT COALESCE(SUM(CAST(amount AS REAL)), 0), COUNT(*) FROM records WHERE base_id = ? AND type = 'r'",
+        (base_id,),
+    ).fetchone() if base_id is not None else (0.0, 0)
+    if rec.get("type") == "i" and rec.get("number"):
+        total = float(rec.get("amount") or 0)
+        values = [str(rec["number"]), base_id, rec.get("date"), rec.get("client_name"), rec.get("phone"),
+                  rec.get("location"), total, paid, round(total - paid, 2), n]
+        conn.execute(
+            f"INSERT OR REPLACE INTO invoice_balances ({', '.join(BALANCE_COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in BALANCE_COLUMNS)})",
+            [storage.to_sql_value(v) for v in values],
+        )
+    elif base_id is not None:
+        conn.execute(
+            "UPDATE invoice_balances SET paid = ?, receipts = ?, remaining = ROUND(total - ?, 2) WHERE base_id = ?",
+            (paid, n, paid, base_id),
+        )
+
+
+def _sync_local(rec: Optional[Dict] = None):
+    """Bring the local index up to the current records version (incrementally for `rec`)."""
+    with storage.transaction("invoice_balances") as conn:
+        _prepare_local(conn)
+        version = storage.table_version("records", conn)
+        synced = _synced_version(conn)
+        # Our own save bumped records by one; anything more came from elsewhere
+        if rec is not None and synced is not None and synced >= version - 1:
+            _refresh_local(conn, rec)
+        elif synced != version:
+            _rebuild_local(conn)
+        _set_synced(conn, version)
+
+
+def _open_local(search: str, limit: int) -> pd.DataFrame:
+    conn = storage.get_connection()
+    if _synced_version(conn) != storage.table_version("records", conn) or not storage.table_exists("invoice_balances", conn):
+        _sync_local()
+    where = f"remaining > {SETTLED}"
+    params = []
+    if search:
+        where += " AND (lower(number) LIKE ? OR lower(client_name) LIKE ? OR lower(phone) LIKE ?)"
+        params = [f"%{search.strip().lower()}%"] * 3
+    return pd.read_sql_query(
+        f"SELECT {', '.join(BALANCE_COLUMNS)} FROM invoice_balances WHERE {where} "
+        "ORDER BY date DESC, number DESC LIMIT ?",
+        conn, params=params + [limit],
+    )
+
+
+# ==========================================
+# Public API
+# ==========================================
+
+def record_saved(rec: Dict, db: bool = False):
+    """Update the index after `rec` was saved (to Postgres when `db`); never raises."""
+    try:
+        if db:
+            if _db_ready():
+                _refresh_db(rec)
+            return
+        _sync_local(rec)
+    except Exception as e:
+        if db:
+            _db_missing(e)
+        else:
+            # The next read sees the version gap and rebuilds
+            print(f"invoice_balances: update skipped ({e})")
+
+
+@timed("balances.open_invoices")
+def open_invoices(search: str = "", limit: int = PICKER_LIMIT) -> pd.DataFrame:
+    """Invoices with a remaining balance, newest first, optionally filtered by number/client/phone."""
+    if _db_ready():
+        try:
+            return _open_db(search, limit)
+        except Exception as e:
+            _db_missing(e)
+    if _db is not None and _db.get_connection_string():
+        try:
+            from utils.records import load_records
+            return _filter_open(balances_from_records(load_records()), search, limit)
+        except Exception:
+            pass
+    try:
+        return _open_local(search, limit)
+    except Exception as e:
+        print(f"invoice_balances: local index unavailable ({e})")
+        return pd.DataFrame(columns=BALANCE_COLUMNS)
+
+
+@timed("balances.receipts_for")
+def receipts_for(base_id) -> pd.DataFrame:
+    """Receipts already issued for a project, newest first."""
+    columns = ["number", "date", "amount"]
+    if base_id is None:
+        return pd.DataFrame(columns=columns)
+    if _db is not None:
+        try:
+            if _db.get_connection_string():
+                rows = _db.db_query(
+                    "SELECT number, date, amount FROM records WHERE type = 'r' AND base_id = %s ORDER BY date DESC",
+                    (base_id,),
+                )
+                df = pd.DataFrame(rows, columns=columns)
+                df["amount"] = pd.to_numeric(df["amount"], errors="coerce").fillna(0.0)
+                return df
+        except Exception:
+            pass
+    try:
+        conn = storage.get_connection()
+        df = pd.read_sql_query(
+            "SELECT number, date, amount FROM records WHERE base_id = ? AND type = 'r' ORDER BY date DESC",
+            conn, params=[storage.to_sql_value(base_id)],
+        )
+        df["amount"] = pd.to_numeric(df["amount"], errors="coerce").fillna(0.0)
+        return df
+    except Exception:
+        return pd.DataFrame(columns=columns)
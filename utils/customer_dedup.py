@@ -0,0 +1,327 @@
+"""
+Customer Deduplication for Newton Smart Home Application
+Batch entity resolution: finds duplicate customers, merges them and re-links their documents.
+
+Pages used to match customers differently (name + phone, name or phone, raw
+vs normalized phone), so the same person can exist several times. The job:
+
+1. Blocks candidates: only customers sharing a phone key, the same set of name
+   tokens, or an uncommon name token are compared, not every pair.
+2. Scores pairs: equal phone keys match, different phone keys never do, and
+   otherwise name similarity adjusted by location/email agreement decides.
+3. Clusters matches (a cluster never holds two different phones) and merges
+   each cluster into its most complete row, filling blanks from the others.
+4. Re-links documents: `records` of merged customers take the surviving name
+   (and phone, when they had none), and Postgres `quotations.customer_id`
+   points to the surviving id.
+
+Afterwards each customer owns one phone key and documents join on exact keys
+(`utils.customers.match_records`). Run it with scripts/dedupe_customers.py.
+"""
+
+import re
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from utils import storage
+from utils.customers import CUSTOMER_COLUMNS, key_series, match_records, name_key, phone_key, proper_case
+from utils.profiler import count, timed
+
+try:
+    from utils import db as _db
+except Exception:
+    _db = None
+
+MATCH_THRESHOLD = 0.9
+# Blocks on a single name token ("mohammed") larger than this are skipped
+MAX_TOKEN_BLOCK = 50
+# Postgres customers only have these columns (app name -> DB name)
+DB_COLUMNS = {"client_name": "name", "phone": "phone", "email": "email", "location": "address"}
+
+
+def _blank(value) -> bool:
+    return value is None or (isinstance(value, float) and pd.isna(value)) or not str(value).strip()
+
+
+def _tokens(key: str) -> frozenset:
+    return frozenset(t for t in re.split(r"\W+", key) if t)
+
+
+# ==========================================
+# Matching
+# ==========================================
+
+def score(a: Dict, b: Dict) -> float:
+    """Match score in [0, 1] for two prepared customers (see `_prepare`)."""
+    if a["phone_key"] and b["phone_key"]:
+        return 1.0 if a["phone_key"] == b["phone_key"] else 0.0
+    if not a["name_key"] or not b["name_key"]:
+        return 0.0
+    union = a["tokens"] | b["tokens"]
+    jaccard = len(a["tokens"] & b["tokens"]) / len(union) if union else 0.0
+    value = max(jaccard, SequenceMatcher(None, a["name_key"], b["name_key"]).ratio())
+    for field in ("location", "email"):
+        if a[field] and b[field]:
+            value += 0.05 if a[field] == b[field] else -0.1
+    return max(0.0, min(1.0, value))
+
+
+def _prepare(customers: pd.DataFrame) -> List[Dict]:
+    phones = key_series(customers["phone"], phone_key)
+    names = key_series(customers["client_name"], name_key)
+    locations = key_series(customers["location"], name_key)
+    emails = key_series(customers["email"], name_key)
+    return [
+        {"phone_key": pk, "name_key": nk, "tokens": _tokens(nk), "location": loc, "email": em}
+        for pk, nk, loc, em in zip(phones, names, locations, emails)
+    ]
+
+
+def _candidate_pairs(prepared: List[Dict]):
+    """(i, j, score) for compared pairs; phone blocks match without scoring."""
+    blocks = defaultdict(list)
+    for pos, c in enumerate(prepared):
+        if c["phone_key"]:
+            blocks[("phone", c["phone_key"])].append(pos)
+        if c["tokens"]:
+            blocks[("name", " ".join(sorted(c["tokens"])))].append(pos)
+            for t in c["tokens"]:
+                if len(t) >= 3:
+                    blocks[("token", t)].append(pos)
+    seen = set()
+    for (kind, _), members in blocks.items():
+        if len(members) < 2:
+            continue
+        if kind == "phone":
+            for other in members[1:]:
+                yield members[0], other, 1.0
+            continue
+        if kind == "token" and len(members) > MAX_TOKEN_BLOCK:
+            count("customers.dedupe.skipped_blocks")
+            continue
+        for x, i in enumerate(members):
+            for j in members[x + 1:]:
+                if (i, j) in seen:
+                    continue
+                seen.add((i, j))
+                count("customers.dedupe.compared")
+                s = score(prepared[i], prepared[j])
+                if s >= MATCH_THRESHOLD:
+                    yield i, j, s
+
+
+def _clusters(prepared: List[Dict]) -> List[List[int]]:
+    parent = list(range(len(prepared)))
+    phone = [c["phone_key"] for c in prepared]
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    pairs = list(_candidate_pairs(prepared))
+    # A customer without a phone whose name matches customers with different
+    # phones could be any of them; leave it unmerged rather than guess
+    matched_phones = defaultdict(set)
+    for i, j, _ in pairs:
+        if bool(phone[i]) != bool(phone[j]):
+            matched_phones[j if phone[i] else i].add(phone[i] or phone[j])
+    ambiguous = {pos for pos, phones in matched_phones.items() if len(phones) > 1}
+    if ambiguous:
+        count("customers.dedupe.ambiguous", len(ambiguous))
+        pairs = [p for p in pairs if p[0] not in ambiguous and p[1] not in ambiguous]
+
+    # Strongest matches first, so a weak link cannot claim a row for the wrong phone
+    for i, j, _ in sorted(pairs, key=lambda p: -p[2]):
+        ri, rj = find(i), find(j)
+        if ri == rj or (phone[ri] and phone[rj] and phone[ri] != phone[rj]):
+            continue
+        parent[rj] = ri
+        phone[ri] = phone[ri] or phone[rj]
+
+    groups = defaultdict(list)
+    for pos in range(len(prepared)):
+        groups[find(pos)].append(pos)
+    return [sorted(m) for m in groups.values() if len(m) > 1]
+
+
+# ==========================================
+# Merging
+# ==========================================
+
+def merge_rows(rows: List[Dict]) -> Dict:
+    """Combine a cluster into its first row: blanks filled, notes/tags joined, latest activity kept."""
+    merged = dict(rows[0])
+    for other in rows[1:]:
+        for col, value in other.items():
+            if _blank(merged.get(col)) and not _blank(value):
+                merged[col] = value
+    notes = [str(r.get("notes")).strip() for r in rows if not _blank(r.get("notes"))]
+    if notes:
+        merged["notes"] = "\n".join(dict.fromkeys(notes))
+    tags = [t.strip() for r in rows if not _blank(r.get("tags")) for t in str(r["tags"]).split(",") if t.strip()]
+    if tags:
+        merged["tags"] = ", ".join(dict.fromkeys(tags))
+    activity = [str(r.get("last_activity")) for r in rows if not _blank(r.get("last_activity"))]
+    if activity:
+        merged["last_activity"] = max(activity)
+    merged["client_name"] = proper_case(merged.get("client_name"))
+    return merged
+
+
+def _completeness(row: Dict) -> tuple:
+    return (not _blank(row.get("phone")), sum(not _blank(row.get(c)) for c in CUSTOMER_COLUMNS))
+
+
+@timed("customers.dedupe.find")
+def find_duplicates(customers: pd.DataFrame) -> List[Dict]:
+    """
+    Duplicate clusters in `customers` (app columns plus the row `id`).
+
+    Each cluster is {"keep": id, "merge": [ids], "positions": [row positions],
+    "rows": [original rows], "merged": surviving row}; the survivor (first)
+    is the most complete, then oldest, row.
+    """
+    if customers.empty:
+        return []
+    customers = customers.reset_index(drop=True)
+    rows = customers.to_dict("records")
+    clusters = []
+    for members in _clusters(_prepare(customers)):
+        # members are in table order, so max() keeps the oldest of equally complete rows
+        best = max(members, key=lambda p: (_completeness(rows[p]), -p))
+        ordered = [best] + [p for p in members if p != best]
+        cluster_rows = [rows[p] for p in ordered]
+        clusters.append({
+            "keep": cluster_rows[0]["id"],
+            "merge": [r["id"] for r in cluster_rows[1:]],
+            "positions": ordered,
+            "rows": cluster_rows,
+            "merged": merge_rows(cluster_rows),
+        })
+    return clusters
+
+
+def relink_records(customers: pd.DataFrame, records: pd.DataFrame, clusters: List[Dict]) -> pd.DataFrame:
+    """Records owned by a merged customer that change: surviving name, and its phone where they had none."""
+    survivor = {pos: c["merged"] for c in clusters for pos in c["positions"]}
+    if records.empty or not survivor:
+        return records.iloc[0:0]
+    owner = match_records(customers.reset_index(drop=True), records)
+    changed = []
+    for idx, pos in owner.dropna().astype(int).items():
+        merged = survivor.get(pos)
+        if merged is None:
+            continue
+        rec = records.loc[idx].to_dict()
+        name = merged.get("client_name")
+        phone = rec.get("phone") if not _blank(rec.get("phone")) else merged.get("phone")
+        if name == rec.get("client_name") and (phone == rec.get("phone") or _blank(phone)):
+            continue
+        changed.append({**rec, "client_name": name, "phone": phone})
+    return pd.DataFrame(changed, columns=records.columns)
+
+
+# ==========================================
+# Backends
+# ==========================================
+
+def _load_db() -> Optional[pd.DataFrame]:
+    if _db is None or not _db.get_connection_string():
+        return None
+    rows = _db.db_query('SELECT id, name, phone, email, address FROM customers ORDER BY id')
+    df = pd.DataFrame(rows, columns=["id", "name", "phone", "email", "address"])
+    df = df.rename(columns={v: k for k, v in DB_COLUMNS.items()})
+    for col in CUSTOMER_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    return df
+
+
+def _load_local() -> pd.DataFrame:
+    storage.ensure_table("customers")
+    conn = storage.get_connection()
+    df = pd.read_sql_query('SELECT rowid AS id, * FROM customers ORDER BY rowid', conn)
+    for col in CUSTOMER_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    return df
+
+
+def _apply_db(clusters: List[Dict], relinked: pd.DataFrame):
+    if not relinked.empty:
+        keyed = relinked[relinked["number"].notna() & relinked["type"].notna()]
+        _db.db_execute(
+            "UPDATE records r SET client_name = u.client_name, phone = u.phone "
+            "FROM unnest(%s::text[], %s::text[], %s::text[], %s::text[]) AS u(type, number, client_name, phone) "
+            "WHERE r.type = u.type AND r.number = u.number",
+            (keyed["type"].astype(str).tolist(), keyed["number"].astype(str).tolist(),
+             keyed["client_name"].astype(str).tolist(), keyed["phone"].where(keyed["phone"].notna(), None).tolist()),
+        )
+    for c in clusters:
+        m = c["merged"]
+        # Duplicates go before the survivor takes their phone (customers_phone_key_key)
+        _db.db_execute(
+            "UPDATE quotations SET customer_id = %s WHERE customer_id = ANY(%s); "
+            "DELETE FROM customers WHERE id = ANY(%s); "
+            "UPDATE customers SET name = %s, phone = %s, email = %s, address = %s WHERE id = %s",
+            (c["keep"], c["merge"], c["merge"], m.get("client_name"), m.get("phone"),
+             m.get("email"), m.get("location"), c["keep"]),
+        )
+
+
+def _apply_local(clusters: List[Dict], relinked: pd.DataFrame):
+    # Records first: if the job stops halfway, a rerun still finds the same clusters
+    if not relinked.empty:
+        with storage.transaction("records") as conn:
+            conn.executemany(
+                'UPDATE records SET client_name = ?, phone = ? WHERE rowid = ?',
+                [(storage.to_sql_value(n), storage.to_sql_value(p), int(r))
+                 for n, p, r in zip(relinked["client_name"], relinked["phone"], relinked["rowid"])],
+            )
+    with storage.transaction("customers") as conn:
+        updates = []
+        for c in clusters:
+            conn.executemany('DELETE FROM customers WHERE rowid = ?', [(int(i),) for i in c["merge"]])
+            updates.append([storage.to_sql_value(c["merged"].get(col)) for col in CUSTOMER_COLUMNS] + [int(c["keep"])])
+        # phone_key/name_key are recomputed by utils.customers on the next upsert
+        conn.executemany(
+            f'UPDATE customers SET {", ".join(f"{col} = ?" for col in CUSTOMER_COLUMNS)} WHERE rowid = ?', updates
+        )
+
+
+@timed("customers.dedupe")
+def dedupe_customers(apply: bool = False) -> Dict:
+    """
+    Find duplicate customers in Postgres (when configured) or the local store;
+    with `apply`, merge them and re-link their records.
+
+    Returns {"backend", "customers", "clusters", "records"}; "records" is the
+    number of documents re-linked (or that would be).
+    """
+    customers, backend = None, "local"
+    try:
+        customers = _load_db()
+        backend = "postgres" if customers is not None else "local"
+    except Exception as e:
+        print(f"customers dedupe: database unavailable, using local store ({e})")
+    if customers is None:
+        customers = _load_local()
+
+    clusters = find_duplicates(customers)
+    if backend == "postgres":
+        records = pd.DataFrame(_db.db_query('SELECT type, number, client_name, phone FROM records'),
+                               columns=["type", "number", "client_name", "phone"])
+    else:
+        storage.ensure_table("records")
+        records = pd.read_sql_query('SELECT rowid, type, number, client_name, phone FROM records', storage.get_connection())
+    relinked = relink_records(customers, records, clusters)
+
+    if apply and clusters:
+        (_apply_db if backend == "postgres" else _apply_local)(clusters, relinked)
+        count("customers.dedupe.merged", sum(len(c["merge"]) for c in clusters))
+    return {"backend": backend, "customers": len(customers), "clusters": clusters, "records": len(relinked)}
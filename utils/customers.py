@@ -0,0 +1,525 @@
+"""
+Customer Sync for Newton Smart Home Application
+Resolves and upserts customers from quotations and invoices by a normalized phone key.
+
+A customer is identified by `phone_key`, the 10-digit local form of the phone
+number (the same rules as `phone_flat10` on the pages), so "+971 50 299 2932",
+"0502992932" and "502992932" are one customer. Customers without a phone fall
+back to a case-insensitive name key.
+
+- Postgres: `phone_key` is a generated column with a unique index (sql/ddl.sql)
+  and saves are `INSERT ... ON CONFLICT (phone_key)` upserts.
+- Local store: `phone_key`/`name_key` columns with SQLite indexes. Each upsert
+  is an indexed lookup plus a one-row write inside a write-locked transaction.
+
+The customers page adds, edits and deletes one customer at a time
+(`add_customer`, `update_customer`, `delete_customer`); an edit writes only
+the fields that differ from the row as it was loaded.
+
+Documents are attributed to customers with the same keys (`match_records`),
+so per-customer totals are one vectorized join instead of a scan per customer.
+Older duplicates are merged by scripts/dedupe_customers.py.
+"""
+
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils import storage
+from utils.profiler import count, timed
+
+try:
+    from utils import db as _db
+except Exception:
+    _db = None
+
+CUSTOMER_COLUMNS = list(storage.TABLE_COLUMNS["customers"])
+KEY_COLUMNS = ["phone_key", "name_key"]
+FINANCE_COLUMNS = ["quotations", "invoices", "paid", "outstanding"]
+
+_lock = threading.Lock()
+# db path -> table version at which phone_key/name_key were last known to be current
+_synced_versions: Dict[str, int] = {}
+# None = not checked yet; "upsert" = phone_key unique index, "legacy" = plain lookups
+_db_mode: Optional[str] = None
+
+
+def phone_key(raw) -> str:
+    """10-digit local phone (0502992932); "" when there are no digits."""
+    if raw is None:
+        return ""
+    digits = ''.join(filter(str.isdigit, str(raw)))
+    if not digits:
+        return ""
+    if digits.startswith('971') and len(digits) >= 12 and digits[3] == '5':
+        return '0' + digits[3:12]
+    if len(digits) == 9 and digits.startswith('5'):
+        return '0' + digits
+    if len(digits) == 10 and digits.startswith('05'):
+        return digits
+    return digits[-10:]
+
+
+def name_key(name) -> str:
+    if name is None:
+        return ""
+    return re.sub(r"\s+", " ", str(name)).strip().lower()
+
+
+def proper_case(text) -> str:
+    if not text:
+        return ""
+    try:
+        return str(text).title().strip()
+    except Exception:
+        return str(text)
+
+
+# ==========================================
+# Postgres
+# ==========================================
+
+def _detect_db_mode() -> str:
+    global _db_mode
+    if _db_mode is None:
+        try:
+            rows = _db.db_query(
+                "SELECT 1 FROM pg_indexes WHERE tablename = 'customers' "
+                "AND indexdef ILIKE 'CREATE UNIQUE INDEX%%(phone_key)%%'"
+            )
+            _db_mode = "upsert" if rows else "legacy"
+        except Exception:
+            _db_mode = "legacy"
+        if _db_mode == "legacy":
+            print("customers: phone_key unique index missing; run sql/ddl.sql for upserts")
+    return _db_mode
+
+
+def _upsert_db(name: str, phone: str, location: str) -> str:
+    if not _db.get_connection_string():
+        raise RuntimeError("No database configured")
+    name, location = proper_case(name), proper_case(location)
+    if phone_key(phone) and _detect_db_mode() == "upsert":
+        row = _db.db_execute(
+            "INSERT INTO customers(name, phone, email, address) VALUES (%s, %s, '', %s) "
+            "ON CONFLICT (phone_key) DO UPDATE SET name = EXCLUDED.name, phone = EXCLUDED.phone, "
+            "address = COALESCE(NULLIF(EXCLUDED.address, ''), customers.address) "
+            "RETURNING (xmax = 0) AS inserted",
+            (name, phone, location), returning=True,
+        )
+        return "inserted" if row and row.get("inserted") else "updated"
+
+    if phone_key(phone):
+        existing = _db.db_query(
+            'SELECT id FROM customers WHERE lower(name) = %s OR phone = %s ORDER BY id LIMIT 1',
+            (name_key(name), phone),
+        )
+    else:
+        existing = _db.db_query('SELECT id FROM customers WHERE lower(name) = %s ORDER BY id LIMIT 1', (name_key(name),))
+    if existing:
+        _db.db_execute(
+            "UPDATE customers SET name = %s, phone = COALESCE(NULLIF(%s, ''), phone), "
+            "address = COALESCE(NULLIF(%s, ''), address) WHERE id = %s",
+            (name, phone or '', location, existing[0].get('id')),
+        )
+        return "updated"
+    _db.db_execute('INSERT INTO customers(name, phone, email, address) VALUES (%s, %s, %s, %s)', (name, phone, '', location))
+    return "inserted"
+
+
+def find_customer_id(name: str, phone: str) -> Optional[int]:
+    """
+    Postgres id of the customer a document belongs to (None without a DB or match).
+
+    A phone matches only its own customer; the name is used only for a
+    customer without a phone, and then only among rows without one.
+    """
+    if _db is None:
+        return None
+    try:
+        if not _db.get_connection_string():
+            return None
+        pk = phone_key(phone)
+        if pk and _detect_db_mode() == "upsert":
+            rows = _db.db_query('SELECT id FROM customers WHERE phone_key = %s', (pk,))
+        elif pk:
+            # No phone_key column: narrow by trailing digits, then compare normalized phones
+            rows = _db.db_query(
+                "SELECT id, phone FROM customers WHERE regexp_replace(coalesce(phone, ''), '\\D', '', 'g') LIKE %s "
+                "ORDER BY id", ('%' + pk[-9:],),
+            )
+            rows = [r for r in rows if phone_key(r.get('phone')) == pk][:1]
+        elif _detect_db_mode() == "upsert":
+            rows = _db.db_query(
+                'SELECT id FROM customers WHERE lower(name) = %s AND phone_key IS NULL ORDER BY id LIMIT 1',
+                (name_key(proper_case(name)),),
+            )
+        else:
+            rows = _db.db_query(
+                "SELECT id FROM customers WHERE lower(name) = %s "
+                "AND regexp_replace(coalesce(phone, ''), '\\D', '', 'g') = '' ORDER BY id LIMIT 1",
+                (name_key(proper_case(name)),),
+            )
+        return rows[0].get('id') if rows else None
+    except Exception:
+        return None
+
+
+# ==========================================
+# Local store
+# ==========================================
+
+def _sync_keys(conn):
+    """Recompute the key columns after a bulk write (e.g. the customers page editor)."""
+    rows = conn.execute(
+        'SELECT rowid, phone, client_name, phone_key, name_key FROM customers ORDER BY rowid'
+    ).fetchall()
+    seen = set()
+    changes = []
+    for rowid, phone, name, old_pk, old_nk in rows:
+        pk = phone_key(phone) or None
+        # Older duplicates keep their phone but only the first row owns the key
+        # (scripts/dedupe_customers.py merges them)
+        if pk in seen:
+            pk = None
+        elif pk:
+            seen.add(pk)
+        nk = name_key(name) or None
+        if (pk, nk) != (old_pk, old_nk):
+            changes.append((pk, nk, rowid))
+    if changes:
+        # Clear first so reassigned keys never collide with the unique index mid-update
+        conn.executemany('UPDATE customers SET phone_key = NULL WHERE rowid = ?', [(r,) for _, _, r in changes])
+        conn.executemany('UPDATE customers SET phone_key = ?, name_key = ? WHERE rowid = ?', changes)
+        count("customers.keys_synced", len(changes))
+
+
+def _prepare_local(conn):
+    storage.ensure_columns("customers", CUSTOMER_COLUMNS + KEY_COLUMNS, conn=conn)
+    path = os.path.abspath(storage.DB_PATH)
+    version = storage.table_version("customers", conn)
+    with _lock:
+        current = _synced_versions.get(path) == version
+    indexed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='index' AND name='ux_customers_phone_key'"
+    ).fetchone() is not None
+    if not current or not indexed:
+        _sync_keys(conn)
+    if not indexed:
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_customers_phone_key ON customers (phone_key)')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_customers_name_key ON customers (name_key)')
+
+
+def _mark_synced(version: int):
+    """transaction() bumps the version on commit; our own writes keep the keys current."""
+    with _lock:
+        _synced_versions[os.path.abspath(storage.DB_PATH)] = version
+
+
+def _locate_local(conn, customer: Dict[str, Any]) -> Optional[int]:
+    """
+    rowid of a loaded customer: by phone key, or by name key for a customer without a phone.
+
+    A phone that is not in the local store means the customer is not here (Postgres
+    only, deleted or re-numbered elsewhere); it never falls back to a namesake.
+    """
+    pk, nk = phone_key(customer.get("phone")), name_key(customer.get("client_name"))
+    if pk:
+        row = conn.execute('SELECT rowid FROM customers WHERE phone_key = ?', (pk,)).fetchone()
+    elif nk:
+        row = conn.execute(
+            'SELECT rowid FROM customers WHERE name_key = ? AND phone_key IS NULL ORDER BY rowid LIMIT 1', (nk,)
+        ).fetchone()
+    else:
+        row = None
+    return row[0] if row else None
+
+
+def _phone_taken_local(conn, pk: Optional[str], rowid: Optional[int] = None) -> bool:
+    if not pk:
+        return False
+    row = conn.execute('SELECT rowid FROM customers WHERE phone_key = ?', (pk,)).fetchone()
+    return row is not None and row[0] != rowid
+
+
+def _upsert_local(name: str, phone: str, location: str, status: str) -> str:
+    pk, nk = phone_key(phone) or None, name_key(name) or None
+    today = datetime.today().strftime('%Y-%m-%d')
+    with storage.transaction("customers") as conn:
+        _prepare_local(conn)
+        row = None
+        if pk:
+            row = conn.execute('SELECT rowid, status FROM customers WHERE phone_key = ?', (pk,)).fetchone()
+        if row is None and nk:
+            # Name matches only customers that do not already own a different phone
+            row = conn.execute(
+                'SELECT rowid, status FROM customers WHERE name_key = ? AND (phone_key IS NULL OR ? IS NULL) '
+                'ORDER BY rowid LIMIT 1', (nk, pk),
+            ).fetchone()
+        if row is not None:
+            rowid, current_status = row
+            conn.execute(
+                'UPDATE customers SET client_name = ?, phone = COALESCE(?, phone), '
+                'phone_key = COALESCE(?, phone_key), name_key = ?, location = COALESCE(?, location), '
+                'status = ?, last_activity = ? WHERE rowid = ?',
+                (proper_case(name), phone or None, pk, nk, proper_case(location) or None,
+                 current_status if str(current_status or '').strip() else status, today, rowid),
+            )
+            result = "updated"
+        else:
+            values = {
+                "client_name": proper_case(name), "phone": phone, "location": proper_case(location),
+                "email": "", "status": status, "notes": "", "tags": "", "next_follow_up": "",
+                "assigned_to": "", "last_activity": today, "phone_key": pk, "name_key": nk,
+            }
+            cols = list(values)
+            conn.execute(
+                f'INSERT INTO customers ({", ".join(cols)}) VALUES ({", ".join("?" for _ in cols)})',
+                [values[c] for c in cols],
+            )
+            result = "inserted"
+        version = storage.table_version("customers", conn) + 1
+    _mark_synced(version)
+    return result
+
+
+@timed("customers.upsert")
+def upsert_customer(name: str, phone: str, location: str, status: str = "New") -> Optional[str]:
+    """
+    Add the customer or update the existing one; returns "inserted", "updated" or None.
+
+    Matching is by normalized phone first, then by name for customers without
+    a phone. `status` applies to new customers and to existing ones with no status.
+    """
+    if not str(name or "").strip():
+        return None
+    if _db is not None:
+        try:
+            return _upsert_db(name, phone, location)
+        except Exception:
+            pass
+    return _upsert_local(name, phone or "", location or "", status)
+
+
+# ==========================================
+# Row-level edits (customers page)
+# ==========================================
+# Postgres holds name/phone/email/address only; the local store keeps every
+# field, so it is written in both modes.
+
+# App column -> Postgres column
+DB_COLUMNS = {"client_name": "name", "phone": "phone", "email": "email", "location": "address"}
+
+
+def _clean(values: Mapping[str, Any]) -> Dict[str, Any]:
+    unknown = set(values) - set(CUSTOMER_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown customer fields: {', '.join(sorted(unknown))}")
+    return {c: storage.to_sql_value(v) for c, v in values.items()}
+
+
+def _db_configured() -> bool:
+    return _db is not None and bool(_db.get_connection_string())
+
+
+def _db_id(customer: Mapping[str, Any]) -> Optional[int]:
+    return find_customer_id(customer.get("client_name") or "", customer.get("phone") or "")
+
+
+def _phone_taken_db(pk: str, customer_id: Optional[int] = None) -> bool:
+    if not pk or _detect_db_mode() != "upsert":
+        return False
+    rows = _db.db_query('SELECT id FROM customers WHERE phone_key = %s', (pk,))
+    return bool(rows) and rows[0].get("id") != customer_id
+
+
+def _db_sets(values: Dict[str, Any]):
+    cols = [c for c in values if c in DB_COLUMNS]
+    return ", ".join(f"{DB_COLUMNS[c]} = %s" for c in cols), tuple(values[c] for c in cols)
+
+
+def _add_local(values: Dict[str, Any]):
+    row = {c: values.get(c, "") for c in CUSTOMER_COLUMNS}
+    row["phone_key"], row["name_key"] = phone_key(row["phone"]) or None, name_key(row["client_name"]) or None
+    with storage.transaction("customers") as conn:
+        _prepare_local(conn)
+        if _phone_taken_local(conn, row["phone_key"]):
+            raise ValueError("A customer with this phone number already exists.")
+        cols = list(row)
+        conn.execute(
+            f'INSERT INTO customers ({", ".join(cols)}) VALUES ({", ".join("?" for _ in cols)})',
+            [row[c] for c in cols],
+        )
+        version = storage.table_version("customers", conn) + 1
+    _mark_synced(version)
+
+
+def _update_local(customer: Mapping[str, Any], changes: Dict[str, Any]):
+    keys = {}
+    if "phone" in changes:
+        keys["phone_key"] = phone_key(changes["phone"]) or None
+    if "client_name" in changes:
+        keys["name_key"] = name_key(changes["client_name"]) or None
+    with storage.transaction("customers") as conn:
+        _prepare_local(conn)
+        rowid = _locate_local(conn, customer)
+        if "phone_key" in keys and _phone_taken_local(conn, keys["phone_key"], rowid):
+            raise ValueError("Another customer already has this phone number.")
+        if rowid is None and _db_configured():
+            # Known to Postgres only: keep a full local copy from here on
+            row = {c: storage.to_sql_value(customer.get(c)) for c in CUSTOMER_COLUMNS}
+            row.update(changes)
+            row["phone_key"], row["name_key"] = phone_key(row["phone"]) or None, name_key(row["client_name"]) or None
+            cols = list(row)
+            conn.execute(
+                f'INSERT INTO customers ({", ".join(cols)}) VALUES ({", ".join("?" for _ in cols)})',
+                [row[c] for c in cols],
+            )
+        elif rowid is not None:
+            values = dict(changes, **keys)
+            conn.execute(
+                f'UPDATE customers SET {", ".join(f"{c} = ?" for c in values)} WHERE rowid = ?',
+                list(values.values()) + [rowid],
+            )
+        version = storage.table_version("customers", conn) + 1
+    _mark_synced(version)
+
+
+def _delete_local(customer: Mapping[str, Any]) -> bool:
+    with storage.transaction("customers") as conn:
+        _prepare_local(conn)
+        rowid = _locate_local(conn, customer)
+        if rowid is not None:
+            conn.execute('DELETE FROM customers WHERE rowid = ?', (rowid,))
+        version = storage.table_version("customers", conn) + 1
+    _mark_synced(version)
+    return rowid is not None
+
+
+@timed("customers.add")
+def add_customer(values: Mapping[str, Any]):
+    """Insert one customer; raises ValueError without a name or when the phone is already taken."""
+    values = _clean(values)
+    if not str(values.get("client_name") or "").strip():
+        raise ValueError("Client name is required.")
+    if _db_configured():
+        try:
+            if _phone_taken_db(phone_key(values.get("phone"))):
+                raise ValueError("A customer with this phone number already exists.")
+            cols = [c for c in DB_COLUMNS if c in values]
+            _db.db_execute(
+                f'INSERT INTO customers({", ".join(DB_COLUMNS[c] for c in cols)}) '
+                f'VALUES ({", ".join("%s" for _ in cols)})',
+                tuple(values[c] for c in cols),
+            )
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"customers: add kept in local store only ({e})")
+    _add_local(values)
+
+
+@timed("customers.update")
+def update_customer(customer: Mapping[str, Any], edited: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Write the fields of `edited` that differ from `customer` (the row as loaded).
+
+    Returns the changes written ({} when nothing changed). Raises ValueError
+    when the new phone number belongs to another customer.
+    """
+    changes = _clean(storage.changed_fields(customer, edited))
+    if not changes:
+        return {}
+    if _db_configured():
+        try:
+            sets, params = _db_sets(changes)
+            customer_id = _db_id(customer) if sets else None
+            if customer_id is not None:
+                if "phone" in changes and _phone_taken_db(phone_key(changes["phone"]), customer_id):
+                    raise ValueError("Another customer already has this phone number.")
+                _db.db_execute(f'UPDATE customers SET {sets} WHERE id = %s', params + (customer_id,))
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"customers: update kept in local store only ({e})")
+    _update_local(customer, changes)
+    count("customers.fields_updated", len(changes))
+    return changes
+
+
+@timed("customers.delete")
+def delete_customer(customer: Mapping[str, Any]) -> bool:
+    """Delete the one customer matching the loaded row; returns False when it was already gone."""
+    deleted = False
+    if _db_configured():
+        try:
+            customer_id = _db_id(customer)
+            if customer_id is not None:
+                _db.db_execute('DELETE FROM customers WHERE id = %s', (customer_id,))
+                deleted = True
+        except Exception as e:
+            print(f"customers: delete kept in local store only ({e})")
+    return _delete_local(customer) or deleted
+
+
+# ==========================================
+# Joins
+# ==========================================
+
+def key_series(values: pd.Series, fn: Callable[[object], str]) -> pd.Series:
+    """`fn` applied once per distinct value (names and phones repeat across records)."""
+    values = values.astype(object).where(values.notna(), "")
+    uniques = pd.unique(values)
+    return values.map(dict(zip(uniques, map(fn, uniques))))
+
+
+def _first_position(keys: pd.Series) -> pd.Series:
+    """key -> position of the first customer holding it (blank keys dropped)."""
+    index = pd.Series(np.arange(len(keys)), index=keys.to_numpy())
+    index = index[index.index != ""]
+    return index[~index.index.duplicated()]
+
+
+@timed("customers.match_records")
+def match_records(customers: pd.DataFrame, records: pd.DataFrame) -> pd.Series:
+    """
+    Position in `customers` of the customer each record belongs to (NaN if none).
+
+    A record belongs to the customer with the same phone key, or, when its
+    phone matches nobody, to the customer with the same name key.
+    """
+    if customers.empty or records.empty:
+        return pd.Series(np.nan, index=records.index)
+    by_phone = _first_position(key_series(customers["phone"], phone_key))
+    by_name = _first_position(key_series(customers["client_name"], name_key))
+    rec_phone = key_series(records["phone"], phone_key) if "phone" in records.columns else pd.Series("", index=records.index)
+    rec_name = key_series(records["client_name"], name_key)
+    return rec_phone.map(by_phone).fillna(rec_name.map(by_name))
+
+
+@timed("customers.finances")
+def customer_finances(customers: pd.DataFrame, records: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Quotation, invoice and receipt totals plus the outstanding balance, indexed like `customers`."""
+    out = pd.DataFrame(0.0, index=customers.index, columns=FINANCE_COLUMNS)
+    if records is None or records.empty or customers.empty:
+        return out
+    owner = match_records(customers, records)
+    matched = owner.notna()
+    if not matched.any():
+        return out
+    amounts = pd.to_numeric(records["amount"], errors="coerce").fillna(0.0)[matched]
+    totals = (
+        amounts.groupby([owner[matched].astype(int).to_numpy(), records["type"][matched].to_numpy()]).sum()
+        .unstack(fill_value=0.0)
+        .reindex(index=range(len(customers)), columns=["q", "i", "r"], fill_value=0.0)
+    )
+    out["quotations"] = totals["q"].to_numpy(dtype=float)
+    out["invoices"] = totals["i"].to_numpy(dtype=float)
+    out["paid"] = totals["r"].to_numpy(dtype=float)
+    out["outstanding"] = out["invoices"] - out["paid"]
+    return out
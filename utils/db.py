@@ -1,5 +1,7 @@
-from typing import Any, List, Optional
+from contextlib import contextmanager
+from typing import Any, Iterable, List, Optional, Sequence
 import os
+from utils.profiler import timed
 
 try:
     import streamlit as st
@@ -33,6 +35,7 @@ def get_connection():
     return psycopg2.connect(conn_str)
 
 
+@timed("db.query")
 def db_query(query: str, params: Optional[tuple] = None) -> List[dict]:
     """Execute a SELECT query and return list of dict rows."""
     conn = get_connection()
@@ -48,6 +51,7 @@ def db_query(query: str, params: Optional[tuple] = None) -> List[dict]:
             pass
 
 
+@timed("db.execute")
 def db_execute(query: str, params: Optional[tuple] = None, returning: bool = False) -> Any:
     """Execute INSERT/UPDATE/DELETE. If returning=True, fetch one row from RETURNING clause."""
     conn = get_connection()
@@ -71,3 +75,29 @@ def db_execute(query: str, params: Optional[tuple] = None, returning: bool = Fal
             conn.close()
         except Exception:
             pass
+
+
+@contextmanager
+def db_transaction():
+    """One connection and transaction for several statements: commit on success, rollback on error."""
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            yield cur
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+@timed("db.execute_values")
+def execute_values(cur, query: str, rows: Iterable[Sequence[Any]], template: Optional[str] = None,
+                   page_size: int = 500, fetch: bool = False) -> List[dict]:
+    """Run `query` (with one `VALUES %s`) for many rows in pages of `page_size` on `cur`."""
+    result = psycopg2.extras.execute_values(cur, query, rows, template=template, page_size=page_size, fetch=fetch)
+    return [dict(r) for r in result] if fetch and result else []
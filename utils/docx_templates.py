@@ -0,0 +1,61 @@
+"""
+Word Templates for Newton Smart Home Application
+Parses each .docx template once per process and hands every export a copy.
+
+Building a quotation, invoice, receipt or catalog used to parse its template
+with `Document(path)` on every click. Parsed templates are now kept here,
+keyed by path and re-parsed only when the file's size or modification time
+changes; `load` returns a deep copy, so fillers can edit it freely while the
+cached original stays pristine. utils/warmup.py fills the cache at startup.
+"""
+
+import copy
+import os
+import threading
+from typing import Dict, Tuple
+
+from utils.profiler import count
+
+_lock = threading.Lock()
+# absolute path -> ((size, mtime), parsed Document)
+_cache: Dict[str, Tuple[Tuple[int, float], object]] = {}
+
+
+def _stamp(path: str) -> Tuple[int, float]:
+    st = os.stat(path)
+    return st.st_size, st.st_mtime
+
+
+def _parsed(path: str):
+    from docx import Document
+
+    key = os.path.abspath(str(path))
+    stamp = _stamp(key)
+    with _lock:
+        hit = _cache.get(key)
+    if hit is not None and hit[0] == stamp:
+        count("docx_templates.cache_hit")
+        return hit[1]
+    doc = Document(key)
+    with _lock:
+        _cache[key] = (stamp, doc)
+    count("docx_templates.cache_miss")
+    return doc
+
+
+def preload(path) -> bool:
+    """Parse `path` into the cache; False when the file does not exist."""
+    if not os.path.exists(str(path)):
+        return False
+    _parsed(path)
+    return True
+
+
+def load(path):
+    """A fresh Document for `path`: a copy of the cached parse."""
+    return copy.deepcopy(_parsed(path))
+
+
+def clear():
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,132 @@
+"""
+Export Downloads for Newton Smart Home Application
+Serves generated documents by token from the side HTTP server.
+
+Embedding an export in the page as base64 (a data-URI link plus an inline
+script carrying the payload) sends ~2.7x its size over the websocket and keeps
+it in browser memory. Exports are instead held here for a few minutes and
+fetched with a plain GET on `/download/<token>/<filename>`, with the right
+Content-Length, Content-Disposition and caching headers.
+
+The route is opt-in: unless a deployment says where browsers reach the side
+server, a link to it would point at each user's own localhost (and be blocked
+as plain HTTP on an HTTPS page). Set NEWTON_SIDE_PUBLIC_URL to that address,
+or NEWTON_SIDE_DOWNLOADS=1 when the app is only used on the server machine;
+otherwise exports use Streamlit download buttons.
+"""
+
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote
+
+from utils import http_side
+from utils.profiler import count
+
+ROUTE = "/download/"
+TTL_SECONDS = 15 * 60
+MAX_BYTES = 200 * 1024 * 1024
+
+_lock = threading.Lock()
+# token -> (data, filename, mime, etag, expires_at), oldest first
+_exports: "OrderedDict[str, Tuple[bytes, str, str, str, float]]" = OrderedDict()
+# (etag, filename) -> token, so a rerun re-publishing the same file reuses its URL
+_tokens: Dict[Tuple[str, str], str] = {}
+_total = 0
+
+
+# ==========================================
+# Store
+# ==========================================
+
+def _drop(token: str):
+    global _total
+    data, filename, _mime, etag, _expires = _exports.pop(token)
+    _tokens.pop((etag, filename), None)
+    _total -= len(data)
+
+
+def _evict(now: float):
+    for token in [t for t, entry in _exports.items() if entry[4] <= now]:
+        _drop(token)
+    while _total > MAX_BYTES and _exports:
+        _drop(next(iter(_exports)))
+
+
+def publish(data: bytes, filename: str, mime: str) -> str:
+    """Keep `data` for TTL_SECONDS and return its download token."""
+    global _total
+    etag = hashlib.sha1(data).hexdigest()
+    now = time.time()
+    with _lock:
+        _evict(now)
+        token = _tokens.get((etag, filename))
+        if token is not None:
+            entry = _exports.pop(token)
+            _exports[token] = entry[:4] + (now + TTL_SECONDS,)
+            return token
+        token = secrets.token_urlsafe(16)
+        _exports[token] = (data, filename, mime, etag, now + TTL_SECONDS)
+        _tokens[(etag, filename)] = token
+        _total += len(data)
+        _evict(now)
+    count("downloads.published")
+    return token
+
+
+def get(token: str) -> Optional[Tuple[bytes, str, str, str, float]]:
+    with _lock:
+        entry = _exports.get(token)
+        if entry is None or entry[4] <= time.time():
+            return None
+        return entry
+
+
+def clear():
+    global _total
+    with _lock:
+        _exports.clear()
+        _tokens.clear()
+        _total = 0
+
+
+# ==========================================
+# Route
+# ==========================================
+
+def enabled() -> bool:
+    """True when the deployment opted in: NEWTON_SIDE_PUBLIC_URL set or NEWTON_SIDE_DOWNLOADS=1."""
+    if os.environ.get("NEWTON_SIDE_PUBLIC_URL", "").strip():
+        return True
+    return os.environ.get("NEWTON_SIDE_DOWNLOADS", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def available() -> bool:
+    """True when exports should be served from the side server (it is started on demand)."""
+    return enabled() and http_side.ensure_server()
+
+
+def url(token: str, filename: str) -> str:
+    return f"{http_side.side_base_url()}{ROUTE}{token}/{quote(filename)}"
+
+
+def _serve(rest: str):
+    entry = get(rest.split("/", 1)[0])
+    if entry is None:
+        return 404, "text/plain", b"Download expired or not found", {}
+    data, filename, mime, etag, expires = entry
+    count("downloads.served")
+    ascii_name = filename.encode("ascii", "replace").decode("ascii").replace('"', "'")
+    return 200, mime, data, {
+        "Content-Disposition": f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}",
+        "Cache-Control": f"private, max-age={max(0, int(expires - time.time()))}, immutable",
+        "ETag": f'"{etag}"',
+        "X-Content-Type-Options": "nosniff",
+    }
+
+
+http_side.register_route(ROUTE, _serve)
@@ -0,0 +1,251 @@
+"""
+File Locking for Newton Smart Home Application
+Advisory locks, atomic replace and coalesced write-behind for files under data/.
+
+Tables live in SQLite (utils/storage.py), which does its own locking. The
+remaining plain files - settings.json, uploaded Word templates, exports,
+product images and restored backups - are written here instead of with a bare
+`open(path, "w")`:
+
+- `file_lock(path)`: exclusive lock on `<path>.lock`, shared by the threads of
+  this process and by other processes (CLI scripts, a second app instance).
+- `atomic_write(path, data)`: write a temp file next to the target, fsync, then
+  `os.replace`, so readers see either the old or the new file, never half of one.
+- `write_behind(path, data)`: queue a write; a burst of saves to the same file
+  within `WRITE_BEHIND_DELAY` seconds becomes a single flush of the last value.
+"""
+
+import atexit
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple, Union
+
+from utils.profiler import count, timed
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LOCK_TIMEOUT = 10.0
+WRITE_BEHIND_DELAY = 0.5
+_POLL = 0.05
+
+
+# ==========================================
+# Advisory locks
+# ==========================================
+
+class _PathLock:
+    """In-process half of a file lock: serializes threads, re-entrant per thread."""
+
+    def __init__(self):
+        self.rlock = threading.RLock()
+        self.depth = 0
+        self.fd: Optional[int] = None
+
+
+_path_locks: Dict[str, _PathLock] = {}
+_path_locks_guard = threading.Lock()
+
+
+def _path_lock(key: str) -> _PathLock:
+    with _path_locks_guard:
+        lock = _path_locks.get(key)
+        if lock is None:
+            lock = _path_locks[key] = _PathLock()
+        return lock
+
+
+def _try_os_lock(fd: int) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _os_unlock(fd: int):
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    except OSError:
+        pass
+
+
+@contextmanager
+def file_lock(path: str, timeout: float = LOCK_TIMEOUT):
+    """Hold an exclusive advisory lock for `path` (raises TimeoutError after `timeout` seconds)."""
+    key = os.path.abspath(path)
+    lock = _path_lock(key)
+    deadline = time.monotonic() + timeout
+    if not lock.rlock.acquire(timeout=timeout):
+        raise TimeoutError(f"Timed out waiting for lock on {path}")
+    try:
+        if lock.depth == 0:
+            os.makedirs(os.path.dirname(key), exist_ok=True)
+            fd = os.open(key + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+            waited = False
+            while not _try_os_lock(fd):
+                if time.monotonic() >= deadline:
+                    os.close(fd)
+                    raise TimeoutError(f"Timed out waiting for lock on {path}")
+                waited = True
+                time.sleep(_POLL)
+            if waited:
+                count("file_lock.contended")
+            lock.fd = fd
+        lock.depth += 1
+        try:
+            yield
+        finally:
+            lock.depth -= 1
+            if lock.depth == 0 and lock.fd is not None:
+                _os_unlock(lock.fd)
+                os.close(lock.fd)
+                lock.fd = None
+    finally:
+        lock.rlock.release()
+
+
+# ==========================================
+# Atomic replace
+# ==========================================
+
+def _replace(key: str, data: bytes):
+    directory = os.path.dirname(key)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{os.path.basename(key)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        for attempt in range(5):
+            try:
+                os.replace(tmp, key)
+                break
+            except PermissionError:
+                # Windows refuses to replace a file another process has open
+                if attempt == 4:
+                    raise
+                time.sleep(_POLL * (attempt + 1))
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+@timed("file_lock.atomic_write")
+def atomic_write(path: str, data: Union[bytes, str], encoding: str = "utf-8"):
+    """Replace `path` with `data` under its lock; supersedes any queued write for the same file."""
+    if isinstance(data, str):
+        data = data.encode(encoding)
+    key = os.path.abspath(path)
+    with file_lock(key):
+        _queue.discard(key)
+        _replace(key, data)
+
+
+# ==========================================
+# Write-behind queue
+# ==========================================
+
+class _WriteBehind:
+    """Background writer that keeps only the newest pending content per file."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._cond = threading.Condition()
+        # path -> (data, due time); due is set by the first write of a burst
+        self._pending: Dict[str, Tuple[bytes, float]] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, key: str, data: bytes):
+        with self._cond:
+            previous = self._pending.get(key)
+            if previous is not None:
+                count("file_lock.coalesced")
+            due = previous[1] if previous is not None else time.monotonic() + self.delay
+            self._pending[key] = (data, due)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="newton-write-behind", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def pending(self, key: str) -> Optional[bytes]:
+        with self._cond:
+            entry = self._pending.get(key)
+            return entry[0] if entry else None
+
+    def discard(self, key: str):
+        with self._cond:
+            self._pending.pop(key, None)
+
+    def flush(self, key: Optional[str] = None):
+        with self._cond:
+            keys = list(self._pending) if key is None else [key]
+        for k in keys:
+            self._flush_key(k)
+
+    def _flush_key(self, key: str, only_due: bool = False):
+        # Take the entry while holding the file lock so flushes of one file never reorder
+        try:
+            with file_lock(key):
+                with self._cond:
+                    entry = self._pending.get(key)
+                    if entry is None or (only_due and entry[1] > time.monotonic()):
+                        return
+                    del self._pending[key]
+                _replace(key, entry[0])
+            count("file_lock.flushes")
+        except Exception as e:
+            print(f"Write-behind failed for {key}: {e}")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                now = time.monotonic()
+                due = min(d for _, d in self._pending.values())
+                if due > now:
+                    self._cond.wait(due - now)
+                    continue
+                ready = [k for k, v in self._pending.items() if v[1] <= now]
+            for k in ready:
+                self._flush_key(k, only_due=True)
+
+
+_queue = _WriteBehind(WRITE_BEHIND_DELAY)
+atexit.register(_queue.flush)
+
+
+def write_behind(path: str, data: Union[bytes, str], encoding: str = "utf-8"):
+    """Queue `data` for `path`; use `pending_data` to read it back before it is flushed."""
+    if isinstance(data, str):
+        data = data.encode(encoding)
+    _queue.submit(os.path.abspath(path), data)
+
+
+def pending_data(path: str) -> Optional[bytes]:
+    """Content queued for `path` but not yet on disk (None if nothing is pending)."""
+    return _queue.pending(os.path.abspath(path))
+
+
+def flush(path: Optional[str] = None):
+    """Write queued content now (one file, or everything when `path` is None)."""
+    _queue.flush(os.path.abspath(path) if path else None)
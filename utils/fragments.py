@@ -0,0 +1,79 @@
+"""
+Fragment helpers for Newton Smart Home pages
+Lets a page section rerun on its own instead of re-executing the whole script.
+"""
+
+import functools
+import time
+
+import streamlit as st
+
+from utils import profiler
+from utils.session_memory import memo_store
+
+
+# st.fragment is stable from Streamlit 1.37; older releases ship the
+# experimental name. Without either, sections simply run as plain functions.
+_fragment_api = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+
+def _timed(func):
+    """Record the last run time of a section in `st.session_state.fragment_ms`."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            st.session_state.setdefault("fragment_ms", {})[func.__name__] = elapsed
+            if profiler.is_enabled():
+                profiler.record(f"fragment.{func.__name__}", elapsed)
+    return wrapper
+
+
+def fragment(func=None, **kwargs):
+    """Decorate a page section so widget interactions inside it rerun only that section."""
+    if func is None:
+        return lambda f: fragment(f, **kwargs)
+    func = _timed(func)
+    if _fragment_api is None:
+        return func
+    return _fragment_api(func, **kwargs)
+
+
+def rerun_fragment():
+    """Rerun the current fragment, or the whole app when fragments are unavailable."""
+    if _fragment_api is not None:
+        try:
+            st.rerun(scope="fragment")
+        except Exception:
+            # Called outside a fragment or on a Streamlit without scoped reruns
+            pass
+    st.rerun()
+
+
+def peek_memo(name, key):
+    """Return the value memoized under `name` if it was built for `key`, else None."""
+    store = memo_store(st.session_state)
+    hit = store.get(name)
+    if hit is not None and hit[0] == key:
+        store.touch(name)
+        return hit[1]
+    return None
+
+
+def session_memo(name, key, build):
+    """
+    Return `build()` for `key`, reusing the previous result while `key` is unchanged.
+
+    Export panels key their documents on the line item revision and the filled
+    fields, so a rerun only regenerates a file when its inputs actually changed.
+    Entries count against the per-process memo budget (`utils.session_memory`)
+    and may be evicted, in which case the next call rebuilds them.
+    """
+    value = peek_memo(name, key)
+    if value is None:
+        value = build()
+        memo_store(st.session_state).put(name, key, value)
+    return value
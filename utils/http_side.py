@@ -0,0 +1,94 @@
+"""
+Side HTTP Server for Newton Smart Home Application
+Serves small non-UI endpoints (metrics dumps) next to the Streamlit app.
+
+Streamlit does not expose custom routes, so a tiny threaded server runs on
+NEWTON_SIDE_PORT (default 8599), bound to NEWTON_SIDE_HOST (default 127.0.0.1).
+"""
+
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+# A handler takes the path remainder and returns (status, content_type, body, extra_headers)
+Handler = Callable[[str], Tuple[int, str, bytes, Dict[str, str]]]
+
+_routes: Dict[str, Handler] = {}
+_server: Optional[ThreadingHTTPServer] = None
+_lock = threading.Lock()
+
+
+def register_route(prefix: str, handler: Handler):
+    """Serve GET requests whose path starts with `prefix` using `handler`."""
+    _routes[prefix] = handler
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        # Longest prefix wins so /metrics.json is not shadowed by /metrics
+        for prefix in sorted(_routes, key=len, reverse=True):
+            if path.startswith(prefix):
+                try:
+                    status, ctype, body, headers = _routes[prefix](path[len(prefix):])
+                except Exception as e:
+                    status, ctype, body, headers = 500, "text/plain", str(e).encode("utf-8"), {}
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+                return
+        self.send_error(404)
+
+    def log_message(self, format, *args):
+        # Keep the Streamlit console clean
+        pass
+
+
+def side_base_url() -> str:
+    host = os.environ.get("NEWTON_SIDE_PUBLIC_URL")
+    if host:
+        return host.rstrip("/")
+    return f"http://{os.environ.get('NEWTON_SIDE_HOST', '127.0.0.1')}:{side_port()}"
+
+
+def side_port() -> int:
+    try:
+        return int(os.environ.get("NEWTON_SIDE_PORT", "8599"))
+    except ValueError:
+        return 8599
+
+
+def ensure_server() -> bool:
+    """Start the side server once per process. Returns False if the port is unavailable."""
+    global _server
+    with _lock:
+        if _server is not None:
+            return True
+        try:
+            _server = ThreadingHTTPServer((os.environ.get("NEWTON_SIDE_HOST", "127.0.0.1"), side_port()), _RequestHandler)
+        except OSError as e:
+            print(f"Side server not started: {e}")
+            return False
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="newton-side-server", daemon=True).start()
+        return True
+
+
+def _metrics_text(_rest: str):
+    from utils import profiler
+    return 200, "text/plain; version=0.0.4", profiler.to_prometheus().encode("utf-8"), {}
+
+
+def _metrics_json(_rest: str):
+    from utils import profiler
+    return 200, "application/json", json.dumps(profiler.snapshot()).encode("utf-8"), {}
+
+
+register_route("/metrics.json", _metrics_json)
+register_route("/metrics", _metrics_text)
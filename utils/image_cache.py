@@ -0,0 +1,99 @@
+"""
+Image Cache for Newton Smart Home Application
+Process-wide store of product images addressed by content hash.
+
+Line items used to carry the product's full base64 image (twice: as
+`image_base64` and again as `image`), so every session holding a quotation or
+invoice kept its own copy of each picture. Items now store only the hash
+returned by `register`; exporters resolve it here at render time, and all
+sessions share one copy per distinct image. An image evicted while a line
+item still refers to it is registered again from the catalog row when the
+item is exported (`utils.line_items.restore_images`).
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from utils.profiler import count
+
+# Least recently used images are dropped beyond this (far above a typical catalog)
+MAX_BYTES = 64 * 1024 * 1024
+
+_lock = threading.Lock()
+# content hash -> base64 text (no data: prefix), least recently used first
+_images: "OrderedDict[str, str]" = OrderedDict()
+_total = 0
+
+# First base64 characters of common image formats
+_MIME_PREFIXES = (("/9j/", "image/jpeg"), ("iVBOR", "image/png"), ("R0lGOD", "image/gif"), ("UklGR", "image/webp"))
+
+
+def _clean(value: Any) -> Optional[str]:
+    """Base64 text of `value`, or None for NaN/empty/non-text values."""
+    if not isinstance(value, str):
+        return None
+    s = value.strip()
+    if s.startswith("data:") and "," in s:
+        s = s.split(",", 1)[1]
+    return s or None
+
+
+def register(value: Any) -> Optional[str]:
+    """Store a base64 image (raw or data URI) once and return its content hash."""
+    global _total
+    s = _clean(value)
+    if s is None:
+        return None
+    key = hashlib.sha1(s.encode("ascii", "ignore")).hexdigest()
+    with _lock:
+        if key in _images:
+            _images.move_to_end(key)
+            return key
+        _images[key] = s
+        _total += len(s)
+        while _total > MAX_BYTES and len(_images) > 1:
+            _, old = _images.popitem(last=False)
+            _total -= len(old)
+    count("image_cache.stored")
+    return key
+
+
+def contains(key: Optional[str]) -> bool:
+    """True when `key` is still cached (no hit/miss is counted and recency is unchanged)."""
+    with _lock:
+        return bool(key) and key in _images
+
+
+def get_base64(key: Optional[str]) -> Optional[str]:
+    if not key:
+        return None
+    with _lock:
+        s = _images.get(key)
+        if s is not None:
+            _images.move_to_end(key)
+    count("image_cache.hit" if s is not None else "image_cache.miss")
+    return s
+
+
+def data_uri(key: Optional[str]) -> Optional[str]:
+    """`data:` URI for a registered image (None when unknown or evicted)."""
+    s = get_base64(key)
+    if s is None:
+        return None
+    mime = next((m for prefix, m in _MIME_PREFIXES if s.startswith(prefix)), "image/png")
+    return f"data:{mime};base64,{s}"
+
+
+def stats() -> Dict[str, int]:
+    with _lock:
+        return {"images": len(_images), "bytes": _total}
+
+
+def clear():
+    global _total
+    with _lock:
+        _images.clear()
+        _total = 0
+
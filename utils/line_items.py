@@ -0,0 +1,169 @@
+"""
+Line Item Model for Newton Smart Home Documents
+Holds quotation/invoice line items in session state with running totals.
+
+Items reference their product image by content hash (`utils.image_cache`)
+rather than holding the base64 text, which is resolved only when a record is
+built for an export. If the shared cache evicted the image meanwhile, it is
+reloaded from the product's catalog row (`restore_images`).
+"""
+
+import sys
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from utils import image_cache
+from utils.profiler import count
+
+
+@dataclass(slots=True)
+class LineItem:
+    """One product row on a quotation or invoice."""
+    device: str
+    description: str = ""
+    qty: float = 1
+    unit_price: float = 0.0
+    warranty: int = 0
+    item_no: int = 0
+    image_path: Optional[str] = None
+    image_key: Optional[str] = None
+
+    @property
+    def line_total(self) -> float:
+        return float(self.qty or 0) * float(self.unit_price or 0)
+
+    def to_record(self) -> Dict[str, Any]:
+        """Return the row using the column names the exporters expect."""
+        if not self.image_path and self.image_key and not image_cache.contains(self.image_key):
+            restore_images([self])
+        return {
+            "Item No": self.item_no,
+            "Product / Device": self.device,
+            "Description": self.description,
+            "Qty": self.qty,
+            "Unit Price (AED)": self.unit_price,
+            "Line Total (AED)": self.line_total,
+            "Warranty (Years)": self.warranty,
+            "ImagePath": self.image_path,
+            "ImageKey": self.image_key,
+            # file path, else the cached image as a data URI, for HTML/PDF rendering
+            "image": self.image_path or image_cache.data_uri(self.image_key),
+        }
+
+    def nbytes(self) -> int:
+        """Approximate memory held by this item, including the strings it references."""
+        return sys.getsizeof(self) + sum(sys.getsizeof(getattr(self, f.name)) for f in fields(self))
+
+
+class LineItemTable:
+    """
+    Ordered list of line items with an incrementally maintained subtotal.
+
+    `revision` increases on every change so callers can tell when anything
+    derived from the items (totals, rendered exports) is out of date.
+    """
+
+    __slots__ = ("_items", "_subtotal", "revision")
+
+    def __init__(self, items: Optional[List[LineItem]] = None):
+        self._items: List[LineItem] = []
+        self._subtotal = 0.0
+        self.revision = 0
+        for item in items or []:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[LineItem]:
+        return iter(self._items)
+
+    def __getitem__(self, index: int) -> LineItem:
+        return self._items[index]
+
+    @property
+    def empty(self) -> bool:
+        return not self._items
+
+    @property
+    def subtotal(self) -> float:
+        return self._subtotal
+
+    def add(self, item: LineItem) -> LineItem:
+        item.item_no = len(self._items) + 1
+        self._items.append(item)
+        self._subtotal += item.line_total
+        self.revision += 1
+        return item
+
+    def remove(self, index: int) -> LineItem:
+        item = self._items.pop(index)
+        self._subtotal -= item.line_total
+        # Only rows after the removed one need renumbering
+        for pos in range(index, len(self._items)):
+            self._items[pos].item_no = pos + 1
+        if not self._items:
+            self._subtotal = 0.0
+        self.revision += 1
+        return item
+
+    def clear(self):
+        self._items.clear()
+        self._subtotal = 0.0
+        self.revision += 1
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        restore_images(self._items)
+        return [item.to_record() for item in self._items]
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the table in session state."""
+        return sys.getsizeof(self) + sys.getsizeof(self._items) + sum(item.nbytes() for item in self._items)
+
+
+def catalog_image(row) -> Dict[str, Optional[str]]:
+    """`image_path`/`image_key` for a catalog row; the base64 image goes to the shared cache."""
+    path = row.get("ImagePath") if hasattr(row, "get") else None
+    path = str(path).strip() if isinstance(path, str) and path.strip() else None
+    return {"image_path": path, "image_key": image_cache.register(row.get("ImageBase64"))}
+
+
+def _device_key(name) -> str:
+    return " ".join(str(name).split()).lower() if name is not None else ""
+
+
+def restore_images(items: Iterable[LineItem]):
+    """
+    Re-register images evicted from the shared cache, from each item's catalog row.
+
+    The catalog is loaded once for all items that need it; an item whose
+    product no longer has an image keeps its (unresolvable) key.
+    """
+    missing = [item for item in items
+               if not item.image_path and item.image_key and not image_cache.contains(item.image_key)]
+    if not missing:
+        return
+    from utils import products
+    try:
+        catalog = products.load_products()
+    except Exception:
+        return
+    count("line_items.image_restored", len(missing))
+    rows = {_device_key(d): (b64, path) for d, b64, path
+            in zip(catalog["Device"], catalog["ImageBase64"], catalog["ImagePath"])}
+    for item in missing:
+        b64, path = rows.get(_device_key(item.device), (None, None))
+        key = image_cache.register(b64)
+        if key is not None:
+            item.image_key = key
+        elif isinstance(path, str) and path.strip():
+            item.image_path = path.strip()
+
+
+def ensure_table(state, key: str) -> LineItemTable:
+    """Return the LineItemTable stored under `key`, creating it when missing."""
+    table = state.get(key) if hasattr(state, "get") else None
+    if not isinstance(table, LineItemTable):
+        table = LineItemTable()
+        state[key] = table
+    return table
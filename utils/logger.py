@@ -1,12 +1,13 @@
 """
 Logger System for Newton Smart Home Application
-Logs all important events to data/logs.xlsx
+Logs all important events to the logs table (Postgres or local storage)
 """
 
-import os
 import pandas as pd
 from datetime import datetime
 from typing import Optional
+from utils.profiler import timed
+from utils import storage
 try:
     from utils import db as _db
 except Exception:
@@ -14,17 +15,14 @@ except Exception:
 
 
 def ensure_logs_file():
-    """Create logs.xlsx if it doesn't exist."""
-    os.makedirs("data", exist_ok=True)
-    path = "data/logs.xlsx"
-    if not os.path.exists(path):
-        df = pd.DataFrame(columns=["timestamp", "user", "page", "action", "details"])
-        df.to_excel(path, index=False)
+    """Create the local logs table if it doesn't exist."""
+    storage.ensure_table("logs")
 
 
+@timed("logger.log_event")
 def log_event(user: str, page: str, action: str, details: str = ""):
     """
-    Log an event to data/logs.xlsx.
+    Log an event (appended as a single row, never rewriting the table).
     
     Args:
         user: Username or "System"
@@ -41,32 +39,21 @@ def log_event(user: str, page: str, action: str, details: str = ""):
                 ))
                 return
             except Exception:
-                # Fall back to Excel below
+                # Fall back to local storage below
                 pass
 
-        ensure_logs_file()
-        # Load existing logs
-        try:
-            logs = pd.read_excel("data/logs.xlsx")
-        except:
-            logs = pd.DataFrame(columns=["timestamp", "user", "page", "action", "details"])
-
-        # Create new log entry
-        new_log = pd.DataFrame([{
+        storage.append_rows("logs", [{
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "user": str(user),
             "page": str(page),
             "action": str(action),
             "details": str(details)
         }])
-
-        # Append and save
-        logs = pd.concat([logs, new_log], ignore_index=True)
-        logs.to_excel("data/logs.xlsx", index=False)
     except Exception as e:
         print(f"Error logging event: {e}")
 
 
+@timed("logger.load_logs")
 def load_logs(filters: Optional[dict] = None) -> pd.DataFrame:
     """
     Load logs with optional filters.
@@ -93,10 +80,10 @@ def load_logs(filters: Optional[dict] = None) -> pd.DataFrame:
         logs = None
 
     if logs is None:
-        # Excel fallback
-        ensure_logs_file()
+        # Local storage fallback
         try:
-            logs = pd.read_excel("data/logs.xlsx")
+            ensure_logs_file()
+            logs = storage.read_table("logs")
             logs.columns = [c.strip().lower() for c in logs.columns]
         except Exception as e:
             print(f"Error loading logs: {e}")
@@ -128,10 +115,11 @@ def clear_old_logs(days: int = 90):
             except Exception:
                 pass
 
-        logs = pd.read_excel("data/logs.xlsx")
+        logs = storage.read_table("logs")
         logs["timestamp"] = pd.to_datetime(logs["timestamp"])
         cutoff = datetime.now() - pd.Timedelta(days=days)
         logs = logs[logs["timestamp"] >= cutoff]
-        logs.to_excel("data/logs.xlsx", index=False)
+        logs["timestamp"] = logs["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S")
+        storage.write_table("logs", logs)
     except Exception as e:
         print(f"Error clearing old logs: {e}")
@@ -0,0 +1,62 @@
+"""
+Page Registry for Newton Smart Home Application
+Maps page ids to their modules and imports each page the first time it is opened.
+
+main.py used to import all eight pages (and through them pandas, python-docx,
+PIL, altair and jinja2) before the PIN screen could render. Pages are now
+listed here by module path and loaded with importlib on first navigation;
+the module stays in `sys.modules`, so later visits cost nothing.
+"""
+
+import importlib
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from utils import profiler
+
+# page id -> (module, entry point)
+PAGES: Dict[str, Tuple[str, str]] = {
+    "dashboard": ("pages_custom.dashboard_new", "dashboard_new_app"),
+    "quotation": ("pages_custom.quotation_page", "quotation_app"),
+    "invoice": ("pages_custom.invoice_page", "invoice_app"),
+    "receipt": ("pages_custom.receipt_page", "receipt_app"),
+    "customers": ("pages_custom.customers_page", "customers_app"),
+    "products": ("pages_custom.products_page", "products_app"),
+    "reports": ("pages_custom.reports_page", "reports_app"),
+    "settings": ("pages_custom.settings_page", "settings_app"),
+}
+
+_lock = threading.Lock()
+_loaded: Dict[str, Callable[[], None]] = {}
+
+
+def load_page(page: str) -> Optional[Callable[[], None]]:
+    """Entry point of `page`, importing its module on first use (None for unknown pages)."""
+    app = _loaded.get(page)
+    if app is not None:
+        return app
+    target = PAGES.get(page)
+    if target is None:
+        return None
+    module_name, attr = target
+    # Import once even when two sessions open the same page at the same time
+    with _lock:
+        app = _loaded.get(page)
+        if app is None:
+            with profiler.span(f"page.import.{page}"):
+                app = getattr(importlib.import_module(module_name), attr)
+            _loaded[page] = app
+    return app
+
+
+def is_loaded(page: str) -> bool:
+    return page in _loaded
+
+
+def preload(pages: Optional[Iterable[str]] = None):
+    """Import pages ahead of navigation (all when `pages` is None); failures are printed, not raised."""
+    for page in pages if pages is not None else PAGES:
+        try:
+            load_page(page)
+        except Exception as e:
+            print(f"Page preload failed ({page}): {e}")
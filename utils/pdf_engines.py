@@ -0,0 +1,273 @@
+"""
+PDF Engines for Newton Smart Home Application
+Registry of HTML/document -> PDF converters with one-time capability detection.
+
+Engines are probed once per process (`detect_engines`, run in the
+background by the warm-up thread) instead of try/except imports on every export. The
+selector prefers the `pdf_engine` setting when it is available, then the
+fastest local engine:
+
+    reportlab   direct A4 layout, no HTML engine (documents only)
+    weasyprint  shared warmed renderer (utils/pdf_renderer.py)
+    pdfkit      wkhtmltopdf binary
+    convertapi  remote; only with CONVERTAPI_SECRET and `pdf_allow_remote`
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from utils.assets import inline_assets
+from utils.pdf_renderer import A4_STYLESHEET, get_renderer, inline_stylesheets
+from utils.profiler import count, timed
+
+
+class PdfEngine:
+    """Base converter. `rank` orders engines by speed (lower is faster)."""
+
+    name = ""
+    rank = 100
+    renders_documents = False
+    renders_html = False
+    remote = False
+
+    def detect(self) -> bool:
+        raise NotImplementedError
+
+    def from_html(self, html_str: str, stylesheets: Iterable[str] = ()) -> bytes:
+        raise NotImplementedError
+
+    def from_document(self, doc_type: str, context: Dict) -> bytes:
+        raise NotImplementedError
+
+    def warm_up(self):
+        """Optional: load fonts/caches ahead of the first conversion."""
+
+
+class ReportLabEngine(PdfEngine):
+    name = "reportlab"
+    rank = 10
+    renders_documents = True
+
+    def detect(self) -> bool:
+        import reportlab  # noqa: F401
+        from utils import pdf_reportlab  # noqa: F401
+        return True
+
+    def from_document(self, doc_type: str, context: Dict) -> bytes:
+        from utils.pdf_reportlab import render_document
+        return render_document(doc_type, context)
+
+    def warm_up(self):
+        from utils.pdf_reportlab import warm_up
+        warm_up()
+
+
+class WeasyPrintEngine(PdfEngine):
+    name = "weasyprint"
+    rank = 20
+    renders_html = True
+
+    def detect(self) -> bool:
+        # Importing WeasyPrint is what fails when pango/cairo are missing
+        import weasyprint  # noqa: F401
+        return True
+
+    def from_html(self, html_str: str, stylesheets: Iterable[str] = ()) -> bytes:
+        return get_renderer().render(html_str, stylesheets)
+
+    def warm_up(self):
+        get_renderer().warm_up()
+
+
+class PdfkitEngine(PdfEngine):
+    name = "pdfkit"
+    rank = 30
+    renders_html = True
+
+    def detect(self) -> bool:
+        import pdfkit  # noqa: F401
+        return shutil.which("wkhtmltopdf") is not None
+
+    def from_html(self, html_str: str, stylesheets: Iterable[str] = ()) -> bytes:
+        import pdfkit
+        html_str = inline_stylesheets(inline_assets(html_str), stylesheets)
+        return pdfkit.from_string(html_str, False, options={"page-size": "A4", "encoding": "UTF-8", "quiet": ""})
+
+
+class ConvertApiEngine(PdfEngine):
+    name = "convertapi"
+    rank = 90
+    renders_html = True
+    remote = True
+
+    def detect(self) -> bool:
+        import convertapi  # noqa: F401
+        return bool(os.environ.get("CONVERTAPI_SECRET"))
+
+    def from_html(self, html_str: str, stylesheets: Iterable[str] = ()) -> bytes:
+        import convertapi
+        convertapi.api_credentials = os.environ.get("CONVERTAPI_SECRET")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            html_path = Path(tmpdir) / "temp.html"
+            # The remote converter cannot resolve local asset URLs or shared stylesheets
+            html_path.write_text(inline_stylesheets(inline_assets(html_str), stylesheets), encoding="utf-8")
+            result = convertapi.convert('pdf', {'File': str(html_path), 'FileName': 'document'}, from_format='html')
+            saved = result.save_files(tmpdir)
+            if not saved:
+                raise RuntimeError('ConvertAPI returned no files')
+            return Path(saved[0]).read_bytes()
+
+
+# ==========================================
+# Registry and detection
+# ==========================================
+
+_engines: Dict[str, PdfEngine] = {}
+_available: Optional[Dict[str, bool]] = None
+_detect_errors: Dict[str, str] = {}
+_detect_lock = threading.Lock()
+
+
+def register_engine(engine: PdfEngine):
+    """Add (or replace) an engine; detection reruns on next use."""
+    global _available
+    _engines[engine.name] = engine
+    _available = None
+
+
+for _engine in (ReportLabEngine(), WeasyPrintEngine(), PdfkitEngine(), ConvertApiEngine()):
+    register_engine(_engine)
+
+
+def detect_engines(force: bool = False) -> Dict[str, bool]:
+    """Probe every registered engine once per process; returns name -> available."""
+    global _available
+    with _detect_lock:
+        if _available is None or force:
+            found = {}
+            for name, engine in _engines.items():
+                try:
+                    found[name] = bool(engine.detect())
+                    _detect_errors.pop(name, None)
+                except Exception as e:
+                    found[name] = False
+                    _detect_errors[name] = str(e).splitlines()[0] if str(e) else type(e).__name__
+            _available = found
+        return dict(_available)
+
+
+def detection_errors() -> Dict[str, str]:
+    detect_engines()
+    return dict(_detect_errors)
+
+
+def _remote_allowed() -> bool:
+    if os.environ.get("NEWTON_PDF_ALLOW_REMOTE", "").strip().lower() in ("1", "true", "yes", "on"):
+        return True
+    try:
+        from utils.settings import get_setting
+        return bool(get_setting("pdf_allow_remote", False))
+    except Exception:
+        return False
+
+
+def _preferred() -> str:
+    try:
+        from utils.settings import get_setting
+        return str(get_setting("pdf_engine", "auto") or "auto")
+    except Exception:
+        return "auto"
+
+
+def select_engines(kind: str = "document", preferred: Optional[str] = None) -> List[PdfEngine]:
+    """Available engines able to render `kind` ("document" or "html"), best first."""
+    available = detect_engines()
+    remote_ok = _remote_allowed()
+    candidates = [
+        e for e in _engines.values()
+        if available.get(e.name)
+        and (e.renders_html or (kind == "document" and e.renders_documents))
+        and (remote_ok or not e.remote)
+    ]
+    candidates.sort(key=lambda e: e.rank)
+    preferred = preferred or _preferred()
+    for i, e in enumerate(candidates):
+        if e.name == preferred:
+            candidates.insert(0, candidates.pop(i))
+            break
+    return candidates
+
+
+def _no_engine_error(kind: str, failures: List[str]) -> RuntimeError:
+    detail = "; ".join(failures) or "none available"
+    return RuntimeError(
+        f"No PDF engine could render this {kind} ({detail}).\n"
+        "Install reportlab or WeasyPrint locally, or set CONVERTAPI_SECRET and enable remote conversion."
+    )
+
+
+@timed("pdf.convert_document")
+def convert_document(doc_type: str, context: Dict, build_html: Callable[[], str]) -> bytes:
+    """Render a normalized document context with the best engine, falling back in rank order.
+
+    `build_html` is called lazily (at most once) when an HTML engine is used; it
+    must return HTML rendered without inline assets or the shared stylesheet.
+    """
+    failures = []
+    html_str = None
+    for engine in select_engines("document"):
+        try:
+            if engine.renders_documents:
+                data = engine.from_document(doc_type, context)
+            else:
+                if html_str is None:
+                    html_str = build_html()
+                data = engine.from_html(html_str, [A4_STYLESHEET])
+            count(f"pdf.engine.{engine.name}")
+            return data
+        except Exception as e:
+            count("pdf.engine_fallback")
+            failures.append(f"{engine.name}: {str(e).splitlines()[0] if str(e) else type(e).__name__}")
+    raise _no_engine_error("document", failures)
+
+
+@timed("pdf.convert_html")
+def convert_html(html_str: str, stylesheets: Iterable[str] = ()) -> bytes:
+    """Render arbitrary HTML with the best HTML-capable engine."""
+    failures = []
+    stylesheets = list(stylesheets)
+    for engine in select_engines("html"):
+        try:
+            data = engine.from_html(html_str, stylesheets)
+            count(f"pdf.engine.{engine.name}")
+            return data
+        except Exception as e:
+            count("pdf.engine_fallback")
+            failures.append(f"{engine.name}: {str(e).splitlines()[0] if str(e) else type(e).__name__}")
+    raise _no_engine_error("HTML", failures)
+
+
+def engine_names() -> List[str]:
+    return sorted(_engines, key=lambda n: _engines[n].rank)
+
+
+def warm_up_engines() -> Dict[str, bool]:
+    """Detect engines and warm the available local ones; returns {engine: warmed}.
+
+    Run by the process warm-up thread (utils/warmup.py), off the request path.
+    """
+    available = detect_engines()
+    warmed = {}
+    for engine in select_engines("document"):
+        if available.get(engine.name) and not engine.remote:
+            try:
+                engine.warm_up()
+                warmed[engine.name] = True
+            except Exception as e:
+                print(f"PDF engine warm-up failed ({engine.name}): {e}")
+                warmed[engine.name] = False
+    return warmed
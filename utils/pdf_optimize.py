@@ -0,0 +1,254 @@
+"""
+PDF Optimizer for Newton Smart Home Application
+Post-processing stage that shrinks exported PDFs before they are downloaded or shared.
+
+Product images are stored as full-quality PNGs and end up in the PDF at their
+original resolution. `optimize_pdf` measures how large each image is actually
+drawn on the page, downsamples it to the DPI of the `pdf_quality` preset,
+re-encodes photos as JPEG, and rewrites the file with compressed object
+streams. Fonts are already subset by the local engines (ReportLab and
+WeasyPrint embed only the glyphs used), so they are left as they are.
+
+Uses pikepdf when installed; without it PDFs are returned unchanged.
+"""
+
+import hashlib
+import io
+import math
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from utils.profiler import count, timed
+
+# Preset -> target resolution and JPEG quality ("original" disables the stage)
+QUALITY_PRESETS: Dict[str, Optional[Dict[str, int]]] = {
+    "original": None,
+    "print": {"dpi": 200, "jpeg_quality": 85},
+    "email": {"dpi": 150, "jpeg_quality": 78},
+    "screen": {"dpi": 96, "jpeg_quality": 65},
+}
+DEFAULT_QUALITY = "email"
+
+# Images already within this factor of the target size are not resampled
+_RESAMPLE_THRESHOLD = 0.85
+_IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+_MAX_FORM_DEPTH = 8
+
+# (image hash, drawn size, preset) -> encoded result; logos and product photos
+# repeat across exports, so each is encoded once per process
+_CACHE_SIZE = 256
+_cache_lock = threading.Lock()
+_encoded: "OrderedDict[tuple, Optional[tuple]]" = OrderedDict()
+_MISSING = object()
+
+
+def _quality(quality: Optional[str]) -> str:
+    if quality is None:
+        try:
+            from utils.settings import get_setting
+            quality = get_setting("pdf_quality", DEFAULT_QUALITY)
+        except Exception:
+            quality = DEFAULT_QUALITY
+    return quality if quality in QUALITY_PRESETS else DEFAULT_QUALITY
+
+
+def is_available() -> bool:
+    try:
+        import pikepdf  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+# ==========================================
+# Where images are drawn
+# ==========================================
+
+def _multiply(m, n):
+    """PDF matrix product m x n (row-vector convention, as used by `cm`)."""
+    a, b, c, d, e, f = m
+    a2, b2, c2, d2, e2, f2 = n
+    return (
+        a * a2 + b * c2, a * b2 + b * d2,
+        c * a2 + d * c2, c * b2 + d * d2,
+        e * a2 + f * c2 + e2, e * b2 + f * d2 + f2,
+    )
+
+
+def _walk(pikepdf, stream, resources, ctm, sizes: Dict[Tuple[int, int], Tuple[float, float]], depth: int = 0):
+    """Record the largest drawn size (points) of every image XObject used by a content stream."""
+    xobjects = resources.get("/XObject", {}) if resources is not None else {}
+    stack = []
+    for operands, operator in pikepdf.parse_content_stream(stream):
+        op = str(operator)
+        if op == "q":
+            stack.append(ctm)
+        elif op == "Q":
+            ctm = stack.pop() if stack else _IDENTITY
+        elif op == "cm" and len(operands) == 6:
+            ctm = _multiply(tuple(float(v) for v in operands), ctm)
+        elif op == "Do" and operands:
+            xobj = xobjects.get(str(operands[0]))
+            if xobj is None:
+                continue
+            subtype = xobj.get("/Subtype")
+            if subtype == "/Image":
+                a, b, c, d = ctm[:4]
+                w, h = math.hypot(a, b), math.hypot(c, d)
+                key = xobj.objgen
+                old = sizes.get(key, (0.0, 0.0))
+                sizes[key] = (max(old[0], w), max(old[1], h))
+            elif subtype == "/Form" and depth < _MAX_FORM_DEPTH:
+                matrix = tuple(float(v) for v in xobj.get("/Matrix", _IDENTITY))
+                _walk(pikepdf, xobj, xobj.get("/Resources", resources), _multiply(matrix, ctm), sizes, depth + 1)
+
+
+def _drawn_sizes(pikepdf, pdf) -> Dict[Tuple[int, int], Tuple[float, float]]:
+    sizes: Dict[Tuple[int, int], Tuple[float, float]] = {}
+    for page in pdf.pages:
+        try:
+            _walk(pikepdf, page.obj, page.obj.get("/Resources"), _IDENTITY, sizes)
+        except Exception as e:
+            print(f"PDF optimize: skipped page ({e})")
+    return sizes
+
+
+# ==========================================
+# Image re-encoding
+# ==========================================
+
+def _is_photo(img) -> bool:
+    """Many distinct colours -> photo (JPEG); few -> logo/line art (kept lossless)."""
+    return img.getcolors(maxcolors=256) is None
+
+
+def _encode(pikepdf, xobj, drawn: Tuple[float, float], preset: Dict[str, int]):
+    """New (data, filter, size, colorspace, smask data) for an image, or None to keep it."""
+    from PIL import Image
+
+    if xobj.get("/ImageMask", False) or int(xobj.get("/BitsPerComponent", 8)) != 8:
+        return None
+    filters = xobj.get("/Filter")
+    filters = [str(f) for f in filters] if isinstance(filters, pikepdf.Array) else [str(filters)] if filters else []
+    if any(f in ("/JPXDecode", "/JBIG2Decode", "/CCITTFaxDecode") for f in filters):
+        return None
+
+    width, height = int(xobj.Width), int(xobj.Height)
+    target_w = max(1, math.ceil(drawn[0] / 72 * preset["dpi"]))
+    target_h = max(1, math.ceil(drawn[1] / 72 * preset["dpi"]))
+    scale = min(1.0, max(target_w / width, target_h / height))
+    resample = scale < _RESAMPLE_THRESHOLD
+    if not resample and "/DCTDecode" in filters:
+        return None
+
+    img = pikepdf.PdfImage(xobj).as_pil_image()
+    if img.mode not in ("RGB", "L"):
+        if img.mode in ("CMYK", "I", "F"):
+            return None
+        img = img.convert("RGB")
+    photo = _is_photo(img)
+    if not resample and not photo:
+        return None
+
+    size = (max(1, round(width * scale)), max(1, round(height * scale))) if resample else (width, height)
+    if resample:
+        img = img.resize(size, Image.LANCZOS)
+    if photo:
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=preset["jpeg_quality"], optimize=True)
+        data, new_filter = buf.getvalue(), "/DCTDecode"
+    else:
+        data, new_filter = zlib.compress(img.tobytes(), 9), "/FlateDecode"
+    if not resample and len(data) >= len(xobj.read_raw_bytes()):
+        return None
+
+    mask_data = None
+    smask = xobj.get("/SMask")
+    if resample and smask is not None:
+        mask = pikepdf.PdfImage(smask).as_pil_image().convert("L").resize(size, Image.LANCZOS)
+        mask_data = zlib.compress(mask.tobytes(), 9)
+    colorspace = "/DeviceRGB" if img.mode == "RGB" else "/DeviceGray"
+    return data, new_filter, size, colorspace, mask_data
+
+
+def _write_image(pikepdf, stream, data: bytes, filter_name: str, size: Tuple[int, int], colorspace: str):
+    stream.write(data, filter=pikepdf.Name(filter_name))
+    stream.Width, stream.Height = size
+    stream.ColorSpace = pikepdf.Name(colorspace)
+    stream.BitsPerComponent = 8
+    for key in ("/DecodeParms", "/Decode"):
+        if key in stream:
+            del stream[key]
+
+
+def _recompress(pikepdf, xobj, drawn: Tuple[float, float], preset: Dict[str, int]) -> bool:
+    """Re-encode one image XObject in place; identical images are only encoded once per process."""
+    raw = xobj.read_raw_bytes()
+    key = (hashlib.sha1(raw).hexdigest(), round(drawn[0], 1), round(drawn[1], 1), preset["dpi"], preset["jpeg_quality"])
+    with _cache_lock:
+        encoded = _encoded.get(key, _MISSING)
+        if encoded is not _MISSING:
+            _encoded.move_to_end(key)
+    if encoded is _MISSING:
+        count("pdf.optimize.cache_miss")
+        encoded = _encode(pikepdf, xobj, drawn, preset)
+        with _cache_lock:
+            _encoded[key] = encoded
+            while len(_encoded) > _CACHE_SIZE:
+                _encoded.popitem(last=False)
+    else:
+        count("pdf.optimize.cache_hit")
+    if encoded is None:
+        return False
+
+    data, filter_name, size, colorspace, mask_data = encoded
+    smask = xobj.get("/SMask")
+    if smask is not None and (int(smask.Width), int(smask.Height)) != size:
+        if mask_data is None:
+            return False
+        _write_image(pikepdf, smask, mask_data, "/FlateDecode", size, "/DeviceGray")
+    _write_image(pikepdf, xobj, data, filter_name, size, colorspace)
+    return True
+
+
+@timed("pdf.optimize")
+def optimize_pdf(data: bytes, quality: Optional[str] = None) -> bytes:
+    """
+    Downsample and re-encode images, then rewrite the PDF with compressed streams.
+
+    `quality` is a `QUALITY_PRESETS` key (defaults to the `pdf_quality`
+    setting). The original bytes are returned when the stage is disabled,
+    pikepdf is missing, anything fails, or the result would not be smaller.
+    """
+    preset = QUALITY_PRESETS[_quality(quality)]
+    if preset is None or not data:
+        return data
+    try:
+        import pikepdf
+    except ImportError:
+        count("pdf.optimize.unavailable")
+        return data
+
+    try:
+        with pikepdf.open(io.BytesIO(data)) as pdf:
+            for objgen, drawn in _drawn_sizes(pikepdf, pdf).items():
+                try:
+                    if _recompress(pikepdf, pdf.get_object(objgen), drawn, preset):
+                        count("pdf.optimize.images")
+                except Exception as e:
+                    print(f"PDF optimize: kept image {objgen} ({e})")
+            pdf.remove_unreferenced_resources()
+            out = io.BytesIO()
+            pdf.save(out, compress_streams=True,
+                     object_stream_mode=pikepdf.ObjectStreamMode.generate)
+    except Exception as e:
+        print(f"PDF optimize failed, sending original: {e}")
+        return data
+
+    result = out.getvalue()
+    if len(result) >= len(data):
+        return data
+    count("pdf.optimize.bytes_saved", len(data) - len(result))
+    return result
@@ -0,0 +1,120 @@
+"""
+PDF Renderer for Newton Smart Home Application
+Long-lived WeasyPrint renderer shared by every PDF export in the process.
+
+A fresh `HTML(string=...).write_pdf()` re-resolves fonts, re-parses the inline
+stylesheet and re-decodes images on every call. The renderer keeps one
+`FontConfiguration`, the shared A4 stylesheet pre-parsed as a `weasyprint.CSS`
+and WeasyPrint's image cache, and is warmed up in a background thread at process
+start (see `utils.pdf_engines`) so the first export is not the slow one.
+"""
+
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from utils.assets import url_fetcher
+from utils.profiler import record, timed
+
+STYLES_DIR = Path(__file__).resolve().parents[1] / "templates" / "partials"
+# Stylesheet shared by the A4 documents (templates/partials/a4_styles.css)
+A4_STYLESHEET = "a4_styles"
+
+_WARMUP_HTML = """<!DOCTYPE html><html><head><meta charset="UTF-8" /></head>
+<body><div class="page"><div class="header"><div class="brand-title">Newton Smart Home</div></div>
+<table class="items-table"><tr><td>warm-up</td><td class="total">0.00</td></tr></table></div></body></html>"""
+
+
+def stylesheet_text(name: str) -> str:
+    """Raw CSS of a shared stylesheet (used to inline it for non-WeasyPrint converters)."""
+    return (STYLES_DIR / f"{name}.css").read_text(encoding="utf-8")
+
+
+def inline_stylesheets(html_str: str, names: Iterable[str]) -> str:
+    """Embed shared stylesheets as <style> tags (for converters that only take plain HTML)."""
+    css = "".join(f"<style>{stylesheet_text(name)}</style>" for name in names)
+    if not css:
+        return html_str
+    return html_str.replace("</head>", css + "</head>", 1) if "</head>" in html_str else css + html_str
+
+
+class PdfRenderer:
+    """WeasyPrint wrapper that keeps fonts, parsed stylesheets and decoded images between renders."""
+
+    def __init__(self):
+        # WeasyPrint objects are not documented as thread-safe; Streamlit runs
+        # sessions on threads, so renders are serialized.
+        self._lock = threading.RLock()
+        self._font_config = None
+        self._stylesheets: Dict[str, object] = {}
+        self._image_cache: Dict = {}
+        self.warm_ms: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def _fonts(self):
+        if self._font_config is None:
+            try:
+                from weasyprint.text.fonts import FontConfiguration
+            except ImportError:
+                # WeasyPrint < 53
+                from weasyprint.fonts import FontConfiguration
+            self._font_config = FontConfiguration()
+        return self._font_config
+
+    def stylesheet(self, name: str):
+        """Parsed `weasyprint.CSS` for `templates/partials/<name>.css`, parsed once."""
+        with self._lock:
+            css = self._stylesheets.get(name)
+            if css is None:
+                from weasyprint import CSS
+                css = CSS(string=stylesheet_text(name), font_config=self._fonts(), url_fetcher=url_fetcher)
+                self._stylesheets[name] = css
+            return css
+
+    @timed("pdf.render")
+    def render(self, html_str: str, stylesheets: Iterable[str] = ()) -> bytes:
+        """Render HTML to PDF bytes, applying the named shared stylesheets."""
+        from weasyprint import HTML
+        with self._lock:
+            sheets = [self.stylesheet(name) for name in stylesheets]
+            document = HTML(string=html_str, url_fetcher=url_fetcher)
+            try:
+                return document.write_pdf(stylesheets=sheets, font_config=self._fonts(), cache=self._image_cache)
+            except TypeError:
+                # `cache` was added in WeasyPrint 56
+                return document.write_pdf(stylesheets=sheets, font_config=self._fonts())
+
+    def warm_up(self) -> bool:
+        """Load fonts and parse the A4 stylesheet with a throwaway render."""
+        started = time.perf_counter()
+        try:
+            self.render(_WARMUP_HTML, stylesheets=[A4_STYLESHEET])
+        except Exception as e:
+            self.error = str(e).splitlines()[0] if str(e) else type(e).__name__
+            return False
+        self.warm_ms = (time.perf_counter() - started) * 1000
+        self.error = None
+        record("pdf.warm_up", self.warm_ms)
+        return True
+
+    def reset(self):
+        """Drop cached fonts, stylesheets and images (e.g. after a template change)."""
+        with self._lock:
+            self._font_config = None
+            self._stylesheets.clear()
+            self._image_cache.clear()
+            self.warm_ms = None
+
+
+_renderer: Optional[PdfRenderer] = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer() -> PdfRenderer:
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = PdfRenderer()
+        return _renderer
+
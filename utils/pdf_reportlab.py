@@ -0,0 +1,425 @@
+"""
+ReportLab Document Renderer for Newton Smart Home Application
+Draws the fixed A4 quotation / invoice / receipt layout directly with ReportLab.
+
+This is the pure-local fast path of `utils.pdf_engines`: no HTML layout engine
+and no network. Wording (badge, headings, totals rows, terms) is read from the
+same Jinja blocks the HTML templates use, so both outputs stay in sync.
+"""
+
+import base64
+import hashlib
+import html as _html
+import os
+import re
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import Image, PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from utils.assets import asset_bytes
+from utils.profiler import timed
+
+PRIMARY = colors.HexColor("#0f172a")
+ACCENT = colors.HexColor("#1d4ed8")
+MUTED = colors.HexColor("#6b7280")
+BORDER = colors.HexColor("#e5e7eb")
+ACCENT_SOFT = colors.HexColor("#eff4ff")
+
+CONTENT_WIDTH = A4[0] - 20 * mm
+
+# Plain binary streams: the pure-Python ASCII85 encoder dominates render time
+rl_config.useA85 = 0
+
+# Images are downscaled to this resolution at their printed size and cached
+IMAGE_DPI = 200
+IMAGE_CACHE_SIZE = 256
+_image_cache: "OrderedDict[tuple, Tuple[bytes, float, float]]" = OrderedDict()
+_image_lock = threading.Lock()
+
+# TTF fonts cover Arabic/extended Latin client names; Helvetica is the fallback
+_FONT_CANDIDATES = [
+    ("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"),
+    ("C:/Windows/Fonts/arial.ttf", "C:/Windows/Fonts/arialbd.ttf"),
+    ("/Library/Fonts/Arial.ttf", "/Library/Fonts/Arial Bold.ttf"),
+]
+_fonts: Optional[Tuple[str, str]] = None
+
+
+def _register_fonts() -> Tuple[str, str]:
+    global _fonts
+    if _fonts is None:
+        _fonts = ("Helvetica", "Helvetica-Bold")
+        for regular, bold in _FONT_CANDIDATES:
+            if os.path.exists(regular) and os.path.exists(bold):
+                try:
+                    pdfmetrics.registerFont(TTFont("NewtonSans", regular))
+                    pdfmetrics.registerFont(TTFont("NewtonSans-Bold", bold))
+                    pdfmetrics.registerFontFamily("NewtonSans", normal="NewtonSans", bold="NewtonSans-Bold")
+                    _fonts = ("NewtonSans", "NewtonSans-Bold")
+                    break
+                except Exception:
+                    continue
+    return _fonts
+
+
+def _styles() -> Dict[str, ParagraphStyle]:
+    regular, bold = _register_fonts()
+    base = getSampleStyleSheet()["Normal"]
+    return {
+        "body": ParagraphStyle("body", parent=base, fontName=regular, fontSize=9, leading=12, textColor=PRIMARY),
+        "muted": ParagraphStyle("muted", parent=base, fontName=regular, fontSize=8, leading=11, textColor=MUTED),
+        "brand": ParagraphStyle("brand", parent=base, fontName=bold, fontSize=16, leading=20, textColor=PRIMARY),
+        "badge": ParagraphStyle("badge", parent=base, fontName=bold, fontSize=8, leading=10, textColor=ACCENT),
+        "h1": ParagraphStyle("h1", parent=base, fontName=bold, fontSize=18, leading=22, textColor=PRIMARY),
+        "label": ParagraphStyle("label", parent=base, fontName=bold, fontSize=8, leading=10, textColor=MUTED),
+        "cell": ParagraphStyle("cell", parent=base, fontName=regular, fontSize=8.5, leading=11, textColor=PRIMARY),
+        "cell_right": ParagraphStyle("cell_right", parent=base, fontName=regular, fontSize=8.5, leading=11,
+                                     textColor=PRIMARY, alignment=TA_RIGHT),
+        "total": ParagraphStyle("total", parent=base, fontName=bold, fontSize=10, leading=13, textColor=PRIMARY),
+        "total_right": ParagraphStyle("total_right", parent=base, fontName=bold, fontSize=10, leading=13,
+                                      textColor=PRIMARY, alignment=TA_RIGHT),
+        "h4": ParagraphStyle("h4", parent=base, fontName=bold, fontSize=10, leading=13, textColor=PRIMARY, spaceAfter=3),
+    }
+
+
+# ==========================================
+# Template blocks -> text
+# ==========================================
+
+def _block_html(doc_type: str, name: str, context: Dict[str, Any]) -> str:
+    """Render one Jinja block of the document's child template (or the base layout)."""
+    from utils.quotation_utils import DOCUMENT_TEMPLATES, _environment
+    env = _environment()
+    for template_name in (DOCUMENT_TEMPLATES[doc_type], "base_A4.html"):
+        template = env.get_template(template_name)
+        block = template.blocks.get(name)
+        if block is not None:
+            return "".join(block(template.new_context(context)))
+    return ""
+
+
+def _text(fragment: str) -> str:
+    return re.sub(r"\s+", " ", _html.unescape(re.sub(r"<[^>]+>", " ", fragment or ""))).strip()
+
+
+def _esc(value: Any) -> str:
+    return _html.escape("" if value is None else str(value))
+
+
+class _TotalsParser(HTMLParser):
+    """Collect `(label, value, is_total)` from the `.totals-row` divs of the totals block."""
+
+    def __init__(self):
+        super().__init__()
+        self.rows: List[Tuple[str, str, bool]] = []
+        self._row = None
+
+    def handle_starttag(self, tag, attrs):
+        cls = (dict(attrs).get("class") or "").split()
+        if tag == "div" and "totals-row" in cls:
+            self._row = {"total": "total" in cls, "spans": []}
+        elif tag == "span" and self._row is not None:
+            self._row["spans"].append("")
+
+    def handle_endtag(self, tag):
+        if tag == "div" and self._row is not None:
+            spans = [s.strip() for s in self._row["spans"]] + ["", ""]
+            self.rows.append((spans[0], spans[1], self._row["total"]))
+            self._row = None
+
+    def handle_data(self, data):
+        if self._row is not None and self._row["spans"]:
+            self._row["spans"][-1] += re.sub(r"\s+", " ", data)
+
+
+class _TermsParser(HTMLParser):
+    """Turn the terms block (info cards with h4/p and nested lists) into paragraph entries."""
+
+    def __init__(self):
+        super().__init__()
+        self.entries: List[Tuple[str, str, int]] = []  # (kind, markup, depth)
+        self._lists: List[list] = []  # [tag, counter]
+        self._buf: Optional[list] = None  # [kind, text, depth]
+        self._bold = 0
+
+    def _flush(self):
+        if self._buf is not None and self._buf[1].strip():
+            self.entries.append((self._buf[0], self._buf[1].strip(), self._buf[2]))
+        self._buf = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("h4", "p"):
+            self._flush()
+            self._buf = [tag, "", 0]
+        elif tag in ("ul", "ol"):
+            self._flush()
+            self._lists.append([tag, 0])
+        elif tag == "li":
+            self._flush()
+            marker = "•"
+            if self._lists:
+                self._lists[-1][1] += 1
+                if self._lists[-1][0] == "ol":
+                    marker = f"{self._lists[-1][1]}."
+            self._buf = ["li", f"{marker} ", max(0, len(self._lists) - 1)]
+        elif tag in ("strong", "b") and self._buf is not None:
+            self._bold += 1
+            self._buf[1] += "<b>"
+
+    def handle_endtag(self, tag):
+        if tag in ("strong", "b") and self._buf is not None and self._bold:
+            self._bold -= 1
+            self._buf[1] += "</b>"
+        elif tag in ("h4", "p", "li"):
+            self._flush()
+        elif tag in ("ul", "ol") and self._lists:
+            self._flush()
+            self._lists.pop()
+
+    def handle_data(self, data):
+        if self._buf is not None:
+            self._buf[1] += _esc(re.sub(r"\s+", " ", data))
+
+
+# ==========================================
+# Images
+# ==========================================
+
+def _image_key(source: Any):
+    """Cache key for an item/asset image without decoding it; None if it cannot be drawn."""
+    if isinstance(source, bytes):
+        return ("bytes", hashlib.sha1(source).hexdigest())
+    if not isinstance(source, str) or not source.strip():
+        return None
+    s = source.strip()
+    if s.startswith("data:") and "," in s:
+        return ("data", hashlib.sha1(s.encode("ascii", "ignore")).hexdigest())
+    if os.path.exists(s):
+        return ("path", s, os.path.getmtime(s))
+    # Remote URLs are skipped: this engine never touches the network
+    return None
+
+
+def _load_source(source: Any):
+    if isinstance(source, bytes):
+        return BytesIO(source)
+    s = source.strip()
+    if s.startswith("data:"):
+        return BytesIO(base64.b64decode(s.split(",", 1)[1]))
+    return s
+
+
+def _prepared(source: Any, key: tuple, max_w: float, max_h: float) -> Tuple[bytes, float, float]:
+    """Downscale an image to its printed size once; returns (png/jpeg bytes, width pt, height pt)."""
+    key = key + (max_w, max_h)
+    with _image_lock:
+        hit = _image_cache.get(key)
+        if hit is not None:
+            _image_cache.move_to_end(key)
+            return hit
+    from PIL import Image as PILImage
+    with PILImage.open(_load_source(source)) as im:
+        w, h = im.size
+        scale = min(max_w / float(w), max_h / float(h))
+        px = (max(1, int(w * scale / 72.0 * IMAGE_DPI)), max(1, int(h * scale / 72.0 * IMAGE_DPI)))
+        im = im.convert("RGBA") if im.mode in ("P", "LA") else im
+        if px[0] < w:
+            im = im.resize(px, PILImage.LANCZOS)
+        out = BytesIO()
+        if im.mode == "RGBA":
+            im.save(out, format="PNG", optimize=True)
+        else:
+            im.convert("RGB").save(out, format="JPEG", quality=85)
+    entry = (out.getvalue(), w * scale, h * scale)
+    with _image_lock:
+        _image_cache[key] = entry
+        while len(_image_cache) > IMAGE_CACHE_SIZE:
+            _image_cache.popitem(last=False)
+    return entry
+
+
+def _image(source: Any, max_w: float, max_h: float) -> Optional[Image]:
+    try:
+        key = _image_key(source)
+        if key is None:
+            return None
+        data, width, height = _prepared(source, key, max_w, max_h)
+        return Image(BytesIO(data), width=width, height=height)
+    except Exception:
+        return None
+
+
+# ==========================================
+# Layout
+# ==========================================
+
+def _card(rows, widths, background=None):
+    table = Table(rows, colWidths=widths)
+    style = [
+        ("BOX", (0, 0), (-1, -1), 0.6, BORDER),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ("LEFTPADDING", (0, 0), (-1, -1), 6),
+        ("RIGHTPADDING", (0, 0), (-1, -1), 6),
+    ]
+    if background is not None:
+        style.append(("BACKGROUND", (0, 0), (-1, -1), background))
+    table.setStyle(TableStyle(style))
+    return table
+
+
+def _items_table(items: List[Dict[str, Any]], st: Dict[str, ParagraphStyle]) -> Table:
+    header = [Paragraph(h, st["label"]) for h in ("Product/Device", "Description", "Warranty", "Qty", "Unit Price", "Amount")]
+    rows = [header]
+    for it in items:
+        img = _image(it.get("image"), 20 * mm, 15 * mm)
+        rows.append([
+            img if img is not None else Paragraph("IMAGE", st["muted"]),
+            Paragraph(_esc(it.get("description")), st["cell"]),
+            Paragraph(_esc(it.get("warranty")), st["cell"]),
+            Paragraph(_esc(it.get("qty")), st["cell_right"]),
+            Paragraph(_esc(it.get("unit_price")), st["cell_right"]),
+            Paragraph(_esc(it.get("total")), st["cell_right"]),
+        ])
+    table = Table(rows, colWidths=[26 * mm, 64 * mm, 20 * mm, 14 * mm, 26 * mm, 30 * mm], repeatRows=1)
+    table.setStyle(TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), ACCENT_SOFT),
+        ("LINEBELOW", (0, 0), (-1, -1), 0.4, BORDER),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+    ]))
+    return table
+
+
+@timed("pdf.reportlab")
+def render_document(doc_type: str, context: Dict[str, Any]) -> bytes:
+    """Draw a quotation, invoice or receipt as PDF bytes.
+
+    `context` must already be normalized by `quotation_utils._document_context`.
+    """
+    st = _styles()
+    block = lambda name: _block_html(doc_type, name, context)
+    story = []
+
+    # Header: brand and logo
+    brand = [
+        Paragraph("Newton Smart Home", st["brand"]),
+        Paragraph("UAE – Abu Dhabi - Mussafa M1", st["muted"]),
+        Paragraph("Supply and installation of smart home systems, security systems, and surveillance cameras.<br/>"
+                  "www.newtonsmarthome.com · +971 52 779 0975 · info@newtonsmarthome.com", st["muted"]),
+    ]
+    logo = _image(asset_bytes("logo"), 35 * mm, 28 * mm) or ""
+    header = Table([[brand, logo]], colWidths=[CONTENT_WIDTH - 40 * mm, 40 * mm])
+    header.setStyle(TableStyle([("VALIGN", (0, 0), (-1, -1), "TOP"), ("ALIGN", (1, 0), (1, 0), "RIGHT")]))
+    story += [header, Spacer(1, 6 * mm)]
+
+    # Meta bar: badge, heading, intro and the number/date/status table
+    title = [
+        Paragraph(_esc(_text(block("badge"))).upper(), st["badge"]),
+        Paragraph(_esc(_text(block("heading"))), st["h1"]),
+        Paragraph(_esc(_text(block("intro"))), st["muted"]),
+    ]
+    meta_rows = [
+        [Paragraph(_esc(_text(block("number_label"))), st["label"]), Paragraph(_esc(context.get("doc_number")), st["cell"])],
+        [Paragraph("Date", st["label"]), Paragraph(_esc(context.get("doc_date")), st["cell"])],
+    ]
+    if doc_type == "quotation":
+        meta_rows.append([Paragraph("Valid Until", st["label"]), Paragraph(_esc(context.get("valid_until")), st["cell"])])
+    meta_rows.append([Paragraph("Status", st["label"]), Paragraph(_esc(_text(block("status"))), st["cell"])])
+    meta = Table([[title, _card(meta_rows, [25 * mm, 40 * mm])]], colWidths=[CONTENT_WIDTH - 68 * mm, 68 * mm])
+    meta.setStyle(TableStyle([("VALIGN", (0, 0), (-1, -1), "TOP")]))
+    story += [meta, Spacer(1, 6 * mm)]
+
+    # Parties
+    client = [
+        Paragraph("CLIENT INFO", st["label"]),
+        Paragraph(f"<b>{_esc(context.get('client_name'))}</b>", st["body"]),
+        Paragraph(f"Mobile: {_esc(context.get('mobile'))}<br/>Location: {_esc(context.get('project_location'))}", st["muted"]),
+    ]
+    project = [
+        Paragraph("PROJECT DETAILS", st["label"]),
+        Paragraph("<b>Project Title</b>", st["body"]),
+        Paragraph(_esc(context.get("project_scope")), st["muted"]),
+    ]
+    half = (CONTENT_WIDTH - 4 * mm) / 2
+    parties = Table([[_card([[client]], [half]), "", _card([[project]], [half])]], colWidths=[half, 4 * mm, half])
+    story += [Paragraph("PARTIES", st["label"]), Spacer(1, 2 * mm), parties, Spacer(1, 6 * mm)]
+
+    # Line items
+    items = context.get("items") or []
+    story.append(Paragraph(_esc(_text(block("items_label"))).upper(), st["label"]))
+    story.append(Spacer(1, 2 * mm))
+    if items or doc_type != "receipt":
+        story += [_items_table(items, st), Spacer(1, 5 * mm)]
+
+    # Account details and totals
+    account = [[Paragraph("Account Details", st["label"]), ""]] + [
+        [Paragraph(label, st["muted"]), Paragraph(value, st["cell"])]
+        for label, value in (
+            ("Bank Name", "Al Maryah Community Bank LLC"),
+            ("Account No", "3003140080000000"),
+            ("IBAN", "AE830973003140080000001"),
+            ("Company Name", "Newton Smart Home"),
+        )
+    ]
+    parser = _TotalsParser()
+    parser.feed(block("totals"))
+    totals = [
+        [Paragraph(_esc(label), st["total" if is_total else "muted"]),
+         Paragraph(_esc(value), st["total_right" if is_total else "cell_right"])]
+        for label, value, is_total in parser.rows
+    ] or [["", ""]]
+    account_card = _card(account, [26 * mm, 54 * mm])
+    account_card.setStyle(TableStyle([("SPAN", (0, 0), (1, 0))]))
+    totals_area = Table(
+        [[account_card, "", _card(totals, [50 * mm, 40 * mm], background=ACCENT_SOFT)]],
+        colWidths=[80 * mm, CONTENT_WIDTH - 170 * mm, 90 * mm],
+    )
+    totals_area.setStyle(TableStyle([("VALIGN", (0, 0), (-1, -1), "TOP")]))
+    story += [totals_area, PageBreak()]
+
+    # Terms (same text as the HTML templates)
+    terms = _TermsParser()
+    terms.feed(block("terms"))
+    for kind, markup, depth in terms.entries:
+        style = st["h4"] if kind == "h4" else st["body"]
+        if kind == "li":
+            style = ParagraphStyle(f"li{depth}", parent=st["body"], leftIndent=6 * mm * (depth + 1), fontSize=8.5, leading=11)
+        story.append(Paragraph(markup, style))
+    story.append(Spacer(1, 10 * mm))
+
+    # Signatures
+    stamp = _image(asset_bytes("stamp"), 40 * mm, 40 * mm) or Spacer(1, 40 * mm)
+    ours = [Paragraph("For Newton Smart Home", st["label"]), stamp,
+            Paragraph("<b>Authorised Signatory</b>", st["body"]), Paragraph("Newton Smart Home", st["muted"])]
+    theirs = [Paragraph("For Client", st["label"]), Spacer(1, 40 * mm),
+              Paragraph("<b>Client Name</b>", st["body"]), Paragraph("Signature", st["muted"])]
+    signatures = Table([[ours, theirs]], colWidths=[CONTENT_WIDTH / 2] * 2)
+    signatures.setStyle(TableStyle([("VALIGN", (0, 0), (-1, -1), "TOP")]))
+    story += [signatures, Spacer(1, 6 * mm)]
+    story.append(Paragraph(
+        f"This {_esc(context.get('doc_label', doc_type))} is issued by Newton Smart Home for the above-mentioned "
+        "individual client. For any questions, please contact us at info@newtonsmarthome.com.", st["muted"]))
+
+    buf = BytesIO()
+    doc = SimpleDocTemplate(buf, pagesize=A4, leftMargin=10 * mm, rightMargin=10 * mm, topMargin=12 * mm,
+                            bottomMargin=12 * mm, title=f"{_text(block('title'))} - Newton Smart Home")
+    doc.build(story)
+    return buf.getvalue()
+
+
+def warm_up():
+    """Register fonts and prepare the template images ahead of the first export."""
+    _register_fonts()
+    _image(asset_bytes("logo"), 35 * mm, 28 * mm)
+    _image(asset_bytes("stamp"), 40 * mm, 40 * mm)
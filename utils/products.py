@@ -0,0 +1,345 @@
+"""
+Product Catalog for Newton Smart Home Application
+Row-level create/update/delete of products with optimistic versioning.
+
+Saving used to hand the whole catalog to `save_products`, which updated or
+inserted every row, deleted missing ids and rewrote the local table, so a
+one-field edit touched every product and the last editor silently replaced
+everyone else's changes. Each product now carries an `id` and a `version`:
+
+- `update_product(id, version, changes)` writes only the changed columns in
+  one `UPDATE ... WHERE id = ? AND version = ?` that also bumps the version.
+- `delete_product(id, version)` deletes only that row at that version.
+- If another session changed or deleted the row first, nothing is written and
+  `ConflictError` is raised, so the page can reload instead of overwriting.
+- Ids and versions belong to the store the catalog was loaded from
+  (`df.attrs["source"]`), so every write names that store and never falls
+  back to the other one: ids start at 1 in both.
+
+Postgres is used when configured (the `version` column is added on first use,
+see sql/ddl.sql); otherwise the local store, where `id`/`version` are extra
+columns backfilled for rows written by whole-table saves or imports.
+"""
+
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from utils import storage
+from utils.profiler import timed
+
+try:
+    from utils import db as _db
+except Exception:
+    _db = None
+
+PRODUCT_COLUMNS = list(storage.TABLE_COLUMNS["products"])
+KEY_COLUMNS = ["id", "version"]
+# App column -> Postgres column
+DB_COLUMNS = {
+    "Device": "device", "Description": "description", "UnitPrice": "unit_price", "Warranty": "warranty",
+    "ImageBase64": "image_base64", "ImagePath": "image_path",
+}
+
+# Postgres casts for batched VALUES lists
+DB_TYPES = {
+    "Device": "text", "Description": "text", "UnitPrice": "numeric", "Warranty": "text",
+    "ImageBase64": "text", "ImagePath": "text",
+}
+
+_lock = threading.Lock()
+# None = not checked yet; True/False = the Postgres products.version column exists
+_db_versioned: Optional[bool] = None
+
+
+class ConflictError(Exception):
+    """The product was changed or deleted by someone else since it was loaded."""
+
+
+def _clean(changes: Dict[str, Any]) -> Dict[str, Any]:
+    unknown = set(changes) - set(PRODUCT_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown product fields: {', '.join(sorted(unknown))}")
+    return {c: storage.to_sql_value(v) for c, v in changes.items()}
+
+
+# ==========================================
+# Postgres
+# ==========================================
+
+def _use_db() -> bool:
+    return _db is not None and bool(_db.get_connection_string())
+
+
+def _ensure_db_version() -> bool:
+    """Add products.version once per process (older databases predate it)."""
+    global _db_versioned
+    with _lock:
+        if _db_versioned is None:
+            try:
+                _db.db_execute('ALTER TABLE products ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 1')
+                _db_versioned = True
+            except Exception as e:
+                print(f"products: version column unavailable ({str(e).splitlines()[0] if str(e) else type(e).__name__})")
+                _db_versioned = False
+        return _db_versioned
+
+
+def _load_db() -> pd.DataFrame:
+    select = ", ".join(f'{db} as "{col}"' for col, db in DB_COLUMNS.items())
+    version = "version" if _ensure_db_version() else "1 as version"
+    rows = _db.db_query(f'SELECT id, {select}, {version} FROM products ORDER BY id')
+    return pd.DataFrame(rows, columns=PRODUCT_COLUMNS + KEY_COLUMNS)
+
+
+def _create_db(values: Dict[str, Any]) -> Dict[str, int]:
+    cols = list(values)
+    row = _db.db_execute(
+        f'INSERT INTO products({", ".join(DB_COLUMNS[c] for c in cols)}) '
+        f'VALUES ({", ".join("%s" for _ in cols)}) RETURNING id',
+        tuple(values[c] for c in cols), returning=True,
+    )
+    return {"id": int(row["id"]), "version": 1}
+
+
+def _conflict_db(product_id) -> ConflictError:
+    exists = _db.db_query('SELECT 1 FROM products WHERE id = %s', (product_id,))
+    return ConflictError("This product was changed by someone else. Reload and try again."
+                         if exists else "This product was deleted by someone else.")
+
+
+def _update_db(product_id, version: int, changes: Dict[str, Any]) -> int:
+    if not _ensure_db_version():
+        raise RuntimeError("products.version column missing")
+    sets = ", ".join(f"{DB_COLUMNS[c]} = %s" for c in changes)
+    row = _db.db_execute(
+        f'UPDATE products SET {sets}, version = version + 1 WHERE id = %s AND version = %s RETURNING version',
+        tuple(changes.values()) + (product_id, version), returning=True,
+    )
+    if not row:
+        raise _conflict_db(product_id)
+    return int(row["version"])
+
+
+def _delete_db(product_id, version: int):
+    if not _ensure_db_version():
+        raise RuntimeError("products.version column missing")
+    row = _db.db_execute('DELETE FROM products WHERE id = %s AND version = %s RETURNING id',
+                         (product_id, version), returning=True)
+    if not row:
+        raise _conflict_db(product_id)
+
+
+def _group_updates(updated: List[Tuple[int, int, Dict[str, Any]]]):
+    """Updates grouped by the set of columns they change, so each group is one statement."""
+    groups: Dict[Tuple[str, ...], list] = {}
+    for product_id, version, changes in updated:
+        groups.setdefault(tuple(changes), []).append((product_id, version, changes))
+    return groups.items()
+
+
+def _apply_db(added, updated, removed) -> Dict[str, Any]:
+    if not _ensure_db_version():
+        raise RuntimeError("products.version column missing")
+    result = {"added": 0, "changed": 0, "removed": 0, "conflicts": []}
+    with _db.db_transaction() as cur:
+        if removed:
+            rows = _db.execute_values(
+                cur,
+                'DELETE FROM products AS p USING (VALUES %s) AS v(id, version) '
+                'WHERE p.id = v.id AND p.version = v.version RETURNING p.id',
+                removed, template="(%s::bigint, %s::integer)", fetch=True,
+            )
+            done = {int(r["id"]) for r in rows}
+            result["removed"] = len(done)
+            result["conflicts"] += [pid for pid, _ in removed if pid not in done]
+        for cols, group in _group_updates(updated):
+            names = [DB_COLUMNS[c] for c in cols]
+            rows = _db.execute_values(
+                cur,
+                f'UPDATE products AS p SET {", ".join(f"{n} = v.{n}" for n in names)}, version = p.version + 1 '
+                f'FROM (VALUES %s) AS v(id, version, {", ".join(names)}) '
+                f'WHERE p.id = v.id AND p.version = v.version RETURNING p.id',
+                [(pid, version) + tuple(changes[c] for c in cols) for pid, version, changes in group],
+                template="(" + ", ".join(["%s::bigint", "%s::integer"] + [f"%s::{DB_TYPES[c]}" for c in cols]) + ")",
+                fetch=True,
+            )
+            done = {int(r["id"]) for r in rows}
+            result["changed"] += len(done)
+            result["conflicts"] += [pid for pid, _, _ in group if pid not in done]
+        if added:
+            _db.execute_values(
+                cur,
+                f'INSERT INTO products({", ".join(DB_COLUMNS[c] for c in PRODUCT_COLUMNS)}) VALUES %s',
+                [tuple(row.get(c) for c in PRODUCT_COLUMNS) for row in added],
+            )
+            result["added"] = len(added)
+    return result
+
+
+# ==========================================
+# Local store
+# ==========================================
+
+def _prepare_local(conn):
+    """Add id/version and give ids to rows written without them (whole-table saves, imports)."""
+    storage.ensure_columns("products", PRODUCT_COLUMNS + KEY_COLUMNS, conn=conn)
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_products_id ON products (id)')
+    if conn.execute('SELECT 1 FROM products WHERE id IS NULL OR version IS NULL LIMIT 1').fetchone():
+        conn.execute('UPDATE products SET id = (SELECT COALESCE(MAX(id), 0) FROM products) + rowid WHERE id IS NULL')
+        conn.execute('UPDATE products SET version = 1 WHERE version IS NULL')
+
+
+def _load_local() -> pd.DataFrame:
+    df = storage.read_table("products")
+    if any(c not in df.columns or df[c].isna().any() for c in KEY_COLUMNS):
+        with storage.transaction("products") as conn:
+            _prepare_local(conn)
+        df = storage.read_table("products")
+    for col in PRODUCT_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    columns = PRODUCT_COLUMNS + KEY_COLUMNS
+    return df if list(df.columns) == columns else df[columns]
+
+
+def _conflict_local(conn, product_id) -> ConflictError:
+    exists = conn.execute('SELECT 1 FROM products WHERE id = ?', (product_id,)).fetchone()
+    return ConflictError("This product was changed by someone else. Reload and try again."
+                         if exists else "This product was deleted by someone else.")
+
+
+def _create_local(values: Dict[str, Any]) -> Dict[str, int]:
+    with storage.transaction("products") as conn:
+        _prepare_local(conn)
+        product_id = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM products').fetchone()[0]
+        row = dict(values, id=product_id, version=1)
+        cols = ", ".join('"' + c + '"' for c in row)
+        conn.execute(f'INSERT INTO products ({cols}) VALUES ({", ".join("?" for _ in row)})', list(row.values()))
+    return {"id": int(product_id), "version": 1}
+
+
+def _update_local(product_id, version: int, changes: Dict[str, Any]) -> int:
+    sets = ", ".join(f'"{c}" = ?' for c in changes)
+    with storage.transaction("products") as conn:
+        _prepare_local(conn)
+        cur = conn.execute(f'UPDATE products SET {sets}, version = version + 1 WHERE id = ? AND version = ?',
+                           list(changes.values()) + [product_id, version])
+        if cur.rowcount != 1:
+            raise _conflict_local(conn, product_id)
+    return int(version) + 1
+
+
+def _delete_local(product_id, version: int):
+    with storage.transaction("products") as conn:
+        _prepare_local(conn)
+        cur = conn.execute('DELETE FROM products WHERE id = ? AND version = ?', (product_id, version))
+        if cur.rowcount != 1:
+            raise _conflict_local(conn, product_id)
+
+
+def _apply_local(added, updated, removed) -> Dict[str, Any]:
+    result = {"added": 0, "changed": 0, "removed": 0, "conflicts": []}
+    with storage.transaction("products") as conn:
+        _prepare_local(conn)
+        for product_id, version in removed:
+            if conn.execute('DELETE FROM products WHERE id = ? AND version = ?', (product_id, version)).rowcount == 1:
+                result["removed"] += 1
+            else:
+                result["conflicts"].append(product_id)
+        for cols, group in _group_updates(updated):
+            sets = ", ".join(f'"{c}" = ?' for c in cols)
+            sql = f'UPDATE products SET {sets}, version = version + 1 WHERE id = ? AND version = ?'
+            for product_id, version, changes in group:
+                if conn.execute(sql, [changes[c] for c in cols] + [product_id, version]).rowcount == 1:
+                    result["changed"] += 1
+                else:
+                    result["conflicts"].append(product_id)
+        if added:
+            first_id = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM products').fetchone()[0]
+            columns = PRODUCT_COLUMNS + KEY_COLUMNS
+            cols = ", ".join('"' + c + '"' for c in columns)
+            conn.executemany(
+                f'INSERT INTO products ({cols}) VALUES ({", ".join("?" for _ in columns)})',
+                ([row.get(c) for c in PRODUCT_COLUMNS] + [first_id + i, 1] for i, row in enumerate(added)),
+            )
+            result["added"] = len(added)
+    return result
+
+
+# ==========================================
+# Public API
+# ==========================================
+
+def load_products() -> pd.DataFrame:
+    """Catalog with `id` and `version` per product, DB first with the local store as fallback.
+
+    `df.attrs["source"]` records which store ("db" or "local") the ids belong to.
+    """
+    if _use_db():
+        try:
+            df = _load_db()
+            if not df.empty:
+                df.attrs["source"] = "db"
+                return df
+        except Exception:
+            pass
+    try:
+        df = _load_local()
+    except Exception:
+        df = pd.DataFrame(columns=PRODUCT_COLUMNS + KEY_COLUMNS)
+    df.attrs["source"] = "local"
+    return df
+
+
+@timed("products.create")
+def create_product(values: Dict[str, Any], source: str = "local") -> Dict[str, int]:
+    """Insert one product into `source` ("db" or "local"); returns its {"id", "version"}."""
+    values = _clean(values)
+    if source == "db":
+        return _create_db(values)
+    return _create_local(values)
+
+
+@timed("products.update")
+def update_product(product_id, version: int, changes: Dict[str, Any], source: str = "local") -> int:
+    """Write only `changes` if the product is still at `version`; returns the new version.
+
+    `product_id` and `version` are those of `source`, the store the catalog was
+    loaded from; only that store is written. Raises ConflictError when the row
+    was changed or deleted since it was loaded.
+    """
+    changes = _clean(changes)
+    if not changes:
+        return int(version)
+    if source == "db":
+        return _update_db(int(product_id), int(version), changes)
+    return _update_local(int(product_id), int(version), changes)
+
+
+@timed("products.delete")
+def delete_product(product_id, version: int, source: str = "local"):
+    """Delete the product of `source` if it is still at `version`; raises ConflictError otherwise."""
+    if source == "db":
+        return _delete_db(int(product_id), int(version))
+    return _delete_local(int(product_id), int(version))
+
+
+@timed("products.apply_batch")
+def apply_batch(added: List[Dict[str, Any]], updated: List[Tuple[int, int, Dict[str, Any]]],
+                removed: List[Tuple[int, int]], source: str = "local") -> Dict[str, Any]:
+    """
+    Insert, update and delete many products in one transaction (see utils/product_import.py).
+
+    `updated` holds (id, version, changes) and `removed` (id, version), with the
+    ids of `source`, the store the catalog was loaded from. Rows whose version
+    moved on are skipped and returned under "conflicts"; the counts of rows
+    actually written are returned under "added", "changed" and "removed".
+    """
+    added = [_clean(row) for row in added]
+    updated = [(int(pid), int(version), _clean(changes)) for pid, version, changes in updated if changes]
+    removed = [(int(pid), int(version)) for pid, version in removed]
+    if source == "db":
+        return _apply_db(added, updated, removed)
+    return _apply_local(added, updated, removed)
@@ -0,0 +1,169 @@
+"""
+Profiler for Newton Smart Home Application
+Opt-in timers and counters for page reruns and hot paths (DB, rendering, exports).
+
+Enable with the `profiling_enabled` setting or the NEWTON_PROFILE=1 environment
+variable. When disabled, `span` and `timed` cost a single flag check.
+"""
+
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# Samples kept per span for percentiles; older samples roll off
+WINDOW = 512
+
+_lock = threading.Lock()
+_spans: Dict[str, "_SpanStats"] = {}
+_counters: Dict[str, int] = {}
+_local = threading.local()
+_enabled = os.environ.get("NEWTON_PROFILE", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+class _SpanStats:
+    __slots__ = ("count", "total_ms", "max_ms", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples = deque(maxlen=WINDOW)
+
+    def add(self, ms: float):
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+        self.samples.append(ms)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(enabled: bool):
+    """Turn instrumentation on or off for the whole process."""
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def record(name: str, ms: float):
+    """Add one timing sample for `name`."""
+    with _lock:
+        stats = _spans.get(name)
+        if stats is None:
+            stats = _spans[name] = _SpanStats()
+        stats.add(ms)
+    run = getattr(_local, "run", None)
+    if run is not None:
+        run.append((name, ms))
+
+
+def count(name: str, n: int = 1):
+    """Increment a counter (e.g. cache hits, rows written)."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block under `name`."""
+    if not _enabled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - started) * 1000)
+
+
+def timed(name: Optional[str] = None):
+    """Decorator form of `span`; defaults to `<module>.<function>` as the span name."""
+    def decorator(func):
+        label = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(label, (time.perf_counter() - started) * 1000)
+        return wrapper
+    return decorator
+
+
+def begin_run():
+    """Start collecting the spans of the current script run (per session thread)."""
+    _local.run = [] if _enabled else None
+
+
+def end_run() -> List[tuple]:
+    """Stop collecting and return `(span, ms)` pairs recorded during this run."""
+    run = getattr(_local, "run", None) or []
+    _local.run = None
+    return run
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+def snapshot() -> Dict[str, Any]:
+    """Return aggregated span statistics and counters across all sessions."""
+    with _lock:
+        spans = {k: (v.count, v.total_ms, v.max_ms, list(v.samples)) for k, v in _spans.items()}
+        counters = dict(_counters)
+    rows = []
+    for name, (n, total, mx, samples) in sorted(spans.items()):
+        samples.sort()
+        rows.append({
+            "span": name,
+            "count": n,
+            "total_ms": round(total, 2),
+            "avg_ms": round(total / n, 2) if n else 0.0,
+            "p50_ms": round(_percentile(samples, 50), 2),
+            "p95_ms": round(_percentile(samples, 95), 2),
+            "max_ms": round(mx, 2),
+        })
+    return {"enabled": _enabled, "spans": rows, "counters": counters}
+
+
+def reset():
+    """Drop all collected samples and counters."""
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+def to_prometheus() -> str:
+    """Render the snapshot in Prometheus text exposition format."""
+    snap = snapshot()
+    lines = [
+        "# HELP newton_span_ms Span duration in milliseconds",
+        "# TYPE newton_span_ms summary",
+    ]
+    for row in snap["spans"]:
+        label = row["span"].replace("\\", "\\\\").replace('"', '\\"')
+        lines.append(f'newton_span_ms{{span="{label}",quantile="0.5"}} {row["p50_ms"]}')
+        lines.append(f'newton_span_ms{{span="{label}",quantile="0.95"}} {row["p95_ms"]}')
+        lines.append(f'newton_span_ms_sum{{span="{label}"}} {row["total_ms"]}')
+        lines.append(f'newton_span_ms_count{{span="{label}"}} {row["count"]}')
+    lines.append("# HELP newton_counter_total Application counters")
+    lines.append("# TYPE newton_counter_total counter")
+    for name, value in sorted(snap["counters"].items()):
+        label = name.replace("\\", "\\\\").replace('"', '\\"')
+        lines.append(f'newton_counter_total{{name="{label}"}} {value}')
+    return "\n".join(lines) + "\n"
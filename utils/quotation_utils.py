@@ -1,46 +1,53 @@
-from typing import Dict, Any
-import tempfile
+from typing import TYPE_CHECKING, Dict, Any, List
 from pathlib import Path
-from jinja2 import Environment, FileSystemLoader, select_autoescape
 import os
 import base64
 import mimetypes
+from functools import lru_cache
+from utils.assets import asset_url, inline_assets as _inline_assets
+from utils import pdf_engines
+from utils.pdf_optimize import optimize_pdf
+from utils.file_lock import atomic_write
+from utils.profiler import timed
 
+if TYPE_CHECKING:
+    from jinja2 import Environment
 
-def render_quotation_html(context: Dict[str, Any], template_name: str = "newton_quotation_A4.html") -> str:
-    """Render the quotation HTML from given context and template.
 
-    Args:
-        context: Data dictionary to pass to the template.
-        template_name: Template filename located in `templates/` folder.
+# Currency filter used by the templates
+def _currency(value, symbol="AED", sep=","):
+    try:
+        # accept numbers or strings like '1,350.00' or 'AED 1,350.00'
+        if isinstance(value, str):
+            # strip common currency symbols and spaces
+            cleaned = value.replace(symbol, '').replace(',', '').strip()
+        else:
+            cleaned = value
+        v = float(cleaned)
+    except Exception:
+        return ""
+    # Format with two decimals and thousands separator
+    formatted = f"{v:,.2f}"
+    return f"{symbol} {formatted}"
+
+
+@lru_cache(maxsize=1)
+def _environment() -> "Environment":
+    """Jinja environment shared by all renders, so parsed templates are reused."""
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
 
-    Returns:
-        Rendered HTML as string.
-    """
     templates_dir = Path(__file__).resolve().parents[1] / "templates"
     env = Environment(
         loader=FileSystemLoader(str(templates_dir)),
         autoescape=select_autoescape(["html", "xml"]),
     )
+    env.filters['currency'] = _currency
+    env.globals['asset'] = asset_url
+    return env
 
-    # Add a simple currency filter
-    def _currency(value, symbol="AED", sep=","):
-        try:
-            # accept numbers or strings like '1,350.00' or 'AED 1,350.00'
-            if isinstance(value, str):
-                # strip common currency symbols and spaces
-                cleaned = value.replace(symbol, '').replace(',', '').strip()
-            else:
-                cleaned = value
-            v = float(cleaned)
-        except Exception:
-            return ""
-        # Format with two decimals and thousands separator
-        formatted = f"{v:,.2f}"
-        return f"{symbol} {formatted}"
 
-    env.filters['currency'] = _currency
-    template = env.get_template(template_name)
+def _prepare_context(context: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize line items and totals shared by all A4 documents."""
     # Normalize item fields so template can rely on `description`, `qty`, `unit_price`, `total`, `warranty`, `image`
     items = context.get('items', []) or []
     normalized = []
@@ -144,71 +151,124 @@ def render_quotation_html(context: Dict[str, Any], template_name: str = "newton_
             subtotal_val = 0
         context['total_amount'] = subtotal_val + inst
 
-    html = template.render(**context)
-    return html
+    return context
+
+
+# Document type -> child template of base_A4.html
+DOCUMENT_TEMPLATES = {
+    "quotation": "newton_quotation_A4.html",
+    "invoice": "newton_invoice_A4.html",
+    "receipt": "newton_receipt_A4.html",
+}
+
+
+def compile_templates() -> List[str]:
+    """Parse and compile every A4 document template into the shared environment."""
+    env = _environment()
+    names = sorted(set(DOCUMENT_TEMPLATES.values()))
+    for name in names:
+        env.get_template(name)
+    return names
+
+
+def _float(value) -> float:
+    try:
+        return float(value or 0)
+    except Exception:
+        return 0.0
+
+
+def _document_context(doc_type: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    """Map page-specific keys onto the names used by base_A4.html and its children."""
+    context = _prepare_context(context)
+    context.setdefault("doc_label", doc_type)
+    # Pages historically passed quotation-shaped keys for every document
+    context.setdefault("doc_number", context.get(f"{doc_type}_number") or context.get("quotation_number", ""))
+    context.setdefault("doc_date", context.get(f"{doc_type}_date") or context.get("quotation_date", ""))
+    context.setdefault("mobile", context.get("client_phone") or context.get("phone", ""))
+    context.setdefault("project_location", context.get("client_location") or context.get("client_address", ""))
+    if doc_type == "invoice":
+        context.setdefault("balance_due", _float(context.get("total_amount")) - _float(context.get("down_payment"))
+                           - _float(context.get("previously_paid")))
+    elif doc_type == "receipt":
+        context.setdefault("amount_paid", _float(context.get("amount")))
+        context.setdefault("remaining_balance", _float(context.get("balance")))
+        context.setdefault("total_invoice_amount", context.get("invoice_total") or (
+            _float(context.get("previous_paid")) + context["amount_paid"] + context["remaining_balance"]))
+        context.setdefault("payment_date", context.get("doc_date", ""))
+        context.setdefault("payment_method", "")
+    return context
+
+
+def _render(template_name: str, context: Dict[str, Any], inline_assets: bool) -> str:
+    html = _environment().get_template(template_name).render(**context)
+    return _inline_assets(html) if inline_assets else html
 
 
-def html_to_pdf(html_str: str, output_path: str | None = None) -> bytes:
-    """Convert HTML string to PDF bytes using WeasyPrint.
+@timed("render.html")
+def render_document_html(doc_type: str, context: Dict[str, Any], inline_assets: bool = True,
+                         inline_styles: bool = True) -> str:
+    """Render a quotation, invoice or receipt from the shared A4 layout.
+
+    Args:
+        doc_type: One of `DOCUMENT_TEMPLATES` ("quotation", "invoice", "receipt").
+        context: Data dictionary to pass to the template.
+        inline_assets: Embed template assets (logo, stamp) as data URIs. Pass
+            False when the HTML goes straight to `html_to_pdf`, which resolves
+            them from memory instead.
+        inline_styles: Embed the shared A4 stylesheet. The PDF renderer
+            applies a pre-parsed copy, so `document_to_pdf` turns this off.
+
+    Returns:
+        Rendered HTML as string.
+    """
+    if doc_type not in DOCUMENT_TEMPLATES:
+        raise ValueError(f"Unknown document type: {doc_type}")
+    context = _document_context(doc_type, context)
+    context["external_styles"] = not inline_styles
+    return _render(DOCUMENT_TEMPLATES[doc_type], context, inline_assets)
+
+
+@timed("render.document_to_pdf")
+def document_to_pdf(doc_type: str, context: Dict[str, Any]) -> bytes:
+    """Render a document to PDF with the fastest available local engine (see `utils.pdf_engines`).
+
+    The output goes through `utils.pdf_optimize` at the `pdf_quality` setting.
+    """
+    if doc_type not in DOCUMENT_TEMPLATES:
+        raise ValueError(f"Unknown document type: {doc_type}")
+    context = _document_context(doc_type, context)
+    data = pdf_engines.convert_document(
+        doc_type, context,
+        lambda: _render(DOCUMENT_TEMPLATES[doc_type], dict(context, external_styles=True), inline_assets=False),
+    )
+    return optimize_pdf(data)
+
+
+def render_quotation_html(context: Dict[str, Any], template_name: str = "newton_quotation_A4.html",
+                          inline_assets: bool = True) -> str:
+    """Render an A4 template by file name (kept for scripts; pages use `render_document_html`)."""
+    for doc_type, name in DOCUMENT_TEMPLATES.items():
+        if name == template_name:
+            return render_document_html(doc_type, context, inline_assets=inline_assets)
+    return _render(template_name, _prepare_context(context), inline_assets)
+
+
+@timed("render.html_to_pdf")
+def html_to_pdf(html_str: str, output_path: str | None = None, stylesheets: list | None = None) -> bytes:
+    """Convert HTML string to PDF bytes with the best available engine.
 
     Args:
         html_str: HTML content to convert.
         output_path: Optional filesystem path to save the PDF. If not provided,
             the PDF bytes are returned and no file is written.
+        stylesheets: Names of shared stylesheets (see `utils.pdf_renderer`)
+            to apply on top of the HTML's own styles.
 
     Returns:
-        PDF content as bytes.
+        PDF content as bytes, optimized at the `pdf_quality` setting.
     """
-    # Preferred: use WeasyPrint (local). If unavailable, attempt ConvertAPI fallback
-    try:
-        from weasyprint import HTML
-        if output_path:
-            HTML(string=html_str).write_pdf(output_path)
-            return Path(output_path).read_bytes()
-        else:
-            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
-                tmp_path = Path(tmp.name)
-            HTML(string=html_str).write_pdf(tmp_path)
-            data = tmp_path.read_bytes()
-            try:
-                tmp_path.unlink()
-            except Exception:
-                pass
-            return data
-    except Exception:
-        # Fallback: try ConvertAPI if the caller has set CONVERTAPI_SECRET env var
-        import os
-        key = os.environ.get("CONVERTAPI_SECRET")
-        if not key:
-            raise RuntimeError(
-                "No local HTML->PDF converter available and CONVERTAPI_SECRET is not set.\n"
-                "Install WeasyPrint locally OR set the environment variable CONVERTAPI_SECRET to use ConvertAPI as fallback."
-            )
-        try:
-            import convertapi
-            convertapi.api_credentials = key
-            # converthtml via ConvertAPI: pass HTML as file by writing tmp .html
-            with tempfile.TemporaryDirectory() as tmpdir:
-                html_path = Path(tmpdir) / "temp.html"
-                with open(html_path, "w", encoding="utf-8") as f:
-                    f.write(html_str)
-                result = convertapi.convert(
-                    'pdf',
-                    {
-                        'File': str(html_path),
-                        'FileName': 'quotation'
-                    },
-                    from_format='html'
-                )
-                saved = result.save_files(tmpdir)
-                if not saved:
-                    raise RuntimeError('ConvertAPI returned no files')
-                pdf_path = saved[0]
-                with open(pdf_path, 'rb') as pf:
-                    pdf_bytes = pf.read()
-                if output_path:
-                    with open(output_path, 'wb') as f:
-                        f.write(pdf_bytes)
-                return pdf_bytes
-        except Exception as e:
-            raise RuntimeError("Failed to convert HTML to PDF (weasyprint missing and ConvertAPI fallback failed).") from e
+    data = optimize_pdf(pdf_engines.convert_html(html_str, stylesheets or ()))
+    if output_path:
+        atomic_write(output_path, data)
+    return data
@@ -0,0 +1,133 @@
+"""
+Document Records for Newton Smart Home Application
+Shared load/save of quotation, invoice and receipt records.
+
+Each document is one row keyed by (type, number). Saving is an upsert against
+a unique index on that key (Postgres, or the local SQLite store), so it touches
+a single row instead of reading and rewriting the whole table, and two users
+saving at the same time cannot overwrite each other's rows. Every save also
+updates the outstanding-balance index (utils/balances.py).
+"""
+
+import threading
+from typing import Dict, Optional
+
+import pandas as pd
+
+from utils import balances, storage
+from utils.profiler import timed
+
+try:
+    from utils import db as _db
+except Exception:
+    _db = None
+
+RECORD_COLUMNS = list(storage.TABLE_COLUMNS["records"])
+RECORD_KEY = ["type", "number"]
+
+# Local saves between automatic compactions (duplicate cleanup + WAL checkpoint)
+COMPACT_EVERY = 200
+
+_lock = threading.Lock()
+_local_saves = 0
+# None = not checked yet; True/False = the Postgres unique index exists
+_db_unique_index: Optional[bool] = None
+
+
+def _record_values(rec: Dict) -> tuple:
+    return tuple(rec.get(c) for c in RECORD_COLUMNS)
+
+
+@timed("records.load")
+def load_records() -> pd.DataFrame:
+    """All records, DB first with the local store as fallback."""
+    if _db is not None:
+        try:
+            rows = _db.db_query('SELECT base_id, date, type, number, amount, client_name, phone, location, note FROM records ORDER BY date')
+            if rows:
+                df = pd.DataFrame(rows)
+                df.columns = [c.strip().lower() for c in df.columns]
+                return df
+        except Exception:
+            pass
+    try:
+        df = storage.read_table("records")
+        df.columns = [c.strip().lower() for c in df.columns]
+        return df
+    except Exception:
+        return pd.DataFrame(columns=RECORD_COLUMNS)
+
+
+def _ensure_db_index() -> bool:
+    """Create the Postgres (type, number) unique index once per process."""
+    global _db_unique_index
+    if _db_unique_index is None:
+        try:
+            _db.db_execute('CREATE UNIQUE INDEX IF NOT EXISTS records_type_number_key ON records (type, number)')
+            _db_unique_index = True
+        except Exception as e:
+            # Existing duplicates block the index; saves fall back to delete + insert
+            print(f"records: unique index unavailable ({str(e).splitlines()[0] if str(e) else type(e).__name__})")
+            _db_unique_index = False
+    return _db_unique_index
+
+
+def _save_db(rec: Dict):
+    if not _db.get_connection_string():
+        raise RuntimeError("No database configured")
+    cols = ", ".join(RECORD_COLUMNS)
+    placeholders = ", ".join("%s" for _ in RECORD_COLUMNS)
+    if rec.get("type") and rec.get("number") and _ensure_db_index():
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in RECORD_COLUMNS if c not in RECORD_KEY)
+        _db.db_execute(
+            f'INSERT INTO records({cols}) VALUES ({placeholders}) ON CONFLICT (type, number) DO UPDATE SET {updates}',
+            _record_values(rec),
+        )
+    elif rec.get("type") and rec.get("number"):
+        # One round trip and one transaction
+        _db.db_execute(
+            f'DELETE FROM records WHERE type = %s AND number = %s; INSERT INTO records({cols}) VALUES ({placeholders})',
+            (rec.get("type"), rec.get("number")) + _record_values(rec),
+        )
+    else:
+        _db.db_execute(f'INSERT INTO records({cols}) VALUES ({placeholders})', _record_values(rec))
+
+
+@timed("records.save")
+def save_record(rec: Dict):
+    """Insert or replace the record with the same (type, number)."""
+    global _local_saves
+    if _db is not None:
+        try:
+            _save_db(rec)
+        except Exception:
+            pass
+        else:
+            balances.record_saved(rec, db=True)
+            return
+
+    row = {c: rec.get(c) for c in RECORD_COLUMNS}
+    row.update({k: v for k, v in rec.items() if k not in row})
+    if row.get("type") and row.get("number"):
+        storage.upsert_rows("records", [row], RECORD_KEY)
+    else:
+        storage.append_rows("records", [row])
+    balances.record_saved(row)
+
+    with _lock:
+        _local_saves += 1
+        due = _local_saves % COMPACT_EVERY == 0
+    if due:
+        compact_records()
+
+
+def compact_records() -> Dict[str, int]:
+    """Remove duplicate (type, number) rows in the local store and checkpoint its log."""
+    try:
+        stats = storage.compact("records", RECORD_KEY)
+        if stats.get("removed"):
+            print(f"records: compacted {stats['removed']} duplicate rows")
+        return stats
+    except Exception as e:
+        print(f"records: compaction skipped ({e})")
+        return {}
@@ -0,0 +1,227 @@
+"""
+Session Memory for Newton Smart Home Application
+Measures what each Streamlit session holds and evicts cached artifacts under a budget.
+
+Every browser tab keeps its own `st.session_state` for as long as it is open:
+line item tables, widget values and, through `utils.fragments.session_memo`,
+rendered exports (Word/PDF/HTML bytes) and other derived copies. main.py calls
+`track()` after each full run to record the deep size of the session's state,
+and the Settings page lists those figures per session and in total.
+
+Memoized artifacts are the only entries that can be rebuilt on demand, so they
+are what gets evicted: each session keeps them in a `MemoStore`, and when the
+memoized bytes of all sessions exceed the `session_memory_budget_mb` setting
+the least recently used entries are dropped process-wide.
+"""
+
+import sys
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional
+
+from utils.profiler import count
+from utils.settings import get_setting
+
+DEFAULT_BUDGET_MB = 256
+# Sessions not seen for this long drop out of the report
+SESSION_TTL = 60 * 60
+# A session's state is re-measured at most this often
+TRACK_INTERVAL = 5.0
+
+_lock = threading.Lock()
+# session id -> {"user", "bytes", "keys", "seen"}
+_sessions: Dict[str, Dict[str, Any]] = {}
+_stores: "weakref.WeakSet[MemoStore]" = weakref.WeakSet()
+_evicted = {"entries": 0, "bytes": 0}
+
+
+# ==========================================
+# Sizes
+# ==========================================
+
+def deep_size(obj: Any, _seen: Optional[set] = None) -> int:
+    """Approximate bytes held by `obj`, following containers, DataFrames and slotted objects."""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return sys.getsizeof(obj)
+    # DataFrame / Series / numpy arrays know their own footprint
+    memory_usage = getattr(obj, "memory_usage", None)
+    if callable(memory_usage) and hasattr(obj, "index"):
+        try:
+            usage = memory_usage(deep=True)
+            return int(usage.sum() if hasattr(usage, "sum") else usage)
+        except Exception:
+            pass
+    # numpy arrays (attribute) and our own containers such as LineItemTable (method)
+    nbytes = getattr(obj, "nbytes", None)
+    if nbytes is not None:
+        try:
+            return int(nbytes() if callable(nbytes) else nbytes)
+        except Exception:
+            pass
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(v, seen) for v in obj)
+    else:
+        for attr in getattr(type(obj), "__slots__", ()):
+            size += deep_size(getattr(obj, attr, None), seen)
+        if hasattr(obj, "__dict__"):
+            size += deep_size(vars(obj), seen)
+    return size
+
+
+def budget_bytes() -> int:
+    try:
+        mb = float(get_setting("session_memory_budget_mb", DEFAULT_BUDGET_MB))
+    except (TypeError, ValueError):
+        mb = DEFAULT_BUDGET_MB
+    return int(max(mb, 1) * 1024 * 1024)
+
+
+# ==========================================
+# Evictable artifacts
+# ==========================================
+
+class MemoStore(dict):
+    """Per-session memo entries: name -> (key, value). Sizes and last use are kept alongside."""
+
+    # Identity semantics so stores can live in the process-wide WeakSet
+    __hash__ = object.__hash__
+    __eq__ = object.__eq__
+
+    def __init__(self):
+        super().__init__()
+        self.sizes: Dict[str, int] = {}
+        self.used: Dict[str, float] = {}
+        with _lock:
+            _stores.add(self)
+
+    def put(self, name: str, key: Any, value: Any):
+        self[name] = (key, value)
+        self.sizes[name] = deep_size(value)
+        self.used[name] = time.monotonic()
+        enforce_budget()
+
+    def touch(self, name: str):
+        if name in self:
+            self.used[name] = time.monotonic()
+
+    def nbytes(self) -> int:
+        return sum(self.sizes.values())
+
+    def evict(self, name: str) -> int:
+        self.pop(name, None)
+        self.used.pop(name, None)
+        return self.sizes.pop(name, 0)
+
+
+def memo_store(state) -> MemoStore:
+    """The session's MemoStore under `_section_memo`, created (or upgraded from a plain dict) on demand."""
+    store = state.get("_section_memo")
+    if not isinstance(store, MemoStore):
+        old = store if isinstance(store, dict) else {}
+        store = MemoStore()
+        for name, entry in old.items():
+            store[name] = entry
+            store.sizes[name] = deep_size(entry[1])
+            store.used[name] = time.monotonic()
+        state["_section_memo"] = store
+    return store
+
+
+def enforce_budget() -> int:
+    """Evict least recently used memo entries across sessions until under budget; returns bytes freed."""
+    budget = budget_bytes()
+    with _lock:
+        stores = list(_stores)
+    entries = [(store.used.get(name, 0.0), name, store) for store in stores for name in list(store.sizes)]
+    total = sum(store.nbytes() for store in stores)
+    freed = dropped = 0
+    for _used, name, store in sorted(entries, key=lambda e: e[0]):
+        if total - freed <= budget:
+            break
+        freed += store.evict(name)
+        dropped += 1
+    if dropped:
+        count("session_memory.evicted", dropped)
+        with _lock:
+            _evicted["entries"] += dropped
+            _evicted["bytes"] += freed
+    return freed
+
+
+# ==========================================
+# Per-session accounting
+# ==========================================
+
+def _session_id() -> Optional[str]:
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        return ctx.session_id if ctx is not None else None
+    except Exception:
+        return None
+
+
+def track(state, user: str = "", force: bool = False):
+    """Record the deep size of each session_state entry for this session (throttled)."""
+    sid = _session_id()
+    if sid is None:
+        return
+    now = time.time()
+    with _lock:
+        prev = _sessions.get(sid)
+    if prev is not None and not force and now - prev["seen"] < TRACK_INTERVAL:
+        prev["seen"] = now
+        return
+    keys = {}
+    for key in list(state.keys()):
+        try:
+            keys[str(key)] = deep_size(state[key])
+        except Exception:
+            continue
+    with _lock:
+        _sessions[sid] = {"user": user, "bytes": sum(keys.values()), "keys": keys, "seen": now}
+
+
+def _active(sid: str) -> bool:
+    try:
+        from streamlit import runtime
+        return not runtime.exists() or runtime.get_instance().is_active_session(sid)
+    except Exception:
+        return True
+
+
+def sessions() -> List[Dict[str, Any]]:
+    """Tracked sessions, largest first: session, user, bytes, largest entries, last seen."""
+    now = time.time()
+    with _lock:
+        tracked = dict(_sessions)
+    gone = [sid for sid, info in tracked.items() if now - info["seen"] > SESSION_TTL or not _active(sid)]
+    with _lock:
+        for sid in gone:
+            _sessions.pop(sid, None)
+        rows = [{"session": sid, **info} for sid, info in _sessions.items()]
+    return sorted(rows, key=lambda r: r["bytes"], reverse=True)
+
+
+def totals() -> Dict[str, int]:
+    """Process-wide figures: tracked sessions, their bytes, memoized bytes, budget and evictions."""
+    rows = sessions()
+    with _lock:
+        stores = list(_stores)
+        evicted = dict(_evicted)
+    return {
+        "sessions": len(rows),
+        "bytes": sum(r["bytes"] for r in rows),
+        "memo_bytes": sum(store.nbytes() for store in stores),
+        "budget_bytes": budget_bytes(),
+        "evictions": evicted["entries"],
+        "evicted_bytes": evicted["bytes"],
+    }
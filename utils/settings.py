@@ -4,9 +4,19 @@ Handles system configuration stored in data/settings.json
 """
 
 import os
+import copy
 import json
+import threading
 from typing import Dict, Any
 
+from utils import file_lock
+
+SETTINGS_PATH = "data/settings.json"
+
+_cache_lock = threading.Lock()
+# Parsed settings keyed by (path, mtime, size); get_setting runs on many reruns
+_cache: Dict[str, Any] = {}
+
 
 DEFAULT_SETTINGS = {
     "company_name": "Newton Smart Home",
@@ -18,17 +28,39 @@ DEFAULT_SETTINGS = {
     "ui_product_image_width_px": 350,
     "ui_product_image_height_px": 195,
     "quote_product_image_width_cm": 3.49,
-    "quote_product_image_height_cm": 1.5
+    "quote_product_image_height_cm": 1.5,
+    "profiling_enabled": False,
+    "pdf_engine": "auto",
+    "pdf_allow_remote": False,
+    "pdf_quality": "email"
 }
 
 
 def ensure_settings_file():
     """Create settings.json if it doesn't exist with default values."""
-    os.makedirs("data", exist_ok=True)
-    path = "data/settings.json"
-    if not os.path.exists(path):
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(DEFAULT_SETTINGS, f, indent=2, ensure_ascii=False)
+    if os.path.exists(SETTINGS_PATH) or file_lock.pending_data(SETTINGS_PATH) is not None:
+        return
+    with file_lock.file_lock(SETTINGS_PATH):
+        if not os.path.exists(SETTINGS_PATH):
+            file_lock.atomic_write(SETTINGS_PATH, json.dumps(DEFAULT_SETTINGS, indent=2, ensure_ascii=False))
+
+
+def _read_settings_file() -> Dict[str, Any]:
+    # Saves are queued for a moment (write-behind); read them back before they hit the disk
+    pending = file_lock.pending_data(SETTINGS_PATH)
+    if pending is not None:
+        return json.loads(pending.decode("utf-8"))
+    stat = os.stat(SETTINGS_PATH)
+    stamp = (os.path.abspath(SETTINGS_PATH), stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        if _cache.get("stamp") == stamp:
+            return copy.deepcopy(_cache["settings"])
+    with open(SETTINGS_PATH, "r", encoding="utf-8") as f:
+        settings = json.load(f)
+    with _cache_lock:
+        _cache["stamp"] = stamp
+        _cache["settings"] = copy.deepcopy(settings)
+    return settings
 
 
 def load_settings() -> Dict[str, Any]:
@@ -38,8 +70,7 @@ def load_settings() -> Dict[str, Any]:
     """
     ensure_settings_file()
     try:
-        with open("data/settings.json", "r", encoding="utf-8") as f:
-            settings = json.load(f)
+        settings = _read_settings_file()
         # Ensure all default keys exist
         for key, value in DEFAULT_SETTINGS.items():
             if key not in settings:
@@ -53,11 +84,12 @@ def load_settings() -> Dict[str, Any]:
 def save_settings(settings: Dict[str, Any]):
     """
     Save settings to data/settings.json.
+
+    The write is atomic and coalesced: several saves in quick succession
+    produce one file replace with the last value.
     """
     try:
-        os.makedirs("data", exist_ok=True)
-        with open("data/settings.json", "w", encoding="utf-8") as f:
-            json.dump(settings, f, indent=2, ensure_ascii=False)
+        file_lock.write_behind(SETTINGS_PATH, json.dumps(settings, indent=2, ensure_ascii=False))
     except Exception as e:
         print(f"Error saving settings: {e}")
 
@@ -0,0 +1,416 @@
+"""
+Local Storage for Newton Smart Home Application
+Keeps app tables in a local SQLite database (WAL mode) at data/newton.db.
+
+This is the fallback used when no Postgres connection is configured, replacing
+the per-call xlsx parsing. xlsx stays available as an explicit import/export
+format, and existing data/*.xlsx files are migrated once on first use.
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+import pandas as pd
+
+from utils.profiler import timed, count
+
+DB_PATH = "data/newton.db"
+
+# Default columns per table (used for empty tables and the legacy xlsx layout)
+TABLE_COLUMNS: Dict[str, List[str]] = {
+    "records": ["base_id", "date", "type", "number", "amount", "client_name", "phone", "location", "note"],
+    "customers": ["client_name", "phone", "location", "email", "status", "notes", "tags",
+                  "next_follow_up", "assigned_to", "last_activity"],
+    "products": ["Device", "Description", "UnitPrice", "Warranty", "ImageBase64", "ImagePath"],
+    "users": ["name", "pin", "role", "allowed_pages"],
+    "logs": ["timestamp", "user", "page", "action", "details"],
+    "suppliers": ["supplier_id", "supplier_name", "warranty", "notes"],
+    "supplier_products": ["sp_id", "supplier_id", "supplier_sku", "product_id", "cost_price", "warranty",
+                          "notes", "updated_at"],
+}
+
+_local = threading.local()
+_cache_lock = threading.Lock()
+# table -> (version, DataFrame); reads reuse the frame until the table changes
+_frame_cache: Dict[str, tuple] = {}
+_migrated = set()
+
+
+def _db_path() -> str:
+    return os.path.abspath(DB_PATH)
+
+
+def _quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def get_connection() -> sqlite3.Connection:
+    """Per-thread connection to the local database (Streamlit runs sessions on threads)."""
+    path = _db_path()
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute('CREATE TABLE IF NOT EXISTS _table_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)')
+        conn.commit()
+        conns[path] = conn
+        if path not in _migrated:
+            _migrated.add(path)
+            try:
+                migrate_from_xlsx(conn=conn)
+            except Exception as e:
+                print(f"xlsx migration skipped: {e}")
+    return conn
+
+
+def close_connections():
+    """Close this thread's connections and drop cached frames (tests, benchmarks, restore)."""
+    for conn in (getattr(_local, "conns", None) or {}).values():
+        try:
+            conn.close()
+        except Exception:
+            pass
+    _local.conns = {}
+    with _cache_lock:
+        _frame_cache.clear()
+
+
+def table_exists(name: str, conn: Optional[sqlite3.Connection] = None) -> bool:
+    conn = conn or get_connection()
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone()
+    return row is not None
+
+
+def table_version(name: str, conn: Optional[sqlite3.Connection] = None) -> int:
+    conn = conn or get_connection()
+    row = conn.execute("SELECT version FROM _table_versions WHERE name=?", (name,)).fetchone()
+    return int(row[0]) if row else 0
+
+
+def _bump_version(conn: sqlite3.Connection, name: str):
+    conn.execute(
+        "INSERT INTO _table_versions(name, version) VALUES (?, 1) "
+        "ON CONFLICT(name) DO UPDATE SET version = version + 1",
+        (name,),
+    )
+
+
+def _table_columns(conn: sqlite3.Connection, name: str) -> List[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({_quote(name)})").fetchall()]
+
+
+def _ensure_columns(conn: sqlite3.Connection, name: str, columns: Iterable[str]):
+    """Create the table or add any missing columns (all untyped, like the xlsx sheets)."""
+    columns = [str(c) for c in columns]
+    existing = _table_columns(conn, name)
+    if not existing:
+        cols_sql = ", ".join(_quote(c) for c in (columns or TABLE_COLUMNS.get(name, ["value"])))
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {_quote(name)} ({cols_sql})")
+        return
+    for c in columns:
+        if c not in existing:
+            conn.execute(f"ALTER TABLE {_quote(name)} ADD COLUMN {_quote(c)}")
+
+
+def _to_sql_value(v):
+    if v is None:
+        return None
+    try:
+        if pd.isna(v):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if isinstance(v, pd.Timestamp):
+        return v.isoformat(sep=" ")
+    if hasattr(v, "item") and not isinstance(v, (str, bytes)):
+        # numpy scalars
+        try:
+            return v.item()
+        except Exception:
+            pass
+    if isinstance(v, (int, float, str, bytes)):
+        return v
+    return str(v)
+
+
+@timed("storage.read_table")
+def read_table(name: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Return the whole table as a DataFrame.
+
+    Frames are cached per table version, so repeated reruns that do not write
+    skip the query entirely. A copy is returned so callers may mutate it.
+    """
+    conn = get_connection()
+    version = table_version(name, conn)
+    with _cache_lock:
+        hit = _frame_cache.get(name)
+    if hit is not None and hit[0] == (_db_path(), version):
+        count("storage.cache_hit")
+        df = hit[1].copy()
+    else:
+        count("storage.cache_miss")
+        if table_exists(name, conn):
+            df = pd.read_sql_query(f"SELECT * FROM {_quote(name)} ORDER BY rowid", conn)
+        else:
+            df = pd.DataFrame(columns=TABLE_COLUMNS.get(name, []))
+        with _cache_lock:
+            _frame_cache[name] = ((_db_path(), version), df)
+        df = df.copy()
+    if columns:
+        for c in columns:
+            if c not in df.columns:
+                df[c] = None
+    return df
+
+
+@timed("storage.write_table")
+def write_table(name: str, df: pd.DataFrame):
+    """Replace the table contents with `df` in a single transaction."""
+    conn = get_connection()
+    cols = [str(c) for c in df.columns]
+    with conn:
+        if table_exists(name, conn):
+            existing = _table_columns(conn, name)
+            # Keep the table (and any indexes) when the layout is compatible
+            if set(existing) >= set(cols):
+                conn.execute(f"DELETE FROM {_quote(name)}")
+            else:
+                conn.execute(f"DROP TABLE {_quote(name)}")
+        _ensure_columns(conn, name, cols or TABLE_COLUMNS.get(name, []))
+        if cols and len(df):
+            placeholders = ", ".join("?" for _ in cols)
+            col_sql = ", ".join(_quote(c) for c in cols)
+            conn.executemany(
+                f"INSERT INTO {_quote(name)} ({col_sql}) VALUES ({placeholders})",
+                ([_to_sql_value(v) for v in row] for row in df.itertuples(index=False, name=None)),
+            )
+        _bump_version(conn, name)
+
+
+@timed("storage.append_rows")
+def append_rows(name: str, rows: List[dict]):
+    """Insert rows without rewriting the table (log lines, new records)."""
+    if not rows:
+        return
+    conn = get_connection()
+    cols = []
+    for r in rows:
+        for k in r.keys():
+            if str(k) not in cols:
+                cols.append(str(k))
+    with conn:
+        _ensure_columns(conn, name, cols)
+        placeholders = ", ".join("?" for _ in cols)
+        col_sql = ", ".join(_quote(c) for c in cols)
+        conn.executemany(
+            f"INSERT INTO {_quote(name)} ({col_sql}) VALUES ({placeholders})",
+            ([_to_sql_value(r.get(c)) for c in cols] for r in rows),
+        )
+        _bump_version(conn, name)
+
+
+def to_sql_value(v):
+    """Python/numpy/pandas value -> value sqlite3 can bind (NaN -> NULL)."""
+    return _to_sql_value(v)
+
+
+def _blank(v) -> bool:
+    return v is None or v == "" or (isinstance(v, float) and pd.isna(v))
+
+
+def _same_value(old, new) -> bool:
+    if _blank(old) or _blank(new):
+        return _blank(old) and _blank(new)
+    try:
+        return float(old) == float(new)
+    except (TypeError, ValueError):
+        return str(old) == str(new)
+
+
+def changed_fields(original: Mapping[str, Any], edited: Mapping[str, Any]) -> Dict[str, Any]:
+    """Fields of `edited` that differ from the loaded row (NaN/None/"" count as empty, 5 == 5.0)."""
+    return {k: v for k, v in edited.items() if not _same_value(original.get(k), v)}
+
+
+def ensure_columns(name: str, columns: Iterable[str], conn: Optional[sqlite3.Connection] = None):
+    """Create the table or add missing columns (public form of the write-path helper)."""
+    _ensure_columns(conn or get_connection(), name, columns)
+
+
+@contextmanager
+def transaction(name: str):
+    """
+    Write transaction on `name` that holds SQLite's write lock from the start.
+
+    Use it for read-then-write sequences (look a row up, then update or insert
+    it) so two sessions cannot both miss the row and insert it twice. The table
+    version is bumped on commit.
+    """
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        _bump_version(conn, name)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def _index_name(name: str, key: List[str]) -> str:
+    return "ux_" + "_".join([name] + list(key))
+
+
+def _dedupe(conn: sqlite3.Connection, name: str, key: List[str]) -> int:
+    """Keep only the newest row per key (rows with a NULL key part are left alone)."""
+    key_sql = ", ".join(_quote(k) for k in key)
+    not_null = " AND ".join(f"{_quote(k)} IS NOT NULL" for k in key)
+    cur = conn.execute(
+        f"DELETE FROM {_quote(name)} WHERE {not_null} AND rowid NOT IN "
+        f"(SELECT MAX(rowid) FROM {_quote(name)} GROUP BY {key_sql})"
+    )
+    return cur.rowcount or 0
+
+
+def _ensure_unique_index(conn: sqlite3.Connection, name: str, key: List[str]):
+    index = _index_name(name, key)
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name=?", (index,)).fetchone()
+    if row is not None:
+        return
+    # Tables replaced by write_table/import may hold duplicates from older saves
+    removed = _dedupe(conn, name, key)
+    if removed:
+        count("storage.dedupe_rows", removed)
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {_quote(index)} ON {_quote(name)} ({', '.join(_quote(k) for k in key)})")
+
+
+@timed("storage.upsert_rows")
+def upsert_rows(name: str, rows: List[dict], key: List[str]):
+    """
+    Insert rows, replacing any existing row with the same `key` values.
+
+    Backed by a unique index, so a save touches one row instead of rewriting the
+    table, and concurrent writers serialize on SQLite's write lock.
+    """
+    if not rows:
+        return
+    conn = get_connection()
+    cols = list(key)
+    for r in rows:
+        for k in r.keys():
+            if str(k) not in cols:
+                cols.append(str(k))
+    updates = [c for c in cols if c not in key]
+    col_sql = ", ".join(_quote(c) for c in cols)
+    conflict = ", ".join(_quote(k) for k in key)
+    action = ("DO UPDATE SET " + ", ".join(f"{_quote(c)} = excluded.{_quote(c)}" for c in updates)) if updates else "DO NOTHING"
+    with conn:
+        _ensure_columns(conn, name, cols)
+        _ensure_unique_index(conn, name, key)
+        conn.executemany(
+            f"INSERT INTO {_quote(name)} ({col_sql}) VALUES ({', '.join('?' for _ in cols)}) "
+            f"ON CONFLICT ({conflict}) {action}",
+            ([_to_sql_value(r.get(c)) for c in cols] for r in rows),
+        )
+        _bump_version(conn, name)
+
+
+@timed("storage.compact")
+def compact(name: Optional[str] = None, key: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Housekeeping: drop duplicate keys in `name`, checkpoint the WAL, refresh
+    planner statistics, and VACUUM when a quarter of the file is free pages.
+    """
+    conn = get_connection()
+    stats = {"removed": 0, "vacuumed": 0}
+    if name and key and table_exists(name, conn):
+        with conn:
+            stats["removed"] = _dedupe(conn, name, key)
+            _ensure_unique_index(conn, name, key)
+            if stats["removed"]:
+                _bump_version(conn, name)
+    conn.execute("PRAGMA optimize")
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if pages and free * 4 > pages:
+        conn.execute("VACUUM")
+        stats["vacuumed"] = 1
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return stats
+
+
+def ensure_table(name: str, columns: Optional[List[str]] = None):
+    """Create an empty table with the given (or default) columns if it is missing."""
+    conn = get_connection()
+    with conn:
+        if not table_exists(name, conn):
+            _ensure_columns(conn, name, columns or TABLE_COLUMNS.get(name, []))
+            _bump_version(conn, name)
+
+
+def _normalize_columns(name: str, df: pd.DataFrame) -> pd.DataFrame:
+    # Legacy sheets were read with lower-cased headers everywhere except products
+    if name in ("records", "customers", "users", "logs", "suppliers", "supplier_products"):
+        df.columns = [str(c).strip().lower() for c in df.columns]
+    return df
+
+
+def export_xlsx(name: str, path: Optional[str] = None) -> str:
+    """Write a table to xlsx (explicit export only)."""
+    from io import BytesIO
+    from utils.file_lock import atomic_write
+    path = path or os.path.join("data", "exports", f"{name}.xlsx")
+    buf = BytesIO()
+    read_table(name).to_excel(buf, index=False)
+    atomic_write(path, buf.getvalue())
+    return path
+
+
+def import_xlsx(name: str, path: str):
+    """Replace a table with the contents of an xlsx file."""
+    df = _normalize_columns(name, pd.read_excel(path))
+    write_table(name, df)
+    return len(df)
+
+
+def migrate_from_xlsx(force: bool = False, conn: Optional[sqlite3.Connection] = None) -> Dict[str, int]:
+    """
+    One-shot import of legacy data/<table>.xlsx files.
+
+    A table is migrated only if it does not exist yet in the local database
+    (or when `force` is set), so this is safe to call on every start.
+    """
+    conn = conn or get_connection()
+    migrated = {}
+    for name in TABLE_COLUMNS:
+        path = os.path.join(os.path.dirname(_db_path()), f"{name}.xlsx")
+        if not os.path.exists(path):
+            continue
+        if table_exists(name, conn) and not force:
+            continue
+        df = _normalize_columns(name, pd.read_excel(path))
+        with conn:
+            if table_exists(name, conn):
+                conn.execute(f"DROP TABLE {_quote(name)}")
+            _ensure_columns(conn, name, [str(c) for c in df.columns] or TABLE_COLUMNS[name])
+            if len(df.columns) and len(df):
+                cols = [str(c) for c in df.columns]
+                conn.executemany(
+                    f"INSERT INTO {_quote(name)} ({', '.join(_quote(c) for c in cols)}) VALUES ({', '.join('?' for _ in cols)})",
+                    ([_to_sql_value(v) for v in row] for row in df.itertuples(index=False, name=None)),
+                )
+            _bump_version(conn, name)
+        migrated[name] = len(df)
+    if migrated:
+        print("Migrated xlsx to local storage: " + ", ".join(f"{k}={v}" for k, v in migrated.items()))
+    return migrated
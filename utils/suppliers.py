@@ -0,0 +1,294 @@
+"""
+Suppliers for Newton Smart Home Application
+Supplier price lists, their SKU mapping to products, and catalog cost/margin.
+
+Each supplier price list row is keyed by (supplier_id, supplier_sku) and
+points at a catalog product through `product_id`:
+
+- `import_price_list` streams an uploaded sheet in chunks and upserts each
+  chunk in one transaction. New SKUs are mapped to products by device name;
+  SKUs that were mapped before keep their product.
+- `map_sku` maps (or unmaps) one SKU by hand.
+- `catalog_costs` joins the cheapest mapped cost onto a catalog frame in one
+  vectorized pass, so the products page shows cost and margin for every
+  product without a lookup per row.
+
+Postgres is used when configured (tables in sql/ddl.sql); otherwise the
+local `suppliers` and `supplier_products` tables, which are migrated from
+data/suppliers.xlsx and data/supplier_products.xlsx on first run. Product ids
+refer to the store the catalog was loaded from (`df.attrs["source"]`).
+"""
+
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils import storage
+from utils.product_import import CHUNK_SIZE, device_key, read_sheet
+from utils.profiler import count, timed
+
+try:
+    from utils import db as _db
+except Exception:
+    _db = None
+
+SUPPLIER_COLUMNS = list(storage.TABLE_COLUMNS["suppliers"])
+PRICE_COLUMNS = list(storage.TABLE_COLUMNS["supplier_products"])
+COST_COLUMNS = ["Cost", "Supplier", "Margin", "Margin %"]
+
+# Accepted price list headers (lower-cased) -> column
+PRICE_LIST_HEADERS = {
+    "sku": "supplier_sku", "supplier sku": "supplier_sku", "supplier_sku": "supplier_sku", "item code": "supplier_sku",
+    "cost": "cost_price", "cost price": "cost_price", "cost_price": "cost_price", "unit cost": "cost_price",
+    "price": "cost_price",
+    "device": "device", "product": "device", "name": "device",
+    "product_id": "product_id",
+    "warranty": "warranty", "notes": "notes",
+}
+
+
+def _use_db(source: str) -> bool:
+    return source == "db" and _db is not None and bool(_db.get_connection_string())
+
+
+def _cost(values: pd.Series) -> pd.Series:
+    text = values.astype(object).where(values.notna(), "").astype(str)
+    return pd.to_numeric(text.str.replace(r"(?i)aed|,", "", regex=True).str.strip(), errors="coerce")
+
+
+def _sku(values: pd.Series) -> pd.Series:
+    """SKUs as trimmed text; 1001.0 from a numeric column becomes "1001"."""
+    def one(v):
+        if v is None or (isinstance(v, float) and pd.isna(v)):
+            return ""
+        if isinstance(v, float) and v.is_integer():
+            v = int(v)
+        return str(v).strip()
+    return values.astype(object).map(one)
+
+
+# ==========================================
+# Local store
+# ==========================================
+
+def _prepare_local(conn, name: str):
+    """Columns and indexes of `name`; legacy price rows without a supplier SKU use their sp_id."""
+    if name == "suppliers":
+        storage.ensure_columns(name, SUPPLIER_COLUMNS, conn=conn)
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_suppliers_id ON suppliers (supplier_id)')
+        return
+    storage.ensure_columns(name, PRICE_COLUMNS, conn=conn)
+    if conn.execute('SELECT 1 FROM supplier_products WHERE supplier_sku IS NULL LIMIT 1').fetchone():
+        conn.execute("UPDATE supplier_products SET supplier_sku = COALESCE(CAST(sp_id AS TEXT), 'row-' || rowid) "
+                     "WHERE supplier_sku IS NULL")
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_supplier_products_sku ON supplier_products (supplier_id, supplier_sku)')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_supplier_products_product ON supplier_products (product_id)')
+
+
+def _load_local(name: str) -> pd.DataFrame:
+    columns = SUPPLIER_COLUMNS if name == "suppliers" else PRICE_COLUMNS
+    df = storage.read_table(name)
+    if name == "supplier_products" and len(df) and ("supplier_sku" not in df.columns or df["supplier_sku"].isna().any()):
+        with storage.transaction(name) as conn:
+            _prepare_local(conn, name)
+        df = storage.read_table(name)
+    if list(df.columns) == columns:
+        return df
+    for col in columns:
+        if col not in df.columns:
+            df[col] = None
+    return df[columns]
+
+
+_UPSERT_SETS = (
+    "cost_price = excluded.cost_price, warranty = COALESCE(excluded.warranty, {t}.warranty), "
+    "notes = COALESCE(excluded.notes, {t}.notes), updated_at = excluded.updated_at, "
+    # A SKU mapped earlier (by hand or by an earlier import) keeps its product
+    "product_id = COALESCE({t}.product_id, excluded.product_id)"
+)
+
+
+def _upsert_local(rows: List[tuple]):
+    cols = ["supplier_id", "supplier_sku", "product_id", "cost_price", "warranty", "notes", "updated_at"]
+    with storage.transaction("supplier_products") as conn:
+        _prepare_local(conn, "supplier_products")
+        conn.executemany(
+            f'INSERT INTO supplier_products ({", ".join(cols)}) VALUES ({", ".join("?" for _ in cols)}) '
+            f'ON CONFLICT (supplier_id, supplier_sku) DO UPDATE SET {_UPSERT_SETS.format(t="supplier_products")}',
+            rows,
+        )
+
+
+# ==========================================
+# Postgres
+# ==========================================
+
+def _load_db(name: str) -> pd.DataFrame:
+    columns = SUPPLIER_COLUMNS if name == "suppliers" else PRICE_COLUMNS
+    rows = _db.db_query(f'SELECT {", ".join(columns)} FROM {name} ORDER BY 1')
+    return pd.DataFrame(rows, columns=columns)
+
+
+def _upsert_db(rows: List[tuple]):
+    with _db.db_transaction() as cur:
+        _db.execute_values(
+            cur,
+            'INSERT INTO supplier_products (supplier_id, supplier_sku, product_id, cost_price, warranty, notes, updated_at) '
+            'VALUES %s ON CONFLICT (supplier_id, supplier_sku) DO UPDATE SET '
+            + _UPSERT_SETS.format(t="supplier_products"),
+            rows, template="(%s, %s, %s::bigint, %s::numeric, %s, %s, %s::timestamptz)", page_size=len(rows),
+        )
+
+
+# ==========================================
+# Public API
+# ==========================================
+
+def load_suppliers(source: str = "local") -> pd.DataFrame:
+    if _use_db(source):
+        try:
+            return _load_db("suppliers")
+        except Exception as e:
+            print(f"suppliers: using local store ({str(e).splitlines()[0] if str(e) else type(e).__name__})")
+    return _load_local("suppliers")
+
+
+@timed("suppliers.load_prices")
+def load_supplier_products(source: str = "local") -> pd.DataFrame:
+    if _use_db(source):
+        try:
+            return _load_db("supplier_products")
+        except Exception as e:
+            print(f"suppliers: using local store ({str(e).splitlines()[0] if str(e) else type(e).__name__})")
+    return _load_local("supplier_products")
+
+
+def add_supplier(name: str, warranty: Any = None, notes: str = "", source: str = "local") -> str:
+    """Create a supplier and return its id (SUP-0001, SUP-0002, ...)."""
+    name = str(name or "").strip()
+    if not name:
+        raise ValueError("Supplier name is required.")
+    existing = load_suppliers(source)
+    numbers = existing["supplier_id"].astype(str).str.extract(r"(\d+)$")[0].dropna().astype(int)
+    supplier_id = f"SUP-{(numbers.max() if len(numbers) else 0) + 1:04d}"
+    values = (supplier_id, name, storage.to_sql_value(warranty), notes or None)
+    if _use_db(source):
+        _db.db_execute('INSERT INTO suppliers (supplier_id, supplier_name, warranty, notes) VALUES (%s, %s, %s, %s)', values)
+    else:
+        with storage.transaction("suppliers") as conn:
+            _prepare_local(conn, "suppliers")
+            conn.execute('INSERT INTO suppliers (supplier_id, supplier_name, warranty, notes) VALUES (?, ?, ?, ?)', values)
+    return supplier_id
+
+
+def map_sku(supplier_id: str, supplier_sku: str, product_id: Optional[int], source: str = "local"):
+    """Point one supplier SKU at a product (None unmaps it)."""
+    pid = int(product_id) if product_id is not None else None
+    if _use_db(source):
+        _db.db_execute('UPDATE supplier_products SET product_id = %s WHERE supplier_id = %s AND supplier_sku = %s',
+                       (pid, supplier_id, supplier_sku))
+        return
+    with storage.transaction("supplier_products") as conn:
+        _prepare_local(conn, "supplier_products")
+        conn.execute('UPDATE supplier_products SET product_id = ? WHERE supplier_id = ? AND supplier_sku = ?',
+                     (pid, supplier_id, supplier_sku))
+
+
+def _price_list(chunk: pd.DataFrame) -> pd.DataFrame:
+    chunk = chunk.rename(columns=lambda c: PRICE_LIST_HEADERS.get(re.sub(r"\s+", " ", str(c)).strip().lower(), c))
+    missing = [c for c in ("supplier_sku", "cost_price") if c not in chunk.columns]
+    if missing:
+        raise ValueError("Price list needs a SKU and a cost column (e.g. 'SKU' and 'Cost').")
+    return chunk.loc[:, ~chunk.columns.duplicated()]
+
+
+@timed("suppliers.import_price_list")
+def import_price_list(file, supplier_id: str, products: pd.DataFrame, chunk_size: int = CHUNK_SIZE,
+                      progress: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+    """
+    Upsert a supplier price list in chunks of `chunk_size` rows, one transaction each.
+
+    New SKUs are mapped to `products` by a `product_id` column or by device
+    name. Returns rows, mapped/unmapped counts, elapsed seconds and rows per second.
+    """
+    started = time.perf_counter()
+    source = products.attrs.get("source", "local")
+    by_device = pd.Series(products["id"].to_numpy(), index=products["Device"].map(device_key).to_numpy())
+    by_device = by_device[~by_device.index.duplicated()]
+    known_ids = set(products["id"].astype(int))
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    result = {"rows": 0, "mapped": 0, "unmapped": 0, "skipped": 0}
+    for chunk in read_sheet(file, chunk_size, required=[], columns=None):
+        chunk = _price_list(chunk)
+        sku, cost = _sku(chunk["supplier_sku"]), _cost(chunk["cost_price"])
+        valid = (sku != "") & cost.notna()
+        result["skipped"] += int((~valid).sum())
+        chunk, sku, cost = chunk[valid], sku[valid], cost[valid]
+        if chunk.empty:
+            continue
+        product = pd.Series(np.nan, index=chunk.index)
+        if "product_id" in chunk.columns:
+            product = pd.to_numeric(chunk["product_id"], errors="coerce")
+            product = product.where(product.isin(known_ids))
+        if "device" in chunk.columns:
+            product = product.fillna(chunk["device"].map(device_key).map(by_device))
+        # Repeated SKUs in one chunk: the last row wins
+        keep = ~sku.duplicated(keep="last")
+        text = {c: chunk[c].where(chunk[c].notna(), None).astype(object) if c in chunk.columns else None
+                for c in ("warranty", "notes")}
+        rows = [
+            (supplier_id, s, None if pd.isna(p) else int(p), float(c),
+             storage.to_sql_value(text["warranty"][i]) if text["warranty"] is not None else None,
+             storage.to_sql_value(text["notes"][i]) if text["notes"] is not None else None, stamp)
+            for i, s, p, c in zip(chunk.index[keep], sku[keep], product[keep], cost[keep])
+        ]
+        if _use_db(source):
+            _upsert_db(rows)
+        else:
+            _upsert_local(rows)
+        result["rows"] += len(rows)
+        result["mapped"] += int(product[keep].notna().sum())
+        if progress is not None:
+            progress(result["rows"])
+    result["unmapped"] = result["rows"] - result["mapped"]
+    result["seconds"] = time.perf_counter() - started
+    result["rows_per_second"] = result["rows"] / result["seconds"] if result["seconds"] > 0 else 0.0
+    count("suppliers.price_rows", result["rows"])
+    return result
+
+
+@timed("suppliers.catalog_costs")
+def catalog_costs(products: pd.DataFrame, prices: Optional[pd.DataFrame] = None,
+                  suppliers: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    Cheapest mapped supplier cost per product, with margin, indexed like `products`.
+
+    Columns: Cost, Supplier, Margin (UnitPrice - Cost) and Margin % (of the
+    unit price). Products without a mapped cost get NaN.
+    """
+    source = products.attrs.get("source", "local")
+    prices = load_supplier_products(source) if prices is None else prices
+    out = pd.DataFrame(np.nan, index=products.index, columns=COST_COLUMNS)
+    out["Supplier"] = None
+    if products.empty or prices.empty:
+        return out
+    cost = pd.to_numeric(prices["cost_price"], errors="coerce")
+    product = pd.to_numeric(prices["product_id"], errors="coerce")
+    mapped = prices.assign(cost_price=cost, product_id=product)[cost.notna() & product.notna()]
+    if mapped.empty:
+        return out
+    best = mapped.sort_values("cost_price", kind="stable").drop_duplicates("product_id").set_index("product_id")
+    suppliers = load_suppliers(source) if suppliers is None else suppliers
+    names = suppliers.set_index("supplier_id")["supplier_name"] if len(suppliers) else pd.Series(dtype=object)
+    names = names[~names.index.duplicated()]
+    ids = pd.to_numeric(products["id"], errors="coerce")
+    price = pd.to_numeric(products["UnitPrice"], errors="coerce")
+    out["Cost"] = ids.map(best["cost_price"]).astype(float)
+    supplier_ids = ids.map(best["supplier_id"])
+    out["Supplier"] = supplier_ids.map(names).fillna(supplier_ids)
+    out["Margin"] = price - out["Cost"]
+    out["Margin %"] = (out["Margin"] / price.where(price > 0) * 100).round(1)
+    return out
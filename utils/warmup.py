@@ -0,0 +1,151 @@
+"""
+Process Warm-up for Newton Smart Home Application
+Preloads data caches, templates and PDF engines in a background thread.
+
+Without it the first user after a deploy pays for importing the pages, reading
+the catalog, customers and records, compiling the Jinja templates, opening the
+Word templates and initializing the PDF engines inside their own request.
+main.py calls `start()` once per server process; each step fills a process-wide
+cache (the storage frame cache, the Jinja environment, the parsed Word
+templates, the asset and image caches, the warmed WeasyPrint renderer) that
+later sessions reuse. Progress is exposed through `status()` and shown in
+Settings > Performance.
+"""
+
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils import profiler
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+DOCX_TEMPLATES = ["quotation_template.docx", "invoice_template.docx", "receipt_template.docx", "catalog_template.docx"]
+
+_lock = threading.Lock()
+_started = False
+_finished_at: Optional[float] = None
+# step -> {"state": pending|running|ok|failed, "ms": float|None, "detail": str}
+_status: Dict[str, Dict] = {}
+
+
+# ==========================================
+# Steps
+# ==========================================
+
+def _pages() -> str:
+    from utils import page_registry
+    page_registry.preload()
+    loaded = sum(page_registry.is_loaded(p) for p in page_registry.PAGES)
+    return f"{loaded}/{len(page_registry.PAGES)} pages imported"
+
+
+def _catalog() -> str:
+    from pages_custom.products_page import load_products
+    return f"{len(load_products())} products"
+
+
+def _customers() -> str:
+    from pages_custom.customers_page import load_customers
+    return f"{len(load_customers())} customers"
+
+
+def _records() -> str:
+    from utils.balances import open_invoices
+    from utils.records import load_records
+    records = load_records()
+    open_invoices()
+    return f"{len(records)} records"
+
+
+def _templates() -> str:
+    from utils.quotation_utils import compile_templates
+    return f"{len(compile_templates())} HTML templates compiled"
+
+
+def _docx_templates() -> str:
+    from utils import docx_templates
+    cached = [name for name in DOCX_TEMPLATES if docx_templates.preload(DATA_DIR / name)]
+    return f"{len(cached)} Word templates cached"
+
+
+def _assets() -> str:
+    from utils.assets import asset_bytes
+    found = [name for name in ("logo", "stamp") if asset_bytes(name)]
+    return f"assets: {', '.join(found) or 'none'}"
+
+
+def _pdf_engines() -> str:
+    from utils import pdf_engines
+    warmed = pdf_engines.warm_up_engines()
+    return f"warmed: {', '.join(n for n, ok in warmed.items() if ok) or 'none'}"
+
+
+# Cheap, widely shared steps first; PDF engines (fonts, images, WeasyPrint) last
+STEPS: List[Tuple[str, Callable[[], str]]] = [
+    ("pages", _pages),
+    ("catalog", _catalog),
+    ("customers", _customers),
+    ("records", _records),
+    ("html_templates", _templates),
+    ("docx_templates", _docx_templates),
+    ("assets", _assets),
+    ("pdf_engines", _pdf_engines),
+]
+
+
+# ==========================================
+# Runner
+# ==========================================
+
+def _set(step: str, **fields):
+    with _lock:
+        _status[step].update(fields)
+
+
+def run():
+    """Run every step in order; a failing step is recorded and the rest still run."""
+    global _finished_at
+    for step, fn in STEPS:
+        _set(step, state="running")
+        started = time.perf_counter()
+        try:
+            with profiler.span(f"warmup.{step}"):
+                detail = fn()
+            _set(step, state="ok", detail=detail or "")
+        except Exception as e:
+            print(f"Warm-up step failed ({step}): {e}")
+            _set(step, state="failed", detail=str(e).splitlines()[0] if str(e) else type(e).__name__)
+        _set(step, ms=(time.perf_counter() - started) * 1000)
+    with _lock:
+        _finished_at = time.time()
+
+
+def start() -> bool:
+    """Start the warm-up thread once per process; False if it was already started."""
+    global _started
+    with _lock:
+        if _started:
+            return False
+        _started = True
+        for step, _ in STEPS:
+            _status[step] = {"state": "pending", "ms": None, "detail": ""}
+    threading.Thread(target=run, name="newton-warmup", daemon=True).start()
+    return True
+
+
+def status() -> List[Dict]:
+    """One row per step: step, state, ms, detail (empty before `start`)."""
+    with _lock:
+        return [{"step": step, **_status[step]} for step, _ in STEPS if step in _status]
+
+
+def is_ready() -> bool:
+    """True once every step has finished (successfully or not)."""
+    with _lock:
+        return _finished_at is not None
+
+
+def finished_at() -> Optional[float]:
+    with _lock:
+        return _finished_at